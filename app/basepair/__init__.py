@@ -1,39 +1,38 @@
 '''set up basepair package'''
 from __future__ import print_function
 import os
-import sys
 
-import requests
-
-from .utils import colors
-
-# Exposing infra webapp library
-from .infra.webapp import Analysis, File, Gene, Genome, GenomeFile, Host, Module, Pipeline, Project, Sample, Upload, User
-
-# Exposing the storage wrapper
+# The webapp classes import requests, they are loaded on first access so that
+# importing basepair stays fast for the commands that do not need them
+WEBAPP_CLASSES = (
+    'Analysis', 'File', 'Gene', 'Genome', 'GenomeFile', 'Host', 'Module', 'Pipeline', 'Project', 'Sample', 'Upload',
+    'User',
+)
 
 __title__ = 'basepair'
 __version__ = '2.2.10a'
 __copyright__ = 'Copyright [2017] - [2024] Basepair INC'
 
 
-JSON_URL = 'https://pypi.python.org/pypi/{}/json'.format(__title__)
-
 if not os.environ.get('SECRETS_DRIVER') == 'local':
-    try:
-        resp = requests.get(JSON_URL, timeout=1)
-        if resp.status_code == 200:
-            latest_version = resp.json()['info']['version']
-            if latest_version != __version__:
-                print(colors.color.warning(
-                    'WARNING: The latest version of basepair package is {}. '
-                    'Please upgrade to avail the latest features and bug-fixes'
-                    ''.format(latest_version)), file=sys.stderr)
-    except (requests.exceptions.ConnectionError, requests.exceptions.ReadTimeout):
-        print('warning: no internet', file=sys.stderr)
+    from .helpers.version_check import check_version
+    check_version(__title__, __version__)
+
+
+def __getattr__(name):
+    if name in WEBAPP_CLASSES:
+        from .infra import webapp
+        return getattr(webapp, name)
+    raise AttributeError('module {} has no attribute {}'.format(__name__, name))
 
 
 def connect(*args, **kwargs):
     '''return basepair package'''
     from basepair.api import BpApi
     return BpApi(*args, **kwargs)
+
+
+def connect_async(*args, **kwargs):
+    '''return basepair asyncio package, requires httpx'''
+    from basepair.async_api import AsyncBpApi
+    return AsyncBpApi(*args, **kwargs)
@@ -23,16 +23,61 @@ from __future__ import print_function
 import os
 import sys
 import json
+from collections import OrderedDict
 import subprocess
 from subprocess import CalledProcessError
+from concurrent.futures import ThreadPoolExecutor
+import threading
 import time
 import datetime
-import yaml
 
 # App imports
-from .helpers import eprint, NicePrint, SetFilter
+from .helpers import eprint, NicePrint
 from .infra.configuration import Parser
 from .infra.webapp import Analysis, File, Gene, Genome, GenomeFile, Host, Instance, Module, Pipeline, Project, Sample, Upload, User
+from .infra.webapp import SessionPool
+from .modules.regions import RegionReader
+from .modules.storage import Storage
+from .helpers.analysis_watcher import AnalysisWatcher, FINAL_STATUSES
+from .helpers.analysis_watcher import DEFAULT_MAX_INTERVAL as WATCH_MAX_INTERVAL
+from .helpers.analysis_watcher import DEFAULT_MIN_INTERVAL as WATCH_MIN_INTERVAL
+from .helpers.expression_matrix import ExpressionStore, parse_counts
+from .helpers.file_index import FileIndex
+from .helpers.genome_catalog import GenomeCatalog
+from .helpers.genome_catalog import DEFAULT_TTL as GENOME_CACHE_TTL
+from .helpers.manifest import read_manifest
+from .helpers.metadata_catalog import MetadataCatalog
+from .helpers.metadata_catalog import RESOURCES as CATALOG_RESOURCES
+from .helpers.record_writer import RecordWriter
+from .helpers.sync_manifest import SyncManifest
+from .modules.transfer import DownloadManager, ObjectCache, TransferEngine, TransferJournal
+from .modules.transfer.cache import DEFAULT_CACHE_SIZE as OBJECT_CACHE_SIZE
+from .modules.transfer.manager import DEFAULT_PARALLEL as TRANSFER_PARALLEL
+from .modules.transfer.engine import DEFAULT_CONCURRENCY as TRANSFER_CONCURRENCY
+from .modules.transfer.engine import DEFAULT_PART_SIZE as TRANSFER_PART_SIZE
+from .modules.transfer.engine import DEFAULT_RETRIES as TRANSFER_RETRIES
+
+BULK_CONCURRENCY = 4
+EXPRESSION_COUNT_TAGS = {
+  'genes': ['expression_count', 'by_gene', 'text'],
+  'transcripts': ['expression_count', 'by_transcript', 'text'],
+}
+FILE_INDEX_CACHE_SIZE = 1024
+PRINT_FIELDS = { # default fields of the csv, tsv and table output formats
+  'analyses': ['id', 'name', 'started_on', 'completed_on', 'status', 'tags'],
+  'analysis': ['id', 'name', 'date_created', 'completed_on', 'status', 'tags'],
+  'genome': ['id', 'name', 'created_on'],
+  'genomes': ['id', 'name', 'created_on'],
+  'module': ['id', 'name', 'date_created', 'visibility', 'status'],
+  'pipeline': ['id', 'name', 'datatype', 'description', 'tags'],
+  'pipeline_modules': ['id', 'name', 'owner', 'date_created'],
+  'pipelines': ['id', 'name', 'datatype', 'description', 'tags'],
+  'projects': ['id', 'name', 'owner_fullname', 'last_updated', 'visibility'],
+  'sample': ['id', 'name', 'datatype', 'genome', 'date_created', 'meta.num_reads'],
+  'samples': ['id', 'name', 'datatype', 'genome', 'date_created', 'meta.num_reads'],
+}
+SAMPLE_RESUME_TTL = 7 * 24 * 3600 # seconds an unfinished sample upload is resumed
+SYNC_TMP_SUFFIX = '.sync-tmp'
 
 class BpApi(): # pylint: disable=too-many-instance-attributes,too-many-public-methods
   ''' A wrapper over the REST API for accessing the Basepair system
@@ -67,34 +112,9 @@ class BpApi(): # pylint: disable=too-many-instance-attributes,too-many-public-me
   bp.delete_sample(sample_id)
   '''
 
-  def __init__(self, conf=None, scratch='.', use_cache=False, user_cache_for_host_conf=False, verbose=None): # pylint: disable=too-many-arguments
+  def __init__(self, conf=None, scratch='.', use_cache=False, user_cache_for_host_conf=False, verbose=None, warm=False): # pylint: disable=too-many-arguments
     self.verbose = verbose
-
-    if conf:
-      self.conf = conf
-    elif 'BP_CONFIG_FILE' in os.environ:
-      self.conf = json.load(open(os.environ['BP_CONFIG_FILE']))
-    else:
-      if 'BP_USERNAME' not in os.environ:
-        sys.exit('ERROR: BP_USERNAME not set in env')
-      if 'BP_API_KEY' not in os.environ:
-        sys.exit('ERROR: BP_API_KEY not set in env')
-      username = os.environ['BP_USERNAME']
-      api_key = os.environ['BP_API_KEY']
-      self.conf = {
-        'api': {
-          'key': api_key,
-          'host': 'app.basepairtech.com',
-          'prefix': '/api/v2/',
-          'ssl': True,
-          'username': username,
-        }
-      }
-
-    if self.conf.get('api', {}).get('ssl') is None:
-      sys.exit('ERROR: The config file need to be updated. Please visit:\n \
-                https://test.basepairtech.com/api/v2/users/api_key\n \
-                To get your new config file.')
+    self.conf = self.load_conf(conf)
 
     self.scratch = self.conf.get('scratch', scratch).rstrip('/')
     self.use_cache = use_cache
@@ -102,24 +122,172 @@ class BpApi(): # pylint: disable=too-many-instance-attributes,too-many-public-me
     if use_cache and self.verbose == 1:
       eprint('Warning: caching data.')
 
-    self._get_user_id()
+    # user, genome catalogue and configuration are fetched on first use
+    self.user_cache_for_host_conf = user_cache_for_host_conf
+    self._file_indexes = OrderedDict()
+    self._lazy = {}
+    self._lazy_locks = {
+      name: threading.Lock()
+      for name in ('catalog', 'configuration', 'genome_catalog', 'region_reader', 'storage', 'transfer_engine', 'user')
+    }
+    if warm:
+      self.warm()
+
+  @property
+  def catalog(self):
+    '''Local metadata catalog of the user resources, in {scratch}/catalog.{host}.{username}.sqlite, see refresh_catalog'''
+    return self._get_lazy('catalog', lambda: MetadataCatalog(
+      '{}/catalog.{}.sqlite'.format(self.scratch, self._get_account_key()),
+      self._list_catalog_resource,
+    ))
+
+  @property
+  def configuration(self):
+    '''Cloud service configuration, from the host only if it is not set in the incoming config'''
+    return self._get_lazy('configuration', self._load_configuration)
+
+  @property
+  def genome_catalog(self):
+    '''Genome catalogue indexed by name, id and resource_uri, persisted by account in the scratch dir with use_cache'''
+    return self._get_lazy('genome_catalog', lambda: GenomeCatalog(
+      self.get_genomes,
+      cache='{}/json/genomes.{}.json'.format(self.scratch, self._get_account_key()) if self.use_cache else None,
+      ttl=self.conf.get('genome_cache_ttl', GENOME_CACHE_TTL),
+    ))
+
+  @property
+  def genomes(self):
+    '''Genome list'''
+    return self.genome_catalog.genomes
+
+  @property
+  def region_reader(self):
+    '''
+    Region queries on the indexed files of the user storage, with caches bounded
+    by the optional regions conf: {"regions": {"block_cache_size": 67108864, "index_cache_size": 32}}
+    '''
+    return self._get_lazy('region_reader', lambda: RegionReader(self.storage, **(self.conf.get('regions') or {})))
 
-    self.genomes = self.get_genomes()
+  @property
+  def storage(self):
+    '''Storage driver of the user storage, used to stream files'''
+    return self._get_lazy('storage', self._load_storage)
 
-    # Get configuration from host only if it is not set in the incoming config
-    cache = False
-    configuration = self.conf
-    if user_cache_for_host_conf:
-      eprint('INFO: Use cached host cloud service configuration.')
-      cache = '{}/json/config.json'.format(self.scratch)
+  @property
+  def transfer_engine(self):
+    '''
+    In process S3 transfer engine, tuned by the optional transfer conf:
+    {"transfer": {"engine": "boto3", "part_size": 8388608, "concurrency": 10, "retries": 5}}
+    Set "engine" to "cli" to copy with the aws cli instead. Set "cache_dir" (and
+    "cache_size" in bytes) to share downloaded objects through a local ObjectCache,
+    and "cache_hardlink" to hardlink them read only instead of copying them.
+    '''
+    return self._get_lazy('transfer_engine', self._load_transfer_engine)
 
-    if self.conf.get('api', {}).get('cli'):
-      configuration = User(self.conf.get('api')).get_configuration(cache=cache)
-    self.configuration = Parser(configuration)
+  @property
+  def user(self):
+    '''User of the username provided in conf'''
+    return self._get_lazy('user', self._get_user_id)
+
+  def warm(self, names=('configuration', 'genome_catalog', 'user')):
+    '''
+    Fetch the lazy attributes concurrently in background threads
+    Parameters
+    ----------
+    names: {tuple} Lazy attributes to fetch
+    Returns
+    -------
+    The started threads
+    '''
+    threads = [threading.Thread(target=getattr, args=(self, name), daemon=True) for name in names]
+    for thread in threads:
+      thread.start()
+    return threads
 
   ################################################################################################
   ### ANALYSIS ###################################################################################
   ################################################################################################
+  def bulk_create_analyses(self, specs, concurrency=BULK_CONCURRENCY):
+    '''
+    Create and start many analyses with concurrent create calls
+
+    Every spec is created with its own call, like create_analysis, several
+    calls at once. Validation warnings are returned instead of prompted for.
+    Parameters
+    ----------
+    concurrency: {int}  Calls at once
+    specs:       {list} Dicts with workflow_id and sample_ids, and optionally control_ids,
+                        ignore_validation_warnings, instance_type, params and project_id  [Required]
+    Returns
+    -------
+    List of results in the order of the specs, dicts with the analysis id, the
+    status created|warning|error|unknown and the error message, unknown when
+    the webapp did not return the analysis
+    '''
+    analysis_api = Analysis(self.conf.get('api'))
+
+    def create(spec):
+      if not spec.get('workflow_id') or not spec.get('sample_ids'):
+        return {'error': 'A spec needs a workflow_id and sample_ids.', 'id': None, 'status': 'error'}
+      data = self._get_analysis_data(
+        spec['workflow_id'],
+        spec['sample_ids'],
+        control_ids=spec.get('control_ids'),
+        ignore_validation_warnings=spec.get('ignore_validation_warnings', False),
+        instance_type=spec.get('instance_type') or (spec.get('params') or {}).get('info', {}).get('instance_type'),
+        project_id=spec.get('project_id'),
+      )
+      if spec.get('params'):
+        data['params'] = spec['params']
+      info = analysis_api.save(payload=data, datatype='analysis')
+      result = self._get_bulk_result(info, 'created')
+      result['id'] = info.get('id') if isinstance(info, dict) and result['status'] == 'created' else None
+      if result['status'] == 'created' and not result['id']:
+        result.update(error='No analysis returned.', status='unknown')
+      return result
+
+    with ThreadPoolExecutor(max_workers=max(1, min(concurrency, len(specs) or 1))) as executor:
+      results = list(executor.map(create, specs))
+    eprint('{} of {} analyses created.'.format(sum(result['status'] == 'created' for result in results), len(results)))
+    return results
+
+  def bulk_reanalyze(self, ids, instance_type=None, concurrency=BULK_CONCURRENCY):
+    '''
+    Restart many analyses with concurrent reanalyze calls, one per analysis
+    Parameters
+    ----------
+    concurrency:   {int}  Calls at once
+    ids:           {list} Analysis ids [Required]
+    instance_type: {str}  Instance type to run them on
+    Returns
+    -------
+    Dict of results by analysis id, with the status restarted|error and the error message
+    '''
+    payload = {'source': 'cli'}
+    if instance_type:
+      payload.update(instance_type=instance_type)
+    results = self._run_bulk_action('reanalyze', ids, payload, 'restarted', concurrency)
+    eprint('{} of {} analyses restarted.'.format(sum(result['status'] == 'restarted' for result in results.values()), len(results)))
+    return results
+
+  def bulk_terminate(self, ids, concurrency=BULK_CONCURRENCY):
+    '''
+    Terminate many analyses with concurrent terminate calls, one per analysis
+    Parameters
+    ----------
+    concurrency: {int}  Calls at once
+    ids:         {list} Analysis ids [Required]
+    Returns
+    -------
+    Dict of results by analysis id, with the status terminated|error and the error message
+    '''
+    results = self._run_bulk_action('terminate', ids, {'source': 'cli'}, 'terminated', concurrency)
+    eprint('INFO: Termination process initiated for {} of {} analyses.'.format(
+      sum(result['status'] == 'terminated' for result in results.values()),
+      len(results),
+    ))
+    return results
+
   def create_analysis(
     self,
     workflow_id,
@@ -159,25 +327,21 @@ class BpApi(): # pylint: disable=too-many-instance-attributes,too-many-public-me
     if sample_id:
       sample_ids.append(sample_id)
 
-    data = {
-      'controls': self._parsed_sample_list(control_ids, prefix),
-      'samples': self._parsed_sample_list(sample_ids, prefix),
-      'ignore_validation_warning': ignore_validation_warnings,
-      'meta': {'source': 'cli'},
-      'workflow': '{}pipelines/{}'.format(prefix, workflow_id)
-    }
-
-    if params.get('info', {}).get('instance_type'):
-      data['instance'] = params['info']['instance_type']
-
-    if project_id:
-      data['projects'] = ['{}projects/{}'.format(prefix, project_id)]
+    data = self._get_analysis_data(
+      workflow_id,
+      sample_ids,
+      control_ids=control_ids,
+      ignore_validation_warnings=ignore_validation_warnings,
+      instance_type=params.get('info', {}).get('instance_type'),
+      project_id=project_id,
+    )
 
     if pipeline_yaml:
       try:
         path = os.path.abspath(os.path.expanduser(os.path.expandvars(pipeline_yaml)))
         with open(path, 'r') as file:
           yaml_string = file.read()
+        import yaml # pylint: disable=import-outside-toplevel
         pipeline_yaml_data = yaml.load(yaml_string, Loader=yaml.FullLoader)
         pipeline_id = pipeline_yaml_data.get('id')
       except Exception: # pylint: disable=bare-except
@@ -187,6 +351,7 @@ class BpApi(): # pylint: disable=too-many-instance-attributes,too-many-public-me
 
     if module_yaml:
       try:
+        import yaml # pylint: disable=import-outside-toplevel
         module_data = []
         for each_yaml in module_yaml:
           path = os.path.abspath(os.path.expanduser(os.path.expandvars(each_yaml)))
@@ -245,12 +410,13 @@ class BpApi(): # pylint: disable=too-many-instance-attributes,too-many-public-me
       eprint('deleted analysis', uid)
     return info
 
-  def download_analysis(self, uid, analysis=None, outdir='.', tagkind=None, tags=None):# pylint:disable=too-many-arguments
+  def download_analysis(self, uid, analysis=None, outdir='.', tagkind=None, tags=None, parallel=None):# pylint:disable=too-many-arguments
     '''
     Download files from one or more analysis.
     Parameters
     ----------
     outdir:   {str}  Output directory to download results to
+    parallel: {int}  Number of files downloaded at once
     tagkind:  {str}  Type of tag filtering to do. Options: exact, diff, subset
     tags:     {list} List of list of tags to filter files by
     analysis: {dict} Analysis data for the uid
@@ -269,6 +435,7 @@ class BpApi(): # pylint: disable=too-many-instance-attributes,too-many-public-me
           analysis=analysis,
           dirname=outdir,
           kind=tagkind,
+          parallel=parallel,
           tags=tags,
           uid=uid
         )
@@ -332,20 +499,85 @@ class BpApi(): # pylint: disable=too-many-instance-attributes,too-many-public-me
       cache='{}/json/analysis.{}.json'.format(self.scratch, uid) if self.use_cache else False,
     )
 
+  def get_analyses_by_ids(self, uids):
+    '''
+    Get several analyses in batched requests, with their files and params
+    Returns
+    -------
+    Dict with the analyses keyed by id under 'objects' and the ids not retrieved under 'errors'
+    '''
+    return self._get_many(Analysis, 'analysis', uids, detail=('files', 'params'))
+
   def get_analysis_owner(self, analysis_id):
     '''get owner user for analysis'''
     user_id = self._get_analysis_owner_id(analysis_id)
     return self.get_user(user_id) if user_id else None
 
-  def get_analyses(self, filters={}): # pylint: disable=dangerous-default-value
+  def get_analyses(self, filters={}, concurrency=1): # pylint: disable=dangerous-default-value
     '''Get resource list'''
-    return (Analysis(self.conf.get('api'))).list_all(filters=filters)
+    return (Analysis(self.conf.get('api'))).list_all(filters=filters, concurrency=concurrency)
 
   def get_instances(self):
     '''get all available instances for analysis'''
     res = Instance(self.conf.get('api')).list()
     return res['data']
 
+  def iter_analyses(self, filters={}): # pylint: disable=dangerous-default-value
+    '''Iterate over analyses page by page'''
+    return (Analysis(self.conf.get('api'))).iter_all(filters=filters)
+
+  def iter_analysis_changes(
+    self,
+    ids,
+    final_statuses=FINAL_STATUSES,
+    max_interval=WATCH_MAX_INTERVAL,
+    min_interval=WATCH_MIN_INTERVAL,
+    timeout=None,
+  ): # pylint: disable=too-many-arguments
+    '''
+    Iterate over the status transitions of analyses until they are all finished
+
+    Every poll sends one id__in list query per chunk of analyses, concurrently,
+    asking only for the analyses updated since the last poll of the chunk. The
+    wait between polls adapts to the rate of change, see AnalysisWatcher.
+    Parameters
+    ----------
+    final_statuses: {tuple} Statuses of finished analyses
+    ids:            {list}  Analysis ids [Required]
+    max_interval:   {float} Longest wait between polls, in seconds
+    min_interval:   {float} Shortest wait between polls, in seconds
+    timeout:        {float} Stop after this many seconds
+    Returns
+    -------
+    Generator of (analysis, previous status) tuples, the current status of every
+    analysis being yielded first with a previous status of None. Its return
+    value is the last status by analysis id. It raises IOError when the query
+    of a chunk fails several polls in a row.
+    '''
+    watcher = AnalysisWatcher(ids, final_statuses=final_statuses, max_interval=max_interval, min_interval=min_interval)
+    analysis_api = Analysis(self.conf.get('api'))
+    deadline = time.time() + timeout if timeout else None
+    with ThreadPoolExecutor(max_workers=max(1, min(BULK_CONCURRENCY, len(watcher.chunks)))) as executor:
+      while not watcher.done:
+        queries = watcher.get_queries()
+        pages = executor.map(lambda query: (query[0], analysis_api.list(params=dict(query[1]))), queries)
+        changes = []
+        for index, page in pages:
+          if page.get('error'):
+            eprint('WARNING: Not able to poll analyses: {}'.format(page.get('msg')))
+            watcher.fail(index, page.get('msg'))
+          else:
+            changes += watcher.update(index, page.get('objects') or [])
+        for uid in watcher.drop_missing():
+          eprint('WARNING: analysis {} not found.'.format(uid))
+        for change in changes:
+          yield change
+        interval = watcher.adapt(changes)
+        if watcher.done or (deadline and time.time() + interval > deadline):
+          break
+        time.sleep(interval)
+    return dict(watcher.statuses)
+
   def restart_analysis(self, uid, instance_type):
     '''Restart analysis'''
     payload = {
@@ -385,6 +617,27 @@ class BpApi(): # pylint: disable=too-many-instance-attributes,too-many-public-me
       eprint('analysis {} updated'.format(uid))
     return info
 
+  def watch_analyses(self, ids, on_change=None, **kwargs):
+    '''
+    Wait for analyses to finish, calling back on every status transition
+    Parameters
+    ----------
+    ids:       {list}     Analysis ids [Required]
+    kwargs:    {dict}     final_statuses, min_interval, max_interval and timeout, see iter_analysis_changes
+    on_change: {function} Called with the analysis and its previous status on every transition
+    Returns
+    -------
+    Dict of the last status by analysis id, statuses not final meaning the timeout was reached
+    '''
+    changes = self.iter_analysis_changes(ids, **kwargs)
+    while True:
+      try:
+        analysis, previous = next(changes)
+      except StopIteration as stop:
+        return stop.value
+      if on_change:
+        on_change(analysis, previous)
+
   ################################################################################################
   ### FILE #######################################################################################
   ################################################################################################
@@ -399,6 +652,10 @@ class BpApi(): # pylint: disable=too-many-instance-attributes,too-many-public-me
       cache='{}/json/file.{}.json'.format(self.scratch, uid) if self.use_cache else False,
     )
 
+  def get_files_by_ids(self, uids):
+    '''Get several files in batched requests'''
+    return self._get_many(File, 'file', uids)
+
   def update_file(self, uid, data):
     '''Update file'''
     return (File(self.conf.get('api'))).save(obj_id=uid, payload=data)
@@ -440,6 +697,10 @@ class BpApi(): # pylint: disable=too-many-instance-attributes,too-many-public-me
     info = (Gene(self.conf.get('api'))).list(params)
     return info.get('objects', [])
 
+  def iter_genes(self, filters={}): # pylint: disable=dangerous-default-value
+    '''Iterate over genes page by page'''
+    return (Gene(self.conf.get('api'))).iter_all(filters=filters)
+
   def update_gene(self, uid, data):
     '''Update gene'''
     info = (Gene(self.conf.get('api'))).save(obj_id=uid, payload=data)
@@ -465,9 +726,13 @@ class BpApi(): # pylint: disable=too-many-instance-attributes,too-many-public-me
       cache='{}/json/genome.{}.json'.format(self.scratch, uid) if self.use_cache else False,
     )
 
-  def get_genomes(self, filters={}): # pylint: disable=dangerous-default-value
+  def get_genomes(self, filters={}, concurrency=1): # pylint: disable=dangerous-default-value
     '''Get genomes list'''
-    return (Genome(self.conf.get('api'))).list_all(filters=filters)
+    return (Genome(self.conf.get('api'))).list_all(filters=filters, concurrency=concurrency)
+
+  def iter_genomes(self, filters={}): # pylint: disable=dangerous-default-value
+    '''Iterate over genomes page by page'''
+    return (Genome(self.conf.get('api'))).iter_all(filters=filters)
 
   def update_genome(self, uid, data):
     '''Update genome'''
@@ -508,6 +773,7 @@ class BpApi(): # pylint: disable=too-many-instance-attributes,too-many-public-me
       path = os.path.abspath(os.path.expanduser(os.path.expandvars(data['yamlpath'])))
       with open(path, 'r') as file:
         yaml_string = file.read()
+      import yaml # pylint: disable=import-outside-toplevel
       yaml_data = yaml.load(yaml_string, Loader=yaml.FullLoader)
       if not yaml_data.get('name'):
         sys.exit('ERROR: Please provide module name in YAML')
@@ -557,6 +823,7 @@ class BpApi(): # pylint: disable=too-many-instance-attributes,too-many-public-me
       path = os.path.abspath(os.path.expanduser(os.path.expandvars(data['yamlpath'])))
       with open(path, 'r') as file:
         yaml_string = file.read()
+      import yaml # pylint: disable=import-outside-toplevel
       yaml_data = yaml.load(yaml_string, Loader=yaml.FullLoader)
       module_id = yaml_data.get('id')
       if not yaml_data.get('name'):
@@ -581,6 +848,7 @@ class BpApi(): # pylint: disable=too-many-instance-attributes,too-many-public-me
       path = os.path.abspath(os.path.expanduser(os.path.expandvars(data['yamlpath'])))
       with open(path, 'r') as file:
         yaml_string = file.read()
+      import yaml # pylint: disable=import-outside-toplevel
       yaml_data = yaml.load(yaml_string, Loader=yaml.FullLoader)
       if not yaml_data.get('name'):
         sys.exit('Please provide pipeline name in YAML')
@@ -619,6 +887,10 @@ class BpApi(): # pylint: disable=too-many-instance-attributes,too-many-public-me
     '''Get pipelines list'''
     return Pipeline(self.conf.get('api')).list_all(filters=filters)
 
+  def iter_pipelines(self, filters={}): # pylint: disable=dangerous-default-value
+    '''Iterate over pipelines page by page'''
+    return Pipeline(self.conf.get('api')).iter_all(filters=filters)
+
   def update_pipeline(self, data=None, params=None, pipeline_id=None):
     '''update pipeline from yaml'''
     if data:
@@ -626,6 +898,7 @@ class BpApi(): # pylint: disable=too-many-instance-attributes,too-many-public-me
         path = os.path.abspath(os.path.expanduser(os.path.expandvars(data['yamlpath'])))
         with open(path, 'r') as file:
           yaml_string = file.read()
+        import yaml # pylint: disable=import-outside-toplevel
         yaml_data = yaml.load(yaml_string, Loader=yaml.FullLoader)
         workflow_id = yaml_data.get('id')
         if not yaml_data.get('name'):
@@ -673,6 +946,10 @@ class BpApi(): # pylint: disable=too-many-instance-attributes,too-many-public-me
     '''Get project list'''
     return Project(self.conf.get('api')).list_all(filters=filters)
 
+  def iter_projects(self, filters={}): # pylint: disable=dangerous-default-value
+    '''Iterate over projects page by page'''
+    return Project(self.conf.get('api')).iter_all(filters=filters)
+
   def update_project(self, uid, data, params=None):
     '''Update project'''
     info = Project(self.conf.get('api')).save(
@@ -687,14 +964,24 @@ class BpApi(): # pylint: disable=too-many-instance-attributes,too-many-public-me
   ################################################################################################
   ### SAMPLE #####################################################################################
   ################################################################################################
-  def create_sample(self, data, source='api', upload=True): # pylint: disable=too-many-branches,too-many-locals,too-many-statements
+  def create_sample(self, data, source='api', upload=True, parallel=None, return_timings=False, resume=True): # pylint: disable=too-many-arguments,too-many-branches,too-many-locals,too-many-statements
     '''Create sample with the provided info
 
+    The upload records are created and the files transferred by a pool of
+    workers, each creating a record, sending its file and updating the
+    record status, so the requests and transfers of different files overlap.
+    An unfinished upload of the same sample, i.e. same name, genome, project
+    and files, is resumed when its sample still exists and it is not older
+    than the transfer.sample_resume_ttl conf, one week by default.
+
     Parameters
     ----------
-    data   : {dict}  Dictionary of sample information.
-    source : {str}   source of the request
-    upload : {bool}  Whether to upload the sample to the server or not.
+    data           : {dict}  Dictionary of sample information.
+    parallel       : {int}   Number of files uploaded at once, transfer.parallel conf by default
+    resume         : {bool}  Resume the unfinished upload of the same sample, if any
+    return_timings : {bool}  Return (sample id, per file timings as returned by upload_file)
+    source         : {str}   source of the request
+    upload         : {bool}  Whether to upload the sample to the server or not.
     '''
     data['meta'] = {'source': source}
     # get api version
@@ -727,6 +1014,16 @@ class BpApi(): # pylint: disable=too-many-instance-attributes,too-many-public-me
     if data.get('projects'):
       data['projects'] = ['{}projects/{}'.format(prefix, data['projects'])]
 
+    # continue the unfinished upload of the same files, if any
+    all_files = data.get('filepaths1', []) + data.get('filepaths2', [])
+    journal_identity = [data.get('name'), data.get('genome'), data.get('projects')] + sorted(os.path.abspath(path) for path in all_files)
+    journal = self.transfer_engine.journal if upload and self._use_transfer_engine() else None
+    pending = self._get_pending_sample(journal, journal_identity) if journal and resume else None
+    if pending:
+      eprint('Resuming the upload of sample {}.'.format(pending['sample_id']))
+      timings = self._upload_sample_files(pending, journal, journal_identity, parallel=parallel)
+      return (pending['sample_id'], timings) if return_timings else pending['sample_id']
+
     info = (Sample(self.conf.get('api'))).save(payload=data, datatype='sample')
     if not info.get('id'):
       sys.exit('ERROR: Sample creation failed.')
@@ -739,47 +1036,121 @@ class BpApi(): # pylint: disable=too-many-instance-attributes,too-many-public-me
     if sample_id and self.verbose:  # success
       eprint('created: sample with id', sample_id)
 
-    # do the actual upload, update filepath
-    files_to_upload = []
-    for path in data.get('filepaths1', []):
-      path = os.path.abspath(os.path.expanduser(
-        os.path.expandvars(path)
-      ))
-    for path in data.get('filepaths2', []):
-      path = os.path.abspath(os.path.expanduser(
-        os.path.expandvars(path)
-      ))
-
     # if a sample id exists, then upload the files
     if self.verbose:
       eprint('Sample id: {}'.format(sample_id))
 
-    order = 0
-    all_files = data.get('filepaths1', []) + data.get('filepaths2', [])
-    for filepath in all_files:
-      if self.verbose:
-        eprint('Creating upload {}'.format(filepath))
+    pending = {
+      'files': [{
+        'done': False,
+        'filepath': filepath,
+        'is_paired_end': filepath in data.get('filepaths2', []),
+        'order': order,
+        'upload': None,
+      } for order, filepath in enumerate(all_files)],
+      'created': time.time(),
+      'sample_id': sample_id,
+      'source': source,
+    }
+    if journal:
+      journal.save(pending, 'sample', *journal_identity)
+    timings = self._upload_sample_files(pending, journal, journal_identity, parallel=parallel, upload=upload)
+    return (sample_id, timings) if return_timings else sample_id
 
-      upload_id, filepath, key = self.create_upload(
-        sample_id,
-        filepath,
-        order,
-        is_paired_end=filepath in data.get('filepaths2', []),
-        source=source
-      )
-      files_to_upload.append([upload_id, filepath, key])
-      order += 1
+  def ingest_manifest(self, path, parallel=None, upload=True, validate_only=False, resume=True): # pylint: disable=too-many-arguments
+    '''
+    Create the samples of a csv, tsv or xlsx manifest and upload their files
 
-    if upload:
-      for upload_id, filepath, key in files_to_upload:
-        if self.verbose:
-          eprint('Uploading. upload_id: {}, filepath: {}, key: {}'.format(
-            upload_id,
-            filepath,
-            key
-          ))
-        self.upload_file(upload_id, filepath, key)
-    return sample_id
+    Every row is validated first, resolving each genome and project once, and
+    nothing is created if a row is invalid. Samples are then created by a pool
+    of workers, each uploading the files of its sample. The rows created are
+    recorded in a journal next to the other transfers, so running it again
+    skips them, and resumes the uploads of the rows that did not finish.
+    Parameters
+    ----------
+    parallel:      {int}  Samples created at once, transfer.parallel conf by default
+    path:          {str}  Manifest, see helpers.read_manifest for the columns  [Required]
+    resume:        {bool} Skip and resume the rows of a previous run, see create_sample
+    upload:        {bool} Whether to upload the files
+    validate_only: {bool} Only validate the rows
+    Returns
+    -------
+    Dict with the error messages by row number under 'errors', and when valid, the
+    row reports (row, name, sample_id, status created|skipped|error, error, bytes,
+    seconds, bytes_per_second) under 'rows', plus their aggregate throughput
+    '''
+    rows = read_manifest(path)
+    report = {'errors': self._validate_manifest(rows, upload=upload), 'rows': []}
+    for number, messages in sorted(report['errors'].items()):
+      eprint('ERROR: row {}: {}'.format(number, ' '.join(messages)))
+    if report['errors'] or validate_only:
+      return report
+
+    journal = TransferJournal('{}/.transfers'.format(self.scratch))
+    identity = os.path.abspath(os.path.expanduser(path))
+    record = (journal.get('manifest', identity) if resume else None) or {'rows': {}}
+    lock = threading.Lock()
+
+    def ingest(row):
+      result = {'error': None, 'name': row['name'], 'row': row['row'], 'sample_id': None, 'status': 'skipped'}
+      done = record['rows'].get(row['name'])
+      if done and done['status'] == 'created':
+        result['sample_id'] = done['sample_id']
+        result.update(TransferEngine.get_stats(0, 0))
+        return result
+
+      starttime = time.time()
+      timings = []
+      try:
+        data = {key: row.get(key) for key in ('datatype', 'genome', 'name', 'platform')}
+        data.update({
+          'datatype': data['datatype'] or 'rna-seq',
+          'default_workflow': int(float(row['default_workflow'])) if row.get('default_workflow') else None,
+          'filepaths1': row.get('filepaths1') or [],
+          'filepaths2': row.get('filepaths2') or [],
+          'info': row['info'],
+          'projects': int(float(row['projects'])) if row.get('projects') else None,
+        })
+        result['sample_id'], timings = self.create_sample(
+          data,
+          resume=resume,
+          return_timings=True,
+          source='manifest',
+          upload=upload,
+        )
+        failed = [timing['filepath'] for timing in timings if timing['status'] != 'completed']
+        if failed:
+          result['error'] = 'Not able to upload {}.'.format(', '.join(failed))
+      except (Exception, SystemExit) as error: # pylint: disable=broad-except
+        result['error'] = str(error) or error.__class__.__name__
+      result['status'] = 'error' if result['error'] else 'created'
+      result.update(TransferEngine.get_stats(
+        sum(timing['bytes'] for timing in timings if timing['status'] == 'completed'),
+        time.time() - starttime,
+      ))
+      with lock:
+        if result['sample_id']:
+          record['rows'][row['name']] = {'sample_id': result['sample_id'], 'status': result['status']}
+          journal.save(record, 'manifest', identity)
+      eprint('row {} {}: {} {}'.format(row['row'], row['name'], result['status'], result['error'] or result['sample_id']))
+      return result
+
+    starttime = time.time()
+    parallel = parallel or (self.conf.get('transfer') or {}).get('parallel', TRANSFER_PARALLEL)
+    with ThreadPoolExecutor(max_workers=max(1, min(parallel, len(rows) or 1))) as executor:
+      report['rows'] = list(executor.map(ingest, rows))
+    report.update(TransferEngine.get_stats(sum(row['bytes'] for row in report['rows']), time.time() - starttime))
+    if all(row['status'] != 'error' for row in report['rows']):
+      journal.remove('manifest', identity)
+    eprint('{} created, {} skipped, {} errors, {} bytes in {}s ({:.1f} MB/s)'.format(
+      sum(row['status'] == 'created' for row in report['rows']),
+      sum(row['status'] == 'skipped' for row in report['rows']),
+      sum(row['status'] == 'error' for row in report['rows']),
+      report['bytes'],
+      report['seconds'],
+      report['bytes_per_second'] / 1024 / 1024,
+    ))
+    return report
 
   def delete_sample(self, uid):
     '''Delete sample'''
@@ -804,9 +1175,22 @@ class BpApi(): # pylint: disable=too-many-instance-attributes,too-many-public-me
     user_id = self._get_sample_owner_id(sample_id)
     return self.get_user(user_id) if user_id else None
 
-  def get_samples(self, filters={}): # pylint: disable=dangerous-default-value
+  def get_samples(self, filters={}, concurrency=1): # pylint: disable=dangerous-default-value
     '''Get samples list'''
-    return Sample(self.conf.get('api')).list_all(filters=filters)
+    return Sample(self.conf.get('api')).list_all(filters=filters, concurrency=concurrency)
+
+  def iter_samples(self, filters={}): # pylint: disable=dangerous-default-value
+    '''Iterate over samples page by page'''
+    return Sample(self.conf.get('api')).iter_all(filters=filters)
+
+  def get_samples_by_ids(self, uids):
+    '''
+    Get several samples in batched requests, without their full analyses
+    Returns
+    -------
+    Dict with the samples keyed by id under 'objects' and the ids not retrieved under 'errors'
+    '''
+    return self._get_many(Sample, 'sample', uids)
 
   def samples_by_name(self, name, project_id=None):
     '''Get sample id from name'''
@@ -826,6 +1210,26 @@ class BpApi(): # pylint: disable=too-many-instance-attributes,too-many-public-me
   ################################################################################################
   ### UPLOAD #####################################################################################
   ################################################################################################
+  def cleanup_uploads(self, older_than=7, dry_run=False):
+    '''
+    Abort the unfinished multipart uploads of the user, so their parts stop taking storage
+    Parameters
+    ----------
+    dry_run:    {bool} Only list the uploads that would be aborted
+    older_than: {int}  Days since the upload was initiated
+    Returns
+    -------
+    List of the aborted uploads, dicts with key, upload_id and initiated
+    '''
+    uploads = self.transfer_engine.abort_stale_uploads(
+      dry_run=dry_run,
+      older_than=older_than * 24 * 60 * 60,
+      prefix='uploads/{}/'.format(self.user['id']),
+    )
+    for upload in uploads:
+      eprint('{} {} initiated {}'.format('stale' if dry_run else 'aborted', upload['key'], upload['initiated']))
+    return uploads
+
   def create_upload(self, sample_id, filepath, order, is_paired_end, source='api', uri=None): # pylint: disable=too-many-arguments
     '''Create a upload object and actually upload the file'''
     prefix = self.conf.get('api', {}).get('prefix', '/api/v2/')
@@ -836,7 +1240,7 @@ class BpApi(): # pylint: disable=too-many-instance-attributes,too-many-public-me
       status = 'completed'
     else:
       key = 'uploads/{}/{}/{}'.format(
-        self.conf['user']['id'],
+        self.user['id'],
         sample_id,
         os.path.basename(filepath)
       )
@@ -879,21 +1283,44 @@ class BpApi(): # pylint: disable=too-many-instance-attributes,too-many-public-me
     )
     return info.get('objects', [])
 
+  def get_uploads_by_ids(self, uids):
+    '''Get several uploads in batched requests'''
+    return self._get_many(Upload, 'upload', uids)
+
+  def iter_uploads(self, filters={}): # pylint: disable=dangerous-default-value
+    '''Iterate over uploads page by page'''
+    return (Upload(self.conf.get('api'))).iter_all(filters=filters)
+
   def update_upload(self, uid, data):
     '''Update resource'''
     return (Upload(self.conf.get('api'))).save(obj_id=uid, payload=data)
 
   def upload_file(self, upload_id, filepath, key):
-    '''Upload file to S3 and update info'''
+    '''
+    Upload file to S3 and update info, an interrupted upload is resumed by calling it again
+    Returns
+    -------
+    Timing dict with upload_id, filepath, key, status, bytes, seconds and bytes_per_second
+    '''
     starttime = time.time()
     response = self.copy_file(filepath, key, action='to')
-    seconds_to_upload = int(time.time() - starttime)
+    seconds = time.time() - starttime
+    timing = TransferEngine.get_stats(os.stat(filepath).st_size, seconds)
+    timing.update({
+      'filepath': filepath,
+      'key': key,
+      'status': 'completed' if response else 'failed',
+      'upload_id': upload_id,
+    })
     (Upload(self.conf.get('api'))).save(obj_id=upload_id, payload={
-      'filesize': os.stat(filepath).st_size,
+      'filesize': timing['bytes'],
       'seq_length': 0,
-      'status': 'completed' if response else 'failed',
-      'timetaken': seconds_to_upload,
+      'status': timing['status'],
+      'timetaken': int(seconds),
     })
+    if self.verbose:
+      eprint('{} {} in {}s'.format(timing['status'], filepath, timing['seconds']))
+    return timing
 
   def upload_uri_to_id(self, uri):
     '''Get upload from uri and return upload id'''
@@ -935,18 +1362,25 @@ class BpApi(): # pylint: disable=too-many-instance-attributes,too-many-public-me
     storage_cfg = self.configuration.get_user_storage()
     if not src.startswith('s3://'):
       src = 's3://{}/{}'.format(storage_cfg.get('bucket'), src)
-    cmd = self.get_copy_cmd(src, dest)
     if self.verbose:
       eprint('copying from s3 bucket to {}'.format(' ./'+dest.split('/')[-1]))
+    if self._use_transfer_engine():
+      return self.transfer_engine.download(src, dest)
+    cmd = self.get_copy_cmd(src, dest)
     return self._execute_command(cmd=cmd, retry=3)
 
   def copy_file_to_s3(self, src, dest, params=None):
-    '''Low level function to copy a file to cloud from disk'''
+    '''
+    Low level function to copy a file to cloud from disk.
+    params are aws cli flags, passing them copies with the aws cli.
+    '''
     storage_cfg = self.configuration.get_user_storage()
     dest = 's3://{}/{}'.format(storage_cfg.get('bucket'), dest)
-    cmd = self.get_copy_cmd(src, dest, sse=True, params=params)
     if self.verbose:
       eprint('copying from {} to {}'.format(src, dest))
+    if self._use_transfer_engine() and not params:
+      return self.transfer_engine.upload(src, dest, sse=True)
+    cmd = self.get_copy_cmd(src, dest, sse=True, params=params)
     return self._execute_command(cmd=cmd)
 
   def download_file(self, filekey, uid=None, filename=None, file_type=None, dirname=None, is_json=False, load=False): # pylint: disable=too-many-arguments,too-many-branches
@@ -985,18 +1419,19 @@ class BpApi(): # pylint: disable=too-many-instance-attributes,too-many-public-me
       elif uid:
         suffix = 'basepair/{}'.format(uid)
       added_path = os.path.join(prefix, suffix)
-      if not os.path.isdir(added_path):
-        os.makedirs(added_path)
+      os.makedirs(added_path, exist_ok=True)
       # rename the file if filename present otherwise use filekey
       filepath = os.path.join(added_path, os.path.basename(filename if filename else filekey))
       filepath = os.path.expanduser(filepath)
-      # if file not already there, download it
-      if not os.path.exists(filepath) or os.path.getsize(filepath) == 0:
+      # if file not already there, download it. The transfer engine checks
+      # the file against the storage object and skips it when current
+      if self._use_transfer_engine() or not os.path.exists(filepath) or os.path.getsize(filepath) == 0:
         if self.verbose:
           eprint('downloading'+' ./ {}'.format(filepath.split('/')[-1]))
-        if not os.path.exists(os.path.dirname(filepath)):
-          os.makedirs(os.path.dirname(filepath))
-        self.copy_file(filekey, filepath, action='from')
+        os.makedirs(os.path.dirname(filepath), exist_ok=True)
+        copied = self.copy_file(filekey, filepath, action='from')
+        if not copied and self._use_transfer_engine():
+          return False
       elif self.verbose:
         eprint('exists'+' ./ {}'.format(filepath.split('/')[-1]))
 
@@ -1007,32 +1442,154 @@ class BpApi(): # pylint: disable=too-many-instance-attributes,too-many-public-me
     except Exception:# pylint: disable=bare-except
       return False
 
-  def download_raw_files(self, sample, file_type=None, outdir=None, uid=None,):
+  def download_files(self, jobs, parallel=None):
+    '''
+    Download files concurrently, largest first
+    Parameters
+    ----------
+    jobs:     {list} Dicts with the download_file arguments (filekey, dirname, file_type, filename, uid)
+                     and the optional size of the file in bytes                              [Required]
+    parallel: {int}  Number of files downloaded at once, transfer.parallel conf by default
+    Returns
+    -------
+    Dict with the downloaded path by filekey under 'files', the error message by
+    filekey under 'errors', and the aggregate bytes, seconds and bytes_per_second
+    '''
+    manager = DownloadManager(
+      self.download_file,
+      parallel=parallel or (self.conf.get('transfer') or {}).get('parallel', TRANSFER_PARALLEL),
+      verbose=bool(self.verbose),
+    )
+    for job in jobs:
+      manager.add(**job)
+    report = manager.run()
+    for filekey, error in report['errors'].items():
+      eprint('ERROR: {} {}'.format(filekey, error))
+    return report
+
+  def download_raw_files(self, sample, file_type=None, outdir=None, uid=None, parallel=None): # pylint: disable=too-many-arguments
     '''
     Download raw data associated with a sample
     Parameters
     ----------
     file_type: {str}  Datatype to be downloaded
     outdir:    {str}  Output directory to save files to
+    parallel:  {int}  Number of files downloaded at once
     sample:    {dict} From calling bp.get_sample()       [Required]
     uid:       {int}  unique id for the datatype
     '''
     try:
       uploads = sample['uploads']
-      files = [(upload.get('uri') or upload.get('key')) for upload in uploads]
-      if not files:
+      jobs = [{
+        'dirname': outdir,
+        'file_type': file_type,
+        'filekey': upload.get('uri') or upload.get('key'),
+        'size': self._get_file_size(upload),
+        'uid': uid,
+      } for upload in uploads]
+      if not jobs:
         eprint('Warning: No files present for sample with id {}'.format(uid))
         return False
-      results = []
-      for file_i in files:
-        result = self.download_file(file_i, file_type=file_type, uid=uid, dirname=outdir)
-        results.append(result)
-      return all(results)
+      report = self.download_files(jobs, parallel=parallel)
+      return not report['errors']
     except Exception:# pylint: disable=broad-except
       return False
 
+  def expression_matrix(self, samples=None, project_id=None, features='genes', parallel=None):
+    '''
+    Build a feature x sample matrix of the expression counts of samples
+
+    Count files are downloaded concurrently and every sample column is cached in
+    {scratch}/expression/{features} with the version of its count file, so a later
+    call only downloads and parses the samples whose count file changed, and reuses
+    the memory mapped matrix when none did.
+    Parameters
+    ----------
+    features:   {str}  genes or transcripts
+    parallel:   {int}  Number of files downloaded at once
+    project_id: {int}  Use the samples of a project
+    samples:    {list} Sample dicts or ids
+    Returns
+    -------
+    ExpressionMatrix, rows aligned on the feature ids, columns the sample ids.
+    Samples without a count file are left out with a warning.
+    '''
+    if features not in EXPRESSION_COUNT_TAGS:
+      raise ValueError('Invalid features {}, expected genes or transcripts.'.format(features))
+    if project_id:
+      samples = self.get_samples(filters={'projects__exact': project_id})
+    samples = list(samples or [])
+    ids = [sample for sample in samples if not isinstance(sample, dict)]
+    if ids:
+      fetched = self.get_samples_by_ids(ids)['objects']
+      samples = [sample if isinstance(sample, dict) else fetched.get(str(sample)) for sample in samples]
+      samples = [sample for sample in samples if sample]
+    with ThreadPoolExecutor(max_workers=min(8, max(1, len(samples)))) as executor:
+      list(executor.map(
+        lambda sample: sample.get('analyses_full') is not None or self._add_full_analysis(sample),
+        samples,
+      ))
+
+    store = ExpressionStore('{}/expression/{}'.format(self.scratch, features))
+    sample_ids, jobs, versions = [], {}, {}
+    for sample in samples:
+      filekey = self.get_file_by_tags(
+        sample,
+        analysis_tags=['alignment'],
+        download=False,
+        kind='exact',
+        tags=EXPRESSION_COUNT_TAGS[features],
+      )
+      if not filekey:
+        eprint('WARNING: no {} count file for sample {}, skipping.'.format(features, sample['id']))
+        continue
+      file = self._find_file(sample, filekey) or {}
+      versions[sample['id']] = '{}@{}'.format(filekey, file.get('last_updated'))
+      sample_ids.append(sample['id'])
+      if store.get_version(sample['id']) != versions[sample['id']]:
+        jobs[filekey] = {'file_type': 'samples', 'filekey': filekey, 'size': self._get_file_size(file), 'uid': sample['id']}
+
+    report = self.download_files(list(jobs.values()), parallel=parallel)
+    for filekey, job in jobs.items():
+      if filekey not in report['files']:
+        raise IOError('Not able to download the count file {} of sample {}.'.format(filekey, job['uid']))
+      store.save(job['uid'], versions[job['uid']], *parse_counts(report['files'][filekey]))
+    return store.matrix(sample_ids)
+
+  def fetch_region(self, sample, region, tags=None, analysis_tags=None, kind='exact', resolution=None): # pylint: disable=too-many-arguments
+    '''
+    Get the records of a region of an indexed sample file, without downloading it
+
+    Only the index and the blocks overlapping the region are read from the storage,
+    e.g. bp.fetch_region(sample, 'chr12:170,000,000-170,300,000', tags=['bam'])
+    Parameters
+    ----------
+    analysis_tags: {list} Analysis tags to filter analyses when looking for the file
+    kind:          {str}  Type of tag filtering to do. Options: exact, diff, or subset
+    region:        {str}  Region, e.g. chr12:170,000,000-170,300,000, or a whole sequence   [Required]
+    resolution:    {int}  bigWig only, bases per value to read a zoom level
+    sample:        {dict} Sample information, with analyses_full                           [Required]
+    tags:          {list} Tags of the file: bam (default), bigwig or a bgzipped tabix file
+    Returns
+    -------
+    List of alignment dicts for bam, of field lists for tabix, of interval dicts for bigWig,
+    False if no file matches the tags
+    '''
+    filekey = self.get_file_by_tags(
+      sample,
+      analysis_tags=analysis_tags,
+      download=False,
+      kind=kind,
+      tags=tags or ['bam'],
+    )
+    if not filekey:
+      return False
+    if not filekey.startswith('s3://'):
+      filekey = 's3://{}/{}'.format(self.configuration.get_user_storage().get('bucket'), filekey)
+    return self.region_reader.fetch(filekey, region, resolution=resolution)
+
   @classmethod
-  def filter_files_by_tags(cls, files, tags, exclude=None, kind='exact', multiple=False): # pylint: disable=too-many-arguments
+  def filter_files_by_tags(cls, files, tags, exclude=None, kind='exact', multiple=False, index=None): # pylint: disable=too-many-arguments
     '''
     Filter files that have all the tags. If exclude tags provided,
     only return the files that don't have the exclude tags.append
@@ -1043,6 +1600,7 @@ class BpApi(): # pylint: disable=too-many-instance-attributes,too-many-public-me
     tags:     {list}  List of tags                                      [Required]
     kind:     {str}   Type of tag filtering. Options: exact, subset
     exclude:  {list}  List of tags to exclude
+    index:    {obj}   FileIndex of the files, built when not provided
     multiple: {bool}  Whether to return all matching files or only one
     Returns
     -------
@@ -1056,16 +1614,8 @@ class BpApi(): # pylint: disable=too-many-instance-attributes,too-many-public-me
       eprint('Invalid tags argument. Provide a list of tags.')
       return None
 
-    # filter for matches
-    files = [
-      file for file in files if file['tags'] and getattr(SetFilter, kind)(tags, file['tags'])
-    ]
-
-    # exclude files by tag
-    if exclude:
-      files = [
-        file for file in files if file['tags'] and SetFilter.diff(file['tags'], exclude)
-      ]
+    # filter for matches, excluding files by tag
+    files = (index or FileIndex(files)).query(tags, kind=kind, exclude=exclude)
 
     # check if no files left after filtering
     if len(files) == 0:
@@ -1080,7 +1630,7 @@ class BpApi(): # pylint: disable=too-many-instance-attributes,too-many-public-me
       return files[0:1]
     return files
 
-  def get_analysis_files(self, analysis, uid, dirname=None, kind='exact', tags=None):  # pylint: disable=too-many-arguments
+  def get_analysis_files(self, analysis, uid, dirname=None, kind='exact', tags=None, parallel=None):  # pylint: disable=too-many-arguments
     '''
     For a analysis, go through files and get that match the tags
     Parameters
@@ -1088,9 +1638,25 @@ class BpApi(): # pylint: disable=too-many-instance-attributes,too-many-public-me
     analysis: {dict}  The dictionary returned by bp.get_analysis()  [Required]
     dirname:  {str}   Directory to download files to
     kind:     {str}   Type of tag filtering. Options: exact, subset
+    parallel: {int}   Number of files downloaded at once
     tags:     {list}  List of lists of tags to filter by
     uid:      {int}   Unique analysis id
     '''
+    jobs = self.get_analysis_file_jobs(analysis, uid, dirname=dirname, kind=kind, tags=tags)
+    if jobs is False:
+      return False
+    if not jobs:
+      return None
+    report = self.download_files(jobs, parallel=parallel)
+    return [report['files'].get(job['filekey'], False) for job in jobs]
+
+  def get_analysis_file_jobs(self, analysis, uid, dirname=None, kind='exact', tags=None): # pylint: disable=too-many-arguments
+    '''
+    Get the download jobs, as taken by download_files, of the analysis files matching the tags
+    Returns
+    -------
+    List of jobs, False if the tags are not valid
+    '''
     # some input checking
     if tags:
       is_not_valid = not (isinstance(tags, list) and all((isinstance(item, list) for item in tags)))
@@ -1106,18 +1672,20 @@ class BpApi(): # pylint: disable=too-many-instance-attributes,too-many-public-me
       files = self.filter_files_by_tags(
         analysis['files'],
         tags_sub,
+        index=self._get_file_index(analysis),
         kind=kind,
         multiple=True,
       )
       if files:
         matching_files += files
 
-    return [self.download_file(
-      matching_file['path'],
-      dirname=dirname,
-      uid=uid,
-      file_type='analyses'
-    ) for matching_file in matching_files] if matching_files else None
+    return [{
+      'dirname': dirname,
+      'file_type': 'analyses',
+      'filekey': matching_file['path'],
+      'size': self._get_file_size(matching_file),
+      'uid': uid,
+    } for matching_file in matching_files]
 
   def get_bam_file(self, sample, tags=None, multiple=False):
     '''Get bam file. If you want deduped bam file, call with tags = ['bam', 'dedup']'''
@@ -1167,9 +1735,7 @@ class BpApi(): # pylint: disable=too-many-instance-attributes,too-many-public-me
 
   def get_expression_count_file(self, sample, features='transcripts', multiple=False):
     '''Get expression count text file - for RNA-Seq'''
-    tags = ['expression_count', 'by_transcript', 'text']
-    if features == 'genes':
-      tags = ['expression_count', 'by_gene', 'text']
+    tags = EXPRESSION_COUNT_TAGS['genes' if features == 'genes' else 'transcripts']
     if self.verbose:
       eprint('getting file w tags', tags)
     return self.get_file_by_tags(
@@ -1247,6 +1813,7 @@ class BpApi(): # pylint: disable=too-many-instance-attributes,too-many-public-me
     file_type=None,
     kind='exact',
     multiple=False,
+    parallel=None,
     tags=None,
     uid=None
     #workflow_id=None,
@@ -1263,6 +1830,7 @@ class BpApi(): # pylint: disable=too-many-instance-attributes,too-many-public-me
     file_type:     {str}  Datatype to download ex - analyses, file, sample
     kind:          {str}  Type of tag filtering to do. Options: exact, diff, or subset
     multiple:      {bool} Whether to return multiple files or just the first one
+    parallel:      {int}  Number of files downloaded at once when multiple
     sample:        {dict} Sample information   [Required]
     tags:          {list} List of list of tags for file filtering. If just list of tags, will convert to list of lists.
     uid:           {int}  Workflow id to look for files in.
@@ -1279,7 +1847,6 @@ class BpApi(): # pylint: disable=too-many-instance-attributes,too-many-public-me
           tags = [tags]
 
       matches = []
-      matching_file = []
       for analysis in sample['analyses_full']:
         if analysis['status'] == 'error':
           eprint('analysis ended in error, skipping.')
@@ -1306,11 +1873,14 @@ class BpApi(): # pylint: disable=too-many-instance-attributes,too-many-public-me
 
         if self.verbose:
           eprint('looking at', analysis['id'], 'status', analysis['status'])
+        index = self._get_file_index(analysis)
+        matching_file = []
         for tags_sub in tags:
           filtered_files = self.filter_files_by_tags(
             analysis['files'],
             tags_sub,
             exclude=exclude,
+            index=index,
             kind=kind,
             multiple=multiple,
           )
@@ -1332,16 +1902,26 @@ class BpApi(): # pylint: disable=too-many-instance-attributes,too-many-public-me
         return False
 
       if len(matches) > 1:
-        matches.sort(
-          key=lambda match: datetime.datetime.strptime(match[1]['last_updated'], '%Y-%m-%dT%H:%M:%S.%f'),
-          reverse=True,
-        )
+        matches.sort(key=lambda match: FileIndex.parse_timestamp(match[1]['last_updated']), reverse=True)
         if not multiple:
           eprint('WARNING: multiple matching file for', tags)
         for match in matches:
           eprint('\t', match[1]['last_updated'], match[1]['path'])
 
       filepath = []
+      # matches downloaded to one dest are done serially, they would race on its path
+      if download and multiple and (not dest or len(matches) == 1):
+        jobs = [{
+          'dirname': dest or dirname,
+          'file_type': file_type,
+          'filekey': match[1]['path'],
+          'filename': dest,
+          'size': self._get_file_size(match[1]),
+          'uid': uid,
+        } for match in matches]
+        report = self.download_files(jobs, parallel=parallel)
+        return [report['files'][job['filekey']] for job in jobs if job['filekey'] in report['files']]
+
       for match in matches:
         if download:
           path = self.download_file(match[1]['path'], dirname=dest, filename=dest, file_type=file_type, uid=uid) if dest \
@@ -1387,6 +1967,11 @@ class BpApi(): # pylint: disable=too-many-instance-attributes,too-many-public-me
     )
     return self.download_file(filekey, filename, load=True, is_json=True)
 
+  @staticmethod
+  def get_pool_stats():
+    '''Get connection reuse stats of the pooled webapp sessions'''
+    return SessionPool.stats()
+
   def get_id_from_url(self, url):
     '''Parse URL to get the id'''
     return self.parse_url(url)['id']
@@ -1416,25 +2001,92 @@ class BpApi(): # pylint: disable=too-many-instance-attributes,too-many-public-me
       suffix,
     )
 
+  @staticmethod
+  def load_conf(conf=None):
+    '''
+    Get the api conf from the argument, BP_CONFIG_FILE or BP_USERNAME and BP_API_KEY
+    Parameters
+    ----------
+    conf: {dict} Conf to use as is
+    '''
+    if not conf:
+      if 'BP_CONFIG_FILE' in os.environ:
+        conf = json.load(open(os.environ['BP_CONFIG_FILE']))
+      else:
+        if 'BP_USERNAME' not in os.environ:
+          sys.exit('ERROR: BP_USERNAME not set in env')
+        if 'BP_API_KEY' not in os.environ:
+          sys.exit('ERROR: BP_API_KEY not set in env')
+        conf = {
+          'api': {
+            'key': os.environ['BP_API_KEY'],
+            'host': 'app.basepairtech.com',
+            'prefix': '/api/v2/',
+            'ssl': True,
+            'username': os.environ['BP_USERNAME'],
+          }
+        }
+
+    if conf.get('api', {}).get('ssl') is None:
+      sys.exit('ERROR: The config file need to be updated. Please visit:\n \
+                https://test.basepairtech.com/api/v2/users/api_key\n \
+                To get your new config file.')
+    return conf
+
+  def open_file(self, filekey, mode='rb', compression='infer', chunk_size=None, read_ahead=None): # pylint: disable=too-many-arguments
+    '''
+    Open a file of the storage as a seekable stream, without downloading it
+
+    The file is read with ranged GETs of chunk_size bytes, prefetching the next
+    read_ahead chunks, so memory stays constant whatever the file size. Use it
+    as a context manager, e.g. to count the lines of a gzipped text output:
+
+    > with bp.open_file('path/to/counts.txt.gz', mode='rt') as handle:
+    >   lines = sum(1 for line in handle)
+
+    Parameters
+    ----------
+    chunk_size:  {int} Bytes per ranged GET, default is the transfer part_size
+    compression: {str} infer: gzip for .gz and .bgz keys, gzip or None to force it
+    filekey:     {str} s3:// uri or key in the storage bucket                        [Required]
+    mode:        {str} rb for bytes, r or rt to iterate text lines
+    read_ahead:  {int} Chunks fetched ahead of the reader
+    '''
+    storage_cfg = self.configuration.get_user_storage()
+    if not filekey.startswith('s3://'):
+      filekey = 's3://{}/{}'.format(storage_cfg.get('bucket'), filekey)
+    kwargs = {'chunk_size': chunk_size or (self.conf.get('transfer') or {}).get('part_size', TRANSFER_PART_SIZE)}
+    if read_ahead is not None:
+      kwargs['read_ahead'] = read_ahead
+    return self.storage.open(filekey, mode=mode, compression=compression, **kwargs)
+
   @classmethod
   def parse_url(cls, url):
     '''Parse URL to get the id, and other stuff'''
     parts = url.rsplit('/', 1)
     return {'id': parts[1]}
 
-  def print_data(self, data_type='', is_json=False, uid=None, project=None): # pylint: disable=too-many-branches
+  def print_data(self, data_type='', is_json=False, uid=None, project=None, output_format=None, fields=None): # pylint: disable=too-many-arguments,too-many-branches
     '''
     Print data associated with genomes, samples, etc.
     Parameters
     ----------
-    data_type: {str}   Type of data to print (e.g. workflows)
-    is_json:   {bool}  By default, data is printed in a human-readable format
-    project:   {int}   Project id to filter data
-    uid:       {list}  One or more ids of the objects you want
+    data_type:     {str}   Type of data to print (e.g. workflows)
+    fields:        {list}  Fields printed with an output_format, dotted for nested ones, e.g. meta.num_reads
+    is_json:       {bool}  Same as the ndjson output_format
+    output_format: {str}   ndjson, csv, tsv or table, to print the data to stdout page by page as it is
+                           received. By default, the full data is printed in a human-readable format
+    project:       {int}   Project id to filter data
+    uid:           {list}  One or more ids of the objects you want
+    Returns
+    -------
+    Whether some data was found
     '''
 
     if not isinstance(uid, list):
       uid = [uid]
+    if is_json and not output_format:
+      output_format = 'ndjson'
 
     detail_methods = {
       'analysis': 'get_analysis',
@@ -1453,6 +2105,31 @@ class BpApi(): # pylint: disable=too-many-instance-attributes,too-many-public-me
       'samples': 'get_samples',
     }
 
+    # lists that can be streamed page by page
+    iter_methods = {
+      'analyses': 'iter_analyses',
+      'genomes': 'iter_genomes',
+      'pipelines': 'iter_pipelines',
+      'projects': 'iter_projects',
+      'samples': 'iter_samples',
+    }
+
+    filters = {}
+    if project:
+      filters['projects__exact'] = project
+
+    # stream the data as it is received
+    if output_format:
+      if data_type in detail_methods:
+        items = (item for item in map(getattr(self, detail_methods[data_type]), uid) if item.get('id'))
+      elif data_type in iter_methods:
+        items = getattr(self, iter_methods[data_type])(filters=filters)
+      else:
+        items = getattr(self, list_methods[data_type])(uid[0])
+      if output_format != 'ndjson':
+        fields = fields or PRINT_FIELDS.get(data_type)
+      return self._print_stream([items] if isinstance(items, dict) else items, output_format, fields)
+
     # get the appropriate data
     data = []
 
@@ -1463,10 +2140,6 @@ class BpApi(): # pylint: disable=too-many-instance-attributes,too-many-public-me
         if data_tmp.get('id'):
           data.append(data_tmp)
 
-    filters = {}
-    if project:
-      filters['projects__exact'] = project
-
     # if it is a list
     if data_type in list_methods:
       method = list_methods.get(data_type)
@@ -1483,24 +2156,149 @@ class BpApi(): # pylint: disable=too-many-instance-attributes,too-many-public-me
       eprint(data.get('msg', 'Error retrieving data.'))
       return True
 
-    # print the data as json
-    if is_json:
-      for item in data:
-        eprint(item)
-        eprint()
-      return True
-
     # print the data human readable
     getattr(NicePrint, data_type)(data)
     return True
 
+  def query_catalog(self, kind='files', refresh=True, sql=None, params=(), **filters):
+    '''
+    Query the local metadata catalog, e.g. the dedup bams of the hg38 samples of a project updated this month:
+
+    > bp.query_catalog('files', tags=['dedup', 'bam'], genome='hg38', project_id=12, updated_after='2024-06-01')
+
+    Parameters
+    ----------
+    filters: {dict} Filters of the kind, see the analyses, files and samples methods of MetadataCatalog
+    kind:    {str}  analyses, files or samples
+    params:  {list} Parameters of the sql query
+    refresh: {bool} Refresh the catalog once before the query
+    sql:     {str}  Select query run instead, on the tables of helpers.metadata_catalog.SCHEMA
+    Returns
+    -------
+    List of the matching objects, or of the rows of the sql query
+    '''
+    if refresh:
+      self.refresh_catalog()
+    if sql:
+      return self.catalog.execute(sql, params)
+    if kind not in ('analyses', 'files', 'samples'):
+      raise ValueError('Unknown catalog kind {}, use analyses, files or samples.'.format(kind))
+    return getattr(self.catalog, kind)(**filters)
+
+  def refresh_catalog(self, resources=CATALOG_RESOURCES, full=False):
+    '''
+    Fetch the objects updated since the last refresh into the local catalog
+    Parameters
+    ----------
+    full:      {bool} Fetch every object and drop the ones deleted remotely
+    resources: {list} Resources among genomes, samples, analyses, files and uploads
+    Returns
+    -------
+    Dict of the number of objects fetched by resource, or of the error message
+    '''
+    counts = self.catalog.refresh(resources=resources, full=full)
+    if self.verbose:
+      eprint('catalog refreshed: {}'.format(', '.join('{} {}'.format(count, resource) for resource, count in counts.items())))
+    return counts
+
+  def sync(self, project_id, dest, tags=None, kind='exact', prune=False, dry_run=False, parallel=None): # pylint: disable=too-many-arguments,too-many-locals
+    '''
+    Mirror the analysis files of a project in a local directory
+
+    The remote files are listed from the metadata catalog, refreshed once,
+    with their etags from one storage listing per analysis, and compared with
+    the manifest of the mirror. Only the new and changed files are downloaded,
+    concurrently, so syncing an unchanged project makes no request per file.
+    Files are mirrored under their storage path.
+    Parameters
+    ----------
+    dest:       {str}  Mirror directory  [Required]
+    dry_run:    {bool} Only report what would be transferred and pruned
+    kind:       {str}  Type of tag filtering. Options: exact, subset
+    parallel:   {int}  Number of files downloaded at once, transfer.parallel conf by default
+    project_id: {int}  Project id  [Required]
+    prune:      {bool} Delete the mirrored files that are not in the project anymore
+    tags:       {list} List of lists of tags to filter by
+    Returns
+    -------
+    Dict with the paths transferred and pruned, the number of unchanged files,
+    the error message by path under 'errors', and the bytes, seconds and
+    bytes_per_second of the transfers
+    '''
+    if tags and not (isinstance(tags, list) and all(isinstance(item, list) for item in tags)):
+      raise ValueError('Invalid tags argument. Provide a list of list of tags.')
+    counts = self.refresh_catalog(resources=('samples', 'analyses', 'files'))
+    files = self.query_catalog('files', refresh=False, project_id=project_id)
+    failed = sorted(resource for resource, count in counts.items() if not isinstance(count, int))
+    if prune and (failed or not files): # an incomplete catalog would prune the whole mirror
+      eprint('WARNING: Not pruning, {}.'.format(
+        'not able to refresh the {}'.format(', '.join(failed)) if failed else 'the project has no files',
+      ))
+      prune = False
+    if tags:
+      index = FileIndex(files)
+      files = list({item['path']: item for tags_sub in tags for item in index.query(tags_sub, kind=kind)}.values())
+    remote = {item['path']: {
+      'analysis_id': item.get('analysis_id'),
+      'etag': None,
+      'last_updated': item.get('last_updated'),
+      'size': self._get_file_size(item) or None,
+    } for item in files if item.get('path')}
+    self._add_storage_etags(remote, parallel=parallel)
+
+    manifest = SyncManifest(dest)
+    report = {'errors': {}, 'pruned': [], 'transferred': [], 'unchanged': 0}
+    jobs = []
+    for path, state in sorted(remote.items()):
+      try:
+        local_path = manifest.get_local_path(path)
+      except ValueError as error:
+        report['errors'][path] = str(error)
+        continue
+      if manifest.is_current(path, state):
+        report['unchanged'] += 1
+      else:
+        jobs.append({'dirname': os.path.dirname(local_path), 'filekey': path, 'size': state['size'] or 0})
+    stale = sorted(path for path in manifest.entries if path not in remote) if prune else []
+
+    if dry_run:
+      report.update(TransferEngine.get_stats(0, 0), pruned=stale, transferred=[job['filekey'] for job in jobs])
+      return report
+
+    for job in jobs: # downloaded next to the local copy, which is only replaced once complete
+      job['filename'] = '.{}{}'.format(os.path.basename(job['filekey']), SYNC_TMP_SUFFIX)
+      tmp_path = os.path.join(job['dirname'], job['filename'])
+      if os.path.isfile(tmp_path):
+        os.remove(tmp_path)
+    transfers = self.download_files(jobs, parallel=parallel)
+    for path, tmp_path in transfers['files'].items():
+      os.replace(tmp_path, manifest.get_local_path(path))
+      manifest.set(path, remote[path])
+      report['transferred'].append(path)
+    report['errors'].update(transfers['errors'])
+    for path in stale:
+      local_path = manifest.get_local_path(path)
+      if os.path.isfile(local_path):
+        os.remove(local_path)
+      manifest.remove(path)
+      report['pruned'].append(path)
+    manifest.save()
+    report.update({key: transfers[key] for key in ('bytes', 'bytes_per_second', 'seconds')})
+    eprint('{} transferred, {} unchanged, {} pruned, {} errors.'.format(
+      len(report['transferred']),
+      report['unchanged'],
+      len(report['pruned']),
+      len(report['errors']),
+    ))
+    return report
+
   ### Private methods ###
   def _add_full_analysis(self, sample):
     '''Add full analysis info to the sample'''
     analysis_ids = [self.parse_url(uri)['id'] for uri in sample.get('analyses', [])]
-    analyses = [self.get_analysis(uid) for uid in analysis_ids]
-    # remove null analyses, probably deleted or no ownership
-    analyses = [analysis for analysis in analyses if not analysis.get('error')]
+    found = self.get_analyses_by_ids(analysis_ids)['objects'] if analysis_ids else {}
+    # skip missing analyses, probably deleted or no ownership
+    analyses = [found[uid] for uid in analysis_ids if uid in found]
     # sort them by latest updated
     analyses.sort(
       key=lambda analysis: datetime.datetime.strptime(analysis.get('last_updated'), '%Y-%m-%dT%H:%M:%S.%f'),
@@ -1509,6 +2307,37 @@ class BpApi(): # pylint: disable=too-many-instance-attributes,too-many-public-me
     sample['analyses_full'] = analyses
     return sample
 
+  def _add_storage_etags(self, remote, parallel=None):
+    '''
+    Set the etag and size of remote files, by path, from one storage listing per analysis,
+    leaving the etag unset, i.e. unknown, for the files missing from a listing or whose
+    storage can not be listed
+    '''
+    prefixes = {}
+    for path, state in remote.items():
+      prefixes.setdefault(state['analysis_id'], []).append(path)
+    prefixes = [
+      paths[0] if len(paths) == 1 else os.path.commonpath(paths).rstrip('/') + '/'
+      for paths in prefixes.values()
+    ]
+
+    def list_prefix(prefix):
+      try:
+        return self.storage.list(prefix)
+      except Exception as error: # pylint: disable=broad-except
+        eprint('WARNING: Not able to list {}: {}'.format(prefix, error))
+        return []
+
+    if not prefixes:
+      return
+    parallel = parallel or (self.conf.get('transfer') or {}).get('parallel', TRANSFER_PARALLEL)
+    with ThreadPoolExecutor(max_workers=max(1, min(parallel, len(prefixes)))) as executor:
+      for objects in executor.map(list_prefix, prefixes):
+        for obj in objects or []:
+          state = remote.get(obj.get('Key'))
+          if state is not None:
+            state.update(etag=(obj.get('ETag') or '').strip('"') or None, size=obj.get('Size', state['size']))
+
   def _execute_command(self, cmd=None, retry=5, current_try=0):
     '''Execute s3 commands'''
     sleep_time = 3
@@ -1536,40 +2365,342 @@ class BpApi(): # pylint: disable=too-many-instance-attributes,too-many-public-me
       eprint('multiple matches for node:', node)
     return files[0]
 
+  @staticmethod
+  def _find_file(sample, filekey):
+    '''File of the analyses of a sample with a path'''
+    for analysis in sample.get('analyses_full') or []:
+      for file in analysis.get('files') or []:
+        if file.get('path') == filekey:
+          return file
+    return None
+
+  def _get_account_key(self):
+    '''File name safe key of the api host and username, for the files of one account'''
+    api_cfg = self.conf.get('api') or {}
+    key = '{}.{}'.format(api_cfg.get('host'), api_cfg.get('username'))
+    return ''.join(char if char.isalnum() or char in '-.' else '_' for char in key)
+
+  def _get_analysis_data(
+    self,
+    workflow_id,
+    sample_ids,
+    control_ids=None,
+    ignore_validation_warnings=False,
+    instance_type=None,
+    project_id=None,
+  ): # pylint: disable=too-many-arguments
+    '''Analysis payload of a workflow on samples'''
+    prefix = self.conf.get('api', {}).get('prefix', '/api/v2/')
+    data = {
+      'controls': self._parsed_sample_list(control_ids or [], prefix),
+      'samples': self._parsed_sample_list(sample_ids, prefix),
+      'ignore_validation_warning': ignore_validation_warnings,
+      'meta': {'source': 'cli'},
+      'workflow': '{}pipelines/{}'.format(prefix, workflow_id)
+    }
+
+    if instance_type:
+      data['instance'] = instance_type
+
+    if project_id:
+      data['projects'] = ['{}projects/{}'.format(prefix, project_id)]
+    return data
+
   def _get_analysis_owner_id(self, analysis_id):
     '''Get analysis owner id'''
     info = self.get_analysis(analysis_id)
     return self.parse_url(info['owner'])['id'] if info else None
 
+  @staticmethod
+  def _get_bulk_result(response, status):
+    '''Result of one call of a bulk operation, with the status it gets when it succeeded'''
+    response = response if isinstance(response, dict) else {}
+    if response.get('error') or response.get('error_msgs'):
+      return {'error': str(response.get('msg') or response.get('error_msgs') or response['error']), 'status': 'error'}
+    if response.get('warning') or response.get('warning_msgs'):
+      return {'error': str(response.get('warning_msgs') or response['warning']), 'status': 'warning'}
+    return {'error': None, 'status': status}
+
+  def _get_file_index(self, analysis):
+    '''Get the FileIndex of an analysis, reused while the analysis is unchanged'''
+    key = (analysis.get('id'), analysis.get('last_updated'), len(analysis.get('files') or []))
+    index = self._file_indexes.pop(key, None)
+    if index is None:
+      index = FileIndex(analysis.get('files') or [])
+    self._file_indexes[key] = index
+    if len(self._file_indexes) > FILE_INDEX_CACHE_SIZE:
+      self._file_indexes.popitem(last=False)
+    return index
+
+  @staticmethod
+  def _get_file_size(file):
+    '''Size in bytes of a file or upload object, 0 when unknown'''
+    try:
+      return int(file.get('filesize') or file.get('size') or 0)
+    except (TypeError, ValueError):
+      return 0
+
   def _get_genome_by_name(self, genome_name):
     '''Check if the genome is in the Basepair database'''
     if genome_name:
-      available_genomes = [item for item in self.genomes if item.get('name') == genome_name]
-      if not available_genomes:
+      genome = self.genome_catalog.by_name(genome_name)
+      if not genome:
         eprint(
           'The provided genome, {}, does not exist in Basepair. Proceeding anyway...'.format(genome_name)
         )
         return None
-      return available_genomes[0].get('resource_uri')
+      return genome.get('resource_uri')
     return None
 
+  def _get_many(self, resource, kind, uids, detail=()):
+    '''
+    Get several resources at once, using the json cache when enabled. The list
+    queries may leave out detail fields, the objects missing one of the detail
+    fields are fetched one by one.
+    '''
+    result = {'errors': {}, 'objects': {}}
+    missing = []
+    for uid in uids:
+      cache = '{}/json/{}.{}.json'.format(self.scratch, kind, uid) if self.use_cache else False
+      cached = resource._get_from_cache(cache) # pylint: disable=protected-access
+      if cached and all(field in cached for field in detail):
+        result['objects'][str(uid)] = cached
+      else:
+        missing.append(uid)
+
+    if missing:
+      api = resource(self.conf.get('api'))
+      fetched = api.get_many(missing)
+      partial = [uid for uid, obj in fetched['objects'].items() if not all(field in obj for field in detail)]
+      if partial:
+        with ThreadPoolExecutor(max_workers=min(4, len(partial))) as executor:
+          for uid, obj in zip(partial, executor.map(lambda uid: api.get(uid, params={}), partial)):
+            if obj.get('error'):
+              del fetched['objects'][uid]
+              fetched['errors'][uid] = obj.get('msg')
+            else:
+              fetched['objects'][uid] = obj
+      result['errors'].update(fetched['errors'])
+      result['objects'].update(fetched['objects'])
+      if self.use_cache:
+        for uid, obj in fetched['objects'].items():
+          resource._save_cache('{}/json/{}.{}.json'.format(self.scratch, kind, uid), obj) # pylint: disable=protected-access
+    return result
+
+  def _get_pending_sample(self, journal, journal_identity):
+    '''
+    Get the unfinished upload of a sample to resume, forgetting it when it expired
+    or its sample is gone. Exits when the sample can not be checked.
+    '''
+    pending = journal.get('sample', *journal_identity)
+    if not pending:
+      return None
+    ttl = (self.conf.get('transfer') or {}).get('sample_resume_ttl', SAMPLE_RESUME_TTL)
+    if time.time() - pending.get('created', 0) > ttl:
+      eprint('WARNING: Not resuming the upload of sample {}, started over {}s ago.'.format(pending['sample_id'], ttl))
+      journal.remove('sample', *journal_identity)
+      return None
+    info = Sample(self.conf.get('api')).get(pending['sample_id'])
+    if info.get('error'):
+      if info.get('status_code') not in (401, 404):
+        sys.exit('ERROR: Not able to check sample {} of the unfinished upload: {}'.format(pending['sample_id'], info.get('msg')))
+      eprint('WARNING: Not resuming the upload of sample {}, not found.'.format(pending['sample_id']))
+      journal.remove('sample', *journal_identity)
+      return None
+    return pending
+
   def _get_sample_owner_id(self, sample_id):
     '''Get sample owner id'''
     info = self.get_sample(sample_id)
     return self.parse_url(info['owner'])['id'] if info else None
 
+  def _get_lazy(self, name, loader):
+    '''Get a lazy attribute, loading it once even when called from several threads'''
+    if name not in self._lazy:
+      with self._lazy_locks[name]:
+        if name not in self._lazy:
+          self._lazy[name] = loader()
+    return self._lazy[name]
+
   def _get_user_id(self):
-    '''Get userid, username provided in conf'''
+    '''Get user, username provided in conf'''
     user = (User(self.conf.get('api'))).list(
       params={'limit': 1, 'username': self.conf['api']['username']}
     )
-    self.conf['user'] = user.get('objects', [None])[0]
+    self.conf['user'] = (user.get('objects') or [None])[0]
+    return self.conf['user']
+
+  def _list_catalog_resource(self, resource, filters):
+    '''List the objects of a catalog resource, with concurrent pages'''
+    api = {'analyses': Analysis, 'files': File, 'genomes': Genome, 'samples': Sample, 'uploads': Upload}[resource]
+    return api(self.conf.get('api')).list_all(filters=filters, concurrency=BULK_CONCURRENCY)
+
+  def _load_configuration(self):
+    '''Build the configuration parser'''
+    configuration = self.conf
+    if self.conf.get('api', {}).get('cli'):
+      cache = False
+      if self.user_cache_for_host_conf:
+        eprint('INFO: Use cached host cloud service configuration.')
+        cache = '{}/json/config.json'.format(self.scratch)
+      configuration = User(self.conf.get('api')).get_configuration(cache=cache)
+    return Parser(configuration)
+
+  def _load_storage(self):
+    '''Build the storage driver for the user storage'''
+    storage_cfg = self.configuration.get_user_storage()
+    return Storage({
+      'credentials': storage_cfg.get('credentials'),
+      'driver': storage_cfg.get('driver'),
+      'settings': {**storage_cfg, 'disable_sts': True},
+    })
+
+  def _load_transfer_engine(self):
+    '''Build the transfer engine for the user storage'''
+    transfer_cfg = self.conf.get('transfer') or {}
+    cache = None
+    if transfer_cfg.get('cache_dir'):
+      cache = ObjectCache(
+        transfer_cfg['cache_dir'],
+        hardlink=transfer_cfg.get('cache_hardlink', False),
+        max_size=transfer_cfg.get('cache_size', OBJECT_CACHE_SIZE),
+      )
+    return TransferEngine(
+      self.configuration.get_user_storage(),
+      cache=cache,
+      concurrency=transfer_cfg.get('concurrency', TRANSFER_CONCURRENCY),
+      journal=TransferJournal('{}/.transfers'.format(self.scratch)),
+      part_size=transfer_cfg.get('part_size', TRANSFER_PART_SIZE),
+      retries=transfer_cfg.get('retries', TRANSFER_RETRIES),
+      verbose=bool(self.verbose),
+    )
 
   @classmethod
   def _parsed_sample_list(cls, items, prefix):
     '''Parse sample id list into sample resource uri list'''
     return ['{}samples/{}'.format(prefix, item_id) for item_id in items]
 
+  @staticmethod
+  def _print_stream(items, output_format, fields=None):
+    '''Print items to stdout as they are received, without holding the full list'''
+    found = False
+    with RecordWriter(output_format, fields=fields) as writer:
+      for item in items:
+        if item.get('error'):
+          eprint(item.get('msg', 'Error retrieving data.'))
+          return True
+        found = True
+        writer.write(item)
+    if not found:
+      eprint('No data found for the parameters you gave.')
+    return found
+
+  def _run_bulk_action(self, action, ids, payload, status, concurrency): # pylint: disable=too-many-arguments
+    '''Post every analysis id to the reanalyze or terminate action, several calls at once'''
+    post = getattr(Analysis(self.conf.get('api')), action)
+    ids = list(dict.fromkeys(str(uid) for uid in ids))
+    with ThreadPoolExecutor(max_workers=max(1, min(concurrency, len(ids) or 1))) as executor:
+      responses = executor.map(lambda uid: post(payload=dict(payload, id=uid)), ids)
+      return {uid: self._get_bulk_result(response, status) for uid, response in zip(ids, responses)}
+
+  def _upload_sample_files(self, pending, journal, journal_identity, parallel=None, upload=True): # pylint: disable=too-many-arguments
+    '''
+    Create the upload records of a sample and send its files, pipelined on a pool of workers.
+    The journal tracks the records created and the files sent, so a re-run skips them.
+    Returns
+    -------
+    The timings of the files sent, as returned by upload_file
+    '''
+    lock = threading.Lock()
+
+    def save(item, **changes):
+      with lock:
+        item.update(changes)
+        if journal:
+          journal.save(pending, 'sample', *journal_identity)
+
+    def process(item):
+      if item['done']:
+        return None
+      if not item['upload']:
+        if self.verbose:
+          eprint('Creating upload {}'.format(item['filepath']))
+        upload_id, filepath, key = self.create_upload(
+          pending['sample_id'],
+          item['filepath'],
+          item['order'],
+          is_paired_end=item['is_paired_end'],
+          source=pending['source'],
+        )
+        if not upload_id:
+          return {'filepath': item['filepath'], 'status': 'failed', 'upload_id': None}
+        save(item, upload=[upload_id, filepath, key])
+      if not upload:
+        return None
+      if self.verbose:
+        eprint('Uploading. upload_id: {}, filepath: {}, key: {}'.format(*item['upload']))
+      timing = self.upload_file(*item['upload'])
+      if timing['status'] == 'completed':
+        save(item, done=True)
+      return timing
+
+    parallel = parallel or (self.conf.get('transfer') or {}).get('parallel', TRANSFER_PARALLEL)
+    with ThreadPoolExecutor(max_workers=max(1, min(parallel, len(pending['files']) or 1))) as executor:
+      timings = [timing for timing in executor.map(process, pending['files']) if timing]
+    if journal and all(item['done'] for item in pending['files']):
+      journal.remove('sample', *journal_identity)
+    return timings
+
+  def _validate_manifest(self, rows, upload=True):
+    '''Error messages of the invalid manifest rows by row number, resolving every genome and project once'''
+    errors = {}
+    names = {}
+    for row in rows:
+      names.setdefault(row.get('name'), []).append(row['row'])
+    genomes = {name: self.genome_catalog.by_name(name) for name in {row.get('genome') for row in rows} if name}
+    project_ids = set()
+    for row in rows:
+      messages = []
+      if not row.get('name'):
+        messages.append('Missing name.')
+      elif len(names[row['name']]) > 1:
+        messages.append('Duplicate name {} in rows {}.'.format(row['name'], ', '.join(map(str, names[row['name']]))))
+      if not row.get('genome'):
+        messages.append('Missing genome.')
+      elif not genomes.get(row['genome']):
+        messages.append('Unknown genome {}.'.format(row['genome']))
+      if not row.get('filepaths1'):
+        messages.append('Missing filepaths1.')
+      files = (row.get('filepaths1') or []) + (row.get('filepaths2') or [])
+      if len(set(files)) < len(files):
+        messages.append('Same file used twice.')
+      if upload:
+        messages.extend('File {} does not exist.'.format(filepath) for filepath in files if not os.path.isfile(filepath))
+      for column in ('default_workflow', 'projects'):
+        try:
+          if row.get(column):
+            value = int(float(row[column]))
+            if column == 'projects':
+              project_ids.add(value)
+        except ValueError:
+          messages.append('Invalid {} {}.'.format(column, row[column]))
+      if messages:
+        errors[row['row']] = messages
+
+    if project_ids:
+      found = self._get_many(Project, 'project', sorted(project_ids))['objects']
+      for row in rows:
+        try:
+          if row.get('projects') and str(int(float(row['projects']))) not in found:
+            errors.setdefault(row['row'], []).append('Unknown project {}.'.format(row['projects']))
+        except ValueError:
+          pass
+    return errors
+
+  def _use_transfer_engine(self):
+    '''Whether to copy files with the transfer engine rather than the aws cli'''
+    return (self.conf.get('transfer') or {}).get('engine', 'boto3') != 'cli'
+
   @staticmethod
   def yes_or_no(question):
     '''
@@ -0,0 +1,264 @@
+'''
+Asyncio interface to Basepair's REST API
+
+Use it thus:
+
+> import basepair
+> async with basepair.connect_async() as bp:
+>   samples = await asyncio.gather(*[bp.get_sample(uid) for uid in uids])
+
+The file transfers run the transfer engine of a BpApi in the default
+executor, so they do not block the event loop.
+
+It requires the httpx package.
+'''
+
+# General imports
+import asyncio
+import datetime
+import functools
+import time
+
+# Lib imports
+import httpx
+
+# App imports
+from .api import BpApi
+from .helpers import eprint
+from .helpers.analysis_watcher import AnalysisWatcher, DEFAULT_MAX_INTERVAL, DEFAULT_MIN_INTERVAL, FINAL_STATUSES
+from .infra.webapp import Analysis, File, Gene, Genome, Module, Pipeline, Project, Sample, Upload, User
+from .infra.webapp.async_abstract import AsyncAbstract
+from .infra.webapp.session import DEFAULT_POOL_SIZE, SessionPool
+
+DEFAULT_CONCURRENCY = 50
+
+class AsyncBpApi(): # pylint: disable=too-many-public-methods
+  '''
+  Async wrapper over the REST API, sharing one pooled httpx.AsyncClient
+
+  Parameters
+  ----------
+  conf:        {dict} Same conf as BpApi
+  concurrency: {int}  Max requests in flight
+  scratch:     {str}  Scratch directory of the file transfers, as for BpApi
+  verbose:     {bool} Print more information
+  '''
+  resources = {
+    'analyses': Analysis,
+    'files': File,
+    'genes': Gene,
+    'genomes': Genome,
+    'modules': Module,
+    'pipelines': Pipeline,
+    'projects': Project,
+    'samples': Sample,
+    'uploads': Upload,
+    'users': User,
+  }
+
+  def __init__(self, conf=None, concurrency=DEFAULT_CONCURRENCY, scratch='.', verbose=None):
+    self.conf = BpApi.load_conf(conf)
+    self.scratch = scratch
+    self.verbose = verbose
+    api_cfg = self.conf.get('api')
+    pool_size = int(api_cfg.get('pool_size') or DEFAULT_POOL_SIZE)
+    timeout = SessionPool.get_timeout(api_cfg)
+    self.client = httpx.AsyncClient(
+      limits=httpx.Limits(max_connections=pool_size, max_keepalive_connections=pool_size),
+      timeout=httpx.Timeout(timeout[1], connect=timeout[0]) if isinstance(timeout, tuple) else timeout,
+    )
+    self.semaphore = asyncio.Semaphore(concurrency)
+    self._apis = {}
+    self._sync_api = None
+
+  async def __aenter__(self):
+    return self
+
+  async def __aexit__(self, *args):
+    await self.close()
+
+  def api(self, resource):
+    '''Get the async api of a resource, e.g. samples, analyses'''
+    if resource not in self._apis:
+      self._apis[resource] = AsyncAbstract(
+        self.resources[resource](self.conf.get('api')),
+        self.client,
+        self.semaphore,
+      )
+    return self._apis[resource]
+
+  async def close(self):
+    '''Close the pooled connections'''
+    await self.client.aclose()
+
+  @property
+  def sync_api(self):
+    '''BpApi running the file transfers, created on first use'''
+    if self._sync_api is None:
+      self._sync_api = BpApi(conf=self.conf, scratch=self.scratch, verbose=self.verbose)
+    return self._sync_api
+
+  ################################################################################################
+  ### GENERAL ####################################################################################
+  ################################################################################################
+  async def delete(self, resource, uid):
+    '''Delete a resource'''
+    return await self.api(resource).delete(uid)
+
+  async def get(self, resource, uid):
+    '''Get a resource'''
+    return await self.api(resource).get(uid)
+
+  async def list_all(self, resource, filters={}): # pylint: disable=dangerous-default-value
+    '''Get every item of a resource'''
+    return await self.api(resource).list_all(filters=filters)
+
+  async def save(self, resource, payload, uid=None, params={}): # pylint: disable=dangerous-default-value
+    '''Create or update a resource'''
+    datatype = {'analyses': 'analysis', 'samples': 'sample'}.get(resource)
+    return await self.api(resource).save(obj_id=uid, params=params, payload=payload, datatype=datatype)
+
+  ################################################################################################
+  ### ANALYSIS ###################################################################################
+  ################################################################################################
+  async def bulk_reanalyze(self, payload):
+    '''Restart analyses'''
+    return await self.api('analyses').action('reanalyze', payload)
+
+  async def bulk_start(self, payload):
+    '''Start analyses in bulk'''
+    return await self.api('analyses').action('bulk_start', payload)
+
+  async def bulk_terminate(self, payload):
+    '''Terminate analyses'''
+    return await self.api('analyses').action('terminate', payload)
+
+  async def get_analyses(self, filters={}): # pylint: disable=dangerous-default-value
+    '''Get analyses list'''
+    return await self.list_all('analyses', filters=filters)
+
+  async def get_analysis(self, uid):
+    '''Get analysis'''
+    return await self.get('analyses', uid)
+
+  async def iter_analysis_changes(
+    self,
+    ids,
+    final_statuses=FINAL_STATUSES,
+    max_interval=DEFAULT_MAX_INTERVAL,
+    min_interval=DEFAULT_MIN_INTERVAL,
+    timeout=None,
+  ): # pylint: disable=too-many-arguments
+    '''
+    Iterate over the status transitions of analyses until they are all finished,
+    the chunk queries of a poll being sent concurrently, see BpApi.iter_analysis_changes
+
+    > async for analysis, previous in bp.iter_analysis_changes(uids):
+    >   print(analysis['id'], previous, analysis['status'])
+    '''
+    watcher = AnalysisWatcher(ids, final_statuses=final_statuses, max_interval=max_interval, min_interval=min_interval)
+    deadline = time.time() + timeout if timeout else None
+    while not watcher.done:
+      queries = watcher.get_queries()
+      pages = await asyncio.gather(*[self.api('analyses').list(params=params) for _, params in queries])
+      changes = []
+      for (index, _), page in zip(queries, pages):
+        if page.get('error'):
+          eprint('WARNING: Not able to poll analyses: {}'.format(page.get('msg')))
+          watcher.fail(index, page.get('msg'))
+        else:
+          changes += watcher.update(index, page.get('objects') or [])
+      for uid in watcher.drop_missing():
+        eprint('WARNING: analysis {} not found.'.format(uid))
+      for change in changes:
+        yield change
+      interval = watcher.adapt(changes)
+      if watcher.done or (deadline and time.time() + interval > deadline):
+        break
+      await asyncio.sleep(interval)
+
+  ################################################################################################
+  ### FILE #######################################################################################
+  ################################################################################################
+  async def create_file(self, uid, data):
+    '''Create file'''
+    return await self.save('files', data, uid=uid)
+
+  async def download_file(self, filekey, **kwargs):
+    '''Download a file in the default executor, see BpApi.download_file'''
+    return await self._run_sync('download_file', filekey, **kwargs)
+
+  async def download_files(self, jobs, parallel=None):
+    '''Download files concurrently in the default executor, see BpApi.download_files'''
+    return await self._run_sync('download_files', jobs, parallel=parallel)
+
+  async def get_file(self, uid):
+    '''Get file'''
+    return await self.get('files', uid)
+
+  async def get_file_by_tags(self, sample, **kwargs):
+    '''Get, and by default download, the files of a sample matching tags in the default executor, see BpApi.get_file_by_tags'''
+    return await self._run_sync('get_file_by_tags', sample, **kwargs)
+
+  async def get_files(self, filters={}): # pylint: disable=dangerous-default-value
+    '''Get files list'''
+    return await self.list_all('files', filters=filters)
+
+  async def update_file(self, uid, data):
+    '''Update file'''
+    return await self.save('files', data, uid=uid)
+
+  ################################################################################################
+  ### SAMPLE #####################################################################################
+  ################################################################################################
+  async def bulk_import_samples(self, payload):
+    '''Import samples in bulk'''
+    return await self.api('samples').action('bulk_import', payload)
+
+  async def bulk_import_uploads(self, payload):
+    '''Import uploads in bulk'''
+    return await self.api('uploads').action('bulk_import', payload)
+
+  async def get_sample(self, uid, add_analysis=True):
+    '''Get sample, with its analyses fetched concurrently'''
+    info = await self.get('samples', uid)
+    if info and not info.get('error') and add_analysis:
+      analyses = await asyncio.gather(*[
+        self.get_analysis(BpApi.parse_url(uri)['id']) for uri in info.get('analyses', [])
+      ])
+      analyses = [analysis for analysis in analyses if not analysis.get('error')]
+      analyses.sort(
+        key=lambda analysis: datetime.datetime.strptime(analysis.get('last_updated'), '%Y-%m-%dT%H:%M:%S.%f'),
+        reverse=True,
+      )
+      info['analyses_full'] = analyses
+    return info
+
+  async def get_samples(self, filters={}): # pylint: disable=dangerous-default-value
+    '''Get samples list'''
+    return await self.list_all('samples', filters=filters)
+
+  async def update_sample(self, uid, data):
+    '''Update sample'''
+    return await self.save('samples', data, uid=uid)
+
+  ################################################################################################
+  ### UPLOAD #####################################################################################
+  ################################################################################################
+  async def get_upload(self, uid):
+    '''Get upload'''
+    return await self.get('uploads', uid)
+
+  async def update_upload(self, uid, data):
+    '''Update upload'''
+    return await self.save('uploads', data, uid=uid)
+
+  async def upload_file(self, upload_id, filepath, key):
+    '''Upload a file and update its upload in the default executor, see BpApi.upload_file'''
+    return await self._run_sync('upload_file', upload_id, filepath, key)
+
+  ### Private methods ###
+  async def _run_sync(self, method, *args, **kwargs):
+    '''Run a method of the sync api in the default executor'''
+    call = functools.partial(getattr(self.sync_api, method), *args, **kwargs)
+    return await asyncio.get_running_loop().run_in_executor(None, call)
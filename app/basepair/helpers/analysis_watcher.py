@@ -0,0 +1,130 @@
+'''Status of many analyses tracked with batched list queries'''
+
+# Constants
+DEFAULT_CHUNK = 200
+DEFAULT_MAX_FAILURES = 5
+DEFAULT_MAX_INTERVAL = 60
+DEFAULT_MIN_INTERVAL = 2
+FINAL_STATUSES = ('cancelled', 'complete', 'error', 'failed', 'terminated')
+
+class AnalysisWatcher():
+  '''
+  Poll state of a set of analyses
+
+  The ids are split in fixed chunks, each polled with one id__in list query.
+  Every chunk keeps the highest last_updated it has seen, and later queries
+  only ask for the analyses updated after it. As one query is a consistent
+  snapshot of its chunk, no update is missed. The chunks whose analyses are
+  all in a final status are not polled anymore. The analyses absent from
+  the first successful query of their chunk are dropped, and a chunk failing
+  max_failures polls in a row stops the watch.
+
+  The poll interval is halved when a cycle sees a status change and grows by
+  half otherwise, between min_interval and max_interval, so it follows the
+  rate of change.
+
+  Parameters
+  ----------
+  chunk:          {int}   Analyses per list query
+  final_statuses: {tuple} Statuses after which an analysis is not polled
+  ids:            {list}  Analysis ids [Required]
+  max_failures:   {int}   Failed polls in a row of a chunk before giving up
+  max_interval:   {float} Longest wait between polls, in seconds
+  min_interval:   {float} Shortest wait between polls, in seconds
+  '''
+  def __init__(
+    self,
+    ids,
+    chunk=DEFAULT_CHUNK,
+    final_statuses=FINAL_STATUSES,
+    max_failures=DEFAULT_MAX_FAILURES,
+    max_interval=DEFAULT_MAX_INTERVAL,
+    min_interval=DEFAULT_MIN_INTERVAL,
+  ): # pylint: disable=too-many-arguments
+    ids = list(dict.fromkeys(str(uid) for uid in ids))
+    self.chunks = [ids[index:index + chunk] for index in range(0, len(ids), chunk)]
+    self.failures = [0] * len(self.chunks)
+    self.final_statuses = final_statuses
+    self.interval = min_interval
+    self.max_failures = max_failures
+    self.max_interval = max_interval
+    self.min_interval = min_interval
+    self.polled = set()
+    self.unchecked = set()
+    self.seen = set()
+    self.statuses = dict.fromkeys(ids)
+    self.watermarks = [None] * len(self.chunks)
+
+  @property
+  def done(self):
+    '''Whether every analysis is in a final status'''
+    return all(status in self.final_statuses for status in self.statuses.values())
+
+  def adapt(self, changes):
+    '''Set the interval before the next poll from the number of changes of a cycle'''
+    if changes:
+      self.interval = max(self.min_interval, self.interval / 2)
+    else:
+      self.interval = min(self.max_interval, self.interval * 1.5)
+    return self.interval
+
+  def drop_missing(self):
+    '''Stop watching the analyses absent from the first successful query of their chunk, returns their ids'''
+    missing = [
+      uid for index in sorted(self.unchecked) for uid in self.chunks[index]
+      if uid in self.statuses and uid not in self.seen
+    ]
+    self.unchecked.clear()
+    for uid in missing:
+      del self.statuses[uid]
+    return missing
+
+  def fail(self, index, error):
+    '''Record a failed query of a chunk, raising IOError after max_failures in a row'''
+    self.failures[index] += 1
+    if self.failures[index] >= self.max_failures:
+      raise IOError('Not able to get the status of analyses {}: {}'.format(', '.join(self.chunks[index]), error))
+
+  def get_queries(self):
+    '''
+    List queries of the next poll cycle
+    Returns
+    -------
+    List of (chunk index, params) of the chunks with analyses not finished
+    '''
+    queries = []
+    for index, chunk in enumerate(self.chunks):
+      pending = [uid for uid in chunk if uid in self.statuses and self.statuses[uid] not in self.final_statuses]
+      if not pending:
+        continue
+      params = {'id__in': ','.join(pending), 'limit': len(pending)}
+      if self.watermarks[index]:
+        params['last_updated__gt'] = self.watermarks[index]
+      queries.append((index, params))
+    return queries
+
+  def update(self, index, objects):
+    '''
+    Record the analyses returned by the query of a chunk
+    Returns
+    -------
+    List of the status transitions, as (analysis, previous status) tuples,
+    the previous status being None on the first poll
+    '''
+    changes = []
+    self.failures[index] = 0
+    if index not in self.polled:
+      self.polled.add(index)
+      self.unchecked.add(index)
+    for obj in objects:
+      uid = str(obj.get('id'))
+      if uid not in self.statuses:
+        continue
+      self.seen.add(uid)
+      if obj.get('last_updated') and (self.watermarks[index] is None or obj['last_updated'] > self.watermarks[index]):
+        self.watermarks[index] = obj['last_updated']
+      previous = self.statuses[uid]
+      if obj.get('status') != previous:
+        self.statuses[uid] = obj.get('status')
+        changes.append((obj, previous))
+    return changes
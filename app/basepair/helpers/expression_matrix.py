@@ -0,0 +1,268 @@
+'''Feature x sample expression matrices with a columnar on disk cache'''
+
+# General imports
+from array import array
+import hashlib
+import json
+import mmap
+import os
+import threading
+
+def parse_counts(path, column=-1):
+  '''
+  Parse a tab separated count file in one pass, with numpy when the matrix extra is installed
+  Parameters
+  ----------
+  column: {int} Column of the counts, the last one by default
+  path:   {str} Count file path, feature ids in the first column [Required]
+  Returns
+  -------
+  (features, values), a list of feature ids and an array of doubles.
+  Comment lines and the header line are skipped.
+  '''
+  with open(path, 'r') as handle:
+    lines = handle.read().splitlines()
+  try:
+    import numpy # pylint: disable=import-outside-toplevel
+  except ImportError:
+    return _parse_count_lines(path, lines, column)
+
+  for start, line in enumerate(lines): # skip the comments and header up to the first count
+    if not line or line[0] == '#':
+      continue
+    fields = line.split('\t')
+    try:
+      float(fields[column])
+    except (IndexError, ValueError):
+      continue
+    break
+  else:
+    return [], array('d')
+  try:
+    counts = numpy.loadtxt(
+      lines[start:],
+      comments='#',
+      delimiter='\t',
+      dtype=numpy.float64,
+      ndmin=1,
+      usecols=column % len(fields),
+    )
+  except (IndexError, ValueError) as error:
+    raise ValueError('Invalid count line in {}: {}'.format(path, error)) from error
+  values = array('d')
+  values.frombytes(counts.tobytes())
+  return [line.split('\t', 1)[0] for line in lines[start:] if line and line[0] != '#'], values
+
+def _parse_count_lines(path, lines, column):
+  '''Pure python parse_counts of the lines of a count file'''
+  features = []
+  values = array('d')
+  for line in lines:
+    if not line or line[0] == '#':
+      continue
+    fields = line.split('\t')
+    try:
+      value = float(fields[column])
+    except (IndexError, ValueError):
+      if features: # a non numeric line past the header is an error
+        raise ValueError('Invalid count line in {}: {}'.format(path, line))
+      continue
+    features.append(fields[0])
+    values.append(value)
+  return features, values
+
+class ExpressionMatrix():
+  '''
+  Read only feature x sample matrix of doubles, memory mapped from the cache
+
+  Values are stored column major, so a sample column is one contiguous
+  memoryview. Missing features of a sample are nan.
+
+  Parameters
+  ----------
+  path: {str} Matrix path in the cache, without extension
+  '''
+  def __init__(self, path):
+    with open('{}.json'.format(path), 'r') as handle:
+      meta = json.load(handle)
+    self.features = meta['features']
+    self.samples = meta['samples']
+    self.shape = (len(self.features), len(self.samples))
+    self._rows = {feature: position for position, feature in enumerate(self.features)}
+    self._columns = {sample: position for position, sample in enumerate(self.samples)}
+    self._handle = open('{}.{}.bin'.format(path, meta['values']), 'rb')
+    size = os.fstat(self._handle.fileno()).st_size
+    self._map = mmap.mmap(self._handle.fileno(), 0, access=mmap.ACCESS_READ) if size else None
+    self._values = memoryview(self._map).cast('d') if size else memoryview(array('d'))
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, *args):
+    self.close()
+
+  def __getitem__(self, key):
+    '''Value of a (feature, sample id) cell'''
+    feature, sample = key
+    return self._values[self._columns[str(sample)] * self.shape[0] + self._rows[feature]]
+
+  def close(self):
+    '''Release the memory map'''
+    self._values.release()
+    if self._map:
+      self._map.close()
+    self._handle.close()
+
+  def column(self, sample):
+    '''Values of a sample id, as a memoryview of doubles in the order of features'''
+    start = self._columns[str(sample)] * self.shape[0]
+    return self._values[start:start + self.shape[0]]
+
+  def row(self, feature):
+    '''Values of a feature, as a list in the order of samples'''
+    position = self._rows[feature]
+    return [self._values[column * self.shape[0] + position] for column in range(self.shape[1])]
+
+  def to_numpy(self):
+    '''Features x samples numpy array over the memory map, needs numpy'''
+    import numpy # pylint: disable=import-outside-toplevel
+    return numpy.frombuffer(self._values, dtype=numpy.float64).reshape(self.shape[1], self.shape[0]).T
+
+class ExpressionStore():
+  '''
+  Columnar cache of the expression counts of samples
+
+  Every sample column is stored once as raw doubles with the version of its
+  count file, and its feature ids are stored once per distinct list. A matrix
+  of samples is written column major next to them and reused as long as the
+  versions of its samples did not change, so only changed samples are parsed
+  again.
+
+  The .bin files are named after the digest of their content, and their .json
+  metadata names the .bin it goes with, so a reader never pairs new values with
+  old metadata. The .bin before the current one is kept for such readers.
+
+  Parameters
+  ----------
+  directory: {str} Cache directory, e.g. {scratch}/expression/genes
+  '''
+  def __init__(self, directory):
+    self.directory = os.path.expanduser(directory)
+    self.lock = threading.Lock()
+    for name in ('features', 'matrices', 'samples'):
+      os.makedirs(os.path.join(self.directory, name), exist_ok=True)
+
+  def get_version(self, sample_id):
+    '''Version of the stored column of a sample, None if it is not stored'''
+    meta = self._read_json(self._get_sample_path(sample_id, 'json')) or {}
+    return meta.get('version') if meta.get('values') else None
+
+  def matrix(self, sample_ids):
+    '''
+    Matrix of stored samples, rows aligned on the feature ids in order of first appearance
+    Returns
+    -------
+    ExpressionMatrix, built only when a sample version changed since the last one
+    '''
+    sample_ids = [str(sample_id) for sample_id in sample_ids]
+    metas = [self._read_json(self._get_sample_path(sample_id, 'json')) for sample_id in sample_ids]
+    missing = [sample_id for sample_id, meta in zip(sample_ids, metas) if not (meta or {}).get('values')]
+    if missing:
+      raise KeyError('Samples not in the expression cache: {}.'.format(', '.join(missing)))
+    versions = [meta['version'] for meta in metas]
+    path = os.path.join(self.directory, 'matrices', hashlib.sha1(json.dumps(sample_ids).encode('utf-8')).hexdigest())
+    with self.lock:
+      current = self._read_json('{}.json'.format(path))
+      if not current or not current.get('values') or current.get('versions') != versions:
+        self._write_matrix(path, sample_ids, metas)
+    return ExpressionMatrix(path)
+
+  def save(self, sample_id, version, features, values):
+    '''Store the column of a sample'''
+    digest = hashlib.sha1('\n'.join(features).encode('utf-8')).hexdigest()
+    features_path = os.path.join(self.directory, 'features', '{}.json'.format(digest))
+    if not os.path.isfile(features_path):
+      self._write(features_path, json.dumps(features).encode('utf-8'))
+    data = array('d', values).tobytes()
+    values_digest = hashlib.sha1(data).hexdigest()
+    meta_path = self._get_sample_path(sample_id, 'json')
+    previous = (self._read_json(meta_path) or {}).get('values')
+    self._write(self._get_sample_path(sample_id, '{}.bin'.format(values_digest)), data)
+    self._write(meta_path, json.dumps({'features': digest, 'values': values_digest, 'version': version}).encode('utf-8'))
+    self._prune(self._get_sample_path(sample_id, ''), (values_digest, previous))
+
+  def _get_sample_path(self, sample_id, extension):
+    '''Path of the column or metadata of a sample'''
+    return os.path.join(self.directory, 'samples', '{}.{}'.format(sample_id, extension))
+
+  @staticmethod
+  def _prune(prefix, keep):
+    '''Remove the .bin files of a prefix but the ones of the digests kept'''
+    directory, name = os.path.split(prefix)
+    for filename in os.listdir(directory):
+      digest = filename[len(name):-len('.bin')]
+      if filename.startswith(name) and filename.endswith('.bin') and '.' not in digest and digest not in keep:
+        try:
+          os.remove(os.path.join(directory, filename))
+        except OSError: # still mapped by a reader on windows
+          pass
+
+  @staticmethod
+  def _read_json(path):
+    '''Read a json file, None when missing or corrupt'''
+    try:
+      with open(path, 'r') as handle:
+        return json.load(handle)
+    except (OSError, ValueError):
+      return None
+
+  @staticmethod
+  def _write(path, data):
+    '''Write a file atomically'''
+    tmp = '{}.{}.tmp'.format(path, threading.get_ident())
+    with open(tmp, 'wb') as handle:
+      handle.write(data)
+    os.replace(tmp, path)
+
+  def _write_matrix(self, path, sample_ids, metas):
+    '''Align the sample columns on their features and write the matrix'''
+    lists = {}
+    for meta in metas:
+      if meta['features'] not in lists:
+        lists[meta['features']] = self._read_json(os.path.join(self.directory, 'features', '{}.json'.format(meta['features'])))
+    features = []
+    if len(lists) == 1:
+      features = next(iter(lists.values()))
+    else:
+      seen = set()
+      for digest in dict.fromkeys(meta['features'] for meta in metas):
+        for feature in lists[digest]:
+          if feature not in seen:
+            seen.add(feature)
+            features.append(feature)
+    rows = {feature: position for position, feature in enumerate(features)}
+
+    tmp = '{}.bin.{}.tmp'.format(path, threading.get_ident())
+    digest = hashlib.sha1()
+    with open(tmp, 'wb') as handle:
+      for sample_id, meta in zip(sample_ids, metas):
+        values = array('d')
+        with open(self._get_sample_path(sample_id, '{}.bin'.format(meta['values'])), 'rb') as column:
+          values.frombytes(column.read())
+        sample_features = lists[meta['features']]
+        if sample_features is not features:
+          aligned = array('d', [float('nan')]) * len(features)
+          for feature, value in zip(sample_features, values):
+            aligned[rows[feature]] = value
+          values = aligned
+        digest.update(values.tobytes())
+        values.tofile(handle)
+    previous = (self._read_json('{}.json'.format(path)) or {}).get('values')
+    os.replace(tmp, '{}.{}.bin'.format(path, digest.hexdigest()))
+    self._write('{}.json'.format(path), json.dumps({
+      'features': features,
+      'samples': sample_ids,
+      'values': digest.hexdigest(),
+      'versions': [meta['version'] for meta in metas],
+    }).encode('utf-8'))
+    self._prune('{}.'.format(path), (digest.hexdigest(), previous))
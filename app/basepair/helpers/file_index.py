@@ -0,0 +1,75 @@
+'''Helper to look up analysis files by tags'''
+
+# General imports
+import datetime
+
+class FileIndex():
+  '''
+  Inverted index of files by tags
+
+  Files are grouped by their frozenset of tags for exact queries and by
+  every single tag for subset, diff and exclude queries, so a query only
+  touches the matching files. The last_updated timestamps are parsed once.
+  Files without tags are never matched, as in BpApi.filter_files_by_tags.
+
+  Parameters
+  ----------
+  files: {list} Files of an analysis, e.g. analysis['files']
+  '''
+  def __init__(self, files):
+    self.files = [file for file in files if file.get('tags')]
+    self._by_tag = {}
+    self._by_tags = {}
+    self._timestamps = {}
+    for position, file in enumerate(self.files):
+      tags = frozenset(file['tags'])
+      self._by_tags.setdefault(tags, []).append(position)
+      for tag in tags:
+        self._by_tag.setdefault(tag, []).append(position)
+      self._timestamps[id(file)] = self.parse_timestamp(file.get('last_updated'))
+
+  def __len__(self):
+    return len(self.files)
+
+  def last_updated(self, file):
+    '''Parsed last_updated of an indexed file'''
+    return self._timestamps.get(id(file)) or self.parse_timestamp(file.get('last_updated'))
+
+  @staticmethod
+  def parse_timestamp(value):
+    '''Parse a webapp timestamp, unknown values sort as the oldest'''
+    try:
+      return datetime.datetime.strptime(value, '%Y-%m-%dT%H:%M:%S.%f')
+    except (TypeError, ValueError):
+      return datetime.datetime.min
+
+  def query(self, tags, kind='exact', exclude=None):
+    '''
+    Get the files matching the tags, in their original order
+    Parameters
+    ----------
+    exclude: {list} Skip the files having any of these tags
+    kind:    {str}  exact: same tags, subset: any of the tags, diff: none of the tags
+    tags:    {list} Tags to match
+    '''
+    if kind == 'exact':
+      positions = self._by_tags.get(frozenset(tags), [])
+    elif kind == 'subset':
+      positions = sorted(self._with_any(tags))
+    elif kind == 'diff':
+      excluded = self._with_any(tags)
+      positions = [position for position in range(len(self.files)) if position not in excluded]
+    else:
+      raise ValueError('Invalid kind of tag filtering {}.'.format(kind))
+
+    if exclude:
+      excluded = self._with_any(exclude)
+      positions = [position for position in positions if position not in excluded]
+    return [self.files[position] for position in positions]
+
+  def _with_any(self, tags):
+    '''Positions of the files having any of the tags'''
+    positions = set()
+    for tag in set(tags):
+      positions.update(self._by_tag.get(tag, []))
+    return positions
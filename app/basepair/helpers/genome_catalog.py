@@ -0,0 +1,139 @@
+'''Helper to look up genomes by name, id or resource uri'''
+
+# General imports
+import json
+import os
+import threading
+import time
+
+# App imports
+from .eprint import eprint
+
+DEFAULT_TTL = 24 * 60 * 60 # seconds
+
+class GenomeCatalog():
+  '''
+  Genome catalogue with dict indexes by name, id and resource_uri
+
+  The genome list is persisted to the cache file. A cached catalogue younger
+  than ttl seconds is used as is; an older one is used right away while a
+  background thread downloads it again (stale while revalidate). A lookup
+  missing in a cached catalogue refreshes it once, in case the genome was
+  added after the catalogue was saved.
+
+  Parameters
+  ----------
+  loader: {callable} Returns the genome list, or an error dict
+  cache:  {str}      Json file to persist the catalogue, None to disable
+  ttl:    {int}      Seconds before the cached catalogue is revalidated
+  '''
+  def __init__(self, loader, cache=None, ttl=DEFAULT_TTL):
+    self.cache = os.path.expanduser(cache) if cache else None
+    self.loader = loader
+    self.ttl = ttl
+    self._from_cache = False
+    self._indexes = {'id': {}, 'name': {}, 'resource_uri': {}}
+    self._lock = threading.Lock()
+    self._refresh_thread = None
+    self.genomes = []
+    self._load()
+
+  def __contains__(self, name):
+    return self.by_name(name) is not None
+
+  def __iter__(self):
+    return iter(self.genomes)
+
+  def __len__(self):
+    return len(self.genomes)
+
+  def by_id(self, uid):
+    '''Get genome by id'''
+    return self._lookup('id', str(uid))
+
+  def by_name(self, name):
+    '''Get genome by name'''
+    return self._lookup('name', name)
+
+  def by_uri(self, uri):
+    '''Get genome by resource uri'''
+    return self._lookup('resource_uri', uri)
+
+  def refresh(self, background=False):
+    '''
+    Download the catalogue again
+    Parameters
+    ----------
+    background: {bool} Refresh in a daemon thread, returns the thread
+    '''
+    if not background:
+      return self._fetch()
+    with self._lock:
+      if self._refresh_thread is None or not self._refresh_thread.is_alive():
+        self._refresh_thread = threading.Thread(target=self._fetch, daemon=True)
+        self._refresh_thread.start()
+      return self._refresh_thread
+
+  def _fetch(self):
+    '''Download the genome list, index it and persist it'''
+    genomes = self.loader()
+    if isinstance(genomes, dict) and genomes.get('error'):
+      eprint('ERROR: Could not get the genome list: {}'.format(genomes.get('msg')))
+      return False
+    self._set(genomes, from_cache=False)
+    self._save(genomes)
+    return True
+
+  def _load(self):
+    '''Load the catalogue from the cache file, downloading it when missing'''
+    if self.cache and os.path.exists(self.cache):
+      try:
+        with open(self.cache, 'r') as handle:
+          genomes = json.load(handle)
+      except (OSError, ValueError):
+        genomes = None
+      if isinstance(genomes, list):
+        self._set(genomes, from_cache=True)
+        if time.time() - os.path.getmtime(self.cache) > self.ttl:
+          self.refresh(background=True)
+        return
+    self._fetch()
+
+  def _lookup(self, key, value):
+    '''Look a genome up in an index, refreshing a cached catalogue once on miss'''
+    if value is None:
+      return None
+    genome = self._indexes[key].get(value)
+    if genome is None and self._from_cache:
+      self._from_cache = False
+      self._fetch()
+      genome = self._indexes[key].get(value)
+    return genome
+
+  def _save(self, genomes):
+    '''Persist the genome list to the cache file'''
+    if not self.cache:
+      return
+    try:
+      directory = os.path.dirname(self.cache)
+      if directory and not os.path.exists(directory):
+        os.makedirs(directory)
+      tmp = '{}.{}.tmp'.format(self.cache, os.getpid())
+      with open(tmp, 'w') as handle:
+        json.dump(genomes, handle)
+      os.replace(tmp, self.cache)
+    except OSError as error:
+      eprint('WARNING: Could not save the genome catalogue: {}'.format(error))
+
+  def _set(self, genomes, from_cache):
+    '''Replace the genome list and its indexes'''
+    indexes = {'id': {}, 'name': {}, 'resource_uri': {}}
+    for genome in genomes:
+      for key, index in indexes.items():
+        value = genome.get(key)
+        if value is not None:
+          index.setdefault(str(value) if key == 'id' else value, genome)
+    with self._lock:
+      self.genomes = genomes
+      self._indexes = indexes
+      self._from_cache = from_cache
@@ -0,0 +1,123 @@
+'''Helper to read sample manifests and analysis specs'''
+
+# General imports
+import csv
+import json
+import os
+import re
+
+# Constants
+MANIFEST_ALIASES = {
+  'data_type': 'datatype',
+  'file1': 'filepaths1',
+  'file2': 'filepaths2',
+  'filepath1': 'filepaths1',
+  'filepath2': 'filepaths2',
+  'pipeline': 'default_workflow',
+  'project': 'projects',
+  'project_id': 'projects',
+  'sample': 'name',
+  'sample_name': 'name',
+  'workflow': 'default_workflow',
+}
+MANIFEST_COLUMNS = ('datatype', 'default_workflow', 'filepaths1', 'filepaths2', 'genome', 'name', 'platform', 'projects')
+SPEC_ALIASES = {
+  'control': 'control_ids',
+  'controls': 'control_ids',
+  'instance': 'instance_type',
+  'pipeline': 'workflow_id',
+  'pipeline_id': 'workflow_id',
+  'project': 'project_id',
+  'sample': 'sample_ids',
+  'samples': 'sample_ids',
+  'workflow': 'workflow_id',
+}
+
+def normalise_column(column):
+  '''Canonical name of a manifest column, e.g. "Filepath 1" -> filepaths1'''
+  column = re.sub(r'[\s\-]+', '_', str(column or '').strip().lower())
+  return MANIFEST_ALIASES.get(column, MANIFEST_ALIASES.get(column.replace('_', ''), column))
+
+def read_analysis_specs(path):
+  '''
+  Read the analyses to create from a json, csv or tsv file
+  Parameters
+  ----------
+  path: {str} Specs path [Required]
+  Returns
+  -------
+  List of spec dicts for BpApi.bulk_create_analyses. A json file holds a list
+  of specs, a csv or tsv file has one spec per line with the columns pipeline,
+  sample and optionally control, project, instance and params, several values
+  of a cell being separated by ;. Params are node:arg:val like the cli ones.
+  '''
+  path = os.path.expanduser(path)
+  with open(path, 'r', newline='') as handle:
+    if path.lower().endswith('.json'):
+      return [{SPEC_ALIASES.get(key, key): value for key, value in spec.items()} for spec in json.load(handle)]
+    lines = list(csv.DictReader(handle, delimiter='\t' if path.lower().endswith('.tsv') else ','))
+
+  specs = []
+  for line in lines:
+    values = {}
+    for key, value in line.items():
+      key = re.sub(r'[\s\-]+', '_', str(key or '').strip().lower())
+      if key:
+        values[SPEC_ALIASES.get(key, key)] = (value or '').strip()
+    if not any(values.values()):
+      continue
+    spec = {}
+    for key, value in values.items():
+      items = [item.strip() for item in value.split(';') if item.strip()]
+      if key in ('control_ids', 'sample_ids'):
+        spec[key] = items
+      elif key == 'params':
+        spec[key] = {'info': {}, 'node': {}}
+        for item in items:
+          node_id, arg, val = item.split(':')
+          spec[key]['node'].setdefault(node_id, {})[arg] = val
+      elif value:
+        spec[key] = value
+    specs.append(spec)
+  return specs
+
+def read_manifest(path):
+  '''
+  Read the rows of a csv, tsv or xlsx sample manifest
+  Parameters
+  ----------
+  path: {str} Manifest path, xlsx needs openpyxl [Required]
+  Returns
+  -------
+  List of row dicts keyed by canonical column: name, genome, datatype,
+  filepaths1 and filepaths2 (lists, paths separated by ; in a cell),
+  projects, default_workflow, platform, and the other columns under info.
+  Empty rows are skipped, every row has its 1-based line number under row.
+  '''
+  path = os.path.expanduser(path)
+  if path.lower().endswith(('.xls', '.xlsx')):
+    from openpyxl import load_workbook # pylint: disable=import-outside-toplevel
+    sheet = load_workbook(path, read_only=True, data_only=True).worksheets[0]
+    lines = [['' if value is None else value for value in row] for row in sheet.iter_rows(values_only=True)]
+  else:
+    with open(path, 'r', newline='') as handle:
+      lines = list(csv.reader(handle, delimiter='\t' if path.lower().endswith('.tsv') else ','))
+
+  if not lines:
+    return []
+  header = [normalise_column(column) for column in lines[0]]
+  rows = []
+  for number, line in enumerate(lines[1:], start=2):
+    values = {column: str(value).strip() for column, value in zip(header, line) if column}
+    if not any(values.values()):
+      continue
+    row = {'info': {}, 'row': number}
+    for column, value in values.items():
+      if column in ('filepaths1', 'filepaths2'):
+        row[column] = [item.strip() for item in value.split(';') if item.strip()]
+      elif column in MANIFEST_COLUMNS:
+        row[column] = value or None
+      elif value:
+        row['info'][column] = value
+    rows.append(row)
+  return rows
@@ -0,0 +1,342 @@
+'''Local SQLite catalog of the samples, analyses, files, uploads and genomes metadata'''
+
+# General imports
+from concurrent.futures import ThreadPoolExecutor
+import json
+import os
+import re
+import sqlite3
+import threading
+
+# Constants
+LINKS = {
+  'analyses': ('analysis_samples', 'analysis_id'),
+  'files': ('file_tags', 'file_id'),
+  'samples': ('sample_projects', 'sample_id'),
+}
+READ_ACTIONS = (sqlite3.SQLITE_FUNCTION, sqlite3.SQLITE_READ, sqlite3.SQLITE_RECURSIVE, sqlite3.SQLITE_SELECT)
+RESOURCES = ('genomes', 'samples', 'analyses', 'files', 'uploads') # refresh order, genomes resolve the sample genomes
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS watermarks (resource TEXT PRIMARY KEY, last_updated TEXT);
+CREATE TABLE IF NOT EXISTS genomes (id INTEGER PRIMARY KEY, name TEXT, last_updated TEXT, data TEXT);
+CREATE INDEX IF NOT EXISTS genomes_name ON genomes (name);
+CREATE TABLE IF NOT EXISTS samples (id INTEGER PRIMARY KEY, name TEXT, genome TEXT, datatype TEXT, last_updated TEXT, data TEXT);
+CREATE INDEX IF NOT EXISTS samples_genome ON samples (genome, last_updated);
+CREATE INDEX IF NOT EXISTS samples_name ON samples (name);
+CREATE TABLE IF NOT EXISTS sample_projects (sample_id INTEGER, project_id INTEGER, PRIMARY KEY (sample_id, project_id));
+CREATE INDEX IF NOT EXISTS sample_projects_project ON sample_projects (project_id);
+CREATE TABLE IF NOT EXISTS analyses (id INTEGER PRIMARY KEY, name TEXT, status TEXT, workflow INTEGER, last_updated TEXT, data TEXT);
+CREATE INDEX IF NOT EXISTS analyses_status ON analyses (status, last_updated);
+CREATE TABLE IF NOT EXISTS analysis_samples (analysis_id INTEGER, sample_id INTEGER, PRIMARY KEY (analysis_id, sample_id));
+CREATE INDEX IF NOT EXISTS analysis_samples_sample ON analysis_samples (sample_id);
+CREATE TABLE IF NOT EXISTS files (id INTEGER PRIMARY KEY, analysis_id INTEGER, path TEXT, filesize INTEGER, last_updated TEXT, data TEXT);
+CREATE INDEX IF NOT EXISTS files_analysis ON files (analysis_id);
+CREATE INDEX IF NOT EXISTS files_last_updated ON files (last_updated);
+CREATE TABLE IF NOT EXISTS file_tags (file_id INTEGER, tag TEXT, PRIMARY KEY (file_id, tag));
+CREATE INDEX IF NOT EXISTS file_tags_tag ON file_tags (tag, file_id);
+CREATE TABLE IF NOT EXISTS uploads (id INTEGER PRIMARY KEY, sample_id INTEGER, status TEXT, last_updated TEXT, data TEXT);
+CREATE INDEX IF NOT EXISTS uploads_sample ON uploads (sample_id);
+'''
+
+def get_ref_id(value):
+  '''Id of a reference given as an id, a resource uri or a dict, None when missing'''
+  if isinstance(value, dict):
+    value = value.get('id')
+  if isinstance(value, int) or (isinstance(value, str) and value.isdigit()):
+    return int(value)
+  match = re.search(r'/(\d+)/?$', value) if isinstance(value, str) else None
+  return int(match.group(1)) if match else None
+
+def get_ref_ids(values):
+  '''Ids of a reference list, or of a single reference'''
+  values = values if isinstance(values, list) else [values]
+  return [uid for uid in (get_ref_id(value) for value in values) if uid is not None]
+
+class MetadataCatalog():
+  '''
+  Metadata of the user resources in an indexed SQLite database
+
+  Every resource keeps the highest last_updated of its objects as a
+  watermark, so a refresh only lists the objects updated since the last one,
+  the resources being listed concurrently.
+  The objects are stored as json with their queried fields in indexed
+  columns, and the links between them (sample projects, analysis samples,
+  file tags) in join tables. The sql queries of users run on a separate read
+  only connection, only allowed to read.
+
+  Parameters
+  ----------
+  loader: {callable} Called with a resource and list filters, returns the object list or an error dict [Required]
+  path:   {str}      Database file [Required]
+  '''
+  def __init__(self, path, loader):
+    from urllib.request import pathname2url # pylint: disable=import-outside-toplevel
+    self.path = os.path.expanduser(path)
+    self.loader = loader
+    self.lock = threading.Lock()
+    if os.path.dirname(self.path):
+      os.makedirs(os.path.dirname(self.path), exist_ok=True)
+    self.db = sqlite3.connect(self.path, check_same_thread=False)
+    self.db.row_factory = sqlite3.Row
+    self.db.execute('PRAGMA journal_mode=WAL')
+    self.db.executescript(SCHEMA)
+    self.reader = sqlite3.connect('file:{}?mode=ro'.format(pathname2url(self.path)), check_same_thread=False, uri=True)
+    self.reader.row_factory = sqlite3.Row
+    self.reader.execute('PRAGMA query_only=ON')
+    self.reader.set_authorizer(lambda action, *_: sqlite3.SQLITE_OK if action in READ_ACTIONS else sqlite3.SQLITE_DENY)
+
+  def analyses(self, genome=None, project_id=None, sample_id=None, status=None, updated_after=None): # pylint: disable=too-many-arguments
+    '''
+    Analyses matching every filter given
+    Parameters
+    ----------
+    genome:        {str} Genome name of one of the samples
+    project_id:    {int} Project of one of the samples
+    sample_id:     {int} Sample of the analysis
+    status:        {str} Analysis status
+    updated_after: {str} Date or timestamp, e.g. 2024-06-01
+    '''
+    joins, where, params = self._sample_filters(genome=genome, project_id=project_id, sample_id=sample_id)
+    if status:
+      where.append('analyses.status = ?')
+      params.append(status)
+    if updated_after:
+      where.append('analyses.last_updated > ?')
+      params.append(updated_after)
+    return self._select('analyses', joins, where, params)
+
+  def close(self):
+    '''Close the database'''
+    self.reader.close()
+    self.db.close()
+
+  def execute(self, sql, params=()):
+    '''Run a sql query on the read only connection, returns the rows as dicts'''
+    with self.lock:
+      try:
+        return [dict(row) for row in self.reader.execute(sql, params).fetchall()]
+      except sqlite3.DatabaseError as error:
+        if 'not authorized' in str(error) or 'readonly' in str(error):
+          raise ValueError('Only select queries can be run on the catalog.') from error
+        raise
+
+  def files(self, genome=None, project_id=None, sample_id=None, status=None, tags=None, updated_after=None): # pylint: disable=too-many-arguments
+    '''
+    Analysis files matching every filter given
+    Parameters
+    ----------
+    genome:        {str}  Genome name of the sample
+    project_id:    {int}  Project of the sample
+    sample_id:     {int}  Sample of the analysis
+    status:        {str}  Analysis status
+    tags:          {list} Tags the files have, among others
+    updated_after: {str}  Date or timestamp, e.g. 2024-06-01
+    Returns
+    -------
+    List of the file dicts, with their analysis_id
+    '''
+    joins, where, params = self._sample_filters(genome=genome, project_id=project_id, sample_id=sample_id)
+    joins.insert(0, 'JOIN analyses ON analyses.id = files.analysis_id')
+    if status:
+      where.append('analyses.status = ?')
+      params.append(status)
+    for tag in tags or []:
+      where.append('EXISTS (SELECT 1 FROM file_tags WHERE file_tags.file_id = files.id AND file_tags.tag = ?)')
+      params.append(tag)
+    if updated_after:
+      where.append('COALESCE(files.last_updated, analyses.last_updated) > ?')
+      params.append(updated_after)
+    return self._select('files', joins, where, params, ['files.analysis_id'])
+
+  def refresh(self, resources=RESOURCES, full=False):
+    '''
+    Fetch the objects updated since the last refresh
+    Parameters
+    ----------
+    full:      {bool} Fetch every object and drop the ones deleted remotely
+    resources: {list} Resources to refresh, in the order of RESOURCES
+    Returns
+    -------
+    Dict of the number of objects fetched by resource, or of the error message
+    '''
+    resources = [name for name in RESOURCES if name in resources]
+    watermarks = {resource: None if full else self._get_watermark(resource) for resource in resources}
+    with ThreadPoolExecutor(max_workers=max(1, len(resources))) as executor:
+      results = executor.map(
+        lambda resource: self.loader(resource, {'last_updated__gt': watermarks[resource]} if watermarks[resource] else {}),
+        resources,
+      )
+    counts = {}
+    for resource, objects in zip(resources, results):
+      watermark = watermarks[resource]
+      if isinstance(objects, dict):
+        counts[resource] = objects.get('msg') or 'error'
+        continue
+      with self.lock, self.db:
+        if full:
+          self._delete_missing(resource, [obj.get('id') for obj in objects])
+        for obj in objects:
+          getattr(self, '_store_{}'.format(resource))(obj)
+        latest = max((obj.get('last_updated') or '' for obj in objects), default='')
+        if latest and latest > (watermark or ''):
+          self.db.execute('INSERT OR REPLACE INTO watermarks VALUES (?, ?)', (resource, latest))
+      counts[resource] = len(objects)
+    return counts
+
+  def samples(self, genome=None, name=None, project_id=None, updated_after=None):
+    '''
+    Samples matching every filter given
+    Parameters
+    ----------
+    genome:        {str} Genome name
+    name:          {str} Sample name
+    project_id:    {int} Project of the sample
+    updated_after: {str} Date or timestamp, e.g. 2024-06-01
+    '''
+    joins, where, params = [], [], []
+    if genome:
+      where.append('samples.genome = ?')
+      params.append(genome)
+    if name:
+      where.append('samples.name = ?')
+      params.append(name)
+    if project_id:
+      joins.append('JOIN sample_projects ON sample_projects.sample_id = samples.id')
+      where.append('sample_projects.project_id = ?')
+      params.append(int(project_id))
+    if updated_after:
+      where.append('samples.last_updated > ?')
+      params.append(updated_after)
+    return self._select('samples', joins, where, params)
+
+  def _delete_missing(self, resource, ids):
+    '''Drop the objects of a resource that are not in ids'''
+    self.db.execute('CREATE TEMP TABLE IF NOT EXISTS keep (id INTEGER PRIMARY KEY)')
+    self.db.execute('DELETE FROM keep')
+    self.db.executemany('INSERT OR IGNORE INTO keep VALUES (?)', [(uid,) for uid in ids])
+    self.db.execute('DELETE FROM {0} WHERE id NOT IN (SELECT id FROM keep)'.format(resource))
+    if resource in LINKS:
+      self.db.execute('DELETE FROM {0} WHERE {1} NOT IN (SELECT id FROM keep)'.format(*LINKS[resource]))
+    self.db.execute('DELETE FROM watermarks WHERE resource = ?', (resource,))
+
+  def _get_watermark(self, resource):
+    '''Highest last_updated stored for a resource'''
+    with self.lock:
+      row = self.db.execute('SELECT last_updated FROM watermarks WHERE resource = ?', (resource,)).fetchone()
+    return row[0] if row else None
+
+  @staticmethod
+  def _sample_filters(genome=None, project_id=None, sample_id=None):
+    '''Joins, conditions and params of the sample filters of analyses and files'''
+    joins, where, params = [], [], []
+    if genome or project_id or sample_id:
+      joins.append('JOIN analysis_samples ON analysis_samples.analysis_id = analyses.id')
+    if genome:
+      joins.append('JOIN samples ON samples.id = analysis_samples.sample_id')
+      where.append('samples.genome = ?')
+      params.append(genome)
+    if project_id:
+      joins.append('JOIN sample_projects ON sample_projects.sample_id = analysis_samples.sample_id')
+      where.append('sample_projects.project_id = ?')
+      params.append(int(project_id))
+    if sample_id:
+      where.append('analysis_samples.sample_id = ?')
+      params.append(int(sample_id))
+    return joins, where, params
+
+  def _select(self, table, joins, where, params, columns=()): # pylint: disable=too-many-arguments
+    '''Stored objects of a table matching the conditions, ordered by id'''
+    sql = 'SELECT DISTINCT {0}.id, {0}.data{1} FROM {0} {2} {3} ORDER BY {0}.id'.format(
+      table,
+      ''.join(', {}'.format(column) for column in columns),
+      ' '.join(joins),
+      'WHERE {}'.format(' AND '.join(where)) if where else '',
+    )
+    with self.lock:
+      rows = self.db.execute(sql, params).fetchall()
+    items = []
+    for row in rows:
+      item = json.loads(row['data'])
+      for column in columns:
+        item[column.split('.')[-1]] = row[column.split('.')[-1]]
+      items.append(item)
+    return items
+
+  def _store_analyses(self, obj):
+    '''Store an analysis, its samples and its files'''
+    self.db.execute('INSERT OR REPLACE INTO analyses VALUES (?, ?, ?, ?, ?, ?)', (
+      obj['id'],
+      obj.get('name'),
+      obj.get('status'),
+      get_ref_id(obj.get('workflow')),
+      obj.get('last_updated'),
+      json.dumps({key: value for key, value in obj.items() if key != 'files'}),
+    ))
+    self.db.execute('DELETE FROM analysis_samples WHERE analysis_id = ?', (obj['id'],))
+    self.db.executemany(
+      'INSERT OR IGNORE INTO analysis_samples VALUES (?, ?)',
+      [(obj['id'], sample_id) for sample_id in get_ref_ids(obj.get('samples') or [])],
+    )
+    if isinstance(obj.get('files'), list): # the files removed from the analysis are dropped
+      ids = [item['id'] for item in obj['files'] if item.get('id') is not None]
+      self.db.execute(
+        'DELETE FROM files WHERE analysis_id = ? AND id NOT IN ({})'.format(','.join('?' * len(ids))),
+        [obj['id']] + ids,
+      )
+      for item in obj['files']:
+        if item.get('id') is not None:
+          self._store_files(dict(item, analysis_id=obj['id']))
+
+  def _store_files(self, obj):
+    '''Store a file and its tags'''
+    analysis_id = obj.get('analysis_id') or get_ref_id(obj.get('analysis'))
+    self.db.execute('INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, ?, ?)', (
+      obj['id'],
+      analysis_id,
+      obj.get('path'),
+      obj.get('filesize') or obj.get('size'),
+      obj.get('last_updated'),
+      json.dumps(obj),
+    ))
+    self.db.execute('DELETE FROM file_tags WHERE file_id = ?', (obj['id'],))
+    self.db.executemany('INSERT OR IGNORE INTO file_tags VALUES (?, ?)', [(obj['id'], tag) for tag in obj.get('tags') or []])
+
+  def _store_genomes(self, obj):
+    '''Store a genome'''
+    self.db.execute('INSERT OR REPLACE INTO genomes VALUES (?, ?, ?, ?)', (
+      obj['id'],
+      obj.get('name'),
+      obj.get('last_updated'),
+      json.dumps(obj),
+    ))
+
+  def _store_samples(self, obj):
+    '''Store a sample and its projects, with the name of its genome'''
+    genome = obj.get('genome')
+    genome_id = get_ref_id(genome) if not isinstance(genome, str) or '/' in genome else None
+    if genome_id is not None:
+      row = self.db.execute('SELECT name FROM genomes WHERE id = ?', (genome_id,)).fetchone()
+      genome = row[0] if row else None
+    self.db.execute('INSERT OR REPLACE INTO samples VALUES (?, ?, ?, ?, ?, ?)', (
+      obj['id'],
+      obj.get('name'),
+      genome,
+      obj.get('datatype'),
+      obj.get('last_updated'),
+      json.dumps(obj),
+    ))
+    self.db.execute('DELETE FROM sample_projects WHERE sample_id = ?', (obj['id'],))
+    self.db.executemany(
+      'INSERT OR IGNORE INTO sample_projects VALUES (?, ?)',
+      [(obj['id'], project_id) for project_id in get_ref_ids(obj.get('projects') or [])],
+    )
+
+  def _store_uploads(self, obj):
+    '''Store an upload'''
+    self.db.execute('INSERT OR REPLACE INTO uploads VALUES (?, ?, ?, ?, ?)', (
+      obj['id'],
+      get_ref_id(obj.get('sample')),
+      obj.get('status'),
+      obj.get('last_updated'),
+      json.dumps(obj),
+    ))
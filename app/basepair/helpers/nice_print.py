@@ -4,12 +4,14 @@ from __future__ import print_function
 # General imports
 import os
 
-# Lib imports
-from tabulate import tabulate
-
 # App imports
 from basepair.helpers import eprint
 
+def tabulate(*args, **kwargs):
+  '''tabulate.tabulate, only imported when something is printed as it is slow to import'''
+  from tabulate import tabulate as _tabulate # pylint: disable=import-outside-toplevel
+  return _tabulate(*args, **kwargs)
+
 class NicePrint:
   '''Helper class to print nice objects'''
 
@@ -46,15 +48,12 @@ class NicePrint:
 
       eprint('\nAnalysis files:')
 
-      # convert only filesizes that are not None
-      for filedata in analysis['files']:
-        filedata['filesize'] = filedata['filesize']/(1024.**3) if filedata['filesize'] else 'NA'
-
       bucket = analysis.get('params', {}).get('info', {}).get('bucket', None)
       to_print = [
         [
           file['id'],
-          file['filesize'],
+          # convert only filesizes that are not None, leaving the analysis as is
+          file['filesize']/(1024.**3) if file['filesize'] else 'NA',
           file['source'],
           os.path.split(file['path'])[1],
           '{}{}'.format('s3://{}/'.format(bucket) if bucket else '', file['path']),
@@ -0,0 +1,109 @@
+'''Helper to write records as they arrive, as json lines, csv, tsv or a table'''
+
+# General imports
+import csv
+import json
+import sys
+
+# Constants
+FORMATS = ('csv', 'ndjson', 'table', 'tsv')
+TABLE_SAMPLE = 50 # rows read to size the columns of a table before it is printed
+
+def get_field(item, field):
+  '''Value of a field of a dict, nested fields being separated by dots, e.g. meta.num_reads'''
+  value = item
+  for key in field.split('.'):
+    if not isinstance(value, dict):
+      return None
+    value = value.get(key)
+  return value
+
+def to_cell(value):
+  '''Text of a value in a csv, tsv or table cell, lists and dicts being json'''
+  if value is None:
+    return ''
+  if isinstance(value, (dict, list)):
+    return json.dumps(value, default=str, separators=(',', ':'))
+  return str(value)
+
+class RecordWriter():
+  '''
+  Write records one at a time, holding none but the first rows of a table
+
+  Parameters
+  ----------
+  fields:        {list} Fields to write, dotted for nested ones. Defaults to
+                        every field for ndjson, to the fields of the first
+                        record otherwise
+  output_format: {str}  ndjson, csv, tsv or table [Required]
+  stream:        {obj}  Text stream written to, stdout by default
+
+  A table is written once TABLE_SAMPLE rows are read or the writer is closed,
+  its columns sized to these rows. The rows after are written as they come,
+  a longer value only shifting the rest of its line.
+  '''
+  def __init__(self, output_format, fields=None, stream=None):
+    if output_format not in FORMATS:
+      raise ValueError('Unknown output format {}, use one of {}.'.format(output_format, ', '.join(FORMATS)))
+    self.count = 0
+    self.fields = list(fields) if fields else None
+    self.output_format = output_format
+    self.pending = []
+    self.stream = stream or sys.stdout
+    self.widths = None
+    self.writer = None
+    if output_format in ('csv', 'tsv'):
+      self.writer = csv.writer(self.stream, delimiter='\t' if output_format == 'tsv' else ',', lineterminator='\n')
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, *args):
+    self.close()
+
+  def close(self):
+    '''Write the rows of a table still held'''
+    if self.output_format == 'table' and self.pending:
+      self._write_table_head()
+    self.stream.flush()
+
+  def write(self, item):
+    '''Write a record'''
+    self.count += 1
+    if self.output_format == 'ndjson':
+      record = item if not self.fields else {field: get_field(item, field) for field in self.fields}
+      self.stream.write(json.dumps(record, default=str) + '\n')
+      self.stream.flush()
+      return
+
+    if self.fields is None:
+      self.fields = list(item)
+    row = [to_cell(get_field(item, field)) for field in self.fields]
+    if self.writer:
+      if self.count == 1:
+        self.writer.writerow(self.fields)
+      self.writer.writerow(row)
+    elif self.widths is None:
+      self.pending.append(row)
+      if len(self.pending) >= TABLE_SAMPLE:
+        self._write_table_head()
+      return
+    else:
+      self._write_table_row(row)
+    self.stream.flush()
+
+  def _write_table_head(self):
+    '''Size the columns of a table to the rows held and write them with the header'''
+    self.widths = [
+      max([len(field)] + [len(row[index]) for row in self.pending]) for index, field in enumerate(self.fields)
+    ]
+    self._write_table_row(self.fields)
+    self._write_table_row(['-' * width for width in self.widths])
+    for row in self.pending:
+      self._write_table_row(row)
+    self.pending = []
+    self.stream.flush()
+
+  def _write_table_row(self, row):
+    '''Write a line of a table, its cells padded to the column widths'''
+    self.stream.write('  '.join(cell.ljust(width) for cell, width in zip(row, self.widths)).rstrip() + '\n')
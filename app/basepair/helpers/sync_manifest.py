@@ -0,0 +1,70 @@
+'''Manifest of the files of a local mirror'''
+
+# General imports
+import json
+import os
+import threading
+
+MANIFEST_NAME = '.basepair-sync.json'
+
+class SyncManifest():
+  '''
+  Remote state of every file of a local mirror when it was transferred
+
+  A file is current when its remote path, size, etag and last_updated did
+  not change since it was transferred and the local copy still has its size,
+  so an unchanged mirror is checked without a request per file. An unknown
+  etag, e.g. when the storage could not be listed, is not compared. Only the
+  files of the manifest are ever pruned.
+
+  Parameters
+  ----------
+  dest: {str} Mirror directory, the manifest being {dest}/.basepair-sync.json [Required]
+  '''
+  def __init__(self, dest):
+    self.dest = os.path.abspath(os.path.expanduser(dest))
+    self.path = os.path.join(self.dest, MANIFEST_NAME)
+    self.lock = threading.Lock()
+    try:
+      with open(self.path, 'r') as handle:
+        self.entries = json.load(handle)
+    except (OSError, ValueError):
+      self.entries = {}
+
+  def get_local_path(self, path):
+    '''Local path of a remote path, refusing paths outside of the mirror'''
+    local_path = os.path.normpath(os.path.join(self.dest, path.lstrip('/')))
+    if not local_path.startswith(self.dest + os.sep):
+      raise ValueError('Path {} is outside of the mirror.'.format(path))
+    return local_path
+
+  def is_current(self, path, remote):
+    '''
+    Whether the local copy of a path matches its remote state, a dict of size, etag and last_updated,
+    the etag being compared only when it is known
+    '''
+    entry = self.entries.get(path)
+    keys = ('etag', 'last_updated', 'size') if remote.get('etag') else ('last_updated', 'size')
+    if not entry or any(entry.get(key) != remote.get(key) for key in keys):
+      return False
+    local_path = self.get_local_path(path)
+    return os.path.isfile(local_path) and (remote.get('size') is None or os.path.getsize(local_path) == remote['size'])
+
+  def remove(self, path):
+    '''Forget a path'''
+    with self.lock:
+      self.entries.pop(path, None)
+
+  def save(self):
+    '''Write the manifest atomically'''
+    os.makedirs(self.dest, exist_ok=True)
+    with self.lock:
+      tmp = '{}.{}.tmp'.format(self.path, threading.get_ident())
+      with open(tmp, 'w') as handle:
+        json.dump(self.entries, handle, sort_keys=True)
+      os.replace(tmp, self.path)
+
+  def set(self, path, remote):
+    '''Record the remote state of a transferred path'''
+    with self.lock:
+      self.entries[path] = {key: remote.get(key) for key in ('etag', 'last_updated', 'size')}
@@ -0,0 +1,81 @@
+'''Helper to warn about newer releases without waiting on the network'''
+
+# General imports
+import json
+import os
+import threading
+import time
+
+# App imports
+from basepair.helpers.eprint import eprint
+from basepair.utils.colors import color
+
+# Constants
+DEFAULT_CACHE = os.path.join('~', '.basepair', 'version_check.json')
+DEFAULT_TTL = 24 * 3600 # seconds between two lookups of the latest release
+JSON_URL = 'https://pypi.python.org/pypi/{}/json'
+LEASE = 600 # seconds before a lookup that did not finish is attempted again
+TIMEOUT = 5 # seconds
+
+def check_version(title, version, cache=DEFAULT_CACHE, ttl=DEFAULT_TTL):
+  '''
+  Warn when the last known release of a package is not the running one
+  Parameters
+  ----------
+  cache:   {str} Json file holding the last known release  [Optional]
+  title:   {str} Package name on PyPI                      [Required]
+  ttl:     {int} Seconds after which the release is looked up again [Optional]
+  version: {str} Running version                           [Required]
+  Returns
+  -------
+  Thread looking up the latest release in the background when the cached one
+  is older than ttl, else None. The thread is a daemon, so a short command
+  never waits on it: the warning shows from the next call on.
+  '''
+  path = os.path.expanduser(cache)
+  try:
+    with open(path, 'r') as handle:
+      state = json.load(handle)
+  except (OSError, ValueError):
+    state = {}
+
+  latest = state.get('version')
+  if latest and latest != version:
+    eprint(color.warning(
+      'WARNING: The latest version of basepair package is {}. '
+      'Please upgrade to avail the latest features and bug-fixes'.format(latest)
+    ))
+
+  if time.time() - state.get('checked', 0) < ttl:
+    return None
+  # a lease is saved first so that concurrent calls do not all look it up, a
+  # process exiting before the lookup finishes lets another one retry later
+  state['checked'] = time.time() - ttl + min(LEASE, ttl)
+  if not _save(path, state):
+    return None
+  thread = threading.Thread(target=_refresh, args=(title, path, state), daemon=True)
+  thread.start()
+  return thread
+
+def _refresh(title, path, state):
+  '''Look up the latest release on PyPI and save it in the cache'''
+  from urllib.request import urlopen # pylint: disable=import-outside-toplevel
+  try:
+    with urlopen(JSON_URL.format(title), timeout=TIMEOUT) as response:
+      state['version'] = json.load(response)['info']['version']
+  except (OSError, KeyError, ValueError):
+    return
+  state['checked'] = time.time()
+  _save(path, state)
+
+def _save(path, state):
+  '''Write the cache atomically, returns whether it could be written'''
+  try:
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = '{}.{}.tmp'.format(path, os.getpid())
+    with open(tmp, 'w') as handle:
+      json.dump(state, handle)
+    os.replace(tmp, path)
+  except OSError:
+    return False
+  return True
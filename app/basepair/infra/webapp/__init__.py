@@ -11,3 +11,4 @@ from .sample import Sample
 from .upload import Upload
 from .user import User
 from .instance import Instance
+from .session import SessionPool
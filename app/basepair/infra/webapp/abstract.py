@@ -3,12 +3,25 @@
 # General imports
 import json
 import os
+import time
+from concurrent.futures import ThreadPoolExecutor
 
 # Lib imports
 import requests
 
 # App imports
 from basepair.helpers import eprint
+from . import codec
+from .session import SessionPool
+
+# Constants
+GET_MANY_CHUNK = 100
+PAGE_MAX_GROWTH = 2 # max page size factor between two pages
+PAGE_SIZE = 500
+PAGE_SIZE_MAX = 1000 # tastypie default max_limit
+PAGE_SIZE_MIN = 100
+PAGE_TARGET_BYTES = 8 * 1024 * 1024
+PAGE_TARGET_SECONDS = 2
 
 class Abstract(object):
   '''Webapp abastract class'''
@@ -21,15 +34,19 @@ class Abstract(object):
       'username': cfg.get('username'),
       'api_key': cfg.get('key')
     }
+    self.compress_min_size = cfg.get('compress_min_size')
     self.headers = {'content-type': 'application/json'}
+    self.session = SessionPool.get_session(cfg)
+    self.timeout = SessionPool.get_timeout(cfg)
 
   def delete(self, obj_id, verify=True):
     '''Delete resource'''
     try:
-      response = requests.delete(
+      response = self.session.delete(
         '{}{}'.format(self.endpoint, obj_id),
         params=self.payload,
-        verify=verify
+        timeout=self.timeout,
+        verify=verify,
       )
       return self._parse_obj_response(response, obj_id)
     except requests.exceptions.RequestException as error:
@@ -44,9 +61,10 @@ class Abstract(object):
 
     params.update(self.payload)
     try:
-      response = requests.get(
+      response = self.session.get(
         self.resource_url(obj_id),
         params=params,
+        timeout=self.timeout,
         verify=verify,
       )
       parsed = self._parse_obj_response(response, obj_id)
@@ -58,6 +76,78 @@ class Abstract(object):
       eprint('ERROR: {}'.format(error))
       return {'error': True, 'msg': error}
 
+  def get_many(self, obj_ids, chunk=GET_MANY_CHUNK, concurrency=4, verify=True):
+    '''
+    Get several resources with id__in list queries, fetching the chunks concurrently
+    Parameters
+    ----------
+    chunk:       {int}  Number of ids per request
+    concurrency: {int}  Number of chunks fetched in parallel
+    obj_ids:     {list} Ids of the resources
+    verify:      {bool} Verify ssl certificate
+    Returns
+    -------
+    Dict with the found resources keyed by id under 'objects' and the error
+    message of the ids not retrieved under 'errors'
+    '''
+    obj_ids = list(dict.fromkeys(str(obj_id) for obj_id in obj_ids))
+    chunks = [obj_ids[index:index + chunk] for index in range(0, len(obj_ids), chunk)]
+
+    def get_chunk(ids):
+      params = {'id__in': ','.join(ids), 'limit': len(ids)}
+      params.update(self.payload)
+      return ids, self._get_page(params, verify=verify)[0]
+
+    result = {'errors': {}, 'objects': {}}
+    with ThreadPoolExecutor(max_workers=max(1, min(concurrency, len(chunks)))) as executor:
+      for ids, page in executor.map(get_chunk, chunks):
+        if page.get('error'):
+          result['errors'].update({obj_id: page.get('msg') for obj_id in ids})
+          continue
+        for obj in page.get('objects') or []:
+          result['objects'][str(obj.get('id'))] = obj
+        for obj_id in ids:
+          if obj_id not in result['objects']:
+            result['errors'][obj_id] = 'Resource with id {} not found.'.format(obj_id)
+    return result
+
+  def iter_all(self, filters={}, page_size=None, verify=True): # pylint: disable=dangerous-default-value
+    '''
+    Iterate over all items page by page while the next page is prefetched in
+    the background, so at most two pages are held in memory.
+    If a page fails, the error dict is yielded and the iteration stops.
+    Parameters
+    ----------
+    filters:   {dict} Filters to apply to the list
+    page_size: {int}  Fixed page size. If not set, it adapts to the response latency and size
+    verify:    {bool} Verify ssl certificate
+    '''
+    limit = page_size or PAGE_SIZE
+    offset = 0
+    executor = ThreadPoolExecutor(max_workers=1)
+    try:
+      future = executor.submit(self._get_list_page, filters, offset, limit, verify)
+      while future:
+        response, stats = future.result()
+        if response.get('error'):
+          yield {'error': True, 'msg': response.get('msg')}
+          return
+        objects = response.get('objects') or []
+        total_count = response.get('meta', {}).get('total_count') or 0
+        offset += len(objects)
+        if not page_size:
+          limit = self._adapt_page_size(limit, len(objects), *stats)
+
+        # prefetch the next page before handing over this one
+        future = None
+        if objects and offset < total_count:
+          future = executor.submit(self._get_list_page, filters, offset, limit, verify)
+        for item in objects:
+          yield item
+        del objects, response
+    finally:
+      executor.shutdown(wait=False)
+
   def list(self, cache=False, params={'limit': 100}, verify=True): # pylint: disable=dangerous-default-value
     '''Get a list of items'''
     _cache = Abstract._get_from_cache(cache)
@@ -65,37 +155,44 @@ class Abstract(object):
       return _cache
 
     params.update(self.payload)
-    try:
-      response = requests.get(
-        self.endpoint.rstrip('/'),
-        params=params,
-        verify=verify,
-      )
-      parsed = self._parse_response(response)
-
-      # save in cache if required
-      Abstract._save_cache(cache, parsed)
-      return parsed
-    except requests.exceptions.RequestException as error:
-      eprint('ERROR: {}'.format(error))
-      return {'error': True, 'msg': error}
+    parsed, _ = self._get_page(params, verify=verify)
+
+    # save in cache if required
+    Abstract._save_cache(cache, parsed)
+    return parsed
+
+  def list_all(self, filters={}, concurrency=1, page_size=None, verify=True): # pylint: disable=dangerous-default-value
+    '''
+    Get a list of all items
+    Parameters
+    ----------
+    concurrency: {int}  Number of pages fetched in parallel once the total count is known
+    filters:     {dict} Filters to apply to the list
+    page_size:   {int}  Fixed page size. If not set, it adapts to the response latency and size
+    verify:      {bool} Verify ssl certificate
+    '''
+    limit = page_size or PAGE_SIZE
+    response, stats = self._get_list_page(filters, 0, limit, verify)
+    if response.get('error'):
+      return {'error': True, 'msg': response.get('msg')}
+    total_count = response.get('meta', {}).get('total_count') or 0
+    item_list = response.get('objects')
+    if not page_size:
+      limit = self._adapt_page_size(limit, len(item_list), *stats)
+
+    if concurrency > 1 and len(item_list) < total_count:
+      return self._list_rest_concurrently(item_list, filters, total_count, limit, concurrency, verify)
 
-  def list_all(self, filters={}): # pylint: disable=dangerous-default-value
-    '''Get a list of all items'''
-    item_list = []
-    limit = 500
-    offset = 0
-    total_count = 1
     while len(item_list) < total_count:
-      params = {'limit': limit, 'offset': offset}
-      params.update(filters)
-      # response = self.list({**filters, 'limit': limit, 'offset': offset}) #TODO: Uncomment when everything moved to py3
-      response = self.list(params=params)
+      response, stats = self._get_list_page(filters, len(item_list), limit, verify)
       if response.get('error'):
         return {'error': True, 'msg': response.get('msg')}
-      total_count = response.get('meta', {}).get('total_count')
-      item_list += response.get('objects')
-      offset += limit
+      objects = response.get('objects')
+      if not objects:  # total count changed while paging
+        break
+      item_list += objects
+      if not page_size:
+        limit = self._adapt_page_size(limit, len(objects), *stats)
     return item_list
 
   def resource_uri(self, obj_id):
@@ -110,11 +207,13 @@ class Abstract(object):
     '''Save or update resource'''
     params.update(self.payload)
     try:
-      response = getattr(requests, 'put' if obj_id else 'post')(
+      body, headers = self._encode_body(payload)
+      response = getattr(self.session, 'put' if obj_id else 'post')(
         self.resource_url(obj_id) if obj_id else self.endpoint,
-        data=json.dumps(payload),
-        headers=self.headers,
+        data=body,
+        headers=headers,
         params=params,
+        timeout=self.timeout,
         verify=verify,
       )
       if datatype == 'analysis' or datatype == 'sample':
@@ -128,15 +227,83 @@ class Abstract(object):
   def pathname(self):
     return self.endpoint.replace(f"{self.protocol}://", '').replace(self.host, '')
 
+  @staticmethod
+  def _adapt_page_size(limit, count, elapsed, size):
+    '''Scale the page size so a page takes about PAGE_TARGET_SECONDS and PAGE_TARGET_BYTES'''
+    if not count:
+      return limit
+    factor = min(
+      PAGE_TARGET_SECONDS / elapsed if elapsed else PAGE_MAX_GROWTH,
+      PAGE_TARGET_BYTES / size if size else PAGE_MAX_GROWTH,
+      PAGE_MAX_GROWTH,
+    )
+    return max(PAGE_SIZE_MIN, min(PAGE_SIZE_MAX, int(count * factor)))
+
+  def _encode_body(self, payload):
+    '''Json body of a request and its headers, the body being gzipped from compress_min_size bytes'''
+    body, encoding = codec.gzip_body(codec.dumps(payload), self.compress_min_size)
+    if encoding:
+      return body, dict(self.headers, **{'content-encoding': encoding})
+    return body, self.headers
+
   @staticmethod
   def _get_from_cache(cache):
     '''Helper to get data from cache'''
     if cache:
       filename = os.path.expanduser(cache)
       if os.path.exists(filename) and os.path.getsize(filename):
-        return json.loads(open(filename, 'r').read().strip())
+        return codec.read_cache(filename)
     return None
 
+  def _get_list_page(self, filters, offset, limit, verify=True):
+    '''Get one page of the list, returns the parsed page and its (seconds, bytes)'''
+    params = {'limit': limit, 'offset': offset}
+    params.update(filters)
+    params.update(self.payload)
+    return self._get_page(params, verify=verify)
+
+  def _get_page(self, params, verify=True):
+    '''Request a list page, returns the parsed page and its (seconds, bytes)'''
+    try:
+      starttime = time.time()
+      response = self.session.get(
+        self.endpoint.rstrip('/'),
+        params=params,
+        timeout=self.timeout,
+        verify=verify,
+      )
+      stats = (time.time() - starttime, len(response.content))
+      return self._parse_response(response), stats
+    except requests.exceptions.RequestException as error:
+      eprint('ERROR: {}'.format(error))
+      return {'error': True, 'msg': error}, (0, 0)
+
+  def _list_rest_concurrently(self, item_list, filters, total_count, limit, concurrency, verify=True): # pylint: disable=too-many-arguments
+    '''Fetch the pages after the first one in parallel and reassemble them in order'''
+    offsets = list(range(len(item_list), total_count, limit))
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+      pages = list(executor.map(
+        lambda offset: self._get_list_page(filters, offset, limit, verify)[0],
+        offsets,
+      ))
+
+    for offset, page in zip(offsets, pages):
+      if page.get('error'):
+        return {'error': True, 'msg': page.get('msg')}
+      objects = page.get('objects') or []
+      item_list += objects
+      # server capped the page size under the requested limit, fill the gap
+      start, end = offset + len(objects), min(offset + limit, total_count)
+      while start < end:
+        page, _ = self._get_list_page(filters, start, end - start, verify)
+        if page.get('error'):
+          return {'error': True, 'msg': page.get('msg')}
+        if not page.get('objects'):
+          break
+        item_list += page['objects']
+        start += len(page['objects'])
+    return item_list
+
   @classmethod
   def _parse_obj_response(cls, response, obj_id):
     '''General response parser with obj id'''
@@ -147,13 +314,13 @@ class Abstract(object):
     }
     if response.status_code in error_msgs:
       eprint('ERROR: {}'.format(error_msgs[response.status_code]))
-      return {'error': True, 'msg': error_msgs[response.status_code]}
+      return {'error': True, 'msg': error_msgs[response.status_code], 'status_code': response.status_code}
 
     if response.status_code == 204:  # for delete response
       return {'error': False}
 
     try:
-      response = response.json()
+      response = codec.loads(response.content)
 
       error = isinstance(response, dict) and response.get('error')
       if error:
@@ -189,7 +356,7 @@ class Abstract(object):
       return {'error': False}
 
     try:
-      response = response.json()
+      response = codec.loads(response.content)
       error = isinstance(response, dict) and response.get('error')
       if error:
         if isinstance(error, dict):
@@ -225,7 +392,7 @@ class Abstract(object):
       return {'error': False}
 
     try:
-      response = response.json()
+      response = codec.loads(response.content)
 
       error = isinstance(response, dict) and response.get('error')
       if error:
@@ -248,11 +415,10 @@ class Abstract(object):
 
   @staticmethod
   def _save_cache(cache, content):
-    '''Helper to save the content in the cache'''
+    '''Helper to save the content in the cache, as compact json'''
     if cache and content and not content.get('error'):
       filename = os.path.expanduser(cache)
       directory = os.path.dirname(filename)
       if not os.path.exists(directory):
         os.makedirs(directory)
-      with open(filename, 'w') as handle:
-        handle.write(json.dumps(content, indent=2))
+      codec.write_cache(filename, content)
@@ -1,7 +1,6 @@
 '''Analysis webapp api wrapper'''
 
 # Lib imports
-import json
 import requests
 
 # App imports
@@ -17,11 +16,13 @@ class Analysis(Abstract):
   def bulk_start(self, payload={}, verify=True):
     '''Import sample from s3'''
     try:
-      response = requests.post(
+      body, headers = self._encode_body(payload)
+      response = self.session.post(
         '{}bulk_start'.format(self.endpoint),
-        data=json.dumps(payload),
-        headers=self.headers,
+        data=body,
+        headers=headers,
         params=self.payload,
+        timeout=self.timeout,
         verify=verify,
       )
       return self._parse_response(response)
@@ -32,11 +33,13 @@ class Analysis(Abstract):
   def reanalyze(self, payload={}, verify=True):
     '''Restart analysis'''
     try:
-      response = requests.post(
+      body, headers = self._encode_body(payload)
+      response = self.session.post(
         '{}reanalyze'.format(self.endpoint),
-        data=json.dumps(payload),
-        headers=self.headers,
+        data=body,
+        headers=headers,
         params=self.payload,
+        timeout=self.timeout,
         verify=verify,
       )
       return self._parse_response(response)
@@ -47,11 +50,13 @@ class Analysis(Abstract):
   def terminate(self, payload={}, verify=True):
     '''Terminate analysis'''
     try:
-      response = requests.post(
+      body, headers = self._encode_body(payload)
+      response = self.session.post(
         '{}terminate'.format(self.endpoint),
-        data=json.dumps(payload),
-        headers=self.headers,
+        data=body,
+        headers=headers,
         params=self.payload,
+        timeout=self.timeout,
         verify=verify,
       )
       return self._parse_response(response)
@@ -62,11 +67,13 @@ class Analysis(Abstract):
   def save_log(self, data):
     '''Save analysis log in db'''
     try:
-      response = requests.post(
+      body, headers = self._encode_body(data)
+      response = self.session.post(
         '{}log'.format(self.endpoint),
-        data=json.dumps(data),
-        headers=self.headers,
+        data=body,
+        headers=headers,
         params=self.payload,
+        timeout=self.timeout,
       )
       return self._parse_response(response)
     except requests.exceptions.RequestException as error:
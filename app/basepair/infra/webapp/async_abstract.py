@@ -0,0 +1,104 @@
+'''Async webapp API'''
+
+# General imports
+import asyncio
+
+# Lib imports
+import httpx
+
+# App imports
+from basepair.helpers import eprint
+from .abstract import PAGE_SIZE
+
+class AsyncAbstract(object):
+  '''
+  Async counterpart of the webapp Abstract class
+
+  It wraps a sync resource (Sample(cfg), Analysis(cfg), ...) for the
+  endpoint, credentials and response parsing, and sends the requests
+  through a shared httpx.AsyncClient. Every request waits on the shared
+  semaphore, which bounds the requests in flight.
+  '''
+  def __init__(self, resource, client, semaphore):
+    self.resource = resource
+    self.client = client
+    self.semaphore = semaphore
+
+  async def action(self, name, payload={}): # pylint: disable=dangerous-default-value
+    '''Post to a resource action like bulk_import, bulk_start, reanalyze or terminate'''
+    body, headers = self.resource._encode_body(payload) # pylint: disable=protected-access
+    response = await self._request(
+      'POST',
+      '{}{}'.format(self.resource.endpoint, name),
+      content=body,
+      headers=headers,
+      params=self.resource.payload,
+    )
+    return response if isinstance(response, dict) else self.resource._parse_response(response) # pylint: disable=protected-access
+
+  async def delete(self, obj_id):
+    '''Delete resource'''
+    response = await self._request('DELETE', self.resource.resource_url(obj_id), params=self.resource.payload)
+    return response if isinstance(response, dict) else self.resource._parse_obj_response(response, obj_id) # pylint: disable=protected-access
+
+  async def get(self, obj_id, params={}): # pylint: disable=dangerous-default-value
+    '''Get detail of an resource'''
+    response = await self._request('GET', self.resource.resource_url(obj_id), params={**params, **self.resource.payload})
+    return response if isinstance(response, dict) else self.resource._parse_obj_response(response, obj_id) # pylint: disable=protected-access
+
+  async def list(self, params={'limit': 100}): # pylint: disable=dangerous-default-value
+    '''Get a list of items'''
+    response = await self._request('GET', self.resource.endpoint.rstrip('/'), params={**params, **self.resource.payload})
+    return response if isinstance(response, dict) else self.resource._parse_response(response) # pylint: disable=protected-access
+
+  async def list_all(self, filters={}, page_size=PAGE_SIZE): # pylint: disable=dangerous-default-value
+    '''Get a list of all items, fetching the pages after the first one concurrently'''
+    first = await self.list(params={**filters, 'limit': page_size, 'offset': 0})
+    if first.get('error'):
+      return {'error': True, 'msg': first.get('msg')}
+    total_count = first.get('meta', {}).get('total_count') or 0
+    item_list = first.get('objects') or []
+    # the server may cap the limit (tastypie max_limit), stride by the page it actually sent
+    limit = min(page_size, first.get('meta', {}).get('limit') or len(item_list) or page_size)
+    offsets = range(len(item_list), total_count, limit)
+    pages = await asyncio.gather(*[self.list(params={**filters, 'limit': limit, 'offset': offset}) for offset in offsets])
+    for offset, page in zip(offsets, pages):
+      if page.get('error'):
+        return {'error': True, 'msg': page.get('msg')}
+      objects = page.get('objects') or []
+      item_list += objects
+      # page shorter than the stride, fill the gap
+      start, end = offset + len(objects), min(offset + limit, total_count)
+      while objects and start < end:
+        page = await self.list(params={**filters, 'limit': end - start, 'offset': start})
+        if page.get('error'):
+          return {'error': True, 'msg': page.get('msg')}
+        objects = page.get('objects') or []
+        item_list += objects
+        start += len(objects)
+    return item_list
+
+  async def save(self, obj_id=None, params={}, payload={}, datatype=None): # pylint: disable=dangerous-default-value
+    '''Save or update resource'''
+    body, headers = self.resource._encode_body(payload) # pylint: disable=protected-access
+    response = await self._request(
+      'PUT' if obj_id else 'POST',
+      self.resource.resource_url(obj_id) if obj_id else self.resource.endpoint,
+      content=body,
+      headers=headers,
+      params={**params, **self.resource.payload},
+    )
+    if isinstance(response, dict):
+      return response
+    if datatype in ('analysis', 'sample'):
+      return self.resource._parse_validated_response(response, obj_id) # pylint: disable=protected-access
+    return self.resource._parse_obj_response(response, obj_id) # pylint: disable=protected-access
+
+  async def _request(self, method, url, **kwargs):
+    '''Send the request once a slot is free, returns the response or an error dict'''
+    async with self.semaphore:
+      try:
+        return await self.client.request(method, url, **kwargs)
+      except httpx.HTTPError as error:
+        eprint('ERROR: {}'.format(error))
+        return {'error': True, 'msg': error}
@@ -0,0 +1,57 @@
+'''Json codec of the webapp calls, using orjson when it is installed'''
+
+# General imports
+import gzip
+import json
+
+try:
+  import orjson
+except ImportError: # the json module of the standard library is used instead
+  orjson = None
+
+# Constants
+COMPRESS_LEVEL = 6
+GZIP_MAGIC = b'\x1f\x8b'
+
+def dumps(obj):
+  '''
+  Encode an object to compact json bytes
+  Non str dict keys are converted like json.dumps does, and the objects orjson
+  does not support (e.g. integers over 64 bits) fall back to json.dumps.
+  '''
+  if orjson:
+    try:
+      return orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS)
+    except TypeError:
+      pass
+  return json.dumps(obj, separators=(',', ':')).encode('utf-8')
+
+def gzip_body(body, min_size):
+  '''
+  Compress a request body when it is at least min_size bytes
+  Returns
+  -------
+  (body, content encoding) tuple, the encoding being None for a body sent as is
+  '''
+  if min_size is None or len(body) < min_size:
+    return body, None
+  return gzip.compress(body, compresslevel=COMPRESS_LEVEL), 'gzip'
+
+def loads(data):
+  '''Decode json bytes or str, raising json.JSONDecodeError on invalid json'''
+  if orjson:
+    return orjson.loads(data)
+  return json.loads(data)
+
+def read_cache(filename):
+  '''Decode a cache file, compact or indented json, or gzipped json'''
+  with open(filename, 'rb') as handle:
+    data = handle.read()
+  if data.startswith(GZIP_MAGIC):
+    data = gzip.decompress(data)
+  return loads(data)
+
+def write_cache(filename, content):
+  '''Write a cache file as compact json, still readable as plain json by older versions and scripts'''
+  with open(filename, 'wb') as handle:
+    handle.write(dumps(content))
@@ -15,9 +15,10 @@ class Module(Abstract):
     '''Get modules of an pipeline'''
     params.update(self.payload)
     try:
-      response = requests.get(
+      response = self.session.get(
         '{}?workflow={}'.format(self.api_endpoint, obj_id),
         params=params,
+        timeout=self.timeout,
         verify=verify,
       )
       parsed = self._parse_obj_response(response, obj_id)
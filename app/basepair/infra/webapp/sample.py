@@ -1,8 +1,6 @@
 '''Sample webapp api wrapper'''
 
 # Lib imports
-import json
-import os
 import requests
 
 # App imports
@@ -18,11 +16,13 @@ class Sample(Abstract):
   def bulk_import(self, payload={}, verify=True):
     '''Import sample from s3'''
     try:
-      response = requests.post(
+      body, headers = self._encode_body(payload)
+      response = self.session.post(
         '{}bulk_import'.format(self.endpoint),
-        data=json.dumps(payload),
-        headers=self.headers,
+        data=body,
+        headers=headers,
         params=self.payload,
+        timeout=self.timeout,
         verify=verify,
       )
       return self._parse_response(response)
@@ -32,29 +32,24 @@ class Sample(Abstract):
 
   def by_name(self, name, project_id, cache=False, verify=True): # pylint: disable=dangerous-default-value
     '''Get detail of an resource'''
-    if cache:
-      filename = os.path.expanduser(cache)
-      if os.path.exists(filename) and os.path.getsize(filename):
-        return json.loads(open(filename, 'r').read().strip())
+    _cache = Abstract._get_from_cache(cache)
+    if _cache:
+      return _cache
 
     try:
       params = {'name': name, 'project_id': project_id}
       params.update(self.payload)
-      response = requests.get(
+      response = self.session.get(
         '{}by_name'.format(self.endpoint),
         params=params,
         # params={'name': name, 'project_id': project_id, **self.payload}, #TODO: Uncomment when everything moved to py3
+        timeout=self.timeout,
         verify=verify,
       )
       parsed = self._parse_response(response)
 
       # save in cache if required
-      if cache and parsed and not parsed.get('error'):
-        directory = os.path.dirname(filename)
-        if not os.path.exists(directory):
-          os.makedirs(directory)
-        with open(filename, 'w') as handle:
-          handle.write(json.dumps(parsed, indent=2))
+      Abstract._save_cache(cache, parsed)
       return parsed
     except requests.exceptions.RequestException as error:
       eprint('ERROR: {}'.format(error))
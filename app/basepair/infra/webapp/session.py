@@ -0,0 +1,122 @@
+'''Shared keep-alive http sessions for the webapp api'''
+
+# General imports
+import threading
+
+# Lib imports
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.request import ACCEPT_ENCODING
+
+DEFAULT_POOL_SIZE = 10
+
+class SessionPool():
+  '''Thread safe registry of pooled sessions, one per (host, ssl)
+
+  Every webapp resource built with the same host settings shares one
+  requests.Session, so tcp and tls connections are reused across calls and
+  across the short lived Sample(...)/Analysis(...) objects BpApi creates.
+
+  Responses are requested gzip compressed, or brotli compressed when the
+  brotli package is installed.
+
+  Supported api cfg keys:
+  {
+      "pool_size": 10,            # max connections kept open per host
+      "keep_alive": true,         # false sends Connection: close on every call
+      "timeout": [5, 300],        # default (connect, read) timeout in seconds
+      "compress_min_size": 65536  # gzip the request bodies of at least this many bytes,
+                                  # for webapps decoding Content-Encoding: gzip (off by default)
+  }
+  '''
+  _lock = threading.Lock()
+  _sessions = {}
+  _counters = {}
+
+  @classmethod
+  def close_all(cls):
+    '''Close every pooled session and reset the stats'''
+    with cls._lock:
+      for session in cls._sessions.values():
+        session.close()
+      cls._sessions.clear()
+      cls._counters.clear()
+
+  @classmethod
+  def get_session(cls, cfg):
+    '''Get (or create) the shared session for the cfg host'''
+    key = cls.get_key(cfg)
+    with cls._lock:
+      session = cls._sessions.get(key)
+      if session is None:
+        session = cls._create_session(key, cfg)
+        cls._sessions[key] = session
+      return session
+
+  @staticmethod
+  def get_key(cfg):
+    '''Pool key for a webapp api cfg'''
+    return (cfg.get('host'), bool(cfg.get('ssl', True)))
+
+  @staticmethod
+  def get_timeout(cfg):
+    '''Default per request timeout from the api cfg'''
+    timeout = cfg.get('timeout')
+    return tuple(timeout) if isinstance(timeout, list) else timeout
+
+  @classmethod
+  def stats(cls):
+    '''
+    Connection stats for every pooled session
+    Returns
+    -------
+    Dict keyed by "host (ssl)" with number of requests, connections opened,
+    connections currently open and idle in the pool and the reuse ratio.
+    '''
+    stats = {}
+    with cls._lock:
+      items = list(cls._sessions.items())
+    for key, session in items:
+      counter = cls._counters[key]
+      opened, open_now = 0, 0
+      adapters = {id(adapter): adapter for adapter in session.adapters.values()}
+      for adapter in adapters.values():
+        manager = adapter.poolmanager
+        with manager.pools.lock:
+          pools = list(manager.pools._container.values()) # pylint: disable=protected-access
+        for pool in pools:
+          opened += pool.num_connections
+          idle = list(pool.pool.queue) if pool.pool else []
+          open_now += len([conn for conn in idle if conn is not None and getattr(conn, 'sock', None)])
+      requests_done = counter['requests']
+      stats['{} ({})'.format(key[0], 'https' if key[1] else 'http')] = {
+        'connections_opened': opened,
+        'open_connections': open_now,
+        'requests': requests_done,
+        'reuse_ratio': round(1 - opened / requests_done, 4) if requests_done else 0.0,
+      }
+    return stats
+
+  @classmethod
+  def _create_session(cls, key, cfg):
+    '''Build a session with a sized connection pool'''
+    pool_size = int(cfg.get('pool_size') or DEFAULT_POOL_SIZE)
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    session.headers['Accept-Encoding'] = ACCEPT_ENCODING
+    if cfg.get('keep_alive', True) is False:
+      session.headers['Connection'] = 'close'
+
+    counter = {'requests': 0}
+    cls._counters[key] = counter
+    counter_lock = threading.Lock()
+
+    def count_response(response, *args, **kwargs): # pylint: disable=unused-argument
+      with counter_lock:
+        counter['requests'] += 1
+      return response
+
+    session.hooks['response'].append(count_response)
+    return session
@@ -1,7 +1,6 @@
 '''Upload webapp api wrapper'''
 
 # General imports
-import json
 
 # Lib imports
 import requests
@@ -19,11 +18,13 @@ class Upload(Abstract):
   def bulk_import(self, payload={}, verify=True):
     '''Import sample from s3'''
     try:
-      response = requests.post(
+      body, headers = self._encode_body(payload)
+      response = self.session.post(
         '{}bulk_import'.format(self.endpoint),
-        data=json.dumps(payload),
-        headers=self.headers,
+        data=body,
+        headers=headers,
         params=self.payload,
+        timeout=self.timeout,
         verify=verify,
       )
       return self._parse_response(response)
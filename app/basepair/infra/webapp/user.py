@@ -1,7 +1,6 @@
 '''User webapp api wrapper'''
 
 # General imports
-import json
 import os
 
 # Lib imports
@@ -19,29 +18,25 @@ class User(Abstract):
 
   def get_configuration(self, cache=False, verify=True):
     '''Get host configuration for user'''
-    if cache:
-      filename = os.path.expanduser(cache)
-      if os.path.exists(filename) and os.path.getsize(filename):
-        return json.loads(open(filename, 'r').read().strip())
+    _cache = Abstract._get_from_cache(cache)
+    if _cache:
+      return _cache
 
     params = {'origin': 'cli'}
     params.update(self.payload)
     try:
-      response = requests.get(
+      response = self.session.get(
         '{}get_configuration'.format(self.endpoint),
         params=params,
+        timeout=self.timeout,
         verify=verify,
       )
       parsed = self._parse_response(response)
 
       # save in cache if required
       if cache and parsed and not parsed.get('error'):
-        directory = os.path.dirname(filename)
-        if not os.path.exists(directory):
-          os.makedirs(directory)
-        eprint('Saving configuration into:', filename)
-        with open(filename, 'w') as handle:
-          handle.write(json.dumps(parsed, indent=2))
+        eprint('Saving configuration into:', os.path.expanduser(cache))
+        Abstract._save_cache(cache, parsed)
       return parsed
     except requests.exceptions.RequestException as error:
       eprint('ERROR: {}'.format(error))
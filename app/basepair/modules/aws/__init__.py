@@ -1,18 +1,38 @@
-'''AWS module'''
-from .cw import CW
-from .ec2 import EC2
-from .efs import EFS
-from .handler.exception import ExceptionHandler
-from .hos import HOS
-from .how import HOW
-from .iam import IAM
-from .instance import INSTANCE_INFO
-from .logs import Logs
-from .mrktpl import MMetering
-from .policy import Policy
-from .s3 import S3
-from .service import Service
-from .sm import SM
-from .sqs import SQS
-from .sts import STS
-from .swf import SWF
+'''AWS module
+
+The wrappers are imported on first access, so that using one service does not
+import the modules of all the others.
+'''
+import importlib
+
+SERVICES = {
+  'CW': '.cw',
+  'EC2': '.ec2',
+  'EFS': '.efs',
+  'ExceptionHandler': '.handler.exception',
+  'HOS': '.hos',
+  'HOW': '.how',
+  'IAM': '.iam',
+  'INSTANCE_INFO': '.instance',
+  'Logs': '.logs',
+  'MMetering': '.mrktpl',
+  'Policy': '.policy',
+  'S3': '.s3',
+  'Service': '.service',
+  'SM': '.sm',
+  'SQS': '.sqs',
+  'STS': '.sts',
+  'SWF': '.swf',
+}
+
+__all__ = sorted(SERVICES)
+
+def __getattr__(name):
+  if name not in SERVICES:
+    raise AttributeError('module {} has no attribute {}'.format(__name__, name))
+  value = getattr(importlib.import_module(SERVICES[name], __name__), name)
+  globals()[name] = value
+  return value
+
+def __dir__():
+  return sorted(set(globals()) | set(SERVICES))
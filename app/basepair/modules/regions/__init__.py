@@ -0,0 +1,2 @@
+'''Region queries on indexed genomics files'''
+from .reader import parse_region, RegionReader
@@ -0,0 +1,89 @@
+'''Decoding of BAM headers and alignment records'''
+
+# General imports
+import struct
+
+# Constants
+CIGAR_OPS = 'MIDNSHP=X'
+REFERENCE_OPS = 'MDN=X' # operations consuming the reference
+RECORD = struct.Struct('<iiBBHHHiiii')
+SEQ_CODES = '=ACMGRSVTWYHKDBN'
+
+def parse_header(data):
+  '''
+  Reference names and lengths of a BAM header
+  Returns
+  -------
+  (names, lengths), None when data does not hold the whole header yet
+  '''
+  if data[:4] != b'BAM\x01':
+    raise ValueError('Not a BAM file.')
+  if len(data) < 12:
+    return None
+  offset = 8 + struct.unpack_from('<i', data, 4)[0]
+  if len(data) < offset + 4:
+    return None
+  n_ref = struct.unpack_from('<i', data, offset)[0]
+  offset += 4
+  names, lengths = [], []
+  for _ in range(n_ref):
+    if len(data) < offset + 4:
+      return None
+    name_length = struct.unpack_from('<i', data, offset)[0]
+    if len(data) < offset + 8 + name_length:
+      return None
+    names.append(data[offset + 4:offset + 3 + name_length].decode('utf-8'))
+    lengths.append(struct.unpack_from('<i', data, offset + 4 + name_length)[0])
+    offset += 8 + name_length
+  return names, lengths
+
+def parse_records(data, names, ref_id, start, end):
+  '''
+  Alignments of data overlapping the 0-based, half open region start-end of a reference
+  Returns
+  -------
+  Generator of dicts with the SAM fields, pos and pnext 1-based, and end the
+  0-based exclusive reference end of the alignment
+  '''
+  offset = 0
+  while offset + 4 <= len(data):
+    size = struct.unpack_from('<i', data, offset)[0]
+    record = data[offset + 4:offset + 4 + size]
+    offset += 4 + size
+    if len(record) < size:
+      break
+    (
+      record_ref, pos, name_length, mapq, _, n_cigar, flag, seq_length, next_ref, next_pos, tlen
+    ) = RECORD.unpack_from(record)
+    if record_ref != ref_id or pos >= end:
+      if record_ref > ref_id or pos >= end:
+        break
+      continue
+
+    field = RECORD.size
+    qname = record[field:field + name_length - 1].decode('utf-8')
+    field += name_length
+    cigar = struct.unpack_from('<{}I'.format(n_cigar), record, field)
+    field += 4 * n_cigar
+    span = sum(op >> 4 for op in cigar if CIGAR_OPS[op & 0xf] in REFERENCE_OPS)
+    if pos + max(span, 1) <= start:
+      continue
+
+    packed = record[field:field + (seq_length + 1) // 2]
+    field += (seq_length + 1) // 2
+    seq = ''.join(SEQ_CODES[byte >> 4] + SEQ_CODES[byte & 0xf] for byte in packed)[:seq_length]
+    qual = record[field:field + seq_length]
+    yield {
+      'cigar': ''.join('{}{}'.format(op >> 4, CIGAR_OPS[op & 0xf]) for op in cigar) or '*',
+      'end': pos + max(span, 1),
+      'flag': flag,
+      'mapq': mapq,
+      'pnext': next_pos + 1,
+      'pos': pos + 1,
+      'qname': qname,
+      'qual': '*' if not qual or qual[0] == 0xff else ''.join(chr(score + 33) for score in qual),
+      'rname': names[record_ref],
+      'rnext': '=' if next_ref == record_ref else (names[next_ref] if 0 <= next_ref < len(names) else '*'),
+      'seq': seq or '*',
+      'tlen': tlen,
+    }
@@ -0,0 +1,115 @@
+'''Random access to BGZF compressed files'''
+
+# General imports
+import struct
+import zlib
+
+# Constants
+FETCH_WINDOW = 4 * 1024 * 1024 # compressed bytes fetched at once
+HEADER_SIZE = 18 # gzip header with the BC extra subfield
+MAX_BLOCK_SIZE = 65536
+
+class BgzfFile():
+  '''
+  BGZF file of the storage, read by virtual offsets
+
+  A virtual offset is the compressed offset of a block shifted by 16 bits
+  plus the offset in the uncompressed block, as stored in the bai, tbi and
+  csi indexes. Contiguous blocks are fetched with ranged GETs of at most
+  fetch_window bytes, read from the fetched window and kept decompressed in
+  the shared block cache, so a chunk larger than the cache is still read.
+
+  Parameters
+  ----------
+  cache:        {obj}      LruCache of the decompressed blocks, shared by the files
+  fetch_window: {int}      Compressed bytes fetched at most with one ranged GET
+  get_range:    {callable} Called with (start, end) inclusive offsets, returns the bytes
+  key:          {str}      Key of the file in the block cache, e.g. its uri
+  '''
+  def __init__(self, get_range, cache, key, fetch_window=FETCH_WINDOW):
+    self.cache = cache
+    self.fetch_window = max(fetch_window, MAX_BLOCK_SIZE)
+    self.get_range = get_range
+    self.key = key
+
+  def read(self, start, end):
+    '''Get the uncompressed bytes between two virtual offsets'''
+    coffset, uoffset = start >> 16, start & 0xffff
+    end_coffset, end_uoffset = end >> 16, end & 0xffff
+    if coffset > end_coffset or (coffset == end_coffset and not end_uoffset):
+      return b''
+    # a chunk ending at a block boundary is fetched exactly, otherwise up to the largest last block
+    fetch_end = end_coffset + MAX_BLOCK_SIZE - 1 if end_uoffset else end_coffset - 1
+    parts = []
+    for block_coffset, data, next_coffset in self._iter_blocks(coffset, fetch_end):
+      if block_coffset == end_coffset:
+        parts.append(data[uoffset:end_uoffset])
+        break
+      parts.append(data[uoffset:])
+      uoffset = 0
+      if next_coffset > end_coffset:
+        raise IOError('Invalid BGZF chunk end at offset {} of {}.'.format(end_coffset, self.key))
+      if next_coffset == end_coffset and not end_uoffset:
+        break
+    return b''.join(parts)
+
+  def read_from(self, start, size):
+    '''Get at least size uncompressed bytes from a virtual offset, less at the end of the file'''
+    coffset, uoffset = start >> 16, start & 0xffff
+    parts = []
+    length = 0
+    for _, data, _ in self._iter_blocks(coffset):
+      if length >= size or not data: # end of file marker
+        break
+      parts.append(data[uoffset:])
+      length += len(data) - uoffset
+      uoffset = 0
+    return b''.join(parts)
+
+  def _fetch_blocks(self, coffset, fetch_end):
+    '''Decompress the whole blocks fetched from coffset, up to fetch_end or the fetch window, as (coffset, data, next_coffset)'''
+    raw = self.get_range(coffset, max(coffset + HEADER_SIZE, min(fetch_end, coffset + self.fetch_window - 1)))
+    blocks = []
+    position = 0
+    while position + HEADER_SIZE <= len(raw):
+      size = self._get_block_size(raw, position)
+      if position + size > len(raw):
+        break
+      extra = struct.unpack_from('<H', raw, position + 10)[0]
+      data = zlib.decompress(raw[position + 12 + extra:position + size - 8], -15)
+      blocks.append((coffset + position, data, coffset + position + size))
+      position += size
+    if not blocks:
+      raise IOError('Invalid BGZF block at offset {} of {}.'.format(coffset, self.key))
+    return blocks
+
+  def _iter_blocks(self, coffset, fetch_end=None):
+    '''
+    Iterate on the (coffset, data, next_coffset) of the decompressed blocks from coffset, from the
+    cache or fetched up to the fetch_end byte, one block at a time past it or when it is not set
+    '''
+    while True:
+      block = self.cache.get((self.key, coffset))
+      if block is not None:
+        yield (coffset,) + block
+        coffset = block[1]
+        continue
+      end = fetch_end if fetch_end is not None and fetch_end >= coffset else coffset + MAX_BLOCK_SIZE - 1
+      for block_coffset, data, next_coffset in self._fetch_blocks(coffset, end):
+        self.cache.put((self.key, block_coffset), (data, next_coffset))
+        yield block_coffset, data, next_coffset
+        coffset = next_coffset
+
+  @staticmethod
+  def _get_block_size(raw, position):
+    '''Total size of the block starting at position, from its BC subfield'''
+    if raw[position:position + 4] != b'\x1f\x8b\x08\x04':
+      raise IOError('Not a BGZF block at offset {}.'.format(position))
+    extra_end = position + 12 + struct.unpack_from('<H', raw, position + 10)[0]
+    field = position + 12
+    while field + 4 <= extra_end:
+      length = struct.unpack_from('<H', raw, field + 2)[0]
+      if raw[field:field + 2] == b'BC':
+        return struct.unpack_from('<H', raw, field + 4)[0] + 1
+      field += 4 + length
+    raise IOError('BGZF block without size at offset {}.'.format(position))
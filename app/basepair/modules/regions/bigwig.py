@@ -0,0 +1,177 @@
+'''Random access to bigWig files'''
+
+# General imports
+import struct
+import zlib
+
+# Constants
+BIGWIG_MAGIC = 0x888FFC26
+CHROM_TREE = struct.Struct('<IIIIQQ')
+HEADER = struct.Struct('<IHHQQQHHQQIQ')
+NODE = struct.Struct('<BBH')
+RTREE = struct.Struct('<IIQIIIIQII')
+RTREE_LEAF = struct.Struct('<IIIIQQ')
+RTREE_NODE = struct.Struct('<IIIIQ')
+SECTION = struct.Struct('<IIIIIBBH')
+ZOOM_HEADER = struct.Struct('<IIQQ')
+ZOOM_RECORD = struct.Struct('<IIIIffff')
+
+class BigWigFile():
+  '''
+  bigWig file of the storage, read by regions
+
+  The header, zoom headers and chromosome tree are read once with two
+  ranged GETs. A query walks the R-tree index, whose nodes are kept in the
+  shared cache, and fetches the overlapping data blocks, merging the
+  contiguous ones into a single ranged GET.
+
+  Parameters
+  ----------
+  cache:     {obj}      LruCache of the raw index nodes, shared by the files
+  get_range: {callable} Called with (start, end) inclusive offsets, returns the bytes
+  key:       {str}      Key of the file in the cache, e.g. its uri
+  '''
+  def __init__(self, get_range, cache, key):
+    self.cache = cache
+    self.get_range = get_range
+    self.key = key
+    header = get_range(0, HEADER.size - 1)
+    (
+      magic, _, zoom_levels, chrom_tree_offset, data_offset, index_offset, _, _, _, _, uncompress_size, _
+    ) = HEADER.unpack_from(header)
+    if magic != BIGWIG_MAGIC:
+      raise ValueError('Not a little endian bigWig file.')
+    self.compressed = uncompress_size > 0
+    self.index_offset = index_offset
+    self._block_sizes = {}
+    self.zooms = []
+    if zoom_levels:
+      zooms = get_range(HEADER.size, HEADER.size + zoom_levels * ZOOM_HEADER.size - 1)
+      for level in range(zoom_levels):
+        reduction, _, zoom_data, zoom_index = ZOOM_HEADER.unpack_from(zooms, level * ZOOM_HEADER.size)
+        self.zooms.append({'data_offset': zoom_data, 'index_offset': zoom_index, 'reduction': reduction})
+    self.chroms = self._parse_chrom_tree(get_range(chrom_tree_offset, data_offset - 1), chrom_tree_offset)
+
+  def query(self, name, start, end, resolution=None):
+    '''
+    Intervals overlapping the 0-based, half open region start-end of a chromosome
+    Parameters
+    ----------
+    resolution: {int} Bases per value wanted, reads the coarsest zoom level finer than it
+    Returns
+    -------
+    List of dicts with chrom, start, end and value, plus min, max and count for zoom levels
+    '''
+    if name not in self.chroms:
+      return []
+    chrom_id, size = self.chroms[name]
+    end = min(end, size)
+    index_offset, zoom = self.index_offset, None
+    for level in sorted(self.zooms, key=lambda level: level['reduction']):
+      if resolution and level['reduction'] <= resolution:
+        index_offset, zoom = level['index_offset'], level
+
+    leaves = []
+    self._find_blocks(index_offset, index_offset + RTREE.size, (chrom_id, start, end), leaves)
+    intervals = []
+    for block in self._read_blocks(sorted(leaves)):
+      if zoom:
+        intervals.extend(self._parse_zoom(block, name, chrom_id, start, end))
+      else:
+        intervals.extend(self._parse_section(block, name, chrom_id, start, end))
+    return intervals
+
+  def _find_blocks(self, index_offset, offset, region, leaves):
+    '''Collect the (offset, size) of the data blocks of an R-tree overlapping a (chrom_id, start, end) region'''
+    chrom_id, start, end = region
+    raw = self.cache.get((self.key, 'node', offset))
+    if raw is None:
+      if index_offset not in self._block_sizes:
+        self._block_sizes[index_offset] = RTREE.unpack_from(self.get_range(index_offset, index_offset + RTREE.size - 1))[1]
+      block_size = self._block_sizes[index_offset]
+      raw = self.get_range(offset, offset + NODE.size + block_size * RTREE_LEAF.size - 1)
+      self.cache.put((self.key, 'node', offset), raw)
+
+    is_leaf, _, count = NODE.unpack_from(raw)
+    item = RTREE_LEAF if is_leaf else RTREE_NODE
+    items = [item.unpack_from(raw, NODE.size + i * item.size) for i in range(count)]
+    for start_chrom, start_base, end_chrom, end_base, child, *size in items:
+      if (start_chrom, start_base) < (chrom_id, end) and (end_chrom, end_base) > (chrom_id, start):
+        if is_leaf:
+          leaves.append((child, size[0]))
+        else:
+          self._find_blocks(index_offset, child, region, leaves)
+
+  @staticmethod
+  def _parse_chrom_tree(data, base):
+    '''Map of the chromosome names to their (id, size), from the B+ tree'''
+    _, _, key_size, _, _, _ = CHROM_TREE.unpack_from(data)
+    chroms = {}
+    nodes = [CHROM_TREE.size]
+    while nodes:
+      offset = nodes.pop()
+      is_leaf, _, count = NODE.unpack_from(data, offset)
+      offset += NODE.size
+      for _ in range(count):
+        key = data[offset:offset + key_size].rstrip(b'\x00').decode('utf-8')
+        offset += key_size
+        if is_leaf:
+          chroms[key] = struct.unpack_from('<II', data, offset)
+        else:
+          nodes.append(struct.unpack_from('<Q', data, offset)[0] - base)
+        offset += 8
+    return chroms
+
+  @staticmethod
+  def _parse_section(block, name, chrom_id, start, end):
+    '''Intervals of a bedGraph, variableStep or fixedStep data section'''
+    section_chrom, section_start, _, step, span, kind, _, count = SECTION.unpack_from(block)
+    if section_chrom != chrom_id:
+      return []
+    intervals = []
+    for i in range(count):
+      if kind == 1: # bedGraph
+        item_start, item_end, value = struct.unpack_from('<IIf', block, SECTION.size + i * 12)
+      elif kind == 2: # variableStep
+        item_start, value = struct.unpack_from('<If', block, SECTION.size + i * 8)
+        item_end = item_start + span
+      else: # fixedStep
+        value = struct.unpack_from('<f', block, SECTION.size + i * 4)[0]
+        item_start = section_start + i * step
+        item_end = item_start + span
+      if item_start < end and item_end > start:
+        intervals.append({'chrom': name, 'end': item_end, 'start': item_start, 'value': value})
+    return intervals
+
+  @staticmethod
+  def _parse_zoom(block, name, chrom_id, start, end):
+    '''Summaries of a zoom level data block'''
+    intervals = []
+    for offset in range(0, len(block) - ZOOM_RECORD.size + 1, ZOOM_RECORD.size):
+      record_chrom, record_start, record_end, count, low, high, total, _ = ZOOM_RECORD.unpack_from(block, offset)
+      if record_chrom == chrom_id and record_start < end and record_end > start:
+        intervals.append({
+          'chrom': name,
+          'count': count,
+          'end': record_end,
+          'max': high,
+          'min': low,
+          'start': record_start,
+          'value': total / count if count else 0.0,
+        })
+    return intervals
+
+  def _read_blocks(self, leaves):
+    '''Get the uncompressed data blocks, fetching the contiguous ones at once'''
+    runs = []
+    for offset, size in leaves:
+      if runs and runs[-1][0] + runs[-1][1] == offset:
+        runs[-1][1] += size
+        runs[-1][2].append((offset, size))
+      else:
+        runs.append([offset, size, [(offset, size)]])
+    for run_offset, run_size, blocks in runs:
+      raw = self.get_range(run_offset, run_offset + run_size - 1)
+      for offset, size in blocks:
+        block = raw[offset - run_offset:offset - run_offset + size]
+        yield zlib.decompress(block) if self.compressed else block
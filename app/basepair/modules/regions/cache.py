@@ -0,0 +1,48 @@
+'''Bounded in memory caches of the region reader'''
+
+# General imports
+from collections import OrderedDict
+import threading
+
+class LruCache():
+  '''
+  Least recently used cache bounded by the total weight of its values
+
+  Parameters
+  ----------
+  max_size: {int}      Total weight kept
+  weigh:    {callable} Weight of a value, 1 per value when not set, e.g. len for bytes
+  '''
+  def __init__(self, max_size, weigh=None):
+    self.max_size = max_size
+    self.size = 0
+    self.weigh = weigh or (lambda value: 1)
+    self._items = OrderedDict()
+    self._lock = threading.Lock()
+
+  def __contains__(self, key):
+    return key in self._items
+
+  def __len__(self):
+    return len(self._items)
+
+  def get(self, key, default=None):
+    '''Get a value, marking it as the most recently used'''
+    with self._lock:
+      if key not in self._items:
+        return default
+      self._items.move_to_end(key)
+      return self._items[key][0]
+
+  def put(self, key, value):
+    '''Store a value, evicting the least recently used ones over max_size'''
+    weight = self.weigh(value)
+    with self._lock:
+      if key in self._items:
+        self.size -= self._items.pop(key)[1]
+      self._items[key] = (value, weight)
+      self.size += weight
+      while self.size > self.max_size and len(self._items) > 1:
+        _, (_, evicted) = self._items.popitem(last=False)
+        self.size -= evicted
+    return value
@@ -0,0 +1,127 @@
+'''Binning indexes of BGZF files: bai, tbi and csi'''
+
+# General imports
+import gzip
+import struct
+
+# Constants
+LINEAR_SHIFT = 14 # 16kb windows of the bai and tbi linear index
+TABIX_PRESETS = {0: 'generic', 1: 'sam', 2: 'vcf'}
+TABIX_ZERO_BASED = 0x10000
+
+def reg2bins(start, end, min_shift=14, depth=5):
+  '''Bins overlapping the 0-based, half open interval start-end'''
+  bins = []
+  end -= 1
+  level, first, shift = 0, 0, min_shift + depth * 3
+  while level <= depth:
+    bins.extend(range(first + (start >> shift), first + (end >> shift) + 1))
+    shift -= 3
+    first += 1 << (level * 3)
+    level += 1
+  return bins
+
+class BinningIndex():
+  '''
+  Parsed bai, tbi or csi index
+
+  Every reference has its bins, each with the chunks of virtual offsets of
+  the records it holds. A query merges the chunks of the bins overlapping
+  a region, skipping the ones ending before the first record of the
+  region when the linear index tells it.
+
+  Parameters
+  ----------
+  data: {bytes} Content of the index file, compressed or not
+  '''
+  def __init__(self, data):
+    if data[:2] == b'\x1f\x8b':
+      data = gzip.decompress(data)
+    self.depth = 5
+    self.min_shift = 14
+    self.names = []
+    self.refs = []
+    self.tabix = None
+    self._offset = 4
+    magic = data[:4]
+    if magic == b'BAI\x01':
+      self._parse_refs(data, self._unpack(data, '<i')[0], linear=True)
+    elif magic == b'TBI\x01':
+      n_ref = self._unpack(data, '<i')[0]
+      self._parse_tabix_header(data)
+      self._parse_refs(data, n_ref, linear=True)
+    elif magic == b'CSI\x01':
+      self.min_shift, self.depth, aux_length = self._unpack(data, '<iii')
+      aux_end = self._offset + aux_length
+      if aux_length >= 28:
+        self._parse_tabix_header(data)
+      self._offset = aux_end
+      self._parse_refs(data, self._unpack(data, '<i')[0], linear=False)
+    else:
+      raise ValueError('Unknown index format {!r}.'.format(magic))
+
+  def chunks(self, ref_id, start, end):
+    '''Merged (start, end) virtual offset chunks holding the records of a region'''
+    if ref_id is None or ref_id >= len(self.refs):
+      return []
+    end = min(end, 1 << (self.min_shift + self.depth * 3))
+    if start >= end:
+      return []
+    ref = self.refs[ref_id]
+    min_offset = 0
+    if ref['linear']:
+      min_offset = ref['linear'][min(start >> LINEAR_SHIFT, len(ref['linear']) - 1)]
+
+    chunks = sorted(
+      chunk
+      for number in reg2bins(start, end, self.min_shift, self.depth)
+      for chunk in ref['bins'].get(number, [])
+      if chunk[1] > min_offset
+    )
+    merged = []
+    for chunk_start, chunk_end in chunks:
+      if merged and chunk_start >> 16 <= merged[-1][1] >> 16:
+        merged[-1] = (merged[-1][0], max(merged[-1][1], chunk_end))
+      else:
+        merged.append((chunk_start, chunk_end))
+    return merged
+
+  def _parse_refs(self, data, n_ref, linear):
+    '''Read the bins, and the linear index of bai and tbi'''
+    pseudo_bin = ((1 << (self.depth * 3 + 3)) - 1) // 7 + 1
+    for _ in range(n_ref):
+      bins = {}
+      for _ in range(self._unpack(data, '<i')[0]):
+        number = self._unpack(data, '<I')[0]
+        if not linear:
+          self._unpack(data, '<Q') # loffset
+        n_chunk = self._unpack(data, '<i')[0]
+        offsets = self._unpack(data, '<{}Q'.format(2 * n_chunk))
+        if number != pseudo_bin:
+          bins[number] = list(zip(offsets[::2], offsets[1::2]))
+      intervals = []
+      if linear:
+        intervals = list(self._unpack(data, '<{}Q'.format(self._unpack(data, '<i')[0])))
+      self.refs.append({'bins': bins, 'linear': intervals})
+
+  def _parse_tabix_header(self, data):
+    '''Read the columns and sequence names of a tabix index'''
+    preset, col_seq, col_beg, col_end, meta, skip, names_length = self._unpack(data, '<iiiiiii')
+    self.tabix = {
+      'col_beg': col_beg,
+      'col_end': col_end,
+      'col_seq': col_seq,
+      'meta': chr(meta),
+      'preset': TABIX_PRESETS.get(preset & 0xffff, 'generic'),
+      'skip': skip,
+      'zero_based': bool(preset & TABIX_ZERO_BASED),
+    }
+    names = data[self._offset:self._offset + names_length]
+    self._offset += names_length
+    self.names = [name.decode('utf-8') for name in names.split(b'\x00') if name]
+
+  def _unpack(self, data, fmt):
+    '''Unpack fmt at the current offset and move past it'''
+    values = struct.unpack_from(fmt, data, self._offset)
+    self._offset += struct.calcsize(fmt)
+    return values
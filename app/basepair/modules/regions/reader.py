@@ -0,0 +1,150 @@
+'''Region queries on indexed files of the storage'''
+
+# General imports
+import re
+
+# App imports
+from .bam import parse_header, parse_records
+from .bgzf import BgzfFile
+from .bigwig import BigWigFile
+from .cache import LruCache
+from .index import BinningIndex
+from .tabix import parse_lines
+
+# Constants
+DEFAULT_BLOCK_CACHE_SIZE = 64 * 1024 * 1024 # bytes of decompressed blocks
+DEFAULT_INDEX_CACHE_SIZE = 32 # indexes, bam headers and bigwig headers
+HEADER_READ_SIZE = 64 * 1024 # bytes read at once for a bam header
+MAX_END = 1 << 31
+
+def get_format(uri):
+  '''Format of an indexed file from its extension: bam, bigwig or tabix'''
+  path = uri.lower()
+  if path.endswith('.bam'):
+    return 'bam'
+  if path.endswith(('.bigwig', '.bw')):
+    return 'bigwig'
+  if path.endswith('.cram'):
+    raise ValueError('CRAM files need their reference to be decoded, download them instead.')
+  if path.endswith(('.bgz', '.gz')):
+    return 'tabix'
+  raise ValueError('Unknown indexed file format of {}.'.format(uri))
+
+def parse_region(region):
+  '''
+  Parse a samtools style region, e.g. chr12:170,000,000-170,300,000
+  Returns
+  -------
+  (name, start, end), start 0-based and end exclusive, end is MAX_END for a whole sequence
+  '''
+  match = re.match(r'^([^:]+)(?::(\d+)(?:-(\d+))?)?$', region.replace(',', '').strip())
+  if not match:
+    raise ValueError('Invalid region {}.'.format(region))
+  name, start, end = match.groups()
+  if start is None:
+    return name, 0, MAX_END
+  start = int(start)
+  end = int(end) if end else start
+  if start < 1 or end < start:
+    raise ValueError('Invalid region {}.'.format(region))
+  return name, start - 1, end
+
+class RegionReader():
+  '''
+  Read the records of a region of BAM, tabix and bigWig files of the storage
+
+  Only the index and the byte ranges of the blocks overlapping the region are
+  read, with ranged GETs through the storage driver. Indexes and headers are
+  kept in a cache bounded by count, decompressed blocks and index nodes in a
+  cache bounded by bytes, both least recently used first.
+
+  Parameters
+  ----------
+  storage:          {obj} Storage driver, with get_range and open
+  block_cache_size: {int} Bytes of decompressed blocks kept
+  index_cache_size: {int} Indexes and headers kept
+  '''
+  def __init__(self, storage, block_cache_size=DEFAULT_BLOCK_CACHE_SIZE, index_cache_size=DEFAULT_INDEX_CACHE_SIZE):
+    self.blocks = LruCache(block_cache_size, weigh=lambda value: len(value[0]) if isinstance(value, tuple) else len(value))
+    self.indexes = LruCache(index_cache_size)
+    self.storage = storage
+
+  def fetch(self, uri, region, index_uri=None, resolution=None):
+    '''
+    Records of a file overlapping a region
+    Parameters
+    ----------
+    index_uri:  {str} Uri of the index, found next to the file when not set
+    region:     {str} Region, e.g. chr12:170,000,000-170,300,000 or chr12    [Required]
+    resolution: {int} bigWig only, bases per value to read a zoom level
+    uri:        {str} s3:// uri of a bam, bgzipped tabix or bigWig file    [Required]
+    Returns
+    -------
+    List of alignment dicts for bam, of field lists for tabix, of interval dicts for bigWig
+    '''
+    name, start, end = parse_region(region)
+    kind = get_format(uri)
+    if kind == 'bigwig':
+      return self._get_bigwig(uri).query(name, start, end, resolution=resolution)
+
+    index = self._get_index(uri, kind, index_uri)
+    bgzf = BgzfFile(lambda first, last: self.storage.get_range(uri, first, last), self.blocks, uri)
+    records = []
+    if kind == 'bam':
+      names = self._get_bam_names(uri, bgzf)
+      ref_id = names.index(name) if name in names else None
+      for chunk in index.chunks(ref_id, start, end):
+        records.extend(parse_records(bgzf.read(*chunk), names, ref_id, start, end))
+    else:
+      ref_id = index.names.index(name) if name in index.names else None
+      for chunk in index.chunks(ref_id, start, end):
+        records.extend(parse_lines(bgzf.read(*chunk), index.tabix, name, start, end))
+    return records
+
+  def _get_bam_names(self, uri, bgzf):
+    '''Reference names of a bam, from its header'''
+    names = self.indexes.get((uri, 'header'))
+    if names is None:
+      size = HEADER_READ_SIZE
+      while True:
+        data = bgzf.read_from(0, size)
+        header = parse_header(data)
+        if header or len(data) < size:
+          break
+        size *= 4
+      if not header:
+        raise IOError('Truncated bam header in {}.'.format(uri))
+      names = self.indexes.put((uri, 'header'), header[0])
+    return names
+
+  def _get_bigwig(self, uri):
+    '''Parsed header of a bigWig'''
+    bigwig = self.indexes.get((uri, 'bigwig'))
+    if bigwig is None:
+      bigwig = self.indexes.put(
+        (uri, 'bigwig'),
+        BigWigFile(lambda first, last: self.storage.get_range(uri, first, last), self.blocks, uri),
+      )
+    return bigwig
+
+  def _get_index(self, uri, kind, index_uri=None):
+    '''Parsed index of a file, from index_uri or the usual names next to it'''
+    index = self.indexes.get((uri, 'index'))
+    if index is not None:
+      return index
+
+    if index_uri:
+      candidates = [index_uri]
+    elif kind == 'bam':
+      candidates = ['{}.bai'.format(uri), '{}.bai'.format(uri[:-4]), '{}.csi'.format(uri)]
+    else:
+      candidates = ['{}.tbi'.format(uri), '{}.csi'.format(uri)]
+    from botocore.exceptions import ClientError # pylint: disable=import-outside-toplevel
+    for candidate in candidates:
+      try:
+        with self.storage.open(candidate, compression=None) as handle:
+          data = handle.read()
+      except ClientError:
+        continue
+      return self.indexes.put((uri, 'index'), BinningIndex(data))
+    raise FileNotFoundError('No index found for {}, tried {}.'.format(uri, ', '.join(candidates)))
@@ -0,0 +1,34 @@
+'''Decoding of tabix indexed text records'''
+
+def parse_lines(data, tabix, name, start, end):
+  '''
+  Lines of data overlapping the 0-based, half open region start-end of a sequence
+  Parameters
+  ----------
+  data:  {bytes} Uncompressed text of the index chunks     [Required]
+  end:   {int}   Region end                                [Required]
+  name:  {str}   Sequence name                             [Required]
+  start: {int}   Region start                              [Required]
+  tabix: {dict}  Columns of the records, BinningIndex.tabix [Required]
+  Returns
+  -------
+  Generator of the matching lines, split in fields
+  '''
+  offset = 0 if tabix['zero_based'] else 1
+  for line in data.decode('utf-8').split('\n'):
+    if not line or line.startswith(tabix['meta']):
+      continue
+    fields = line.rstrip('\r').split('\t')
+    if fields[tabix['col_seq'] - 1] != name:
+      continue
+    line_start = int(fields[tabix['col_beg'] - 1]) - offset
+    if tabix['preset'] == 'vcf':
+      line_end = line_start + len(fields[3])
+    elif tabix['col_end']:
+      line_end = int(fields[tabix['col_end'] - 1])
+    else:
+      line_end = line_start + 1
+    if line_start >= end:
+      break
+    if line_end > start:
+      yield fields
@@ -41,6 +41,10 @@ class StorageAbstract:
         """Get a public accessible url"""
         raise_no_implemented()
 
+    def get_range(self, uri, start, end):
+        """Get bytes start to end, inclusive, of a file"""
+        raise_no_implemented()
+
     def get_service(self):
         """Get storage service object"""
         raise_no_implemented()
@@ -57,6 +61,10 @@ class StorageAbstract:
         """List files in prefix"""
         raise_no_implemented()
 
+    def open(self, uri, mode='rb', compression='infer', **kwargs):
+        """Open a seekable read stream over a file"""
+        raise_no_implemented()
+
     def restore_files_from_cold(self, uris, days):
         """Restore files from cold storage"""
         raise_no_implemented()
@@ -2,6 +2,7 @@
 
 # Libs import
 from basepair.modules.aws import S3
+from basepair.modules.transfer.stream import infer_compression, open_stream
 
 # App import
 from .abstract import StorageAbstract
@@ -71,6 +72,15 @@ class Driver(StorageAbstract):
         key = S3.get_key_from_uri(uri)
         return self.s3_service.get_self_signed(key)
 
+    def get_range(self, uri, start, end):
+        """Get bytes start to end, inclusive, of a file"""
+        response = self.s3_service.client.get_object(
+            Bucket=S3.get_bucket_from_uri(uri) or self.s3_service.bucket,
+            Key=S3.get_key_from_uri(uri),
+            Range=f'bytes={start}-{end}',
+        )
+        return response['Body'].read()
+
     def get_service(self):
         return self.s3_service
 
@@ -91,6 +101,23 @@ class Driver(StorageAbstract):
     def list(self, prefix, bucket=None):
         return self.s3_service.list(prefix, bucket)
 
+    def open(self, uri, mode='rb', compression='infer', **kwargs):
+        """
+        Open a seekable read stream over a file, read with ranged GETs
+        kwargs are chunk_size, encoding and read_ahead of open_stream
+        """
+        head = self.s3_service.client.head_object(
+            Bucket=S3.get_bucket_from_uri(uri) or self.s3_service.bucket,
+            Key=S3.get_key_from_uri(uri),
+        )
+        return open_stream(
+            lambda start, end: self.get_range(uri, start, end),
+            head['ContentLength'],
+            mode=mode,
+            compression=infer_compression(uri, compression),
+            **kwargs,
+        )
+
     def restore_files_from_cold(self, uris, days):
         """Restore files from cold storage"""
         for uri in uris:
@@ -40,6 +40,10 @@ class Storage:
         """Get a public accessible url"""
         return self.driver.get_public_url(uri)
 
+    def get_range(self, uri, start, end):
+        """Get bytes start to end, inclusive, of a file"""
+        return self.driver.get_range(uri, start, end)
+
     def get_service(self):
         """Get storage service object"""
         return self.driver.get_service()
@@ -60,6 +64,10 @@ class Storage:
         """List files in prefix"""
         return self.driver.list(prefix, bucket)
 
+    def open(self, uri, mode='rb', compression='infer', **kwargs):
+        """Open a seekable read stream over a file"""
+        return self.driver.open(uri, mode, compression, **kwargs)
+
     def restore_files_from_cold(self, uris, days):
         """Restore files from cold storage"""
         return self.driver.restore_files_from_cold(uris, days)
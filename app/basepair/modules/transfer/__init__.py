@@ -0,0 +1,6 @@
+'''S3 transfer module'''
+from .cache import ObjectCache
+from .engine import TransferEngine
+from .journal import TransferJournal
+from .manager import DownloadManager
+from .stream import open_stream, RangedReader
@@ -0,0 +1,164 @@
+'''Content addressed local cache of storage objects'''
+
+# General imports
+from contextlib import contextmanager
+import errno
+import hashlib
+import os
+import shutil
+
+try:
+  import fcntl
+except ImportError: # not available on windows, locking is then skipped
+  fcntl = None
+
+# Constants
+DEFAULT_CACHE_SIZE = 50 * 1024 * 1024 * 1024 # bytes
+FICLONE = 0x40049409 # linux ioctl to reflink a file
+
+class ObjectCache():
+  '''
+  Local cache of storage objects keyed by bucket, key, ETag and version
+
+  Objects are stored once under directory/objects and materialised where
+  they are requested with a reflink when the filesystem supports it (on the
+  same device only), or a copy. With hardlink, they are hardlinked instead
+  when the destination is on the same device; the cached object is then made
+  read only, as the hardlinked files share their content with the cache. A
+  cached object is only reused when its size matches the HEAD of the storage
+  object, and an object replaced in the storage gets a new ETag, so a new
+  cache entry.
+
+  Every object is fetched under an exclusive file lock, so several processes
+  of a node asking for the same object download it once. The last use of an
+  object is recorded in directory/used, and after every new object the least
+  recently used ones are evicted to stay within max_size.
+
+  Parameters
+  ----------
+  directory: {str}  Cache directory, can be shared by the processes of a node
+  hardlink:  {bool} Hardlink the objects to their destinations, read only
+  max_size:  {int}  Quota in bytes
+  '''
+  def __init__(self, directory, max_size=DEFAULT_CACHE_SIZE, hardlink=False):
+    self.directory = os.path.expanduser(directory)
+    self.hardlink = hardlink
+    self.max_size = max_size
+    for name in ('locks', 'objects', 'used'):
+      os.makedirs(os.path.join(self.directory, name), exist_ok=True)
+
+  def evict(self):
+    '''Delete the least recently used objects until the cache fits its quota, returns the bytes freed'''
+    freed = 0
+    with self._lock('cache'):
+      objects = []
+      for name in os.listdir(os.path.join(self.directory, 'objects')):
+        if name.endswith('.tmp'):
+          continue
+        path = os.path.join(self.directory, 'objects', name)
+        try:
+          stat = os.stat(path)
+        except FileNotFoundError:
+          continue
+        try:
+          used = os.path.getmtime(os.path.join(self.directory, 'used', name))
+        except FileNotFoundError:
+          used = stat.st_mtime
+        objects.append((used, stat.st_size, name, path))
+      size = sum(item[1] for item in objects)
+      for _, object_size, name, path in sorted(objects):
+        if size <= self.max_size:
+          break
+        with self._lock(name, blocking=False) as locked:
+          if not locked: # being fetched or materialised by another process
+            continue
+          for used in (path, os.path.join(self.directory, 'used', name)):
+            try:
+              os.remove(used)
+            except FileNotFoundError:
+              pass
+          size -= object_size
+          freed += object_size
+    return freed
+
+  def fetch(self, identity, size, dest, download):
+    '''
+    Materialise an object at dest, downloading it into the cache when missing
+    Parameters
+    ----------
+    dest:     {str}      Path to materialise the object to                        [Required]
+    download: {callable} Called with a temporary path to download the object to,
+                         returns a truthy value when it succeeded                 [Required]
+    identity: {tuple}    (bucket, key, etag, version) of the object               [Required]
+    size:     {int}      Expected size in bytes, from the HEAD of the object      [Required]
+    Returns
+    -------
+    'hit' or 'miss', None if the download failed
+    '''
+    name = self.get_name(identity)
+    path = os.path.join(self.directory, 'objects', name)
+    with self._lock(name):
+      status = 'hit'
+      if not (os.path.isfile(path) and os.path.getsize(path) == size):
+        status = 'miss'
+        tmp = '{}.{}.tmp'.format(path, os.getpid())
+        if not download(tmp) or not os.path.isfile(tmp) or os.path.getsize(tmp) != size:
+          if os.path.isfile(tmp):
+            os.remove(tmp)
+          return None
+        os.replace(tmp, path)
+      used = os.path.join(self.directory, 'used', name)
+      with open(used, 'a'):
+        os.utime(used) # most recently used, kept apart from the object shared with hardlinks
+      self.materialise(path, dest, hardlink=self.hardlink)
+    if status == 'miss':
+      self.evict()
+    return status
+
+  @staticmethod
+  def get_name(identity):
+    '''Object file name of an identity'''
+    return hashlib.sha256('\0'.join(str(part or '') for part in identity).encode('utf-8')).hexdigest()
+
+  def get_path(self, identity):
+    '''Object file path of an identity'''
+    return os.path.join(self.directory, 'objects', self.get_name(identity))
+
+  @staticmethod
+  def materialise(src, dest, hardlink=False):
+    '''Reflink or copy src to dest, or hardlink it read only, replacing dest atomically'''
+    tmp = '{}.{}.tmp'.format(dest, os.getpid())
+    if hardlink:
+      os.chmod(src, 0o444) # shared with the linked files, an in place edit would corrupt the cache
+      try:
+        os.link(src, tmp)
+        os.replace(tmp, dest)
+        return
+      except OSError as error:
+        if error.errno not in (errno.EXDEV, errno.EPERM, errno.EMLINK, errno.ENOTSUP):
+          raise
+    with open(src, 'rb') as source, open(tmp, 'wb') as target:
+      try:
+        if fcntl is None:
+          raise OSError(errno.ENOTSUP, 'reflink not supported')
+        fcntl.ioctl(target.fileno(), FICLONE, source.fileno())
+      except OSError:
+        shutil.copyfileobj(source, target, 1024 * 1024)
+    os.replace(tmp, dest)
+
+  @contextmanager
+  def _lock(self, name, blocking=True):
+    '''Exclusive lock shared by the processes using the cache, yields whether it was acquired'''
+    with open(os.path.join(self.directory, 'locks', '{}.lock'.format(name)), 'a') as handle:
+      if fcntl is None:
+        yield True
+        return
+      try:
+        fcntl.flock(handle.fileno(), fcntl.LOCK_EX | (0 if blocking else fcntl.LOCK_NB))
+      except BlockingIOError:
+        yield False
+        return
+      try:
+        yield True
+      finally:
+        fcntl.flock(handle.fileno(), fcntl.LOCK_UN)
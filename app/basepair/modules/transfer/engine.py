@@ -0,0 +1,409 @@
+'''In process S3 transfers'''
+
+# General imports
+from concurrent.futures import ThreadPoolExecutor
+import datetime
+import math
+import os
+import random
+import sys
+import threading
+import time
+
+# Constants
+DEFAULT_BACKOFF = 1 # seconds, doubled on every retry
+DEFAULT_CONCURRENCY = 10
+DEFAULT_PART_SIZE = 8 * 1024 * 1024
+DEFAULT_RETRIES = 5
+FATAL_ERROR_CODES = ['403', '404', 'AccessDenied', 'NoSuchBucket', 'NoSuchKey', 'NoSuchUpload']
+MAX_BACKOFF = 60 # seconds
+MAX_PARTS = 10000 # S3 multipart limit
+PROGRESS_INTERVAL = 1 # seconds between progress lines
+
+class TransferEngine():
+  '''
+  Multipart S3 uploads and downloads with the boto3 transfer manager
+
+  It replaces the `aws s3 cp` shell-out: parts are sent by a pool of
+  threads in the current process, failed transfers are retried with an
+  exponential backoff and every transfer reports its throughput.
+
+  Parameters
+  ----------
+  storage_cfg: {dict}     User storage cfg, from Parser.get_user_storage()
+  backoff:     {float}    First retry delay in seconds
+  cache:       {obj}      ObjectCache shared by the downloads
+  concurrency: {int}      Parts transferred in parallel per file
+  journal:     {obj}      TransferJournal, makes the multipart uploads resumable
+  part_size:   {int}      Multipart chunk size and threshold in bytes
+  progress:    {callable} Called with (bytes transferred, total bytes) as parts complete
+  retries:     {int}      Retries after the first attempt
+  verbose:     {bool}     Print progress and throughput to stderr
+  '''
+  def __init__(
+    self,
+    storage_cfg,
+    backoff=DEFAULT_BACKOFF,
+    cache=None,
+    concurrency=DEFAULT_CONCURRENCY,
+    journal=None,
+    part_size=DEFAULT_PART_SIZE,
+    progress=None,
+    retries=DEFAULT_RETRIES,
+    verbose=False,
+  ): # pylint: disable=too-many-arguments
+    # boto3 takes ~100ms to import, so it is only loaded once an engine is needed
+    from boto3.s3.transfer import TransferConfig # pylint: disable=import-outside-toplevel
+    from basepair.modules.aws import S3 # pylint: disable=import-outside-toplevel
+    self.backoff = backoff
+    self.bucket = storage_cfg.get('bucket')
+    self.cache = cache
+    self.concurrency = concurrency
+    self.journal = journal
+    self.part_size = part_size
+    self.progress = progress
+    self.retries = retries
+    self.verbose = verbose
+    self.s3_service = S3({
+      'bucket': self.bucket,
+      'credentials': storage_cfg.get('credentials'),
+      'disable_sts': True,
+      'endpoint_url': storage_cfg.get('endpoint_url'),
+      'region': storage_cfg.get('region'),
+    })
+    self.config = TransferConfig(
+      max_concurrency=concurrency,
+      multipart_chunksize=part_size,
+      multipart_threshold=part_size,
+      use_threads=concurrency > 1,
+    )
+
+  def abort_stale_uploads(self, older_than=0, prefix='', dry_run=False):
+    '''
+    Abort the unfinished multipart uploads of the bucket, and forget their journal records
+    Parameters
+    ----------
+    dry_run:    {bool} Only list the uploads that would be aborted
+    older_than: {int}  Seconds since the upload was initiated
+    prefix:     {str}  Only uploads with keys under this prefix
+    Returns
+    -------
+    List of the aborted uploads, dicts with key, upload_id and initiated
+    '''
+    from botocore.exceptions import ClientError # pylint: disable=import-outside-toplevel
+    limit = datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(seconds=older_than)
+    stale = []
+    paginator = self.s3_service.client.get_paginator('list_multipart_uploads')
+    for page in paginator.paginate(Bucket=self.bucket, Prefix=prefix):
+      for upload in page.get('Uploads') or []:
+        if upload['Initiated'] <= limit:
+          stale.append({
+            'initiated': upload['Initiated'].isoformat(),
+            'key': upload['Key'],
+            'upload_id': upload['UploadId'],
+          })
+    if dry_run:
+      return stale
+
+    aborted_ids = set()
+    for upload in stale:
+      try:
+        self.s3_service.client.abort_multipart_upload(
+          Bucket=self.bucket,
+          Key=upload['key'],
+          UploadId=upload['upload_id'],
+        )
+        aborted_ids.add(upload['upload_id'])
+      except ClientError as error:
+        print('Error: {}'.format(error), file=sys.stderr)
+    if self.journal:
+      for record in self.journal.entries('multipart'):
+        if record.get('upload_id') in aborted_ids:
+          self.journal.remove('multipart', record['bucket'], record['key'])
+    return [upload for upload in stale if upload['upload_id'] in aborted_ids]
+
+  def download(self, src, dest):
+    '''
+    Download a file, unless dest is already a current copy of it
+    Parameters
+    ----------
+    dest: {str} File path to download to                     [Required]
+    src:  {str} s3:// uri or key in the storage bucket       [Required]
+    Returns
+    -------
+    Transfer stats dict, with cache set to current, hit or miss, None if it failed
+    '''
+    bucket, key = self.parse_uri(src)
+    head = self.s3_service.get_object_head(key, bucket=bucket, show_log=False)
+    if not isinstance(head, dict):
+      print('Error: s3://{}/{} not found.'.format(bucket, key), file=sys.stderr)
+      return None
+    size = head.get('ContentLength') or 0
+    identity = (bucket, key, head.get('ETag'), head.get('VersionId'))
+    if self.is_current(dest, head, identity):
+      stats = self.get_stats(0, 0)
+      stats['cache'] = 'current'
+      return stats
+
+    def download(filename):
+      return self._transfer(
+        self.s3_service.client.download_file,
+        {'Bucket': bucket, 'Filename': filename, 'Key': key},
+        size,
+        's3://{}/{}'.format(bucket, key),
+      )
+
+    if not self.cache:
+      return download(dest)
+    starttime = time.time()
+    status = self.cache.fetch(identity, size, dest, download)
+    if not status:
+      return None
+    stats = self.get_stats(size if status == 'miss' else 0, time.time() - starttime)
+    stats['cache'] = status
+    return stats
+
+  @classmethod
+  def get_stats(cls, size, seconds):
+    '''Transfer stats'''
+    return {
+      'bytes': size,
+      'bytes_per_second': round(size / seconds, 2) if seconds else float(size),
+      'seconds': round(seconds, 4),
+    }
+
+  def is_current(self, path, head, identity=None):
+    '''
+    Whether a local file is a current copy of a storage object: its size matches
+    and it is the cached object or was copied from it or, without cache, it was
+    written after the object was last modified
+    '''
+    if not os.path.isfile(path) or os.path.getsize(path) != (head.get('ContentLength') or 0):
+      return False
+    if self.cache and identity:
+      cached = self.cache.get_path(identity)
+      return os.path.isfile(cached) and (os.path.samefile(path, cached) or os.path.getmtime(path) >= os.path.getmtime(cached))
+    last_modified = head.get('LastModified')
+    return bool(last_modified) and os.path.getmtime(path) >= last_modified.timestamp()
+
+  def parse_uri(self, uri):
+    '''Split a s3:// uri or a key of the storage bucket into (bucket, key)'''
+    if uri.startswith('s3://'):
+      bucket = self.s3_service.get_bucket_from_uri(uri)
+      return bucket, self.s3_service.get_key_from_uri(uri, bucket)
+    return self.bucket, uri
+
+  def upload(self, src, dest, extra_args=None, sse=True):
+    '''
+    Upload a file
+    Parameters
+    ----------
+    dest:       {str}  s3:// uri or key in the storage bucket   [Required]
+    extra_args: {dict} boto3 ExtraArgs, e.g. {'StorageClass': 'STANDARD_IA'}
+    src:        {str}  Local file path                          [Required]
+    sse:        {bool} Encrypt the object on the server side, as `aws s3 cp --sse`
+    Files bigger than part_size are checkpointed part by part in the journal, when
+    there is one, and a later upload of the same file to the same key resumes them.
+    Returns
+    -------
+    Transfer stats dict, None if it failed
+    '''
+    bucket, key = self.parse_uri(dest)
+    extra_args = dict(extra_args or {})
+    if sse:
+      extra_args.setdefault('ServerSideEncryption', 'AES256')
+    if self.journal and os.path.getsize(src) > self.part_size:
+      return self._upload_resumable(src, bucket, key, extra_args)
+    return self._transfer(
+      self.s3_service.client.upload_file,
+      {'Bucket': bucket, 'ExtraArgs': extra_args or None, 'Filename': src, 'Key': key},
+      os.path.getsize(src),
+      src,
+    )
+
+  def _abort(self, record):
+    '''Abort a journaled multipart upload, ignoring the ones already gone'''
+    from botocore.exceptions import ClientError # pylint: disable=import-outside-toplevel
+    try:
+      self.s3_service.client.abort_multipart_upload(
+        Bucket=record['bucket'],
+        Key=record['key'],
+        UploadId=record['upload_id'],
+      )
+    except ClientError:
+      pass
+    self.journal.remove('multipart', record['bucket'], record['key'])
+
+  def _get_multipart(self, src, bucket, key, extra_args):
+    '''Get the journal record of the multipart upload of src, resuming it when possible'''
+    from botocore.exceptions import ClientError # pylint: disable=import-outside-toplevel
+    size, mtime = os.path.getsize(src), os.path.getmtime(src)
+    record = self.journal.get('multipart', bucket, key)
+    if record and (record.get('src'), record.get('size'), record.get('mtime')) == (src, size, mtime):
+      try:
+        parts = {}
+        paginator = self.s3_service.client.get_paginator('list_parts')
+        for page in paginator.paginate(Bucket=bucket, Key=key, UploadId=record['upload_id']):
+          for part in page.get('Parts') or []:
+            parts[str(part['PartNumber'])] = part['ETag']
+        # parts sent but not journaled before a crash are kept, parts lost on the server are sent again
+        record['parts'] = parts
+        print('resuming upload of {}, {} parts already sent.'.format(src, len(parts)), file=sys.stderr)
+        return record
+      except ClientError as error:
+        print('Error: {}, starting the upload over.'.format(error), file=sys.stderr)
+    elif record:
+      print('{} changed since the last attempt, starting the upload over.'.format(src), file=sys.stderr)
+      self._abort(record)
+
+    response = self.s3_service.client.create_multipart_upload(Bucket=bucket, Key=key, **extra_args)
+    record = {
+      'bucket': bucket,
+      'key': key,
+      'mtime': mtime,
+      'part_size': max(self.part_size, math.ceil(size / MAX_PARTS)),
+      'parts': {},
+      'size': size,
+      'src': src,
+      'upload_id': response['UploadId'],
+    }
+    self.journal.save(record, 'multipart', bucket, key)
+    return record
+
+  def _is_fatal(self, error):
+    '''Whether retrying the failed transfer is pointless'''
+    from botocore.exceptions import ClientError # pylint: disable=import-outside-toplevel
+    if isinstance(error, ClientError):
+      return str(error.response.get('Error', {}).get('Code')) in FATAL_ERROR_CODES
+    return isinstance(error, FileNotFoundError)
+
+  def _transfer(self, method, kwargs, size, label):
+    '''Run a transfer method with retries, returns the transfer stats or None'''
+    from boto3.exceptions import S3UploadFailedError # pylint: disable=import-outside-toplevel
+    from botocore.exceptions import BotoCoreError, ClientError # pylint: disable=import-outside-toplevel
+    from s3transfer.exceptions import RetriesExceededError # pylint: disable=import-outside-toplevel
+    for attempt in range(self.retries + 1):
+      meter = ProgressMeter(size, label, callback=self.progress, verbose=self.verbose)
+      starttime = time.time()
+      try:
+        method(Callback=meter, Config=self.config, **kwargs)
+        stats = self.get_stats(size, time.time() - starttime)
+        if self.verbose:
+          print('{}: {} bytes in {}s ({:.1f} MB/s)'.format(
+            label,
+            stats['bytes'],
+            stats['seconds'],
+            stats['bytes_per_second'] / 1024 / 1024,
+          ), file=sys.stderr)
+        return stats
+      except (BotoCoreError, ClientError, OSError, RetriesExceededError, S3UploadFailedError) as error:
+        print('Error: {}'.format(error), file=sys.stderr)
+        if attempt >= self.retries or self._is_fatal(error):
+          return None
+        delay = min(MAX_BACKOFF, self.backoff * 2 ** attempt) * (0.5 + random.random() / 2)
+        print('retrying in {:.1f} seconds.'.format(delay), file=sys.stderr)
+        time.sleep(delay)
+    return None
+
+  def _upload_part(self, record, number, meter):
+    '''Upload a part of a journaled multipart upload, returns whether it was sent'''
+    from botocore.exceptions import BotoCoreError, ClientError # pylint: disable=import-outside-toplevel
+    offset = (number - 1) * record['part_size']
+    with open(record['src'], 'rb') as handle:
+      handle.seek(offset)
+      body = handle.read(record['part_size'])
+
+    for attempt in range(self.retries + 1):
+      try:
+        response = self.s3_service.client.upload_part(
+          Body=body,
+          Bucket=record['bucket'],
+          Key=record['key'],
+          PartNumber=number,
+          UploadId=record['upload_id'],
+        )
+        break
+      except (BotoCoreError, ClientError) as error:
+        print('Error: part {} of {}: {}'.format(number, record['src'], error), file=sys.stderr)
+        if attempt >= self.retries or self._is_fatal(error):
+          return False
+        time.sleep(min(MAX_BACKOFF, self.backoff * 2 ** attempt) * (0.5 + random.random() / 2))
+
+    with self.journal.lock:
+      record['parts'][str(number)] = response['ETag']
+    self.journal.save(record, 'multipart', record['bucket'], record['key'])
+    meter(len(body))
+    return True
+
+  def _upload_resumable(self, src, bucket, key, extra_args):
+    '''Multipart upload checkpointing every part in the journal, returns the transfer stats or None'''
+    from botocore.exceptions import BotoCoreError, ClientError # pylint: disable=import-outside-toplevel
+    src = os.path.abspath(src)
+    starttime = time.time()
+    try:
+      record = self._get_multipart(src, bucket, key, extra_args)
+    except (BotoCoreError, ClientError) as error:
+      print('Error: {}'.format(error), file=sys.stderr)
+      return None
+
+    count = max(1, math.ceil(record['size'] / record['part_size']))
+    missing = [number for number in range(1, count + 1) if str(number) not in record['parts']]
+    meter = ProgressMeter(record['size'], src, callback=self.progress, verbose=self.verbose)
+    meter(record['size'] - sum(
+      min(record['part_size'], record['size'] - (number - 1) * record['part_size']) for number in missing
+    ))
+    pending = record['size'] - meter.transferred
+    with ThreadPoolExecutor(max_workers=max(1, self.concurrency)) as executor:
+      results = list(executor.map(lambda number: self._upload_part(record, number, meter), missing))
+    if not all(results):
+      print('upload of {} interrupted, run it again to resume.'.format(src), file=sys.stderr)
+      return None
+
+    try:
+      self.s3_service.client.complete_multipart_upload(
+        Bucket=bucket,
+        Key=key,
+        MultipartUpload={'Parts': [
+          {'ETag': record['parts'][str(number)], 'PartNumber': number} for number in range(1, count + 1)
+        ]},
+        UploadId=record['upload_id'],
+      )
+    except (BotoCoreError, ClientError) as error:
+      print('Error: {}'.format(error), file=sys.stderr)
+      if self._is_fatal(error):
+        self.journal.remove('multipart', bucket, key)
+      return None
+    self.journal.remove('multipart', bucket, key)
+    stats = self.get_stats(record['size'], time.time() - starttime)
+    stats['resumed_bytes'] = record['size'] - pending
+    return stats
+
+class ProgressMeter(): # pylint: disable=too-few-public-methods
+  '''Thread safe boto3 transfer callback accumulating the transferred bytes'''
+  def __init__(self, size, label, callback=None, verbose=False):
+    self.callback = callback
+    self.label = label
+    self.last_print = 0
+    self.lock = threading.Lock()
+    self.size = size
+    self.starttime = time.time()
+    self.transferred = 0
+    self.verbose = verbose
+
+  def __call__(self, chunk):
+    with self.lock:
+      self.transferred += chunk
+      transferred = self.transferred
+      now = time.time()
+      should_print = self.verbose and now - self.last_print >= PROGRESS_INTERVAL
+      if should_print:
+        self.last_print = now
+    if self.callback:
+      self.callback(transferred, self.size)
+    if should_print:
+      elapsed = now - self.starttime
+      print('{}: {:.1f}% {:.1f} MB/s'.format(
+        self.label,
+        100 * transferred / self.size if self.size else 100,
+        transferred / elapsed / 1024 / 1024 if elapsed else 0,
+      ), file=sys.stderr)
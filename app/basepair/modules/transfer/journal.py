@@ -0,0 +1,70 @@
+'''On disk checkpoints of unfinished transfers'''
+
+# General imports
+import hashlib
+import json
+import os
+import threading
+
+class TransferJournal():
+  '''
+  Small json records, one file per unfinished transfer, written atomically
+
+  Records are named by kind and a hash of their identity, e.g. the
+  multipart upload of s3://bucket/key or the files of a sample being
+  created, so a re-run finds them without scanning.
+
+  Parameters
+  ----------
+  directory: {str} Directory of the records, created on first save
+  '''
+  def __init__(self, directory):
+    self.directory = os.path.expanduser(directory)
+    self.lock = threading.Lock()
+
+  def entries(self, kind):
+    '''Get every record of a kind'''
+    if not os.path.isdir(self.directory):
+      return []
+    records = []
+    for filename in sorted(os.listdir(self.directory)):
+      if filename.startswith('{}.'.format(kind)) and filename.endswith('.json'):
+        record = self._read(os.path.join(self.directory, filename))
+        if record is not None:
+          records.append(record)
+    return records
+
+  def get(self, kind, *identity):
+    '''Get the record of a transfer, None if there is none'''
+    return self._read(self.get_path(kind, *identity))
+
+  def get_path(self, kind, *identity):
+    '''Record file path of a transfer'''
+    digest = hashlib.sha1(json.dumps(identity).encode('utf-8')).hexdigest()
+    return os.path.join(self.directory, '{}.{}.json'.format(kind, digest))
+
+  def remove(self, kind, *identity):
+    '''Remove the record of a finished transfer'''
+    try:
+      os.remove(self.get_path(kind, *identity))
+    except FileNotFoundError:
+      pass
+
+  def save(self, record, kind, *identity):
+    '''Save the record of a transfer'''
+    path = self.get_path(kind, *identity)
+    with self.lock:
+      os.makedirs(self.directory, exist_ok=True)
+      tmp = '{}.{}.tmp'.format(path, threading.get_ident())
+      with open(tmp, 'w') as handle:
+        json.dump(record, handle)
+      os.replace(tmp, path)
+
+  @staticmethod
+  def _read(path):
+    '''Read a record, None when missing or corrupt'''
+    try:
+      with open(path, 'r') as handle:
+        return json.load(handle)
+    except (OSError, ValueError):
+      return None
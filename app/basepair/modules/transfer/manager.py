@@ -0,0 +1,98 @@
+'''Concurrent file downloads'''
+
+# General imports
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import os
+import sys
+import threading
+import time
+
+# App imports
+from .engine import TransferEngine
+
+# Constants
+DEFAULT_PARALLEL = 4
+GLOBAL_LIMIT = 16 # downloads at once across every manager of the process
+
+class DownloadManager():
+  '''
+  Download files with a bounded pool of workers
+
+  Jobs run largest first, so the long transfers start early and the small
+  ones fill the gaps. Every download also takes a slot of a semaphore shared
+  by all the managers of the process, so nested batches never run more than
+  GLOBAL_LIMIT downloads at once. A failed file is reported in the errors
+  without stopping the batch.
+
+  Parameters
+  ----------
+  download: {callable} Called with (filekey, **kwargs) of a job, returns the downloaded path
+  parallel: {int}      Files downloaded at once
+  verbose:  {bool}     Print every file and the aggregate throughput to stderr
+  '''
+  slots = threading.BoundedSemaphore(GLOBAL_LIMIT)
+
+  def __init__(self, download, parallel=DEFAULT_PARALLEL, verbose=False):
+    self.download = download
+    self.jobs = []
+    self.parallel = max(1, int(parallel or 1))
+    self.verbose = verbose
+
+  def add(self, filekey, size=0, **kwargs):
+    '''
+    Queue a file
+    Parameters
+    ----------
+    filekey: {str} Storage key or uri of the file  [Required]
+    size:    {int} Size in bytes, used to order the downloads
+    kwargs:  Other arguments for the download callable
+    '''
+    self.jobs.append({'filekey': filekey, 'kwargs': kwargs, 'size': int(size or 0)})
+
+  def run(self):
+    '''
+    Download the queued files
+    Returns
+    -------
+    Dict with the downloaded path by filekey under 'files', the error message
+    by filekey under 'errors', and the aggregate bytes, seconds and bytes_per_second
+    '''
+    jobs = sorted(self.jobs, key=lambda job: job['size'], reverse=True)
+    self.jobs = []
+    report = {'errors': {}, 'files': {}}
+    starttime = time.time()
+    if jobs:
+      with ThreadPoolExecutor(max_workers=min(self.parallel, len(jobs))) as executor:
+        futures = {executor.submit(self._download, job): job for job in jobs}
+        for future in as_completed(futures):
+          job = futures[future]
+          path, error = future.result()
+          if error:
+            report['errors'][job['filekey']] = error
+          else:
+            report['files'][job['filekey']] = path
+          if self.verbose:
+            print('{} {}'.format('failed' if error else 'downloaded', job['filekey']), file=sys.stderr)
+
+    size = sum(os.path.getsize(path) for path in report['files'].values())
+    report.update(TransferEngine.get_stats(size, time.time() - starttime))
+    if self.verbose:
+      print('{} files, {} bytes in {}s ({:.1f} MB/s), {} errors'.format(
+        len(report['files']),
+        report['bytes'],
+        report['seconds'],
+        report['bytes_per_second'] / 1024 / 1024,
+        len(report['errors']),
+      ), file=sys.stderr)
+    return report
+
+  def _download(self, job):
+    '''Download a job in a global slot, returns (path, error)'''
+    with self.slots:
+      try:
+        path = self.download(job['filekey'], **job['kwargs'])
+      except Exception as error: # pylint: disable=broad-except
+        return None, str(error)
+    if not path or not os.path.isfile(path):
+      return None, 'Not able to download {}.'.format(job['filekey'])
+    return path, None
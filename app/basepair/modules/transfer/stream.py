@@ -0,0 +1,159 @@
+'''Seekable streams over storage objects'''
+
+# General imports
+from concurrent.futures import ThreadPoolExecutor
+import gzip
+import io
+
+# Constants
+DEFAULT_CHUNK_SIZE = 8 * 1024 * 1024 # bytes per ranged GET
+DEFAULT_READ_AHEAD = 2 # chunks fetched ahead of the reader
+GZIP_SUFFIXES = ('.bgz', '.gz')
+MODES = ('r', 'rb', 'rt')
+
+class RangedReader(io.RawIOBase):
+  '''
+  Raw stream reading an object with ranged GETs
+
+  The object is read in chunks of chunk_size bytes. While a chunk is
+  consumed, the next read_ahead chunks are fetched by background threads,
+  so a sequential reader rarely waits on the network. A seek outside the
+  prefetched window drops it and restarts from the new position. At most
+  read_ahead + 1 chunks are held in memory.
+
+  Parameters
+  ----------
+  get_range:  {callable} Called with (start, end) inclusive offsets, returns the bytes
+  size:       {int}      Object size in bytes
+  chunk_size: {int}      Bytes per ranged GET
+  read_ahead: {int}      Chunks fetched ahead of the reader, 0 to disable
+  '''
+  def __init__(self, get_range, size, chunk_size=DEFAULT_CHUNK_SIZE, read_ahead=DEFAULT_READ_AHEAD):
+    super().__init__()
+    self.chunk_size = max(1, int(chunk_size))
+    self.get_range = get_range
+    self.read_ahead = max(0, int(read_ahead))
+    self.size = int(size)
+    self._chunk = (None, b'')
+    self._executor = ThreadPoolExecutor(max_workers=self.read_ahead) if self.read_ahead else None
+    self._pending = {}
+    self._position = 0
+
+  def close(self):
+    '''Drop the prefetched chunks and stop the prefetch threads'''
+    if not self.closed:
+      for future in self._pending.values():
+        future.cancel()
+      self._pending = {}
+      self._chunk = (None, b'')
+      if self._executor:
+        self._executor.shutdown(wait=False)
+    super().close()
+
+  def readable(self):
+    return True
+
+  def readinto(self, buffer):
+    '''Read up to len(buffer) bytes of the current chunk into buffer'''
+    if self._position >= self.size or not len(buffer):
+      return 0
+    index = self._position // self.chunk_size
+    data = self._get_chunk(index)
+    offset = self._position - index * self.chunk_size
+    length = min(len(buffer), len(data) - offset)
+    if length <= 0:
+      raise IOError('Short read at offset {} of {} bytes.'.format(self._position, self.size))
+    buffer[:length] = data[offset:offset + length]
+    self._position += length
+    return length
+
+  def seek(self, offset, whence=io.SEEK_SET):
+    if whence == io.SEEK_SET:
+      position = offset
+    elif whence == io.SEEK_CUR:
+      position = self._position + offset
+    elif whence == io.SEEK_END:
+      position = self.size + offset
+    else:
+      raise ValueError('Invalid whence {}.'.format(whence))
+    if position < 0:
+      raise ValueError('Negative seek position {}.'.format(position))
+    self._position = position
+    return position
+
+  def seekable(self):
+    return True
+
+  def tell(self):
+    return self._position
+
+  def _fetch(self, index):
+    '''Get the bytes of a chunk'''
+    start = index * self.chunk_size
+    end = min(start + self.chunk_size, self.size) - 1
+    return self.get_range(start, end)
+
+  def _get_chunk(self, index):
+    '''Get a chunk, from the prefetched ones when possible, and prefetch the next ones'''
+    if self._chunk[0] == index:
+      return self._chunk[1]
+
+    window = range(index, min(index + self.read_ahead + 1, -(-self.size // self.chunk_size)))
+    for pending in list(self._pending):
+      if pending not in window:
+        self._pending.pop(pending).cancel()
+    future = self._pending.pop(index, None)
+    for ahead in window[1:]:
+      if ahead not in self._pending:
+        self._pending[ahead] = self._executor.submit(self._fetch, ahead)
+
+    data = future.result() if future else self._fetch(index)
+    self._chunk = (index, data)
+    return data
+
+class GzipReader(gzip.GzipFile):
+  '''GzipFile closing the stream it decompresses'''
+  def close(self):
+    fileobj = self.fileobj
+    super().close()
+    if fileobj is not None:
+      fileobj.close()
+
+def infer_compression(key, compression='infer'):
+  '''Compression of a key, guessed from its suffix when compression is infer'''
+  if compression == 'infer':
+    return 'gzip' if key.lower().endswith(GZIP_SUFFIXES) else None
+  return compression
+
+def open_stream( # pylint: disable=too-many-arguments
+  get_range,
+  size,
+  mode='rb',
+  compression=None,
+  chunk_size=DEFAULT_CHUNK_SIZE,
+  encoding='utf-8',
+  read_ahead=DEFAULT_READ_AHEAD,
+):
+  '''
+  Open a buffered, seekable stream over an object
+  Parameters
+  ----------
+  chunk_size:  {int}      Bytes per ranged GET
+  compression: {str}      'gzip' to decompress transparently, None to read the raw bytes
+  encoding:    {str}      Text encoding in text mode
+  get_range:   {callable} Called with (start, end) inclusive offsets, returns the bytes [Required]
+  mode:        {str}      'rb' for bytes, 'r' or 'rt' for text lines
+  read_ahead:  {int}      Chunks fetched ahead of the reader
+  size:        {int}      Object size in bytes                                          [Required]
+  '''
+  if mode not in MODES:
+    raise ValueError('Invalid mode {}, expected one of {}.'.format(mode, ', '.join(MODES)))
+  if compression not in (None, 'gzip'):
+    raise ValueError('Invalid compression {}.'.format(compression))
+
+  stream = io.BufferedReader(RangedReader(get_range, size, chunk_size=chunk_size, read_ahead=read_ahead))
+  if compression == 'gzip':
+    stream = GzipReader(fileobj=stream, mode='rb')
+  if mode != 'rb':
+    stream = io.TextIOWrapper(stream, encoding=encoding)
+  return stream
@@ -0,0 +1,115 @@
+'''This module contain tests for the analysis status watcher'''
+
+# General imports
+import asyncio
+from urllib.parse import parse_qs
+
+# Libs import
+import pytest
+from allure import step
+
+# App imports
+import basepair
+from basepair.helpers.analysis_watcher import AnalysisWatcher
+
+def add_analyses(mock_webapp, count):
+  '''Add running analyses'''
+  mock_webapp.add('users', [{'username': 'tester'}])
+  mock_webapp.add('analyses', [{'last_updated': '2024-01-01T00:00:00.000000', 'status': 'running'} for _ in range(count)])
+
+def set_status(mock_webapp, uid, status, last_updated):
+  '''Update an analysis of the mock webapp'''
+  analysis = mock_webapp.objects['analyses'][uid - 1]
+  analysis.update(last_updated=last_updated, status=status)
+
+def test_watch_analyses_polls_changed_chunks(mock_webapp):
+  '''validates a poll is one query per chunk asking for updates only, and only transitions are reported'''
+  with step('Arrange: 450 running analyses, finishing in two steps as they are watched'):
+    add_analyses(mock_webapp, 450)
+    bp_api = basepair.connect({'api': mock_webapp.cfg})
+    changes = []
+    def on_change(analysis, previous):
+      changes.append((analysis['id'], previous, analysis['status']))
+      if analysis['id'] == 1 and previous is None:
+        for uid in range(1, 450):
+          set_status(mock_webapp, uid, 'failed' if uid == 7 else 'complete', '2024-01-02T00:00:00.000000')
+        set_status(mock_webapp, 450, 'running', '2024-01-02T00:00:00.000000')
+      if analysis['id'] == 449 and previous == 'running':
+        set_status(mock_webapp, 450, 'complete', '2024-01-03T00:00:00.000000')
+
+  with step('Act: watch them'):
+    statuses = bp_api.watch_analyses(list(range(1, 451)) + [999], on_change=on_change, min_interval=0.01)
+
+  with step('Assert: 3 + 3 + 1 queries, the last ones filtered on last_updated, one change per transition'):
+    queries = [parse_qs(query) for command, path, query in mock_webapp.requests if path.endswith('/analyses')]
+    assert len(queries) == 7
+    assert all('last_updated__gt' not in query for query in queries[:3])
+    assert all(query['last_updated__gt'] == ['2024-01-01T00:00:00.000000'] for query in queries[3:6])
+    assert queries[6]['last_updated__gt'] == ['2024-01-02T00:00:00.000000'] and queries[6]['id__in'] == ['450']
+    assert len(changes) == 450 + 449 + 1
+    assert (450, 'running', 'running') not in changes and (450, 'running', 'complete') in changes
+    assert statuses[str(7)] == 'failed' and statuses['450'] == 'complete' and '999' not in statuses
+
+def test_watch_analyses_interval_adapts():
+  '''validates the poll interval shrinks on changes and grows when nothing changes'''
+  with step('Arrange: a watcher'):
+    watcher = AnalysisWatcher([1], min_interval=1, max_interval=4)
+
+  with step('Assert: intervals'):
+    assert [watcher.adapt([]) for _ in range(5)] == [1.5, 2.25, 3.375, 4, 4]
+    assert [watcher.adapt([('change', None)]) for _ in range(3)] == [2, 1, 1]
+
+def test_async_iter_analysis_changes(mock_webapp):
+  '''validates the async iterator reports the statuses and stops when they are final'''
+  pytest.importorskip('httpx')
+  from basepair.async_api import AsyncBpApi # pylint: disable=import-outside-toplevel
+
+  with step('Arrange: two finished analyses and a running one'):
+    add_analyses(mock_webapp, 3)
+    set_status(mock_webapp, 1, 'complete', '2024-01-02T00:00:00.000000')
+    set_status(mock_webapp, 2, 'complete', '2024-01-02T00:00:00.000000')
+
+  async def watch():
+    changes = []
+    async with AsyncBpApi(conf={'api': mock_webapp.cfg}) as bp_api:
+      async for analysis, previous in bp_api.iter_analysis_changes([1, 2, 3], min_interval=0.01):
+        changes.append((analysis['id'], previous, analysis['status']))
+        if len(changes) == 3:
+          set_status(mock_webapp, 3, 'terminated', '2024-01-03T00:00:00.000000')
+    return changes
+
+  with step('Act: watch them'):
+    changes = asyncio.run(watch())
+
+  with step('Assert: first statuses then the transition'):
+    assert changes == [(1, None, 'complete'), (2, None, 'complete'), (3, None, 'running'), (3, 'running', 'terminated')]
+
+def test_watch_analyses_stops_on_errors(mock_webapp):
+  '''validates failed polls are reported, drop no analysis, and stop the watch when they go on'''
+  with step('Arrange: analyses whose listing fails'):
+    add_analyses(mock_webapp, 3)
+    mock_webapp.failing.add('analyses')
+    bp_api = basepair.connect({'api': mock_webapp.cfg})
+
+  with step('Act and assert: an IOError after 5 polls'):
+    with pytest.raises(IOError, match='1, 2, 3'):
+      list(bp_api.iter_analysis_changes([1, 2, 3], min_interval=0.01, max_interval=0.01))
+    assert len([path for _, path, _ in mock_webapp.requests if path.endswith('/analyses')]) == 5
+
+def test_watcher_drops_missing_after_a_successful_poll():
+  '''validates analyses are dropped only from the chunks polled successfully'''
+  with step('Arrange: two chunks, the first failing once'):
+    watcher = AnalysisWatcher([1, 2, 3, 4], chunk=2, max_failures=2)
+
+  with step('Act: fail the first chunk, then poll both'):
+    watcher.fail(0, 'Error retrieving data from API!')
+    watcher.update(1, [{'id': 3, 'status': 'running'}])
+    first = watcher.drop_missing()
+    watcher.update(0, [{'id': 1, 'status': 'running'}])
+    watcher.fail(1, 'Error retrieving data from API!')
+    second = watcher.drop_missing()
+
+  with step('Assert: 4 dropped with the second chunk, 2 once the first chunk was polled'):
+    assert (first, second) == (['4'], ['2'])
+    assert sorted(watcher.statuses) == ['1', '3']
+    assert watcher.failures == [0, 1]
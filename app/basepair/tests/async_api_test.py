@@ -0,0 +1,112 @@
+'''This module contain tests for the asyncio api'''
+
+# General imports
+import asyncio
+
+# Libs import
+import pytest
+from allure import step
+
+pytest.importorskip('httpx')
+
+# App imports
+from basepair.async_api import AsyncBpApi # pylint: disable=wrong-import-position
+
+def test_async_concurrent_gets(mock_webapp):
+  '''validates many lookups run concurrently on one client'''
+  with step('Arrange: samples with analyses on a slow webapp'):
+    mock_webapp.delay = 0.05
+    mock_webapp.add('analyses', [{'last_updated': '2024-01-0{}T00:00:00.000'.format(i)} for i in range(1, 4)])
+    mock_webapp.add('samples', [
+      {'analyses': ['/api/v2/analyses/1', '/api/v2/analyses/2', '/api/v2/analyses/3']} for _ in range(40)
+    ])
+
+  async def fetch():
+    async with AsyncBpApi(conf={'api': mock_webapp.cfg}, concurrency=40) as bp_api:
+      return await asyncio.gather(*[bp_api.get_sample(uid) for uid in range(1, 41)])
+
+  with step('Act: get 40 samples and their analyses'):
+    samples = asyncio.run(fetch())
+
+  with step('Assert: samples are complete and analyses sorted by last update'):
+    assert [sample['id'] for sample in samples] == list(range(1, 41))
+    assert [analysis['id'] for analysis in samples[0]['analyses_full']] == [3, 2, 1]
+
+def test_async_list_all_and_save(mock_webapp):
+  '''validates list_all, save and errors through the async api'''
+  with step('Arrange: more samples than a page'):
+    mock_webapp.add('samples', [{'name': 'sample {}'.format(i)} for i in range(1200)])
+
+  async def run():
+    async with AsyncBpApi(conf={'api': mock_webapp.cfg}) as bp_api:
+      samples = await bp_api.get_samples()
+      updated = await bp_api.update_sample(5, {'name': 'renamed'})
+      missing = await bp_api.get_analysis(1)
+      return samples, updated, missing
+
+  with step('Act: list, update and get a missing object'):
+    samples, updated, missing = asyncio.run(run())
+
+  with step('Assert: results match the sync api behaviour'):
+    assert [sample['id'] for sample in samples] == list(range(1, 1201))
+    assert updated['name'] == 'renamed'
+    assert missing.get('error')
+
+def test_async_list_all_fills_capped_pages(mock_webapp):
+  '''validates pages capped by the server max_limit are not skipped'''
+  with step('Arrange: server capping pages under the requested size'):
+    mock_webapp.max_limit = 150
+    mock_webapp.add('samples', [{'name': 'sample {}'.format(i)} for i in range(1000)])
+
+  async def run():
+    async with AsyncBpApi(conf={'api': mock_webapp.cfg}) as bp_api:
+      return await bp_api.api('samples').list_all(page_size=400)
+
+  with step('Act: list all samples with a bigger page size'):
+    samples = asyncio.run(run())
+
+  with step('Assert: no item is skipped'):
+    assert [sample['id'] for sample in samples] == list(range(1, 1001))
+
+def test_async_file_transfers(mock_webapp, tmp_path, monkeypatch):
+  '''validates files are uploaded, found by tags and downloaded concurrently without blocking the loop'''
+  moto = pytest.importorskip('moto')
+  boto3 = pytest.importorskip('boto3')
+  monkeypatch.setenv('AWS_DEFAULT_REGION', 'us-east-1')
+  with moto.mock_aws():
+    with step('Arrange: a bucket, two local files and a sample with an analysis of their keys'):
+      boto3.client('s3', region_name='us-east-1').create_bucket(Bucket='bp-test')
+      mock_webapp.add('users', [{'username': 'tester'}])
+      mock_webapp.add('uploads', [{'status': 'pending'}, {'status': 'pending'}])
+      for name in ('a.bam', 'b.bw'):
+        (tmp_path / name).write_bytes(name.encode() * 100)
+      files = [{'path': 'analyses/1/a.bam', 'tags': ['bam']}, {'path': 'analyses/1/b.bw', 'tags': ['bigwig']}]
+      sample = {'analyses_full': [{'files': files, 'id': 1, 'params': {}, 'status': 'complete', 'tags': []}]}
+      conf = {
+        'api': mock_webapp.cfg,
+        'storage': {'user': {
+          'credentials': {'id': 'id', 'secret': 'secret'},
+          'settings': {'bucket': 'bp-test', 'region': 'us-east-1'},
+        }},
+      }
+
+    async def run():
+      async with AsyncBpApi(conf=conf, scratch=str(tmp_path / 'scratch')) as bp_api:
+        uploads = await asyncio.gather(*[
+          bp_api.upload_file(uid, str(tmp_path / name), 'analyses/1/{}'.format(name))
+          for uid, name in ((1, 'a.bam'), (2, 'b.bw'))
+        ])
+        return uploads, await asyncio.gather(
+          bp_api.get_file_by_tags(sample, dirname=str(tmp_path / 'out'), tags=['bam']),
+          bp_api.download_file('analyses/1/b.bw', dirname=str(tmp_path / 'out')),
+        )
+
+    with step('Act: upload both, then download one by tags and the other by key'):
+      uploads, paths = asyncio.run(run())
+
+    with step('Assert: uploads completed and files downloaded'):
+      assert [upload['status'] for upload in uploads] == ['completed', 'completed']
+      assert [upload['status'] for upload in mock_webapp.objects['uploads']] == ['completed', 'completed']
+      assert (tmp_path / 'out' / 'a.bam').read_bytes() == b'a.bam' * 100
+      assert (tmp_path / 'out' / 'b.bw').read_bytes() == b'b.bw' * 100
+      assert [path.split('/')[-1] for path in paths] == ['a.bam', 'b.bw']
@@ -0,0 +1,72 @@
+'''This module contain tests for the cli batch mode'''
+
+# General imports
+import json
+import os
+import subprocess
+import sys
+
+# Libs import
+from allure import step
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+def run_batch(mock_webapp, tmp_path, lines, *args):
+  '''Run basepair batch on lines through stdin, returns the process'''
+  config = tmp_path / 'config.json'
+  config.write_text(json.dumps({'api': mock_webapp.cfg}))
+  return subprocess.run(
+    [sys.executable, os.path.join(APP_DIR, 'bin', 'basepair'), 'batch', '-c', str(config), '--scratch', str(tmp_path)] + list(args),
+    capture_output=True,
+    check=False,
+    cwd=str(tmp_path),
+    env=dict(os.environ, PYTHONPATH=APP_DIR, SECRETS_DRIVER='local'),
+    input='\n'.join(lines) + '\n',
+    text=True,
+    timeout=60,
+  )
+
+def test_batch_runs_commands_in_order(mock_webapp, tmp_path):
+  '''validates every command gets a json result line, in order, with its own output and exit code'''
+  with step('Arrange: two samples and a batch with a failing and an invalid command'):
+    mock_webapp.add('users', [{'username': 'tester'}])
+    mock_webapp.add('samples', [{'name': 'first', 'analyses_full': []}, {'name': 'second', 'analyses_full': []}])
+    lines = [
+      '# comment',
+      'sample get -u 1 --json',
+      '',
+      'basepair sample get -u 2 --json',
+      'sample get -u 99',
+      'sample frobnicate',
+    ]
+
+  with step('Act: run it with two commands at once'):
+    process = run_batch(mock_webapp, tmp_path, lines, '--parallel', '2')
+
+  with step('Assert: one result per command'):
+    results = [json.loads(line) for line in process.stdout.splitlines()]
+    assert [result['line'] for result in results] == [2, 4, 5, 6]
+    assert [result['exit_code'] for result in results] == [0, 0, 1, 2]
+    assert [item['name'] for item in results[0]['data']] == ['first']
+    assert [item['name'] for item in results[1]['data']] == ['second']
+    assert 'Sample data not found.' in results[2]['stderr']
+    assert 'invalid choice' in results[3]['stderr']
+    assert process.returncode == 1
+    assert '2 of 4 commands failed.' in process.stderr
+
+def test_batch_shares_one_connection(mock_webapp, tmp_path):
+  '''validates the commands share the api, the user being fetched once'''
+  with step('Arrange: a batch of queries'):
+    mock_webapp.add('users', [{'username': 'tester'}])
+    mock_webapp.add('genomes', [{'name': 'hg38'}])
+    mock_webapp.add('samples', [{'name': 's{}'.format(index), 'genome': '/api/v2/genomes/1'} for index in range(3)])
+    lines = ['sample query --genome hg38 --no-refresh'] * 3
+
+  with step('Act: run it'):
+    process = run_batch(mock_webapp, tmp_path, ['sample query --genome hg38'] + lines)
+
+  with step('Assert: json data of every command, one user lookup'):
+    results = [json.loads(line) for line in process.stdout.splitlines()]
+    assert process.returncode == 0, process.stderr
+    assert [len(result['data']) for result in results] == [3, 3, 3, 3]
+    assert len([path for _, path, _ in mock_webapp.requests if '/users' in path]) <= 1
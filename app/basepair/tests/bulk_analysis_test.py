@@ -0,0 +1,92 @@
+'''This module contain tests for the bulk analysis operations'''
+
+# General imports
+import threading
+
+# Libs import
+from allure import step
+
+# App imports
+import basepair
+from basepair.helpers.manifest import read_analysis_specs
+
+def connect(mock_webapp):
+  '''Api on the mock webapp'''
+  mock_webapp.add('users', [{'username': 'tester'}])
+  return basepair.connect({'api': mock_webapp.cfg})
+
+def test_read_analysis_specs(tmp_path):
+  '''validates csv specs are read with their lists and params'''
+  with step('Arrange: csv of two specs'):
+    path = tmp_path / 'specs.csv'
+    path.write_text('Pipeline,Sample,Control,Project,Params\n12,1;2,3,4,5:threads:8\n12,6,,,\n')
+
+  with step('Assert: canonical keys'):
+    specs = read_analysis_specs(str(path))
+    assert specs[0] == {
+      'control_ids': ['3'],
+      'params': {'info': {}, 'node': {'5': {'threads': '8'}}},
+      'project_id': '4',
+      'sample_ids': ['1', '2'],
+      'workflow_id': '12',
+    }
+    assert specs[1] == {'control_ids': [], 'params': {'info': {}, 'node': {}}, 'sample_ids': ['6'], 'workflow_id': '12'}
+
+def test_bulk_create_analyses(mock_webapp):
+  '''validates every spec is created with its own call and gets its own result'''
+  with step('Arrange: analyses endpoint failing sample 7 and not returning the analysis of sample 8'):
+    payloads = []
+    lock = threading.Lock()
+    def create(payload):
+      with lock:
+        payloads.append(payload)
+        if payload['samples'] == ['/api/v2/samples/7']:
+          return 400, {'error': True, 'msg': 'Sample 7 is not ready.'}
+        if payload['samples'] == ['/api/v2/samples/8']:
+          return 201, {}
+        return 201, mock_webapp.add('analyses', [dict(payload)])[-1]
+    mock_webapp.actions[('analyses',)] = create
+    bp_api = connect(mock_webapp)
+    specs = [{'sample_ids': [str(sample_id)], 'workflow_id': 12} for sample_id in range(1, 11)] + [{'sample_ids': ['1']}]
+
+  with step('Act: create them 3 at once'):
+    results = bp_api.bulk_create_analyses(specs, concurrency=3)
+
+  with step('Assert: one call per valid spec, per spec results in order'):
+    assert len(payloads) == 10 and all('samples' in payload for payload in payloads)
+    assert [result['status'] for result in results] == ['created'] * 6 + ['error', 'unknown'] + ['created'] * 2 + ['error']
+    assert results[6]['error'] == 'Sample 7 is not ready.'
+    assert results[7]['id'] is None
+    assert 'workflow_id' in results[10]['error']
+    created = [analysis['samples'][0] for analysis in mock_webapp.objects['analyses']]
+    assert len(set(result['id'] for result in results if result['id'])) == 8
+    assert sorted(created) == sorted('/api/v2/samples/{}'.format(sample_id) for sample_id in range(1, 11) if sample_id not in (7, 8))
+
+def test_bulk_reanalyze_and_terminate(mock_webapp):
+  '''validates every id is posted alone with the single id payload'''
+  with step('Arrange: reanalyze refusing analysis 5'):
+    posted = {'reanalyze': [], 'terminate': []}
+    def reanalyze(payload):
+      posted['reanalyze'].append(payload)
+      if payload['id'] == '5':
+        return 400, {'error': True, 'msg': 'running'}
+      return 200, {'id': payload['id']}
+    def terminate(payload):
+      posted['terminate'].append(payload)
+      return 200, {'id': payload['id']}
+    mock_webapp.actions[('analyses', 'reanalyze')] = reanalyze
+    mock_webapp.actions[('analyses', 'terminate')] = terminate
+    bp_api = connect(mock_webapp)
+    ids = list(range(1, 121))
+
+  with step('Act: reanalyze 120 analyses and terminate 4'):
+    restarted = bp_api.bulk_reanalyze(ids, instance_type='c5.xlarge', concurrency=8)
+    terminated = bp_api.bulk_terminate(ids[:4])
+
+  with step('Assert: one call per id, per id results'):
+    assert sorted(int(payload['id']) for payload in posted['reanalyze']) == ids
+    assert all(payload['instance_type'] == 'c5.xlarge' and 'ids' not in payload for payload in posted['reanalyze'])
+    assert restarted['5'] == {'error': 'running', 'status': 'error'}
+    assert sum(result['status'] == 'restarted' for result in restarted.values()) == 119
+    assert len(posted['terminate']) == 4
+    assert terminated == {str(uid): {'error': None, 'status': 'terminated'} for uid in ids[:4]}
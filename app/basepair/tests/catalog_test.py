@@ -0,0 +1,97 @@
+'''This module contain tests for the local metadata catalog'''
+
+# General imports
+from urllib.parse import parse_qs
+
+# Libs import
+import pytest
+from allure import step
+
+# App imports
+import basepair
+
+def add_project(mock_webapp):
+  '''Two genomes, 4 samples in projects 1 and 2 and an alignment analysis per sample'''
+  mock_webapp.add('users', [{'username': 'tester'}])
+  mock_webapp.add('genomes', [{'last_updated': '2024-01-01T00:00:00.000000', 'name': name} for name in ('hg38', 'mm10')])
+  for uid in range(1, 5):
+    mock_webapp.add('samples', [{
+      'genome': '/api/v2/genomes/{}'.format(1 if uid < 4 else 2),
+      'last_updated': '2024-01-01T00:00:00.000000',
+      'name': 'sample {}'.format(uid),
+      'projects': ['/api/v2/projects/{}'.format(1 if uid < 3 else 2)],
+    }])
+    mock_webapp.add('analyses', [{
+      'files': [
+        {'id': 10 * uid, 'last_updated': '2024-0{}-01T00:00:00.000000'.format(uid), 'path': 'a/{}.dedup.bam'.format(uid), 'tags': ['bam', 'dedup']},
+        {'id': 10 * uid + 1, 'last_updated': '2024-01-01T00:00:00.000000', 'path': 'a/{}.bw'.format(uid), 'tags': ['bigwig']},
+      ],
+      'last_updated': '2024-01-01T00:00:00.000000',
+      'samples': ['/api/v2/samples/{}'.format(uid)],
+      'status': 'complete',
+    }])
+
+def test_catalog_queries_and_incremental_refresh(mock_webapp, tmp_path):
+  '''validates indexed queries, and a refresh fetching only the objects updated since the last one'''
+  with step('Arrange: a project on the mock webapp'):
+    add_project(mock_webapp)
+    bp_api = basepair.connect({'api': mock_webapp.cfg}, scratch=str(tmp_path))
+
+  with step('Act: query, then query again after an analysis changed'):
+    first = bp_api.query_catalog('files', tags=['dedup', 'bam'], genome='hg38', project_id=1, updated_after='2024-02')
+    mock_webapp.requests.clear()
+    mock_webapp.objects['analyses'][0].update(last_updated='2024-03-01T00:00:00.000000', status='failed')
+    analyses = bp_api.query_catalog('analyses', status='failed', project_id=1)
+    queries = {path.split('/')[-1]: parse_qs(query) for command, path, query in mock_webapp.requests if command == 'GET'}
+
+  with step('Assert: matching files, only changes fetched'):
+    assert [(item['id'], item['analysis_id']) for item in first] == [(20, 2)]
+    assert [analysis['id'] for analysis in analyses] == [1]
+    assert queries['analyses']['last_updated__gt'] == ['2024-01-01T00:00:00.000000']
+    assert bp_api.refresh_catalog() == {'analyses': 0, 'files': 0, 'genomes': 0, 'samples': 0, 'uploads': 0}
+    assert [sample['name'] for sample in bp_api.query_catalog('samples', refresh=False, genome='mm10')] == ['sample 4']
+    rows = bp_api.query_catalog(refresh=False, sql='SELECT genome, COUNT(*) AS count FROM samples GROUP BY genome ORDER BY genome')
+    assert rows == [{'count': 3, 'genome': 'hg38'}, {'count': 1, 'genome': 'mm10'}]
+
+def test_catalog_full_refresh_drops_deleted(mock_webapp, tmp_path):
+  '''validates a full refresh drops the objects deleted remotely, and the catalog is read only through sql'''
+  with step('Arrange: a refreshed catalog, then a sample deleted'):
+    add_project(mock_webapp)
+    bp_api = basepair.connect({'api': mock_webapp.cfg}, scratch=str(tmp_path))
+    bp_api.refresh_catalog()
+    del mock_webapp.objects['samples'][3]
+
+  with step('Act: refresh everything'):
+    bp_api.refresh_catalog(resources=['samples'], full=True)
+
+  with step('Assert: sample 4 and its project link are gone'):
+    assert [sample['id'] for sample in bp_api.query_catalog('samples', refresh=False)] == [1, 2, 3]
+    assert bp_api.query_catalog('files', refresh=False, project_id=2, tags=['bam']) == [
+      dict(mock_webapp.objects['analyses'][2]['files'][0], analysis_id=3),
+    ]
+    with pytest.raises(ValueError):
+      bp_api.query_catalog(refresh=False, sql='DELETE FROM samples')
+    with pytest.raises(ValueError):
+      bp_api.query_catalog(refresh=False, sql='WITH x AS (SELECT 1) DELETE FROM samples RETURNING id')
+    with pytest.raises(ValueError):
+      bp_api.query_catalog(refresh=False, sql="ATTACH DATABASE '{}' AS other".format(tmp_path / 'other.sqlite'))
+    assert len(bp_api.query_catalog('samples', refresh=False)) == 3
+
+def test_catalog_is_kept_by_account(mock_webapp, tmp_path):
+  '''validates each account has its own catalog file, so refresh watermarks are not shared'''
+  with step('Arrange: a project and two accounts on the same scratch dir'):
+    add_project(mock_webapp)
+    bp_api = basepair.connect({'api': mock_webapp.cfg}, scratch=str(tmp_path))
+    other = basepair.connect({'api': dict(mock_webapp.cfg, username='other')}, scratch=str(tmp_path))
+
+  with step('Act: refresh with the first account then the other'):
+    bp_api.refresh_catalog()
+    counts = other.refresh_catalog()
+
+  with step('Assert: the other account fetched everything into its own file'):
+    assert counts == {'analyses': 4, 'files': 0, 'genomes': 2, 'samples': 4, 'uploads': 0}
+    host = mock_webapp.cfg['host'].replace(':', '_')
+    assert sorted(path.name for path in tmp_path.glob('catalog.*.sqlite')) == [
+      'catalog.{}.other.sqlite'.format(host),
+      'catalog.{}.tester.sqlite'.format(host),
+    ]
@@ -0,0 +1,77 @@
+'''
+Benchmark of the webapp json codec against the json module on analysis
+objects with thousands of files, and of the compact cache size.
+
+Run it with:
+
+  python -m basepair.tests.codec_benchmark --files 1000 10000 50000
+
+The codec uses orjson when it is installed (pip install basepair[speedups]),
+else it falls back to the json module and both columns are about the same.
+'''
+from __future__ import print_function
+
+# General imports
+import argparse
+import json
+import os
+import tempfile
+import timeit
+
+# App imports
+from basepair.infra.webapp import codec
+
+def get_analysis(files):
+  '''Analysis detail like the webapp returns it, with files output files'''
+  return {
+    'completed_on': '2024-01-02T10:00:00',
+    'id': 1,
+    'name': 'rna-seq analysis',
+    'params': {'info': {'bucket': 'bp-bucket', 'genome_id': 3}, 'node': {'align': {'threads': '8'}}},
+    'samples': [{'id': 1, 'name': 'sample 1'}],
+    'status': 'complete',
+    'files': [{
+      'filesize': 1024 * 1024 * index,
+      'id': index,
+      'last_updated': '2024-01-02T10:{:02d}:00'.format(index % 60),
+      'path': 'analyses/1/outputs/sample_{}/file_{}.bam'.format(index % 12, index),
+      'source': 'output',
+      'tags': ['bam', 'dedup', 'sample_{}'.format(index % 12)],
+    } for index in range(files)],
+  }
+
+def run(files, repeat):
+  '''Best decode time of the json module and the codec, and the sizes of the old and new caches'''
+  data = json.dumps(get_analysis(files)).encode('utf-8')
+  timings = {
+    'json': min(timeit.repeat(lambda: json.loads(data), number=1, repeat=repeat)),
+    'codec': min(timeit.repeat(lambda: codec.loads(data), number=1, repeat=repeat)),
+  }
+  with tempfile.TemporaryDirectory() as directory:
+    filename = os.path.join(directory, 'analysis.json')
+    codec.write_cache(filename, codec.loads(data))
+    sizes = {'indented': len(json.dumps(json.loads(data), indent=2)), 'cache': os.path.getsize(filename)}
+  return timings, sizes
+
+def main():
+  '''Main method'''
+  parser = argparse.ArgumentParser(description='json codec benchmark')
+  parser.add_argument('--files', default=[1000, 10000, 50000], nargs='+', type=int)
+  parser.add_argument('--repeat', default=5, type=int)
+  args = parser.parse_args()
+
+  print('codec backend: {}'.format('orjson' if codec.orjson else 'json'))
+  print('{:>8} {:>10} {:>10} {:>8} {:>12} {:>10}'.format('files', 'json', 'codec', 'speedup', 'indent=2', 'cache'))
+  for files in args.files:
+    timings, sizes = run(files, args.repeat)
+    print('{:>8} {:>8.1f}ms {:>8.1f}ms {:>7.1f}x {:>10.1f}KB {:>8.1f}KB'.format(
+      files,
+      timings['json'] * 1000,
+      timings['codec'] * 1000,
+      timings['json'] / timings['codec'],
+      sizes['indented'] / 1024,
+      sizes['cache'] / 1024,
+    ))
+
+if __name__ == '__main__':
+  main()
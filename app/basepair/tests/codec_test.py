@@ -0,0 +1,79 @@
+'''This module contain tests for the webapp json codec and compressed transport'''
+
+# General imports
+import gzip
+import json
+
+# Libs import
+import pytest
+from allure import step
+
+# App imports
+from basepair.infra.webapp import codec, Sample
+
+@pytest.mark.parametrize('fast', [True, False])
+def test_codec_matches_stdlib(fast, monkeypatch):
+  '''validates the codec encodes and decodes like the json module, with or without orjson'''
+  with step('Arrange: object with int keys and a big integer'):
+    if not fast:
+      monkeypatch.setattr(codec, 'orjson', None)
+    obj = {'files': [{'id': 1, 'tags': ['bam']}], 1: 'one', 'big': 2 ** 70, 'name': 'é'}
+
+  with step('Act: round trip'):
+    data = codec.dumps(obj)
+
+  with step('Assert: same object as through the json module'):
+    assert isinstance(data, bytes)
+    assert codec.loads(data) == json.loads(json.dumps(obj))
+    assert codec.loads(data.decode('utf-8')) == codec.loads(data)
+
+def test_large_bodies_are_gzipped(mock_webapp):
+  '''validates bodies from compress_min_size bytes are sent gzipped and the small ones as is'''
+  with step('Arrange: resource compressing from 1KB'):
+    mock_webapp.add('samples', [{'name': 'existing'}])
+    resource = Sample(dict(mock_webapp.cfg, compress_min_size=1024))
+
+  with step('Act: save a small and a large sample'):
+    small = resource.save(payload={'name': 'small'})
+    large = resource.save(payload={'name': 'large', 'info': {'notes': 'x' * 4096}})
+
+  with step('Assert: both created, only the large one gzipped'):
+    assert small['name'] == 'small' and large['info']['notes'] == 'x' * 4096
+    assert mock_webapp.body_encodings == [None, 'gzip']
+
+def test_gzipped_responses_are_decoded(mock_webapp):
+  '''validates responses are requested and decoded gzipped'''
+  with step('Arrange: webapp compressing its responses'):
+    mock_webapp.gzip = True
+    mock_webapp.add('samples', [{'name': 's{}'.format(index)} for index in range(50)])
+
+  with step('Act: list the samples'):
+    items = Sample(mock_webapp.cfg).list_all()
+
+  with step('Assert: every sample'):
+    assert [item['name'] for item in items] == ['s{}'.format(index) for index in range(50)]
+
+def test_cache_is_compact_and_reads_old_files(mock_webapp, tmp_path):
+  '''validates the cache is written as compact json and the indented or gzipped caches are still read'''
+  with step('Arrange: a sample, an indented and a gzipped cache file'):
+    mock_webapp.add('samples', [{'name': 'first'}])
+    cache = tmp_path / 'json' / 'sample.1.json'
+    old_cache = tmp_path / 'json' / 'sample.2.json'
+    gzip_cache = tmp_path / 'json' / 'sample.3.json'
+    old_cache.parent.mkdir()
+    old_cache.write_text(json.dumps({'id': 2, 'name': 'old'}, indent=2))
+    gzip_cache.write_bytes(gzip.compress(json.dumps({'id': 3, 'name': 'gzipped'}).encode('utf-8')))
+
+  with step('Act: get them through the cache'):
+    resource = Sample(mock_webapp.cfg)
+    first = resource.get(1, cache=str(cache))
+    requests = len(mock_webapp.requests)
+    cached = resource.get(1, cache=str(cache))
+    old = resource.get(2, cache=str(old_cache))
+    gzipped = resource.get(3, cache=str(gzip_cache))
+
+  with step('Assert: plain compact json cache, no request for the cached objects'):
+    assert json.loads(cache.read_text()) == first
+    assert b'\n' not in cache.read_bytes() and b', ' not in cache.read_bytes()
+    assert cached == first and old['name'] == 'old' and gzipped['name'] == 'gzipped'
+    assert len(mock_webapp.requests) == requests
@@ -0,0 +1,175 @@
+''' this module contains fixtures for the api and webapp tests '''
+
+# General imports
+import gzip
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+# Import Libs
+import pytest
+
+# App imports
+from basepair.infra.webapp import SessionPool
+
+PREFIX = '/api/v2/'
+
+class MockWebapp():
+  '''In memory tastypie like server state'''
+  def __init__(self):
+    self.actions = {}
+    self.body_encodings = []
+    self.delay = 0
+    self.excludes = {} # resource: fields left out of the list responses
+    self.failing = set()
+    self.gzip = False
+    self.max_limit = 1000
+    self.objects = {}
+    self.requests = []
+    self.lock = threading.Lock()
+    self.server = None
+
+  @property
+  def cfg(self):
+    '''Api cfg pointing to the mock server'''
+    return {
+      'host': 'localhost:{}'.format(self.server.server_address[1]),
+      'key': 'key',
+      'prefix': PREFIX,
+      'ssl': False,
+      'username': 'tester',
+    }
+
+  def add(self, resource, objects):
+    '''Add objects to a resource, filling id and resource_uri'''
+    items = self.objects.setdefault(resource, [])
+    for obj in objects:
+      obj.setdefault('id', len(items) + 1)
+      obj.setdefault('resource_uri', '{}{}/{}'.format(PREFIX, resource, obj['id']))
+      items.append(obj)
+    return items
+
+  def filter(self, resource, query):
+    '''Apply the tastypie filters the client uses'''
+    items = self.objects.get(resource, [])
+    for name, values in query.items():
+      value = values[0]
+      if name in ('limit', 'offset', 'username', 'api_key', 'order_by'):
+        continue
+      if name.endswith('__in'):
+        wanted = set(value.split(','))
+        items = [item for item in items if str(item.get(name[:-4])) in wanted]
+      elif name.endswith('__gt'):
+        items = [item for item in items if str(item.get(name[:-4], '')) > value]
+      else:
+        field = name.replace('__exact', '')
+        items = [item for item in items if str(item.get(field)) == value]
+    return items
+
+
+class MockHandler(BaseHTTPRequestHandler):
+  '''Request handler answering like the webapp api'''
+  protocol_version = 'HTTP/1.1'
+  webapp = None
+
+  def log_message(self, format, *args): # pylint: disable=redefined-builtin
+    pass
+
+  def _read_payload(self):
+    '''Request body, gunzipped when sent with Content-Encoding: gzip'''
+    content = self.rfile.read(int(self.headers.get('Content-Length') or 0))
+    encoding = self.headers.get('Content-Encoding')
+    with self.webapp.lock:
+      self.webapp.body_encodings.append(encoding)
+    if encoding == 'gzip':
+      content = gzip.decompress(content)
+    return json.loads(content or b'{}')
+
+  def _send(self, status, body=None):
+    content = json.dumps(body).encode() if body is not None else b''
+    self.send_response(status)
+    self.send_header('Content-Type', 'application/json')
+    if self.webapp.gzip and 'gzip' in (self.headers.get('Accept-Encoding') or ''):
+      content = gzip.compress(content)
+      self.send_header('Content-Encoding', 'gzip')
+    self.send_header('Content-Length', str(len(content)))
+    self.end_headers()
+    self.wfile.write(content)
+
+  def _route(self):
+    url = urlparse(self.path)
+    parts = [part for part in url.path[len(PREFIX):].split('/') if part]
+    with self.webapp.lock:
+      self.webapp.requests.append((self.command, url.path, url.query))
+    if self.webapp.delay:
+      time.sleep(self.webapp.delay)
+    return parts, parse_qs(url.query)
+
+  def do_DELETE(self): # pylint: disable=invalid-name
+    '''Delete object'''
+    self._route()
+    self._send(204)
+
+  def do_GET(self): # pylint: disable=invalid-name
+    '''List or detail of objects'''
+    parts, query = self._route()
+    if parts[0] in self.webapp.failing:
+      return self._send(500)
+    if len(parts) == 2:
+      match = [item for item in self.webapp.objects.get(parts[0], []) if str(item['id']) == parts[1]]
+      return self._send(200, match[0]) if match else self._send(404)
+    items = self.webapp.filter(parts[0], query)
+    limit = int(query.get('limit', ['20'])[0])
+    limit = self.webapp.max_limit if limit == 0 else min(limit, self.webapp.max_limit)
+    offset = int(query.get('offset', ['0'])[0])
+    excludes = self.webapp.excludes.get(parts[0], ())
+    return self._send(200, {
+      'meta': {'limit': limit, 'offset': offset, 'total_count': len(items)},
+      'objects': [{key: value for key, value in item.items() if key not in excludes} for item in items[offset:offset + limit]],
+    })
+
+  def do_POST(self): # pylint: disable=invalid-name
+    '''Create object'''
+    parts, _ = self._route()
+    payload = self._read_payload()
+    if tuple(parts) in self.webapp.actions:
+      return self._send(*self.webapp.actions[tuple(parts)](payload))
+    if isinstance(payload, dict) and len(parts) == 1:
+      self.webapp.add(parts[0], [payload])
+    return self._send(201, payload)
+
+  def do_PUT(self): # pylint: disable=invalid-name
+    '''Update object'''
+    parts, _ = self._route()
+    payload = self._read_payload()
+    for item in self.webapp.objects.get(parts[0], []):
+      if str(item['id']) == parts[1]:
+        item.update(payload)
+        return self._send(200, item)
+    return self._send(404)
+
+
+def start_mock_webapp():
+  '''Start a mock webapp api in a background thread'''
+  webapp = MockWebapp()
+  handler = type('Handler', (MockHandler,), {'webapp': webapp})
+  webapp.server = ThreadingHTTPServer(('localhost', 0), handler)
+  webapp.server.daemon_threads = True
+  thread = threading.Thread(target=webapp.server.serve_forever, args=(0.05,), daemon=True)
+  thread.start()
+  return webapp
+
+def stop_mock_webapp(webapp):
+  '''Stop the mock webapp api and drop the pooled sessions'''
+  webapp.server.shutdown()
+  webapp.server.server_close()
+  SessionPool.close_all()
+
+@pytest.fixture
+def mock_webapp():
+  ''' run a local tastypie like webapp api '''
+  webapp = start_mock_webapp()
+  yield webapp
+  stop_mock_webapp(webapp)
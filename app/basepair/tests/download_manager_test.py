@@ -0,0 +1,98 @@
+'''This module contain tests for concurrent downloads'''
+
+# General imports
+import threading
+import time
+
+# Libs import
+import boto3
+import pytest
+from allure import step
+
+# App imports
+import basepair
+from basepair.modules.transfer import DownloadManager
+
+BUCKET = 'bp-test'
+
+class FakeDownload():
+  '''Download callable writing files and recording the order and concurrency'''
+  def __init__(self, tmp_path, failing=()):
+    self.active = 0
+    self.failing = failing
+    self.lock = threading.Lock()
+    self.max_active = 0
+    self.order = []
+    self.tmp_path = tmp_path
+
+  def __call__(self, filekey, content=b'x'):
+    with self.lock:
+      self.active += 1
+      self.max_active = max(self.max_active, self.active)
+      self.order.append(filekey)
+    time.sleep(0.05)
+    with self.lock:
+      self.active -= 1
+    if filekey in self.failing:
+      raise IOError('connection reset')
+    path = self.tmp_path / filekey
+    path.write_bytes(content)
+    return str(path)
+
+def test_largest_first(tmp_path):
+  '''validates a single worker downloads the largest files first'''
+  with step('Arrange: files of different sizes'):
+    download = FakeDownload(tmp_path)
+    manager = DownloadManager(download, parallel=1)
+    for name, size in [('small', 10), ('large', 1000), ('medium', 100)]:
+      manager.add(name, size=size)
+
+  with step('Assert: order by size'):
+    manager.run()
+    assert download.order == ['large', 'medium', 'small']
+
+def test_bounded_workers_and_errors(tmp_path):
+  '''validates the worker bound and that a failed file does not abort the batch'''
+  with step('Arrange: ten files, one failing'):
+    download = FakeDownload(tmp_path, failing=('file3',))
+    manager = DownloadManager(download, parallel=3)
+    for i in range(10):
+      manager.add('file{}'.format(i), content=b'0123456789')
+
+  with step('Act: download them'):
+    report = manager.run()
+
+  with step('Assert: bounded concurrency, per file error and aggregate throughput'):
+    assert download.max_active == 3
+    assert list(report['errors']) == ['file3']
+    assert 'connection reset' in report['errors']['file3']
+    assert len(report['files']) == 9
+    assert report['bytes'] == 90
+    assert report['bytes_per_second'] > 0
+
+def test_get_analysis_files_in_parallel(mock_webapp, tmp_path, monkeypatch):
+  '''validates analysis files are downloaded from the storage concurrently'''
+  moto = pytest.importorskip('moto')
+  monkeypatch.setenv('AWS_DEFAULT_REGION', 'us-east-1')
+  with moto.mock_aws():
+    with step('Arrange: analysis files in the storage'):
+      client = boto3.client('s3', region_name='us-east-1')
+      client.create_bucket(Bucket=BUCKET)
+      files = []
+      for i in range(5):
+        key = 'analyses/7/alignment/file{}.bam'.format(i)
+        client.put_object(Bucket=BUCKET, Key=key, Body=b'x' * (i + 1))
+        files.append({'filesize': i + 1, 'path': key, 'tags': ['bam']})
+      bp = basepair.connect({
+        'api': mock_webapp.cfg,
+        'storage': {'user': {
+          'credentials': {'id': 'id', 'secret': 'secret'},
+          'settings': {'bucket': BUCKET, 'region': 'us-east-1'},
+        }},
+      }, scratch=str(tmp_path))
+
+    with step('Act: download them'):
+      paths = bp.get_analysis_files({'files': files, 'id': 7}, 7, dirname=str(tmp_path / 'out'), parallel=3)
+
+    with step('Assert: every file downloaded in place'):
+      assert [open(path, 'rb').read() for path in paths] == [b'x' * (i + 1) for i in range(5)]
@@ -0,0 +1,119 @@
+'''This module contain tests for the expression matrix builder'''
+
+# General imports
+import math
+import sys
+
+# Libs import
+import boto3
+import pytest
+from allure import step
+
+# App imports
+import basepair
+from basepair import api
+from basepair.helpers import expression_matrix
+from basepair.helpers.expression_matrix import ExpressionStore, parse_counts
+
+BUCKET = 'bp-test'
+
+def test_parse_and_align(tmp_path):
+  '''validates count files are parsed and aligned on feature ids, missing ones being nan'''
+  with step('Arrange: two count files with different features'):
+    (tmp_path / 'a.txt').write_text('# featureCounts\ngene_id\tcount\nA\t1\nB\t2\n')
+    (tmp_path / 'b.txt').write_text('gene_id\tcount\nB\t5\nC\t7\n')
+    store = ExpressionStore(str(tmp_path / 'cache'))
+
+  with step('Act: store them and build the matrix'):
+    for sample_id, name in [(1, 'a.txt'), (2, 'b.txt')]:
+      store.save(sample_id, 'v1', *parse_counts(str(tmp_path / name)))
+    matrix = store.matrix([1, 2])
+
+  with step('Assert: union of the features, aligned columns'):
+    assert matrix.features == ['A', 'B', 'C']
+    assert matrix.shape == (3, 2)
+    assert list(matrix.column(1))[:2] == [1.0, 2.0] and math.isnan(matrix.column(1)[2])
+    assert math.isnan(matrix['A', 2]) and matrix.row('B') == [2.0, 5.0]
+    matrix.close()
+
+def test_parse_counts_with_and_without_numpy(tmp_path, monkeypatch):
+  '''validates the numpy parser matches the pure python one and reports invalid lines the same way'''
+  pytest.importorskip('numpy')
+  with step('Arrange: a count file with comments, a header and a blank line, and an invalid one'):
+    (tmp_path / 'a.txt').write_text('# featureCounts\nGeneid\tLength\tcount\nA\t10\t1.5\n\n# note\nB\t20\t2\n')
+    (tmp_path / 'bad.txt').write_text('gene_id\tcount\nA\t1\nB\tx\n')
+
+  with step('Act: parse with numpy, then without'):
+    with_numpy = parse_counts(str(tmp_path / 'a.txt')), parse_counts(str(tmp_path / 'a.txt'), column=1)
+    with pytest.raises(ValueError):
+      parse_counts(str(tmp_path / 'bad.txt'))
+    monkeypatch.setitem(sys.modules, 'numpy', None)
+    without_numpy = parse_counts(str(tmp_path / 'a.txt')), parse_counts(str(tmp_path / 'a.txt'), column=1)
+    with pytest.raises(ValueError):
+      parse_counts(str(tmp_path / 'bad.txt'))
+
+  with step('Assert: same features and values'):
+    assert with_numpy == without_numpy
+    assert with_numpy[0] == (['A', 'B'], expression_matrix.array('d', [1.5, 2.0]))
+
+def test_store_pairs_values_with_their_metadata(tmp_path):
+  '''validates the metadata names the values it goes with, and an open matrix keeps its values on a rebuild'''
+  with step('Arrange: a sample saved then a matrix opened'):
+    store = ExpressionStore(str(tmp_path))
+    store.save(1, 'v1', ['A', 'B'], [1, 2])
+    first = store.matrix([1])
+
+  with step('Act: save two new versions, with other features, and build again'):
+    store.save(1, 'v2', ['A'], [3])
+    store.save(1, 'v3', ['A', 'B', 'C'], [4, 5, 6])
+    last = store.matrix([1])
+
+  with step('Assert: each matrix reads its own values, only the current and previous columns are kept'):
+    assert first.row('B') == [2.0] and last.row('C') == [6.0]
+    assert len(list((tmp_path / 'samples').glob('1.*.bin'))) == 2
+    first.close()
+    last.close()
+
+def test_expression_matrix_reads_changed_samples_only(mock_webapp, tmp_path, monkeypatch):
+  '''validates a second build reuses the cache and a changed count file is the only one read again'''
+  moto = pytest.importorskip('moto')
+  monkeypatch.setenv('AWS_DEFAULT_REGION', 'us-east-1')
+  with moto.mock_aws():
+    with step('Arrange: project of three samples with gene counts'):
+      client = boto3.client('s3', region_name='us-east-1')
+      client.create_bucket(Bucket=BUCKET)
+      mock_webapp.add('users', [{'username': 'tester'}])
+      for sample_id in range(1, 4):
+        key = 'analyses/{}/counts.txt'.format(sample_id)
+        client.put_object(Bucket=BUCKET, Key=key, Body='gene_id\tcount\nA\t{}\nB\t{}\n'.format(sample_id, 10 * sample_id).encode())
+        mock_webapp.add('analyses', [{
+          'files': [{'last_updated': '2024-01-01T00:00:00.000000', 'path': key, 'tags': ['expression_count', 'by_gene', 'text']}],
+          'last_updated': '2024-01-01T00:00:00.000000',
+          'params': {},
+          'status': 'complete',
+          'tags': ['alignment'],
+        }])
+        mock_webapp.add('samples', [{'analyses': ['/api/v2/analyses/{}'.format(sample_id)], 'projects': 5}])
+      bp = basepair.connect({
+        'api': mock_webapp.cfg,
+        'storage': {'user': {
+          'credentials': {'id': 'id', 'secret': 'secret'},
+          'settings': {'bucket': BUCKET, 'region': 'us-east-1'},
+        }},
+      }, scratch=str(tmp_path))
+      parsed = []
+      monkeypatch.setattr(api, 'parse_counts', lambda path: parsed.append(path) or parse_counts(path))
+
+    with step('Act: build the matrix, again, then after sample 2 is reanalysed'):
+      first = bp.expression_matrix(project_id=5)
+      reads_first = len(parsed)
+      bp.expression_matrix(project_id=5)
+      reads_second = len(parsed)
+      client.put_object(Bucket=BUCKET, Key='analyses/2/counts.txt', Body=b'gene_id\tcount\nA\t200\nB\t20\n')
+      mock_webapp.objects['analyses'][1]['files'][0]['last_updated'] = '2024-02-01T00:00:00.000000'
+      last = bp.expression_matrix(samples=[1, 2, 3])
+
+    with step('Assert: one read per sample, none when unchanged, one for the changed sample'):
+      assert first.samples == ['1', '2', '3'] and first.row('B') == [10.0, 20.0, 30.0]
+      assert (reads_first, reads_second, len(parsed)) == (3, 3, 4)
+      assert last.row('A') == [1.0, 200.0, 3.0]
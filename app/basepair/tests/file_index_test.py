@@ -0,0 +1,90 @@
+'''This module contain tests for the file tag index'''
+
+# General imports
+import random
+
+# Libs import
+import pytest
+from allure import step
+
+# App imports
+import basepair
+from basepair.helpers import SetFilter
+from basepair.helpers.file_index import FileIndex
+
+TAGS = ['bam', 'bigwig', 'dedup', 'expression_count', 'by_gene', 'text']
+
+def random_files(count, seed=0):
+  '''Files with random tags and timestamps'''
+  rand = random.Random(seed)
+  return [{
+    'last_updated': '2020-01-{:02d}T00:00:00.000000'.format(rand.randint(1, 28)),
+    'path': 'file{}'.format(i),
+    'tags': rand.sample(TAGS, rand.randint(0, 3)),
+  } for i in range(count)]
+
+@pytest.mark.parametrize('kind', ['exact', 'subset', 'diff'])
+@pytest.mark.parametrize('tags,exclude', [(['bam'], None), (['bam', 'dedup'], ['text']), (['text'], ['bam', 'by_gene'])])
+def test_query_matches_set_filter(kind, tags, exclude):
+  '''validates indexed queries return the same files as the SetFilter scan'''
+  with step('Arrange: files and the expected scan result'):
+    files = random_files(500)
+    expected = [file for file in files if file['tags'] and getattr(SetFilter, kind)(tags, file['tags'])]
+    if exclude:
+      expected = [file for file in expected if SetFilter.diff(file['tags'], exclude)]
+
+  with step('Assert: same files in the same order'):
+    assert FileIndex(files).query(tags, kind=kind, exclude=exclude) == expected
+
+def test_get_file_by_tags_picks_latest(mock_webapp, tmp_path):
+  '''validates the latest matching file across analyses is returned'''
+  with step('Arrange: sample with two alignment analyses'):
+    bp = basepair.connect({'api': mock_webapp.cfg}, scratch=str(tmp_path))
+    analyses = [{
+      'files': [
+        {'last_updated': updated, 'path': path, 'tags': ['bam']},
+        {'last_updated': updated, 'path': path + '.bai', 'tags': ['bam', 'bai']},
+      ],
+      'id': uid,
+      'params': {},
+      'status': 'completed',
+      'tags': ['alignment'],
+    } for uid, updated, path in [
+      (1, '2020-01-01T00:00:00.000000', 'old.bam'),
+      (2, '2020-02-01T00:00:00.000000', 'new.bam'),
+    ]]
+    sample = {'analyses_full': analyses, 'id': 1}
+
+  with step('Assert: latest file, all files with multiple'):
+    assert bp.get_file_by_tags(sample, analysis_tags=['alignment'], download=False, tags=['bam']) == 'new.bam'
+    assert bp.get_file_by_tags(
+      sample, analysis_tags=['alignment'], download=False, multiple=True, tags=['bam'],
+    ) == ['new.bam', 'old.bam']
+
+def test_get_file_by_tags_downloads_serially_to_dest(mock_webapp, tmp_path, monkeypatch):
+  '''validates several matches downloaded to one dest are not downloaded concurrently'''
+  with step('Arrange: sample with two bam files and a recording download'):
+    bp = basepair.connect({'api': mock_webapp.cfg}, scratch=str(tmp_path))
+    sample = {'analyses_full': [{
+      'files': [{'last_updated': '2020-01-0{}T00:00:00.000000'.format(uid), 'path': '{}.bam'.format(uid), 'tags': ['bam']}],
+      'id': uid,
+      'params': {},
+      'status': 'completed',
+      'tags': ['alignment'],
+    } for uid in (1, 2)], 'id': 1}
+    dest = str(tmp_path / 'sample.bam')
+    calls = []
+    def download_file(filekey, dirname=None, filename=None, **_):
+      calls.append((filekey, dirname, filename))
+      with open(filename, 'w') as handle:
+        handle.write(filekey)
+      return filename
+    monkeypatch.setattr(bp, 'download_file', download_file)
+    monkeypatch.setattr(bp, 'download_files', lambda *args, **kwargs: pytest.fail('concurrent download to one dest'))
+
+  with step('Act: download every match to dest'):
+    paths = bp.get_file_by_tags(sample, dest=dest, multiple=True, tags=['bam'])
+
+  with step('Assert: downloaded one after the other, latest first'):
+    assert calls == [('2.bam', dest, dest), ('1.bam', dest, dest)]
+    assert paths == [dest, dest]
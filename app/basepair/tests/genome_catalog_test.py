@@ -0,0 +1,98 @@
+'''This module contain tests for the genome catalogue'''
+
+# General imports
+import os
+import time
+
+# Libs import
+from allure import step
+
+# App imports
+import basepair
+from basepair.helpers.genome_catalog import GenomeCatalog
+
+GENOMES = [
+  {'id': 1, 'name': 'hg19', 'resource_uri': '/api/v2/genomes/1'},
+  {'id': 2, 'name': 'mm10', 'resource_uri': '/api/v2/genomes/2'},
+]
+
+class Loader():
+  '''Genome list loader counting its calls'''
+  def __init__(self, genomes):
+    self.calls = 0
+    self.genomes = genomes
+
+  def __call__(self):
+    self.calls += 1
+    return list(self.genomes)
+
+def test_catalog_indexes(tmp_path):
+  '''validates genomes are found by name, id and resource uri'''
+  with step('Arrange: catalogue'):
+    catalog = GenomeCatalog(Loader(GENOMES), cache=str(tmp_path / 'genomes.json'))
+
+  with step('Assert: lookups by every index'):
+    assert catalog.by_name('mm10')['id'] == 2
+    assert catalog.by_id(1)['name'] == 'hg19'
+    assert catalog.by_uri('/api/v2/genomes/2')['name'] == 'mm10'
+    assert 'hg38' not in catalog
+    assert len(catalog) == 2
+
+def test_catalog_uses_fresh_cache(tmp_path):
+  '''validates a fresh persisted catalogue is not downloaded again'''
+  with step('Arrange: catalogue persisted by a first instance'):
+    cache = str(tmp_path / 'genomes.json')
+    GenomeCatalog(Loader(GENOMES), cache=cache)
+
+  with step('Act: load it again'):
+    loader = Loader(GENOMES)
+    catalog = GenomeCatalog(loader, cache=cache)
+
+  with step('Assert: nothing was downloaded'):
+    assert catalog.by_name('hg19')['id'] == 1
+    assert loader.calls == 0
+
+def test_catalog_revalidates_stale_cache(tmp_path):
+  '''validates a stale catalogue is served and refreshed in the background'''
+  with step('Arrange: stale persisted catalogue'):
+    cache = str(tmp_path / 'genomes.json')
+    GenomeCatalog(Loader(GENOMES[:1]), cache=cache)
+    os.utime(cache, (time.time() - 120, time.time() - 120))
+
+  with step('Act: load it with a one minute ttl'):
+    loader = Loader(GENOMES)
+    catalog = GenomeCatalog(loader, cache=cache, ttl=60)
+    catalog.refresh(background=True).join()
+
+  with step('Assert: refreshed once in the background'):
+    assert loader.calls == 1
+    assert catalog.by_name('mm10')['id'] == 2
+    assert loader.calls == 1
+
+def test_catalog_refreshes_cache_on_miss(tmp_path):
+  '''validates a genome missing in the persisted catalogue triggers one download'''
+  with step('Arrange: fresh catalogue persisted before mm10 existed'):
+    cache = str(tmp_path / 'genomes.json')
+    GenomeCatalog(Loader(GENOMES[:1]), cache=cache)
+    loader = Loader(GENOMES)
+    catalog = GenomeCatalog(loader, cache=cache)
+
+  with step('Assert: the miss downloads the catalogue once'):
+    assert catalog.by_name('mm10')['id'] == 2
+    assert catalog.by_name('hg38') is None
+    assert loader.calls == 1
+
+def test_bulk_sample_genomes_download_once(mock_webapp, tmp_path):
+  '''validates genome lookups across api instances reuse the persisted catalogue'''
+  with step('Arrange: webapp with genomes'):
+    mock_webapp.add('users', [{'username': 'tester'}])
+    mock_webapp.add('genomes', [{'name': 'genome {}'.format(i)} for i in range(50)])
+
+  with step('Act: resolve genomes from two api instances caching data'):
+    for _ in range(2):
+      bp = basepair.connect({'api': mock_webapp.cfg}, scratch=str(tmp_path), use_cache=True)
+      uris = [bp._get_genome_by_name('genome {}'.format(i % 50)) for i in range(1000)] # pylint: disable=protected-access
+
+  with step('Assert: a single catalogue download'):
+    assert uris[7] == '/api/v2/genomes/8'
+    assert len([req for req in mock_webapp.requests if 'genomes' in req[1]]) == 1
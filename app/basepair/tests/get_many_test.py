@@ -0,0 +1,68 @@
+'''This module contain tests for batched multi-id fetches'''
+
+# Libs import
+from allure import step
+
+# App imports
+import basepair
+from basepair.infra.webapp import Analysis
+
+def test_get_many_batches_ids(mock_webapp):
+  '''validates ids are fetched in chunks with per-id errors'''
+  with step('Arrange: add analyses'):
+    mock_webapp.add('analyses', [{'name': 'analysis {}'.format(i)} for i in range(250)])
+
+  with step('Act: get existing and missing ids in chunks of 100'):
+    result = Analysis(mock_webapp.cfg).get_many(list(range(1, 251)) + [999], chunk=100)
+
+  with step('Assert: objects are keyed by id and missing ids reported'):
+    assert len(result['objects']) == 250
+    assert result['objects']['7']['name'] == 'analysis 6'
+    assert list(result['errors']) == ['999']
+    assert len(mock_webapp.requests) == 3
+
+def test_get_sample_fetches_analyses_in_one_request(mock_webapp):
+  '''validates the full analyses of a sample are fetched with a single batched request'''
+  with step('Arrange: sample with several analyses, one of them deleted'):
+    mock_webapp.add('analyses', [
+      {'files': [], 'name': 'analysis {}'.format(i), 'last_updated': '2020-01-0{}T00:00:00.000000'.format(i + 1), 'params': {}}
+      for i in range(5)
+    ])
+    mock_webapp.add('samples', [{
+      'name': 'sample',
+      'analyses': ['/api/v2/analyses/{}'.format(i) for i in range(1, 6)] + ['/api/v1/analyses/42'],
+    }])
+    mock_webapp.add('users', [{'username': 'tester'}])
+    bp = basepair.connect({'api': mock_webapp.cfg})
+    del mock_webapp.requests[:]
+
+  with step('Act: get sample with analyses'):
+    sample = bp.get_sample(1)
+
+  with step('Assert: analyses sorted by last update, fetched in one request'):
+    assert [analysis['id'] for analysis in sample['analyses_full']] == [5, 4, 3, 2, 1]
+    assert len(mock_webapp.requests) == 2
+
+def test_get_sample_completes_analyses_from_details(mock_webapp, tmp_path):
+  '''validates analyses listed without their files are fetched one by one, and the full ones cached'''
+  with step('Arrange: sample with analyses whose files are left out of the list query'):
+    mock_webapp.add('analyses', [{
+      'files': [{'path': 'a/{}.bam'.format(i)}],
+      'last_updated': '2020-01-0{}T00:00:00.000000'.format(i + 1),
+      'params': {},
+    } for i in range(2)])
+    mock_webapp.add('samples', [{'analyses': ['/api/v2/analyses/1', '/api/v2/analyses/2']}])
+    mock_webapp.add('users', [{'username': 'tester'}])
+    mock_webapp.excludes['analyses'] = ('files',)
+    bp = basepair.connect({'api': mock_webapp.cfg}, scratch=str(tmp_path), use_cache=True)
+    del mock_webapp.requests[:]
+
+  with step('Act: get sample with analyses, twice'):
+    first = bp.get_sample(1)
+    requests = len(mock_webapp.requests)
+    bp.get_sample(1)
+
+  with step('Assert: the files come from the details, then from the cache'):
+    assert [analysis['files'] for analysis in first['analyses_full']] == [[{'path': 'a/1.bam'}], [{'path': 'a/0.bam'}]]
+    assert requests == 4
+    assert not [path for _, path, _ in mock_webapp.requests[requests:] if 'analyses' in path]
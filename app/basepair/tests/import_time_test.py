@@ -0,0 +1,62 @@
+'''This module contain import time benchmarks for the package and the cli'''
+
+# General imports
+import os
+import subprocess
+import sys
+import tempfile
+
+# Libs import
+import pytest
+from allure import step
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+HEAVY_MODULES = ('boto3', 'botocore', 'tabulate', 'yaml')
+IMPORT_BUDGETS = { # seconds, cumulative import time with a cold interpreter
+  'basepair': 0.15,
+  'basepair.api': 0.5,
+  'bin.datatypes': 0.6,
+}
+
+def get_import_times(module):
+  '''Cumulative import time in seconds of every module imported by `import module`, from python -X importtime'''
+  env = {key: value for key, value in os.environ.items() if key != 'SECRETS_DRIVER'}
+  with tempfile.TemporaryDirectory() as home: # the version check keeps its cache in the home dir
+    env['HOME'] = home
+    process = subprocess.run(
+      [sys.executable, '-X', 'importtime', '-c', 'import {}'.format(module)],
+      capture_output=True,
+      check=True,
+      cwd=APP_DIR,
+      env=env,
+      text=True,
+    )
+  times = {}
+  for line in process.stderr.splitlines():
+    if not line.startswith('import time:') or 'cumulative' in line:
+      continue
+    _, cumulative, name = line[len('import time:'):].split('|')
+    times[name.strip()] = int(cumulative) / 1e6
+  return times
+
+@pytest.mark.parametrize('module', sorted(IMPORT_BUDGETS))
+def test_import_time(module):
+  '''validates heavy dependencies are imported on use and the import stays within its budget'''
+  with step('Act: import the module in a fresh interpreter'):
+    times = get_import_times(module)
+
+  with step('Assert: no heavy dependency and within budget'):
+    assert not [name for name in HEAVY_MODULES if name in times]
+    assert times[module] < IMPORT_BUDGETS[module]
+
+def test_webapp_classes_are_lazy():
+  '''validates importing basepair does not import requests nor the helpers until they are used'''
+  with step('Act: import basepair'):
+    times = get_import_times('basepair')
+
+  with step('Assert: requests and the helpers are not imported but the classes are still exposed'):
+    assert 'requests' not in times
+    assert not [name for name in times if name.startswith('basepair.helpers.metadata_catalog') or name == 'sqlite3']
+    import basepair # pylint: disable=import-outside-toplevel
+    from basepair.infra.webapp import Analysis # pylint: disable=import-outside-toplevel
+    assert basepair.Analysis is Analysis
@@ -0,0 +1,57 @@
+'''
+Benchmark of serial vs concurrent Abstract.list_all against a local mock
+tastypie server.
+
+Run it with:
+
+  python -m basepair.tests.list_all_benchmark --sizes 10000 100000 1000000
+
+The server adds --delay seconds to every request to stand in for the
+webapp query and network latency.
+'''
+from __future__ import print_function
+
+# General imports
+import argparse
+import time
+
+# App imports
+from basepair.infra.webapp import Sample
+from basepair.tests.conftest import start_mock_webapp, stop_mock_webapp
+
+def run(size, delay, concurrency):
+  '''Time list_all serially and concurrently for size objects'''
+  webapp = start_mock_webapp()
+  webapp.delay = delay
+  webapp.add('samples', [{'name': 'sample {}'.format(i), 'status': 'completed'} for i in range(size)])
+  timings = {}
+  try:
+    for workers in (1, concurrency):
+      starttime = time.time()
+      items = Sample(webapp.cfg).list_all(concurrency=workers)
+      timings[workers] = time.time() - starttime
+      assert len(items) == size
+  finally:
+    stop_mock_webapp(webapp)
+  return timings
+
+def main():
+  '''Main method'''
+  parser = argparse.ArgumentParser(description='list_all benchmark')
+  parser.add_argument('--concurrency', default=8, type=int)
+  parser.add_argument('--delay', default=0.05, type=float, help='Server latency per request in seconds')
+  parser.add_argument('--sizes', default=[10000, 100000, 1000000], nargs='+', type=int)
+  args = parser.parse_args()
+
+  print('{:>10} {:>10} {:>12} {:>8}'.format('objects', 'serial', 'concurrent', 'speedup'))
+  for size in args.sizes:
+    timings = run(size, args.delay, args.concurrency)
+    print('{:>10} {:>9.2f}s {:>11.2f}s {:>7.1f}x'.format(
+      size,
+      timings[1],
+      timings[args.concurrency],
+      timings[1] / timings[args.concurrency],
+    ))
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,84 @@
+'''This module contain tests for paging through webapp lists'''
+
+# General imports
+import time
+
+# Libs import
+import pytest
+from allure import step
+
+# App imports
+from basepair.infra.webapp import Sample
+from basepair.infra.webapp.abstract import PAGE_SIZE_MAX, PAGE_SIZE_MIN
+
+@pytest.mark.parametrize('concurrency', [1, 4])
+def test_list_all_keeps_order(mock_webapp, concurrency):
+  '''validates serial and concurrent paging return every item in order'''
+  with step('Arrange: add more samples than a page'):
+    mock_webapp.add('samples', [{'name': 'sample {}'.format(i), 'projects': 1 + i % 2} for i in range(2345)])
+
+  with step('Act: list all samples of a project'):
+    items = Sample(mock_webapp.cfg).list_all(filters={'projects__exact': 1}, concurrency=concurrency)
+
+  with step('Assert: items are complete and ordered'):
+    assert [item['id'] for item in items] == list(range(1, 2346, 2))
+
+def test_list_all_fills_capped_pages(mock_webapp):
+  '''validates pages capped by the server max_limit are completed'''
+  with step('Arrange: server capping pages under the requested size'):
+    mock_webapp.max_limit = 150
+    mock_webapp.add('samples', [{'name': 'sample {}'.format(i)} for i in range(1000)])
+
+  with step('Act: list all samples with a bigger page size'):
+    items = Sample(mock_webapp.cfg).list_all(concurrency=3, page_size=400)
+
+  with step('Assert: no item is skipped'):
+    assert [item['id'] for item in items] == list(range(1, 1001))
+
+def test_list_all_returns_error(mock_webapp):
+  '''validates the error dict is returned when a page fails'''
+  with step('Arrange: samples list failing on the server'):
+    mock_webapp.failing.add('samples')
+
+  with step('Assert: error is reported'):
+    assert Sample(mock_webapp.cfg).list_all().get('error')
+
+@pytest.mark.parametrize('elapsed,size,expected', [
+  (0.1, 1000, 1000), # fast and small, grow
+  (8, 1000, 125), # slow, shrink
+  (20, 1000, PAGE_SIZE_MIN), # very slow, shrink to the minimum
+  (1, 64 * 1024 * 1024, PAGE_SIZE_MIN), # huge payload, shrink
+  (2, 8 * 1024 * 1024, 500), # on target, keep
+])
+def test_adapt_page_size(elapsed, size, expected):
+  '''validates the adaptive page size stays in bounds'''
+  with step('Assert: page size follows latency and payload size'):
+    limit = Sample._adapt_page_size(500, 500, elapsed, size) # pylint: disable=protected-access
+    assert PAGE_SIZE_MIN <= limit <= PAGE_SIZE_MAX
+    assert limit == expected
+
+def test_iter_all_streams_pages(mock_webapp):
+  '''validates iter_all yields every item and only prefetches one page'''
+  with step('Arrange: add five pages of samples'):
+    mock_webapp.add('samples', [{'name': 'sample {}'.format(i)} for i in range(500)])
+    items = Sample(mock_webapp.cfg).iter_all(page_size=100)
+
+  with step('Act: read the first item'):
+    first = next(items)
+    time.sleep(0.2)
+
+  with step('Assert: only the current and the next page were requested'):
+    assert first['id'] == 1
+    assert len(mock_webapp.requests) == 2
+
+  with step('Assert: the remaining items arrive in order'):
+    assert [item['id'] for item in items] == list(range(2, 501))
+
+def test_iter_all_yields_error(mock_webapp):
+  '''validates iter_all stops with the error dict when a page fails'''
+  with step('Arrange: samples list failing on the server'):
+    mock_webapp.failing.add('samples')
+
+  with step('Assert: a single error item is yielded'):
+    items = list(Sample(mock_webapp.cfg).iter_all())
+    assert len(items) == 1 and items[0].get('error')
@@ -0,0 +1,96 @@
+'''This module contain tests for the bulk sample ingestion from manifests'''
+
+# Libs import
+import boto3
+import pytest
+from allure import step
+
+# App imports
+import basepair
+from basepair.helpers.manifest import read_manifest
+
+BUCKET = 'bp-test'
+
+@pytest.fixture(name='bp_api')
+def fixture_bp_api(mock_webapp, tmp_path, monkeypatch):
+  '''Api on a mock webapp with a genome and a project, and a mocked S3'''
+  moto = pytest.importorskip('moto')
+  monkeypatch.setenv('AWS_DEFAULT_REGION', 'us-east-1')
+  with moto.mock_aws():
+    boto3.client('s3', region_name='us-east-1').create_bucket(Bucket=BUCKET)
+    mock_webapp.add('users', [{'username': 'tester'}])
+    mock_webapp.add('genomes', [{'name': 'hg38'}])
+    mock_webapp.add('projects', [{'name': 'plate 1'}])
+    yield basepair.connect({
+      'api': mock_webapp.cfg,
+      'storage': {'user': {
+        'credentials': {'id': 'id', 'secret': 'secret'},
+        'settings': {'bucket': BUCKET, 'region': 'us-east-1'},
+      }},
+    }, scratch=str(tmp_path))
+
+def write_manifest(tmp_path, rows):
+  '''Write a csv manifest of (name, genome, file1, file2) rows, creating the files'''
+  lines = ['Sample Name,Genome,Data type,Filepath 1,Filepath 2,Project,Barcode']
+  for name, genome, file1, file2 in rows:
+    for filename in filter(None, [file1, file2]):
+      (tmp_path / filename).write_bytes(b'@read\nACGT\n+\nIIII\n')
+    paths = [str(tmp_path / filename) if filename else '' for filename in (file1, file2)]
+    lines.append('{},{},rna-seq,{},{},1,{}-bc'.format(name, genome, paths[0], paths[1], name))
+  path = tmp_path / 'manifest.csv'
+  path.write_text('\n'.join(lines) + '\n')
+  return str(path)
+
+def test_read_manifest(tmp_path):
+  '''validates columns are normalised and extra columns go to the sample info'''
+  with step('Arrange: manifest with aliased columns'):
+    path = write_manifest(tmp_path, [('s1', 'hg38', 's1_R1.fq.gz', 's1_R2.fq.gz')])
+
+  with step('Assert: canonical keys and info'):
+    row = read_manifest(path)[0]
+    assert row['name'] == 's1' and row['datatype'] == 'rna-seq' and row['projects'] == '1'
+    assert row['filepaths1'] == [str(tmp_path / 's1_R1.fq.gz')]
+    assert row['info'] == {'barcode': 's1-bc'}
+    assert row['row'] == 2
+
+def test_invalid_rows_create_nothing(bp_api, mock_webapp, tmp_path):
+  '''validates every row is checked before any sample is created'''
+  with step('Arrange: manifest with an unknown genome and a duplicate name'):
+    path = write_manifest(tmp_path, [
+      ('s1', 'hg38', 's1.fq.gz', None),
+      ('s2', 'mm99', 's2.fq.gz', None),
+      ('s1', 'hg38', 's3.fq.gz', None),
+    ])
+
+  with step('Act: ingest it'):
+    report = bp_api.ingest_manifest(path)
+
+  with step('Assert: errors by row, no sample'):
+    assert sorted(report['errors']) == [2, 3, 4]
+    assert 'Unknown genome mm99.' in report['errors'][3]
+    assert not mock_webapp.objects.get('samples')
+
+def test_rerun_skips_created_rows(bp_api, mock_webapp, tmp_path, monkeypatch):
+  '''validates a failed row is retried on a re-run while the created rows are skipped'''
+  with step('Arrange: four rows, the upload of s3 failing once'):
+    path = write_manifest(tmp_path, [('s{}'.format(i), 'hg38', 's{}_R1.fq.gz'.format(i), 's{}_R2.fq.gz'.format(i)) for i in range(4)])
+    upload_file = bp_api.upload_file
+    failures = []
+    def flaky_upload_file(upload_id, filepath, key):
+      if filepath.endswith('s3_R2.fq.gz') and not failures:
+        failures.append(filepath)
+        return {'bytes': 0, 'filepath': filepath, 'key': key, 'seconds': 0, 'status': 'failed', 'upload_id': upload_id}
+      return upload_file(upload_id, filepath, key)
+    monkeypatch.setattr(bp_api, 'upload_file', flaky_upload_file)
+
+  with step('Act: ingest it twice'):
+    first = bp_api.ingest_manifest(path, parallel=3)
+    second = bp_api.ingest_manifest(path, parallel=3)
+
+  with step('Assert: one error then one resumed row, four samples in total'):
+    assert [row['status'] for row in first['rows']] == ['created', 'created', 'created', 'error']
+    assert [row['status'] for row in second['rows']] == ['skipped', 'skipped', 'skipped', 'created']
+    assert second['rows'][3]['sample_id'] == first['rows'][3]['sample_id']
+    assert len(mock_webapp.objects['samples']) == 4
+    assert len(mock_webapp.objects['uploads']) == 8
+    assert first['bytes'] > 0 and first['bytes_per_second'] > 0
@@ -0,0 +1,114 @@
+'''This module contain tests for the local object cache'''
+
+# General imports
+import multiprocessing
+import os
+import stat
+import time
+
+# Libs import
+import boto3
+import pytest
+from allure import step
+
+# App imports
+from basepair.modules.transfer import ObjectCache, TransferEngine
+
+BUCKET = 'bp-test'
+STORAGE = {'bucket': BUCKET, 'credentials': {'id': 'id', 'secret': 'secret'}, 'region': 'us-east-1'}
+
+def slow_fetch(directory, dest, counter):
+  '''Fetch an object from another process, counting the downloads'''
+  def download(tmp):
+    with counter.get_lock():
+      counter.value += 1
+    time.sleep(0.2)
+    with open(tmp, 'wb') as handle:
+      handle.write(b'x' * 100)
+    return True
+  ObjectCache(directory).fetch(('bucket', 'ref.fa', 'etag', None), 100, dest, download)
+
+def test_processes_download_once(tmp_path):
+  '''validates processes asking for the same object at once download it once'''
+  with step('Act: four processes fetch the same object'):
+    counter = multiprocessing.Value('i', 0)
+    processes = [
+      multiprocessing.Process(target=slow_fetch, args=(str(tmp_path / 'cache'), str(tmp_path / 'ref{}.fa'.format(i)), counter))
+      for i in range(4)
+    ]
+    for process in processes:
+      process.start()
+    for process in processes:
+      process.join()
+
+  with step('Assert: one download, four copies'):
+    assert counter.value == 1
+    assert all((tmp_path / 'ref{}.fa'.format(i)).read_bytes() == b'x' * 100 for i in range(4))
+    assert os.stat(tmp_path / 'ref0.fa').st_nlink == 1
+
+def test_hardlinks_are_read_only(tmp_path):
+  '''validates hardlinked objects are read only and a later use does not touch the linked files'''
+  with step('Arrange: cache hardlinking its objects'):
+    cache = ObjectCache(str(tmp_path / 'cache'), hardlink=True)
+
+    def writer(tmp):
+      with open(tmp, 'wb') as handle:
+        handle.write(b'x' * 100)
+      return True
+
+  with step('Act: fetch an object, then again an hour later to another file'):
+    cache.fetch(('bucket', 'a', 'etag', None), 100, str(tmp_path / 'a'), writer)
+    os.utime(tmp_path / 'a', (0, 3600))
+    cache.fetch(('bucket', 'a', 'etag', None), 100, str(tmp_path / 'b'), writer)
+
+  with step('Assert: one read only inode, its mtime kept'):
+    assert os.path.samefile(tmp_path / 'a', tmp_path / 'b')
+    assert stat.S_IMODE(os.stat(tmp_path / 'a').st_mode) == 0o444
+    assert os.path.getmtime(tmp_path / 'a') == 3600
+
+def test_lru_eviction(tmp_path):
+  '''validates the least recently used objects are evicted over the quota'''
+  with step('Arrange: cache of 250 bytes'):
+    cache = ObjectCache(str(tmp_path / 'cache'), max_size=250)
+
+    def writer(tmp):
+      with open(tmp, 'wb') as handle:
+        handle.write(b'x' * 100)
+      return True
+
+  with step('Act: fetch a, b, a again, then c'):
+    for name in ['a', 'b', 'a', 'c']:
+      cache.fetch(('bucket', name, 'etag', None), 100, str(tmp_path / name), writer)
+      time.sleep(0.01)
+
+  with step('Assert: b was evicted'):
+    assert os.path.isfile(cache.get_path(('bucket', 'a', 'etag', None)))
+    assert not os.path.isfile(cache.get_path(('bucket', 'b', 'etag', None)))
+    assert os.path.isfile(cache.get_path(('bucket', 'c', 'etag', None)))
+
+def test_engine_validates_against_head(tmp_path, monkeypatch):
+  '''validates cached and local files are reused only while they match the storage object'''
+  moto = pytest.importorskip('moto')
+  monkeypatch.setenv('AWS_DEFAULT_REGION', 'us-east-1')
+  with moto.mock_aws():
+    with step('Arrange: object and an engine with a cache'):
+      client = boto3.client('s3', region_name='us-east-1')
+      client.create_bucket(Bucket=BUCKET)
+      client.put_object(Bucket=BUCKET, Key='genomes/hg19.fa', Body=b'ACGT' * 10)
+      engine = TransferEngine(STORAGE, cache=ObjectCache(str(tmp_path / 'cache')))
+
+    with step('Assert: first download misses, another directory hits, same file is current'):
+      assert engine.download('genomes/hg19.fa', str(tmp_path / 'hg19.fa'))['cache'] == 'miss'
+      assert engine.download('genomes/hg19.fa', str(tmp_path / 'copy.fa'))['cache'] == 'hit'
+      assert engine.download('genomes/hg19.fa', str(tmp_path / 'copy.fa'))['cache'] == 'current'
+
+    with step('Assert: a truncated file is replaced'):
+      os.remove(tmp_path / 'copy.fa')
+      (tmp_path / 'copy.fa').write_bytes(b'ACGT')
+      assert engine.download('genomes/hg19.fa', str(tmp_path / 'copy.fa'))['cache'] == 'hit'
+      assert (tmp_path / 'copy.fa').read_bytes() == b'ACGT' * 10
+
+    with step('Assert: an object changed in the storage is downloaded again'):
+      client.put_object(Bucket=BUCKET, Key='genomes/hg19.fa', Body=b'TTTT' * 10)
+      assert engine.download('genomes/hg19.fa', str(tmp_path / 'copy.fa'))['cache'] == 'miss'
+      assert (tmp_path / 'copy.fa').read_bytes() == b'TTTT' * 10
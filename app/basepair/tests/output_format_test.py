@@ -0,0 +1,127 @@
+'''This module contain tests for the streaming output formats'''
+
+# General imports
+import copy
+import io
+import json
+import sys
+
+# Libs import
+from allure import step
+
+# App imports
+import basepair
+from basepair.helpers import NicePrint, record_writer
+from basepair.helpers.record_writer import RecordWriter
+
+SAMPLES = [
+  {'id': 1, 'name': 'first', 'meta': {'num_reads': 10}, 'tags': ['a', 'b']},
+  {'id': 2, 'name': 'second, with a comma', 'meta': {}, 'tags': None},
+]
+
+def write(output_format, fields=None, items=SAMPLES):
+  '''Write items with a RecordWriter, returns the text'''
+  stream = io.StringIO()
+  with RecordWriter(output_format, fields=fields, stream=stream) as writer:
+    for item in items:
+      writer.write(item)
+  return stream.getvalue()
+
+def test_ndjson_fields():
+  '''validates json lines hold every field, or the selected ones by dotted name'''
+  with step('Act: write all fields then two'):
+    full = write('ndjson')
+    selected = write('ndjson', fields=['id', 'meta.num_reads'])
+
+  with step('Assert: one json object per line'):
+    assert [json.loads(line) for line in full.splitlines()] == SAMPLES
+    assert [json.loads(line) for line in selected.splitlines()] == [
+      {'id': 1, 'meta.num_reads': 10},
+      {'id': 2, 'meta.num_reads': None},
+    ]
+
+def test_csv_and_tsv():
+  '''validates delimited output with a header, quoting and json lists'''
+  with step('Act: write csv and tsv'):
+    csv_text = write('csv', fields=['id', 'name', 'tags'])
+    tsv_text = write('tsv', fields=['id', 'meta.num_reads'])
+
+  with step('Assert: header and one line per item'):
+    assert csv_text.splitlines() == ['id,name,tags', '1,first,"[""a"",""b""]"', '2,"second, with a comma",']
+    assert tsv_text.splitlines() == ['id\tmeta.num_reads', '1\t10', '2\t']
+
+def test_table_is_progressive(monkeypatch):
+  '''validates a table is printed once its first rows are read, the next ones as they come'''
+  with step('Arrange: a table sized on two rows'):
+    monkeypatch.setattr(record_writer, 'TABLE_SAMPLE', 2)
+    stream = io.StringIO()
+    writer = RecordWriter('table', fields=['id', 'name'], stream=stream)
+
+  with step('Act and assert: nothing until two rows, then a line per row'):
+    writer.write({'id': 1, 'name': 'a'})
+    assert stream.getvalue() == ''
+    writer.write({'id': 22, 'name': 'bb'})
+    assert stream.getvalue().splitlines() == ['id  name', '--  ----', '1   a', '22  bb']
+    writer.write({'id': 3, 'name': 'c'})
+    writer.close()
+    assert stream.getvalue().splitlines()[-1] == '3   c'
+
+def test_print_data_streams_pages(mock_webapp, tmp_path, monkeypatch):
+  '''validates a listing is printed page by page, the first line before the last page is fetched'''
+  with step('Arrange: ten samples served two by two'):
+    mock_webapp.max_limit = 2
+    mock_webapp.add('samples', [{'name': 's{}'.format(index), 'meta': {'num_reads': index}} for index in range(10)])
+    bp = basepair.connect({'api': mock_webapp.cfg}, scratch=str(tmp_path))
+    requests_at_first_line = []
+    class Stdout(io.StringIO):
+      '''Stdout recording the number of requests when the first line is written'''
+      def write(self, text):
+        if not requests_at_first_line:
+          requests_at_first_line.append(len(mock_webapp.requests))
+        return super().write(text)
+    stdout = Stdout()
+    monkeypatch.setattr(sys, 'stdout', stdout)
+
+  with step('Act: print them as csv'):
+    found = bp.print_data(data_type='samples', output_format='csv', fields=['name', 'meta.num_reads'])
+
+  with step('Assert: every sample, printed before the listing ended'):
+    assert found
+    assert stdout.getvalue().splitlines() == ['name,meta.num_reads'] + ['s{},{}'.format(index, index) for index in range(10)]
+    assert requests_at_first_line[0] < len(mock_webapp.requests)
+
+def test_json_is_valid_json(mock_webapp, tmp_path, capsys):
+  '''validates is_json prints json lines to stdout'''
+  with step('Arrange: a sample'):
+    mock_webapp.add('samples', [{'name': 'first', 'analyses_full': []}])
+    bp = basepair.connect({'api': mock_webapp.cfg}, scratch=str(tmp_path))
+
+  with step('Act: print it and a missing one'):
+    found = bp.print_data(data_type='sample', uid=[1, 99], is_json=True)
+
+  with step('Assert: one json line'):
+    assert found
+    lines = capsys.readouterr().out.splitlines()
+    assert [json.loads(line)['name'] for line in lines] == ['first']
+
+def test_nice_print_keeps_analysis(capsys):
+  '''validates printing an analysis does not change its file sizes'''
+  with step('Arrange: analysis with a file'):
+    analysis = {
+      'completed_on': None,
+      'controls': [],
+      'date_created': '2024-01-01',
+      'files': [{'filesize': 2 * 1024 ** 3, 'id': 1, 'path': 'a/b.bam', 'source': 'output', 'tags': []}],
+      'id': 1,
+      'name': 'a',
+      'samples': [],
+    }
+    expected = copy.deepcopy(analysis)
+
+  with step('Act: print it twice'):
+    NicePrint.analysis([analysis])
+    NicePrint.analysis([analysis])
+
+  with step('Assert: unchanged analysis, sizes in gigabytes'):
+    assert analysis == expected
+    assert capsys.readouterr().err.count('2.0000') == 2
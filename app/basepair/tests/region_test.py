@@ -0,0 +1,247 @@
+'''This module contain tests for the region queries on indexed files'''
+
+# General imports
+import gzip
+import hashlib
+import struct
+import zlib
+
+# Libs import
+import boto3
+import pytest
+from allure import step
+
+# App imports
+from basepair.modules.regions import parse_region, RegionReader
+from basepair.modules.regions.bgzf import BgzfFile
+from basepair.modules.regions.cache import LruCache
+from basepair.modules.regions.bigwig import CHROM_TREE, HEADER, NODE, RTREE, RTREE_LEAF, SECTION
+from basepair.modules.storage import Storage
+
+BUCKET = 'bp-test'
+CHROMS = [('chr1', 1000000), ('chr2', 500000)]
+
+def bgzf_block(data):
+  '''Compress data in a single BGZF block'''
+  compressor = zlib.compressobj(6, zlib.DEFLATED, -15)
+  cdata = compressor.compress(data) + compressor.flush()
+  header = b'\x1f\x8b\x08\x04\x00\x00\x00\x00\x00\xff' + struct.pack('<H', 6) + b'BC' + struct.pack('<HH', 2, len(cdata) + 25)
+  return header + cdata + struct.pack('<II', zlib.crc32(data), len(data))
+
+def reg2bin(start, end):
+  '''Smallest bin holding start-end, from the SAM specification'''
+  end -= 1
+  for shift, first in ((14, 4681), (17, 585), (20, 73), (23, 9), (26, 1)):
+    if start >> shift == end >> shift:
+      return first + (start >> shift)
+  return 0
+
+def build_bgzf(header, records):
+  '''BGZF file with the header and every (ref_id, start, end, payload) record in its own block, and its bai style refs'''
+  data = bgzf_block(header) if header else b''
+  refs = [{'bins': {}, 'linear': {}} for _ in CHROMS]
+  for ref_id, start, end, payload in records:
+    block = bgzf_block(payload)
+    chunk = (len(data) << 16, (len(data) + len(block)) << 16)
+    ref = refs[ref_id]
+    ref['bins'].setdefault(reg2bin(start, end), []).append(chunk)
+    for window in range(start >> 14, ((end - 1) >> 14) + 1):
+      ref['linear'][window] = min(ref['linear'].get(window, chunk[0]), chunk[0])
+    data += block
+  return data + bgzf_block(b''), refs
+
+def pack_refs(refs):
+  '''Binning index body of the refs'''
+  body = b''
+  for ref in refs:
+    body += struct.pack('<i', len(ref['bins']))
+    for number, chunks in sorted(ref['bins'].items()):
+      body += struct.pack('<Ii', number, len(chunks)) + b''.join(struct.pack('<QQ', *chunk) for chunk in chunks)
+    windows = max(ref['linear'], default=-1) + 1
+    linear, last = [], 0
+    for window in range(windows):
+      last = ref['linear'].get(window, last)
+      linear.append(last)
+    body += struct.pack('<i', windows) + struct.pack('<{}Q'.format(windows), *linear)
+  return body
+
+def build_bam(reads):
+  '''Sorted bam of (ref_id, pos, name) 50M reads, and its bai'''
+  text = b'@HD\tVN:1.6\tSO:coordinate\n'
+  header = b'BAM\x01' + struct.pack('<i', len(text)) + text + struct.pack('<i', len(CHROMS))
+  for name, length in CHROMS:
+    header += struct.pack('<i', len(name) + 1) + name.encode() + b'\x00' + struct.pack('<i', length)
+  records = []
+  for ref_id, pos, name in reads:
+    qname = name.encode() + b'\x00'
+    body = struct.pack('<iiBBHHHiiii', ref_id, pos, len(qname), 60, reg2bin(pos, pos + 50), 1, 0, 50, -1, -1, 0)
+    body += qname + struct.pack('<I', 50 << 4) + bytes([0x12, 0x48] * 12 + [0x12]) + bytes([30] * 50)
+    records.append((ref_id, pos, pos + 50, struct.pack('<i', len(body)) + body))
+  data, refs = build_bgzf(header, records)
+  return data, b'BAI\x01' + struct.pack('<i', len(CHROMS)) + pack_refs(refs)
+
+def build_tabix(intervals):
+  '''bgzipped bed of (ref_id, start, end) intervals, and its tbi'''
+  records = []
+  for number, (ref_id, start, end) in enumerate(intervals):
+    line = '{}\t{}\t{}\tpeak{}\n'.format(CHROMS[ref_id][0], start, end, number).encode()
+    records.append((ref_id, start, end, line))
+  data, refs = build_bgzf(None, records)
+  names = b''.join(name.encode() + b'\x00' for name, _ in CHROMS)
+  tbi = b'TBI\x01' + struct.pack('<iiiiiiii', len(CHROMS), 0x10000, 1, 2, 3, ord('#'), 0, len(names)) + names
+  return data, gzip.compress(tbi + pack_refs(refs))
+
+def build_bigwig(sections):
+  '''Compressed bigWig of bedGraph sections, lists of (ref_id, start, end, value), one data block each'''
+  key_size = max(len(name) for name, _ in CHROMS)
+  tree = CHROM_TREE.pack(0x78CA8C91, len(CHROMS), key_size, 8, len(CHROMS), 0) + NODE.pack(1, 0, len(CHROMS))
+  for chrom_id, (name, length) in enumerate(CHROMS):
+    tree += name.encode().ljust(key_size, b'\x00') + struct.pack('<II', chrom_id, length)
+  data_offset = HEADER.size + len(tree)
+  data, leaves = struct.pack('<I', len(sections)), []
+  for items in sections:
+    chrom_id, start, end = items[0][0], items[0][1], items[-1][2]
+    block = SECTION.pack(chrom_id, start, end, 0, 0, 1, 0, len(items))
+    block += b''.join(struct.pack('<IIf', *item[1:]) for item in items)
+    block = zlib.compress(block)
+    leaves.append(RTREE_LEAF.pack(chrom_id, start, chrom_id, end, data_offset + len(data), len(block)))
+    data += block
+  index_offset = data_offset + len(data)
+  index = RTREE.pack(0x2468ACE0, 256, len(leaves), 0, 0, 0, 0, 0, 1, 0) + NODE.pack(1, 0, len(leaves)) + b''.join(leaves)
+  header = HEADER.pack(0x888FFC26, 4, 0, HEADER.size, data_offset, index_offset, 0, 0, 0, 0, 65536, 0)
+  return header + tree + data + index
+
+@pytest.fixture(name='storage')
+def fixture_storage(monkeypatch):
+  '''Storage driver against a mocked S3, counting the bytes read with ranged GETs'''
+  moto = pytest.importorskip('moto')
+  monkeypatch.setenv('AWS_DEFAULT_REGION', 'us-east-1')
+  with moto.mock_aws():
+    boto3.client('s3', region_name='us-east-1').create_bucket(Bucket=BUCKET)
+    storage = Storage({
+      'credentials': {'id': 'id', 'secret': 'secret'},
+      'settings': {'bucket': BUCKET, 'disable_sts': True, 'region': 'us-east-1'},
+    })
+    storage.ranges = []
+    get_range = storage.get_range
+    def counting_get_range(uri, start, end):
+      data = get_range(uri, start, end)
+      storage.ranges.append((uri, len(data)))
+      return data
+    storage.get_range = counting_get_range
+    yield storage
+
+def put(storage, key, body):
+  '''Store an object, returns its uri'''
+  storage.driver.s3_service.client.put_object(Bucket=BUCKET, Key=key, Body=body)
+  return 's3://{}/{}'.format(BUCKET, key)
+
+def test_parse_region():
+  '''validates samtools style regions are parsed to 0-based half open intervals'''
+  with step('Assert: ranges, single positions and whole sequences'):
+    assert parse_region('chr12:170,000,000-170,300,000') == ('chr12', 169999999, 170300000)
+    assert parse_region('chr1:100') == ('chr1', 99, 100)
+    assert parse_region('chrM')[:2] == ('chrM', 0)
+    with pytest.raises(ValueError):
+      parse_region('chr1:200-100')
+
+def test_bam_region(storage):
+  '''validates a bam region reads only the header and overlapping blocks, and the index once'''
+  with step('Arrange: bam with a read every 200 bases and its bai'):
+    reads = [(ref_id, pos, 'read{}_{}'.format(ref_id, pos)) for ref_id, (_, length) in enumerate(CHROMS) for pos in range(5, length, 200)]
+    bam, bai = build_bam(reads)
+    uri = put(storage, 'analyses/1/sample.bam', bam)
+    put(storage, 'analyses/1/sample.bam.bai', bai)
+    reader = RegionReader(storage)
+
+  with step('Act: fetch a 30kb region twice'):
+    records = reader.fetch(uri, 'chr1:200,001-230,000')
+    data_bytes = sum(size for key, size in storage.ranges if key == uri)
+    requests = len(storage.ranges)
+    again = reader.fetch(uri, 'chr1:200001-230000')
+
+  with step('Assert: overlapping reads decoded, few bytes read, cached on the second query'):
+    expected = [name for ref_id, pos, name in reads if ref_id == 0 and pos + 50 > 200000 and pos < 230000]
+    assert [record['qname'] for record in records] == expected
+    assert records[0]['pos'] == 200006 and records[0]['cigar'] == '50M' and records[0]['rname'] == 'chr1'
+    assert records[0]['seq'].startswith('ACGT') and len(records[0]['qual']) == 50
+    assert data_bytes < len(bam) / 4
+    assert again == records
+    assert len(storage.ranges) == requests
+    assert reader.fetch(uri, 'chrX') == []
+
+def test_tabix_region(storage):
+  '''validates the lines of a bgzipped bed overlapping a region are returned'''
+  with step('Arrange: bed of 1kb peaks every 5kb and its tbi'):
+    intervals = [(ref_id, start, start + 1000) for ref_id, (_, length) in enumerate(CHROMS) for start in range(0, length, 5000)]
+    bed, tbi = build_tabix(intervals)
+    uri = put(storage, 'analyses/2/peaks.bed.gz', bed)
+    put(storage, 'analyses/2/peaks.bed.gz.tbi', tbi)
+
+  with step('Act: fetch a region of chr2'):
+    lines = RegionReader(storage).fetch(uri, 'chr2:10,500-20,000')
+
+  with step('Assert: overlapping peaks only'):
+    assert [line[1:3] for line in lines] == [['10000', '11000'], ['15000', '16000']]
+
+def test_chunk_larger_than_the_cache():
+  '''validates a chunk larger than the block cache is read, with GETs bounded by the fetch window'''
+  with step('Arrange: 50 blocks of 4KB of incompressible data and a 10KB cache'):
+    payloads = [b''.join(hashlib.sha256(b'%d %d' % (index, part)).digest() for part in range(128)) for index in range(50)]
+    data = b''.join(bgzf_block(payload) for payload in payloads) + bgzf_block(b'')
+    ranges = []
+    def get_range(start, end):
+      ranges.append(end - start + 1)
+      return data[start:end + 1]
+    bgzf = BgzfFile(get_range, LruCache(10 * 1024, weigh=lambda value: len(value[0])), 'file', fetch_window=65536)
+
+  with step('Act: read every block, from the middle of the first to the middle of the last'):
+    last = len(data) - len(bgzf_block(b'')) - len(bgzf_block(payloads[-1]))
+    chunk = bgzf.read(100, (last << 16) | 1000)
+
+  with step('Assert: the whole chunk, fetched in windows'):
+    assert chunk == b''.join(payloads)[100:-len(payloads[-1]) + 1000]
+    assert len(ranges) >= 3 and max(ranges) <= 65536
+    assert bgzf.read_from(0, 10000) == b''.join(payloads[:3])
+
+def test_whole_sequence_with_a_small_cache(storage):
+  '''validates a whole sequence is read with a block cache smaller than it'''
+  with step('Arrange: bed of 1kb peaks every 5kb and its tbi'):
+    intervals = [(ref_id, start, start + 1000) for ref_id, (_, length) in enumerate(CHROMS) for start in range(0, length, 5000)]
+    bed, tbi = build_tabix(intervals)
+    uri = put(storage, 'analyses/2/peaks.bed.gz', bed)
+    put(storage, 'analyses/2/peaks.bed.gz.tbi', tbi)
+
+  with step('Act: fetch chr1 through a 1KB cache'):
+    lines = RegionReader(storage, block_cache_size=1024).fetch(uri, 'chr1')
+
+  with step('Assert: every peak of chr1'):
+    assert len(lines) == CHROMS[0][1] // 5000
+
+def test_bigwig_region(storage):
+  '''validates the intervals of a bigWig overlapping a region are returned'''
+  with step('Arrange: bigWig with 100bp intervals in 10kb blocks'):
+    sections = [
+      [(ref_id, start + offset, start + offset + 100, float(start + offset)) for offset in range(0, 10000, 100)]
+      for ref_id, (_, length) in enumerate(CHROMS)
+      for start in range(0, length, 10000)
+    ]
+    bigwig = build_bigwig(sections)
+    uri = put(storage, 'analyses/3/coverage.bw', bigwig)
+
+  with step('Act: fetch a region across two blocks'):
+    intervals = RegionReader(storage).fetch(uri, 'chr1:29,951-30,150')
+
+  with step('Assert: values of the overlapping intervals, only part of the file read'):
+    assert [(item['start'], item['end'], item['value']) for item in intervals] == [
+      (29900, 30000, 29900.0),
+      (30000, 30100, 30000.0),
+      (30100, 30200, 30100.0),
+    ]
+    assert sum(size for _, size in storage.ranges) < len(bigwig) / 4
+
+def test_cram_is_refused():
+  '''validates cram files are refused with a clear error'''
+  with step('Assert: ValueError before any read'):
+    with pytest.raises(ValueError, match='CRAM'):
+      RegionReader(None).fetch('s3://bucket/sample.cram', 'chr1:1-100')
@@ -0,0 +1,144 @@
+'''This module contain tests for resumable multipart uploads'''
+
+# General imports
+import os
+
+# Libs import
+import boto3
+import pytest
+from allure import step
+from botocore.exceptions import EndpointConnectionError
+
+# App imports
+import basepair
+from basepair.modules.transfer import TransferEngine, TransferJournal
+
+moto = pytest.importorskip('moto')
+
+BUCKET = 'bp-test'
+PART_SIZE = 5 * 1024 * 1024
+STORAGE = {'bucket': BUCKET, 'credentials': {'id': 'id', 'secret': 'secret'}, 'region': 'us-east-1'}
+
+@pytest.fixture(name='s3')
+def fixture_s3(monkeypatch):
+  '''Mocked S3 with the test bucket'''
+  monkeypatch.setenv('AWS_DEFAULT_REGION', 'us-east-1')
+  with moto.mock_aws():
+    client = boto3.client('s3', region_name='us-east-1')
+    client.create_bucket(Bucket=BUCKET)
+    yield client
+
+def fail_part(monkeypatch, engine, number):
+  '''Make the upload of a part number fail, returns the list of parts sent'''
+  upload_part = engine.s3_service.client.upload_part
+  sent = []
+
+  def flaky_upload_part(**kwargs):
+    if kwargs['PartNumber'] == number:
+      raise EndpointConnectionError(endpoint_url='https://s3')
+    sent.append(kwargs['PartNumber'])
+    return upload_part(**kwargs)
+
+  monkeypatch.setattr(engine.s3_service.client, 'upload_part', flaky_upload_part)
+  return sent
+
+def test_upload_resumes_missing_parts(s3, tmp_path, monkeypatch):
+  '''validates an interrupted upload only sends the missing parts when run again'''
+  with step('Arrange: three parts file and an upload failing on the last part'):
+    src = tmp_path / 'reads.fastq.gz'
+    src.write_bytes(os.urandom(2 * PART_SIZE + 1000))
+    journal = TransferJournal(str(tmp_path / 'journal'))
+    engine = TransferEngine(STORAGE, backoff=0, concurrency=1, journal=journal, part_size=PART_SIZE, retries=1)
+    fail_part(monkeypatch, engine, 3)
+
+  with step('Act: upload fails and is journaled'):
+    assert engine.upload(str(src), 'uploads/1/2/reads.fastq.gz') is None
+    assert sorted(journal.get('multipart', BUCKET, 'uploads/1/2/reads.fastq.gz')['parts']) == ['1', '2']
+
+  with step('Act: run it again in a new process'):
+    monkeypatch.undo()
+    engine = TransferEngine(STORAGE, concurrency=2, journal=TransferJournal(str(tmp_path / 'journal')), part_size=PART_SIZE)
+    sent = fail_part(monkeypatch, engine, None)
+    stats = engine.upload(str(src), 'uploads/1/2/reads.fastq.gz')
+
+  with step('Assert: only the last part was sent and the object is complete'):
+    assert sent == [3]
+    assert stats['resumed_bytes'] == 2 * PART_SIZE
+    assert s3.get_object(Bucket=BUCKET, Key='uploads/1/2/reads.fastq.gz')['Body'].read() == src.read_bytes()
+    assert journal.entries('multipart') == []
+
+def test_abort_stale_uploads(s3, tmp_path):
+  '''validates stale multipart uploads are aborted and forgotten'''
+  with step('Arrange: unfinished journaled upload'):
+    journal = TransferJournal(str(tmp_path / 'journal'))
+    engine = TransferEngine(STORAGE, journal=journal, part_size=PART_SIZE)
+    upload_id = s3.create_multipart_upload(Bucket=BUCKET, Key='uploads/1/2/a.fastq')['UploadId']
+    record = {'bucket': BUCKET, 'key': 'uploads/1/2/a.fastq', 'upload_id': upload_id}
+    journal.save(record, 'multipart', BUCKET, 'uploads/1/2/a.fastq')
+
+  with step('Assert: dry run only lists, cleanup aborts'):
+    assert [upload['upload_id'] for upload in engine.abort_stale_uploads(dry_run=True)] == [upload_id]
+    assert [upload['upload_id'] for upload in engine.abort_stale_uploads(prefix='uploads/1/')] == [upload_id]
+    assert not s3.list_multipart_uploads(Bucket=BUCKET).get('Uploads')
+    assert journal.entries('multipart') == []
+
+def test_create_sample_resumes(s3, mock_webapp, tmp_path, monkeypatch):
+  '''validates re-running create_sample continues the same sample upload'''
+  with step('Arrange: sample with a big and a small file, failing the big one'):
+    mock_webapp.add('users', [{'username': 'tester'}])
+    big, small = tmp_path / 'big_R1.fastq.gz', tmp_path / 'small_R2.fastq.gz'
+    big.write_bytes(os.urandom(PART_SIZE + 10))
+    small.write_bytes(b'@read\nACGT\n+\nIIII\n')
+    conf = {
+      'api': mock_webapp.cfg,
+      'storage': {'user': {'credentials': STORAGE['credentials'], 'settings': {'bucket': BUCKET, 'region': 'us-east-1'}}},
+      'transfer': {'part_size': PART_SIZE, 'retries': 0},
+    }
+    data = {'filepaths1': [str(small)], 'filepaths2': [str(big)], 'name': 'sample'}
+    bp = basepair.connect(conf, scratch=str(tmp_path))
+    fail_part(monkeypatch, bp.transfer_engine, 2)
+
+  with step('Act: first run fails on the second part'):
+    sample_id = bp.create_sample(dict(data))
+
+  with step('Act: re-run'):
+    monkeypatch.undo()
+    bp = basepair.connect(conf, scratch=str(tmp_path))
+    resumed_id = bp.create_sample(dict(data))
+
+  with step('Assert: same sample, uploads completed'):
+    assert resumed_id == sample_id
+    assert len(mock_webapp.objects['samples']) == 1
+    assert [upload['status'] for upload in mock_webapp.objects['uploads']] == ['completed', 'completed']
+    key = next(upload['key'] for upload in mock_webapp.objects['uploads'] if upload['key'].endswith(big.name))
+    assert s3.get_object(Bucket=BUCKET, Key=key)['Body'].read() == big.read_bytes()
+    assert bp.transfer_engine.journal.entries('sample') == []
+
+def test_create_sample_does_not_resume_into_a_deleted_sample(s3, mock_webapp, tmp_path, monkeypatch):
+  '''validates an unfinished upload is forgotten when its sample was deleted, or when resume is off'''
+  with step('Arrange: an unfinished sample upload'):
+    mock_webapp.add('users', [{'username': 'tester'}])
+    reads = tmp_path / 'big_R1.fastq.gz'
+    reads.write_bytes(os.urandom(PART_SIZE + 10))
+    conf = {
+      'api': mock_webapp.cfg,
+      'storage': {'user': {'credentials': STORAGE['credentials'], 'settings': {'bucket': BUCKET, 'region': 'us-east-1'}}},
+      'transfer': {'part_size': PART_SIZE, 'retries': 0},
+    }
+    data = {'filepaths1': [str(reads)], 'name': 'sample'}
+    bp = basepair.connect(conf, scratch=str(tmp_path))
+    fail_part(monkeypatch, bp.transfer_engine, 2)
+    bp.create_sample(dict(data))
+    monkeypatch.undo()
+
+  with step('Act: delete the sample and run it again, then once more without resuming'):
+    mock_webapp.objects['samples'].clear()
+    bp = basepair.connect(conf, scratch=str(tmp_path))
+    bp.create_sample(dict(data))
+    bp.create_sample(dict(data), resume=False)
+
+  with step('Assert: a new sample created each time, the last two uploads completed'):
+    created = [path for command, path, _ in mock_webapp.requests if command == 'POST' and path.rstrip('/').endswith('/samples')]
+    assert len(created) == 3
+    assert [upload['status'] for upload in mock_webapp.objects['uploads']][1:] == ['completed', 'completed']
+    assert bp.transfer_engine.journal.entries('sample') == []
@@ -0,0 +1,51 @@
+'''This module contain tests for the pipelined sample uploads'''
+
+# General imports
+import time
+
+# Libs import
+import boto3
+import pytest
+from allure import step
+
+# App imports
+import basepair
+
+BUCKET = 'bp-test'
+
+def test_create_sample_pipelines_uploads(mock_webapp, tmp_path, monkeypatch):
+  '''validates upload records and transfers of the files overlap and report timings'''
+  moto = pytest.importorskip('moto')
+  monkeypatch.setenv('AWS_DEFAULT_REGION', 'us-east-1')
+  with moto.mock_aws():
+    with step('Arrange: eight lanes and a webapp answering in 100ms'):
+      boto3.client('s3', region_name='us-east-1').create_bucket(Bucket=BUCKET)
+      mock_webapp.add('users', [{'username': 'tester'}])
+      files = []
+      for lane in range(8):
+        path = tmp_path / 'lane{}_R1.fastq.gz'.format(lane)
+        path.write_bytes(b'@read\nACGT\n+\nIIII\n' * (lane + 1))
+        files.append(str(path))
+      bp = basepair.connect({
+        'api': mock_webapp.cfg,
+        'storage': {'user': {
+          'credentials': {'id': 'id', 'secret': 'secret'},
+          'settings': {'bucket': BUCKET, 'region': 'us-east-1'},
+        }},
+      }, scratch=str(tmp_path))
+      bp.user # pylint: disable=pointless-statement
+      bp.transfer_engine # pylint: disable=pointless-statement
+      mock_webapp.delay = 0.1
+
+    with step('Act: create the sample with four workers'):
+      starttime = time.time()
+      sample_id, timings = bp.create_sample({'filepaths1': files, 'name': 'lanes'}, parallel=4, return_timings=True)
+      elapsed = time.time() - starttime
+
+    with step('Assert: requests overlapped and every file has its timing'):
+      # one sample POST, then 8 upload POST and 8 status PUT, 4 at a time
+      assert elapsed < 1.5 * (1 + 16 / 4) * mock_webapp.delay
+      assert sample_id == 1
+      assert sorted(timing['filepath'] for timing in timings) == files
+      assert all(timing['status'] == 'completed' and timing['seconds'] >= 0 for timing in timings)
+      assert sorted(upload['order'] for upload in mock_webapp.objects['uploads']) == list(range(8))
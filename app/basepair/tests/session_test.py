@@ -0,0 +1,45 @@
+'''This module contain tests for the pooled webapp sessions'''
+
+# General imports
+from concurrent.futures import ThreadPoolExecutor
+
+# Libs import
+from allure import step
+
+# App imports
+from basepair.infra.webapp import Analysis, Sample, SessionPool
+
+def test_resources_share_one_session(mock_webapp):
+  '''validates every resource for the same host reuses the session'''
+  with step('Arrange: two resources built from the same cfg'):
+    sample_api = Sample(mock_webapp.cfg)
+    analysis_api = Analysis(mock_webapp.cfg)
+
+  with step('Assert: they share the pooled session'):
+    assert sample_api.session is analysis_api.session
+    assert SessionPool.get_session({**mock_webapp.cfg, 'ssl': True}) is not sample_api.session
+
+def test_connections_are_reused(mock_webapp):
+  '''validates keep-alive connections are reused across requests and threads'''
+  with step('Arrange: add samples to the webapp'):
+    mock_webapp.add('samples', [{'name': 'sample {}'.format(i)} for i in range(10)])
+
+  with step('Act: fetch each sample from fresh resource objects in threads'):
+    with ThreadPoolExecutor(4) as executor:
+      results = list(executor.map(lambda uid: Sample(mock_webapp.cfg).get(uid, params={}), range(1, 11)))
+
+  with step('Assert: responses are right and connections were reused'):
+    assert [result['id'] for result in results] == list(range(1, 11))
+    stats = SessionPool.stats()['{} (http)'.format(mock_webapp.cfg['host'])]
+    assert stats['requests'] == 10
+    assert stats['connections_opened'] <= 4
+    assert stats['reuse_ratio'] >= 0.6
+    assert stats['open_connections'] >= 1
+
+def test_timeout_is_read_from_cfg(mock_webapp):
+  '''validates the per request timeout setting'''
+  with step('Arrange: cfg with a [connect, read] timeout'):
+    sample_api = Sample({**mock_webapp.cfg, 'timeout': [1, 2]})
+
+  with step('Assert: timeout is used as a tuple'):
+    assert sample_api.timeout == (1, 2)
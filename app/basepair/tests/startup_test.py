@@ -0,0 +1,75 @@
+'''This module contain startup latency tests for the api wrapper'''
+
+# General imports
+import time
+
+# Libs import
+from allure import step
+
+# App imports
+import basepair
+
+STARTUP_BUDGET = 0.1 # seconds
+
+def test_connect_does_not_wait_on_the_network(mock_webapp, tmp_path):
+  '''validates connect makes no request and returns within the startup budget'''
+  with step('Arrange: slow webapp'):
+    mock_webapp.delay = 0.5
+    mock_webapp.add('users', [{'username': 'tester'}])
+    mock_webapp.add('genomes', [{'name': 'hg19'}])
+
+  with step('Act: connect'):
+    starttime = time.time()
+    bp = basepair.connect({'api': mock_webapp.cfg}, scratch=str(tmp_path))
+    elapsed = time.time() - starttime
+
+  with step('Assert: nothing was fetched'):
+    assert elapsed < STARTUP_BUDGET
+    assert mock_webapp.requests == []
+
+  with step('Assert: lazy attributes are fetched once on first use'):
+    assert bp.user['username'] == 'tester'
+    assert [genome['name'] for genome in bp.genomes] == ['hg19']
+    assert bp.user['id'] == bp.conf['user']['id']
+    assert len(mock_webapp.requests) == 2
+
+def test_warm_fetches_concurrently(mock_webapp, tmp_path):
+  '''validates warm fetches user and genomes in parallel background threads'''
+  with step('Arrange: slow webapp'):
+    mock_webapp.delay = 0.3
+    mock_webapp.add('users', [{'username': 'tester'}])
+
+  with step('Act: connect and warm in the background'):
+    starttime = time.time()
+    bp = basepair.connect({'api': mock_webapp.cfg}, scratch=str(tmp_path), warm=True)
+    connected = time.time() - starttime
+    for thread in bp.warm(names=('genome_catalog', 'user')):
+      thread.join()
+    elapsed = time.time() - starttime
+
+  with step('Assert: connect did not block and the fetches overlapped'):
+    assert connected < STARTUP_BUDGET
+    assert elapsed < 2 * mock_webapp.delay
+    assert bp.user['username'] == 'tester'
+    assert len(mock_webapp.requests) == 2
+
+def test_genome_catalog_is_cached_by_account(mock_webapp, tmp_path):
+  '''validates the genome list is persisted only with use_cache, in a file of the host and username'''
+  with step('Arrange: a genome'):
+    mock_webapp.add('genomes', [{'name': 'hg19'}])
+
+  with step('Act: load the genomes without then with use_cache, and with another account'):
+    basepair.connect({'api': mock_webapp.cfg}, scratch=str(tmp_path / 'plain')).genomes # pylint: disable=expression-not-assigned
+    basepair.connect({'api': mock_webapp.cfg}, scratch=str(tmp_path), use_cache=True).genomes # pylint: disable=expression-not-assigned
+    other = basepair.connect({'api': dict(mock_webapp.cfg, username='other')}, scratch=str(tmp_path), use_cache=True)
+    requests = len(mock_webapp.requests)
+    other.genomes # pylint: disable=pointless-statement
+
+  with step('Assert: no file without use_cache, one file per account'):
+    assert not (tmp_path / 'plain').exists()
+    host = mock_webapp.cfg['host'].replace(':', '_')
+    assert sorted(path.name for path in (tmp_path / 'json').iterdir()) == [
+      'genomes.{}.other.json'.format(host),
+      'genomes.{}.tester.json'.format(host),
+    ]
+    assert len(mock_webapp.requests) == requests + 1
@@ -0,0 +1,91 @@
+'''This module contain tests for the ranged storage streams'''
+
+# General imports
+import gzip
+import io
+import os
+
+# Libs import
+import boto3
+import pytest
+from allure import step
+
+# App imports
+from basepair.modules.storage import Storage
+from basepair.modules.transfer.stream import RangedReader, open_stream
+
+BUCKET = 'bp-test'
+
+def test_ranged_reads_with_read_ahead():
+  '''validates reads and seeks are served by whole chunk ranged GETs, prefetching the next ones'''
+  with step('Arrange: 10 chunks object counting the ranges fetched'):
+    data = os.urandom(1000)
+    ranges = []
+    def get_range(start, end):
+      ranges.append((start, end))
+      return data[start:end + 1]
+    stream = open_stream(get_range, len(data), chunk_size=100, read_ahead=2)
+
+  with step('Act: read the start, seek near the end, read past it'):
+    head = stream.read(150)
+    stream.seek(-30, io.SEEK_END)
+    tail = stream.read(100)
+    position = stream.tell()
+    stream.close()
+
+  with step('Assert: same bytes, chunk aligned ranges, only the needed window fetched'):
+    assert head == data[:150]
+    assert tail == data[-30:]
+    assert position == len(data)
+    assert all(start % 100 == 0 and end - start < 100 for start, end in ranges)
+    assert (900, 999) in ranges
+    assert len(ranges) <= 5
+
+def test_sequential_memory_is_bounded():
+  '''validates a reader keeps at most read_ahead + 1 chunks'''
+  with step('Arrange: reader without prefetch'):
+    reader = RangedReader(lambda start, end: b'x' * (end - start + 1), 10 ** 6, chunk_size=1000, read_ahead=0)
+
+  with step('Act: read it all'):
+    total = 0
+    while True:
+      chunk = reader.read(4096)
+      if not chunk:
+        break
+      total += len(chunk)
+
+  with step('Assert: read the whole size with nothing pending'):
+    assert total == 10 ** 6
+    assert not reader._pending # pylint: disable=protected-access
+
+def test_storage_open_gzip_lines(monkeypatch):
+  '''validates a gzipped text object is streamed line by line from the storage'''
+  moto = pytest.importorskip('moto')
+  monkeypatch.setenv('AWS_DEFAULT_REGION', 'us-east-1')
+  with moto.mock_aws():
+    with step('Arrange: gzipped counts in the bucket'):
+      lines = ['gene_{}\t{}\n'.format(i, i * 3) for i in range(5000)]
+      client = boto3.client('s3', region_name='us-east-1')
+      client.create_bucket(Bucket=BUCKET)
+      client.put_object(Bucket=BUCKET, Key='analyses/1/counts.txt.gz', Body=gzip.compress(''.join(lines).encode('utf-8')))
+      storage = Storage({
+        'credentials': {'id': 'id', 'secret': 'secret'},
+        'settings': {'bucket': BUCKET, 'disable_sts': True, 'region': 'us-east-1'},
+      })
+
+    with step('Act: iterate the lines in text mode, and read raw bytes'):
+      uri = 's3://{}/analyses/1/counts.txt.gz'.format(BUCKET)
+      with storage.open(uri, mode='rt', chunk_size=1024) as handle:
+        streamed = list(handle)
+      with storage.open(uri, compression=None) as handle:
+        magic = handle.read(2)
+
+    with step('Assert: decompressed lines, gzip magic in raw mode'):
+      assert streamed == lines
+      assert magic == b'\x1f\x8b'
+
+def test_invalid_mode():
+  '''validates write modes are refused'''
+  with step('Assert: ValueError on wb'):
+    with pytest.raises(ValueError):
+      open_stream(lambda start, end: b'', 0, mode='wb')
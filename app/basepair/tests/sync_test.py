@@ -0,0 +1,120 @@
+'''This module contain tests for the incremental project mirror'''
+
+# Libs import
+import boto3
+import pytest
+from allure import step
+
+# App imports
+import basepair
+
+BUCKET = 'bp-test'
+
+@pytest.fixture(name='project')
+def fixture_project(mock_webapp, tmp_path, monkeypatch):
+  '''Project of two samples with an analysis each, files in a mocked S3'''
+  moto = pytest.importorskip('moto')
+  monkeypatch.setenv('AWS_DEFAULT_REGION', 'us-east-1')
+  with moto.mock_aws():
+    client = boto3.client('s3', region_name='us-east-1')
+    client.create_bucket(Bucket=BUCKET)
+    mock_webapp.add('users', [{'username': 'tester'}])
+    for uid in (1, 2):
+      files = []
+      for number, (name, tags) in enumerate([('sample.dedup.bam', ['bam', 'dedup']), ('sample.bw', ['bigwig'])]):
+        key = 'analyses/{}/{}'.format(uid, name)
+        body = '{} of analysis {}'.format(name, uid).encode()
+        client.put_object(Bucket=BUCKET, Key=key, Body=body)
+        files.append({'filesize': len(body), 'id': 10 * uid + number, 'last_updated': '2024-01-01T00:00:00.000000', 'path': key, 'tags': tags})
+      mock_webapp.add('samples', [{'last_updated': '2024-01-01T00:00:00.000000', 'projects': ['/api/v2/projects/5']}])
+      mock_webapp.add('analyses', [{
+        'files': files,
+        'last_updated': '2024-01-01T00:00:00.000000',
+        'samples': ['/api/v2/samples/{}'.format(uid)],
+        'status': 'complete',
+      }])
+    bp_api = basepair.connect({
+      'api': mock_webapp.cfg,
+      'storage': {'user': {
+        'credentials': {'id': 'id', 'secret': 'secret'},
+        'settings': {'bucket': BUCKET, 'region': 'us-east-1'},
+      }},
+    }, scratch=str(tmp_path / 'scratch'))
+    yield bp_api, client
+
+def test_sync_transfers_only_changes(project, mock_webapp, tmp_path, monkeypatch):
+  '''validates a re-sync transfers nothing, then only the changed file, and prunes the deleted one'''
+  with step('Arrange: count the files copied'):
+    bp_api, client = project
+    dest = tmp_path / 'mirror'
+    copied = []
+    copy_file = bp_api.copy_file
+    monkeypatch.setattr(bp_api, 'copy_file', lambda src, dest, action='to': copied.append(src) or copy_file(src, dest, action=action))
+
+  with step('Act: sync, sync again, then after a file changed and one was deleted'):
+    first = bp_api.sync(5, str(dest))
+    second = bp_api.sync(5, str(dest))
+    copied_before = list(copied)
+    client.put_object(Bucket=BUCKET, Key='analyses/2/sample.bw', Body=b'new coverage')
+    analysis = mock_webapp.objects['analyses'][1]
+    analysis['files'] = [dict(analysis['files'][1], filesize=12, last_updated='2024-02-01T00:00:00.000000')]
+    analysis['last_updated'] = '2024-02-01T00:00:00.000000'
+    last = bp_api.sync(5, str(dest), prune=True)
+
+  with step('Assert: 4 files mirrored once, then 1 transferred and 1 pruned'):
+    assert len(first['transferred']) == 4 and (first['unchanged'], first['errors']) == (0, {})
+    assert (second['transferred'], second['unchanged']) == ([], 4)
+    assert len(copied_before) == 4
+    assert last['transferred'] == ['analyses/2/sample.bw'] and last['pruned'] == ['analyses/2/sample.dedup.bam']
+    assert (dest / 'analyses/2/sample.bw').read_bytes() == b'new coverage'
+    assert not (dest / 'analyses/2/sample.dedup.bam').exists()
+    assert (dest / 'analyses/1/sample.dedup.bam').read_bytes() == b'sample.dedup.bam of analysis 1'
+
+def test_sync_tags_and_dry_run(project, tmp_path):
+  '''validates tag filtering and that a dry run transfers nothing'''
+  with step('Act: dry run of the bams'):
+    bp_api, _ = project
+    report = bp_api.sync(5, str(tmp_path / 'mirror'), tags=[['bam', 'dedup']], dry_run=True)
+
+  with step('Assert: the two bams, nothing written'):
+    assert report['transferred'] == ['analyses/1/sample.dedup.bam', 'analyses/2/sample.dedup.bam']
+    assert not (tmp_path / 'mirror').exists()
+
+def test_sync_without_etags_keeps_the_mirror(project, mock_webapp, tmp_path, monkeypatch):
+  '''validates unlisted etags are not compared and a failed download keeps the local copy'''
+  with step('Arrange: a mirror, a storage that can not be listed and a changed file failing to download'):
+    bp_api, _ = project
+    dest = tmp_path / 'mirror'
+    bp_api.sync(5, str(dest))
+    monkeypatch.setattr(bp_api.storage, 'list', lambda prefix: {})
+    analysis = mock_webapp.objects['analyses'][0]
+    analysis['files'] = [analysis['files'][0], dict(analysis['files'][1], last_updated='2024-02-01T00:00:00.000000')]
+    analysis['last_updated'] = '2024-02-01T00:00:00.000000'
+    def copy_file(src, dest, action='to'):
+      raise IOError('connection reset')
+    monkeypatch.setattr(bp_api, 'copy_file', copy_file)
+
+  with step('Act: sync again'):
+    report = bp_api.sync(5, str(dest))
+
+  with step('Assert: only the changed file attempted, every local copy intact'):
+    assert report['unchanged'] == 3 and report['transferred'] == []
+    assert list(report['errors']) == ['analyses/1/sample.bw']
+    assert (dest / 'analyses/1/sample.bw').read_bytes() == b'sample.bw of analysis 1'
+    assert len(list(dest.rglob('*.bam'))) == 2
+
+def test_sync_does_not_prune_on_refresh_errors(project, mock_webapp, tmp_path):
+  '''validates nothing is pruned when the catalog could not be refreshed'''
+  with step('Arrange: a mirror, then a new catalog whose analyses fail to load'):
+    bp_api, _ = project
+    dest = tmp_path / 'mirror'
+    bp_api.sync(5, str(dest))
+    bp_api = basepair.connect(bp_api.conf, scratch=str(tmp_path / 'new_scratch'))
+    mock_webapp.failing.add('analyses')
+
+  with step('Act: sync with prune'):
+    report = bp_api.sync(5, str(dest), prune=True)
+
+  with step('Assert: nothing pruned'):
+    assert report['pruned'] == []
+    assert len([path for path in dest.rglob('*') if path.is_file()]) == 5
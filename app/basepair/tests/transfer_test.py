@@ -0,0 +1,78 @@
+'''This module contain tests for the S3 transfer engine'''
+
+# General imports
+import os
+
+# Libs import
+import boto3
+import pytest
+from allure import step
+from botocore.exceptions import EndpointConnectionError
+
+# App imports
+from basepair.modules.transfer import TransferEngine
+
+moto = pytest.importorskip('moto')
+
+BUCKET = 'bp-test'
+PART_SIZE = 5 * 1024 * 1024
+
+@pytest.fixture(name='engine')
+def fixture_engine(monkeypatch):
+  '''Transfer engine against a mocked S3'''
+  monkeypatch.setenv('AWS_DEFAULT_REGION', 'us-east-1')
+  with moto.mock_aws():
+    boto3.client('s3', region_name='us-east-1').create_bucket(Bucket=BUCKET)
+    yield TransferEngine(
+      {'bucket': BUCKET, 'credentials': {'id': 'id', 'secret': 'secret'}, 'region': 'us-east-1'},
+      backoff=0.01,
+      concurrency=4,
+      part_size=PART_SIZE,
+    )
+
+def test_multipart_round_trip(engine, tmp_path):
+  '''validates a multipart upload and download keep the content and report throughput'''
+  with step('Arrange: file bigger than two parts'):
+    src = tmp_path / 'reads.fastq.gz'
+    src.write_bytes(os.urandom(2 * PART_SIZE + 123))
+    progress = []
+    engine.progress = lambda done, total: progress.append((done, total))
+
+  with step('Act: upload and download it'):
+    upload = engine.upload(str(src), 'uploads/1/reads.fastq.gz')
+    download = engine.download('s3://{}/uploads/1/reads.fastq.gz'.format(BUCKET), str(tmp_path / 'copy'))
+
+  with step('Assert: same content, encrypted, with stats and progress'):
+    assert (tmp_path / 'copy').read_bytes() == src.read_bytes()
+    head = engine.s3_service.client.head_object(Bucket=BUCKET, Key='uploads/1/reads.fastq.gz')
+    assert head['ServerSideEncryption'] == 'AES256'
+    assert head['ETag'].strip('"').endswith('-3')
+    assert upload['bytes'] == download['bytes'] == 2 * PART_SIZE + 123
+    assert upload['bytes_per_second'] > 0
+    assert progress[-1] == (download['bytes'], download['bytes'])
+
+def test_retries_with_backoff(engine, tmp_path, monkeypatch):
+  '''validates a failed transfer is retried'''
+  with step('Arrange: client failing on the first upload'):
+    src = tmp_path / 'small.txt'
+    src.write_text('data')
+    upload_file = engine.s3_service.client.upload_file
+    calls = []
+
+    def flaky_upload(**kwargs):
+      calls.append(kwargs['Key'])
+      if len(calls) == 1:
+        raise EndpointConnectionError(endpoint_url='https://s3')
+      return upload_file(**kwargs)
+
+    monkeypatch.setattr(engine.s3_service.client, 'upload_file', flaky_upload)
+
+  with step('Assert: second attempt succeeds'):
+    assert engine.upload(str(src), 'small.txt')['bytes'] == 4
+    assert len(calls) == 2
+
+def test_missing_key_is_not_retried(engine, tmp_path):
+  '''validates downloading a missing key fails right away'''
+  with step('Assert: no file and no stats'):
+    assert engine.download('missing.txt', str(tmp_path / 'missing.txt')) is None
+    assert not (tmp_path / 'missing.txt').exists()
@@ -0,0 +1,50 @@
+'''This module contain tests for the cached version check'''
+
+# General imports
+import json
+import time
+
+# Libs import
+import pytest
+from allure import step
+
+# App imports
+from basepair.helpers import version_check
+from basepair.helpers.version_check import check_version
+
+def test_fresh_cache_makes_no_request(tmp_path, monkeypatch, capsys):
+  '''validates the cached release is used within the ttl, with a warning when it is newer'''
+  with step('Arrange: release checked an hour ago'):
+    cache = tmp_path / 'version_check.json'
+    cache.write_text(json.dumps({'checked': time.time() - 3600, 'version': '9.9.9'}))
+    monkeypatch.setattr(version_check, '_refresh', lambda *args: pytest.fail('looked up'))
+
+  with step('Act: check'):
+    thread = check_version('basepair', '1.0.0', cache=str(cache))
+
+  with step('Assert: warning, no lookup'):
+    assert thread is None
+    assert '9.9.9' in capsys.readouterr().err
+
+def test_stale_cache_refreshes_in_background(tmp_path, monkeypatch, capsys):
+  '''validates a stale cache is refreshed by a background thread, the check itself not waiting'''
+  with step('Arrange: no cache and a slow lookup'):
+    cache = tmp_path / 'cache' / 'version_check.json'
+    def slow_refresh(title, path, state):
+      time.sleep(0.5)
+      state['version'] = '2.0.0'
+      version_check._save(path, state) # pylint: disable=protected-access
+    monkeypatch.setattr(version_check, '_refresh', slow_refresh)
+
+  with step('Act: check twice'):
+    starttime = time.time()
+    thread = check_version('basepair', '1.0.0', cache=str(cache))
+    elapsed = time.time() - starttime
+    second = check_version('basepair', '1.0.0', cache=str(cache))
+    thread.join()
+
+  with step('Assert: one lookup, the check did not wait for it'):
+    assert elapsed < 0.1
+    assert second is None
+    assert capsys.readouterr().err == ''
+    assert json.loads(cache.read_text())['version'] == '2.0.0'
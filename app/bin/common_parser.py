@@ -1,7 +1,9 @@
 '''Common parser used in datatypes parsing'''
 import argparse
+import json
 import os
 import re
+import sqlite3
 import sys
 
 # App imports
@@ -39,11 +41,22 @@ def add_force_parser(parser, datatype):
   return parser
 
 def add_json_parser(parser):
-  '''Add json parser'''
+  '''Add json and output format parser'''
   parser.add_argument(
     '--json',
     action='store_true',
-    help='(Optional) Print the data in JSON format (this shows all data associated with each item).'
+    help='(Optional) Print the data as JSON lines (this shows all data associated with each item), same as --format ndjson.'
+  )
+  parser.add_argument(
+    '--format',
+    choices=['csv', 'ndjson', 'table', 'tsv'],
+    dest='output_format',
+    help='(Optional) Print the data to stdout page by page as it is received, in this format.',
+  )
+  parser.add_argument(
+    '--fields',
+    help='(Optional) Comma separated fields to print with --format or --json, e.g. id,name,meta.num_reads.',
+    type=lambda value: [field.strip() for field in value.split(',') if field.strip()],
   )
   return parser
 
@@ -58,6 +71,30 @@ def add_outdir_parser(parser):
   )
   return parser
 
+def add_query_parser(parser, datatype):
+  '''Add local catalog query parser'''
+  parser.add_argument('--genome', help='(Optional) Genome name of the samples.')
+  parser.add_argument('--project', help='(Optional) Project id of the samples.', type=valid_uid)
+  parser.add_argument(
+    '--updated-after',
+    dest='updated_after',
+    help='(Optional) Only {} updated after this date, e.g. 2024-06-01.'.format(datatype),
+  )
+  parser.add_argument(
+    '--no-refresh',
+    action='store_true',
+    dest='no_refresh',
+    help='(Optional) Query the local catalog as is, without fetching the changes first.',
+  )
+  parser.add_argument(
+    '--full-refresh',
+    action='store_true',
+    dest='full_refresh',
+    help='(Optional) Fetch every object again, dropping the deleted ones from the catalog.',
+  )
+  parser.add_argument('--sql', help='(Optional) Select query to run on the catalog tables instead.')
+  return parser
+
 def add_single_uid_parser(parser,datatype):
   '''Add single uid parser'''
   parser.add_argument(
@@ -69,6 +106,17 @@ def add_single_uid_parser(parser,datatype):
   )
   return parser
 
+def add_parallel_parser(parser):
+  '''Add parallel transfers parser'''
+  parser.add_argument(
+    '--parallel',
+    default=None,
+    help='(Optional) Number of files transferred at once (default 4).',
+    metavar='N',
+    type=valid_parallel
+  )
+  return parser
+
 def add_pid_parser(parser):
   '''Add pipeline id parser'''
   parser.add_argument(
@@ -100,6 +148,19 @@ def add_tags_parser(parser):
   )
   return parser
 
+def add_uid_file_parser(parser, datatype):
+  '''Add uid file parser, the uids being then optional'''
+  parser.add_argument(
+    '--uid-file',
+    dest='uid_file',
+    default=None,
+    help='(Optional) File with the unique ids for {}, one per line.'.format(datatype),
+  )
+  for action in parser._actions: # pylint: disable=protected-access
+    if action.dest == 'uid':
+      action.required = False
+  return parser
+
 def add_uid_parser(parser, datatype):
   '''Add uid parser'''
   parser.add_argument(
@@ -124,12 +185,67 @@ def add_yaml_parser(parser):
   )
   return parser
 
+def get_output_args(args):
+  '''Output format and fields of the print_data calls, --json being ndjson'''
+  return {
+    'fields': args.fields,
+    'output_format': args.output_format or ('ndjson' if args.json else None),
+  }
+
+def run_query(bp_api, args, kind, **filters):
+  '''Query the local catalog and print the results as json lines'''
+  if args.full_refresh:
+    bp_api.refresh_catalog(full=True)
+  try:
+    items = bp_api.query_catalog(
+      kind,
+      refresh=not (args.no_refresh or args.full_refresh),
+      sql=args.sql,
+      **({} if args.sql else {key: value for key, value in filters.items() if value}),
+    )
+  except (ValueError, sqlite3.Error) as error:
+    sys.exit('ERROR: {}'.format(error))
+  for item in items:
+    print(json.dumps(item))
+  eprint('{} {} found.'.format(len(items), 'rows' if args.sql else kind))
+
+def read_uids(args):
+  '''Uids of the --uid and --uid-file args, in order and without duplicates'''
+  uids = list(args.uid or [])
+  if getattr(args, 'uid_file', None):
+    try:
+      with open(os.path.expanduser(args.uid_file), 'r') as handle:
+        uids += [line.strip() for line in handle if line.strip() and not line.startswith('#')]
+    except OSError as error:
+      sys.exit('ERROR: Not able to read {}: {}.'.format(args.uid_file, error))
+  invalid = [uid for uid in uids if not (uid.isdigit() and int(uid) > 0)]
+  if invalid:
+    sys.exit('ERROR: uid must be a positive integer, got {}.'.format(', '.join(invalid)))
+  if not uids:
+    sys.exit('ERROR: Please provide --uid or --uid-file.')
+  return list(dict.fromkeys(uids))
+
 def valid_uid(value):
   '''Validates the uid for positive integer'''
   if value.isdigit() and int(value) > 0:
     return value
   raise argparse.ArgumentTypeError('ERROR: uid must be a positive integer')
 
+def valid_parallel(value):
+  '''Validates the number of parallel transfers'''
+  if value.isdigit() and int(value) > 0:
+    return int(value)
+  raise argparse.ArgumentTypeError('ERROR: parallel must be a positive integer')
+
+def valid_seconds(value):
+  '''Validates a positive number of seconds'''
+  try:
+    if float(value) > 0:
+      return float(value)
+  except ValueError:
+    pass
+  raise argparse.ArgumentTypeError('ERROR: seconds must be a positive number')
+
 def valid_email(value):
   '''Validates the email'''
   pattern = re.compile(r"^[a-zA-Z0-9_.+-]+@[a-zA-Z0-9-]+\.[a-zA-Z0-9-.]+$")
@@ -1,5 +1,6 @@
 '''Importing datatypes from module'''
 from .analysis import Analysis
+from .batch import Batch
 from .file import File
 from .genome import Genome
 from .module import Module
@@ -4,25 +4,32 @@
 import sys
 
 # App Import
+from basepair.api import BULK_CONCURRENCY
 from basepair.helpers import eprint
-from bin.common_parser import add_common_args, add_single_uid_parser, add_uid_parser, add_json_parser, \
-  add_tags_parser, add_outdir_parser, valid_uid, validate_analysis_yaml
+from basepair.helpers.manifest import read_analysis_specs
+from basepair.helpers.analysis_watcher import DEFAULT_MAX_INTERVAL, FINAL_STATUSES
+from bin.common_parser import add_common_args, add_single_uid_parser, add_uid_file_parser, add_uid_parser, add_json_parser, \
+  add_parallel_parser, add_query_parser, add_tags_parser, add_outdir_parser, get_output_args, read_uids, run_query, valid_parallel, \
+  valid_seconds, valid_uid, validate_analysis_yaml
 
 class Analysis:
   '''Analysis action methods'''
 
   @staticmethod
-  def create_analysis(bp_api, args):
-    '''Create and submit an analysis'''
+  def create_analysis(bp_api, args): # pylint: disable=too-many-branches
+    '''Create and submit an analysis, or many with --specs or --per-sample'''
     params = {'node': {}, 'info': {}}
     if args.instance:
-      try:
-        instance_choices = bp_api.get_instances()
-      except KeyError:
-        sys.exit('ERROR: Failed to get instance data.')
-      if args.instance not in instance_choices:
-        sys.exit('ERROR: invalid instance_type available instances - {}'.format(' '.join(instance_choices)))
+      Analysis._validate_instance(bp_api, args.instance)
       params['info']['instance_type'] = args.instance
+    if args.specs:
+      results = bp_api.bulk_create_analyses(read_analysis_specs(args.specs), concurrency=args.parallel)
+      Analysis._print_bulk_results(enumerate(results, start=1), 'spec')
+      if all(result['status'] == 'error' for result in results):
+        sys.exit('ERROR: Analysis creation failed!')
+      return results
+    if not args.sample:
+      sys.exit('ERROR: Please provide --sample or --specs.')
     if args.custom_pipeline or args.custom_modules:
       validate_analysis_yaml(args.custom_pipeline if args.custom_pipeline else args.custom_modules)
     if args.params:
@@ -36,6 +43,21 @@ class Analysis:
           sys.exit('ERROR: Missing : in params values.')
     else:
       eprint('You specified no parameters, submitting with default ones.')
+    if args.per_sample:
+      if args.custom_pipeline or args.custom_modules:
+        sys.exit('ERROR: --per-sample does not support custom pipelines or modules.')
+      results = bp_api.bulk_create_analyses([{
+        'control_ids': args.control or [],
+        'ignore_validation_warnings': args.ignore_warning,
+        'params': params,
+        'project_id': args.project,
+        'sample_ids': [sample_id],
+        'workflow_id': args.pipeline,
+      } for sample_id in args.sample], concurrency=args.parallel)
+      Analysis._print_bulk_results(zip(args.sample, results), 'sample')
+      if all(result['status'] == 'error' for result in results):
+        sys.exit('ERROR: Analysis creation failed!')
+      return results
     return bp_api.create_analysis(
         control_ids=args.control or [],
         ignore_validation_warnings=args.ignore_warning,
@@ -62,16 +84,33 @@ class Analysis:
   @staticmethod
   def download_analysis(bp_api, args):
     '''Download analysis'''
-    # download a file from an analysis by tags
-    all_fail = True
+    # download the files of all the analyses by tags in one concurrent batch
+    if args.tags and not (isinstance(args.tags, list) and isinstance(args.tags[0], list)):
+      sys.exit('ERROR: Invalid tags argument. Provide a list of list of tags.')
+    jobs = []
     for each_uid in args.uid:
       analysis = bp_api.get_analysis(each_uid)
-      all_fail = not (bool(analysis.get('id')) \
-        and bool(bp_api.download_analysis(each_uid, analysis=analysis, outdir=args.outdir, tagkind=args.tagkind, tags=args.tags))) \
-        and all_fail
-    if all_fail:
+      if not analysis.get('id'):
+        continue
+      if not analysis['files']:
+        eprint('Warning: No files present for analysis id {}'.format(each_uid))
+        continue
+      jobs += bp_api.get_analysis_file_jobs(
+        analysis,
+        each_uid,
+        dirname=args.outdir,
+        kind=args.tagkind,
+        tags=args.tags,
+      ) or []
+    if not jobs:
+      sys.exit('ERROR: Downloading analysis failed.')
+    report = bp_api.download_files(jobs, parallel=args.parallel)
+    if not report['files']:
       sys.exit('ERROR: Downloading analysis failed.')
-    eprint('All analysis files have been downloaded successfully.')
+    if report['errors']:
+      eprint('{} of {} analysis files could not be downloaded.'.format(len(report['errors']), len(jobs)))
+    else:
+      eprint('All analysis files have been downloaded successfully.')
 
   @staticmethod
   def download_log_analysis(bp_api, args):
@@ -86,39 +125,52 @@ class Analysis:
   @staticmethod
   def get_analysis(bp_api, args):
     '''Get analysis'''
-    all_fail = True
-    for uid in args.uid:
-      all_fail = not bool(bp_api.print_data(data_type='analysis', uid=uid, is_json=args.json)) and all_fail
-    if all_fail:
+    if not bp_api.print_data(data_type='analysis', uid=args.uid, **get_output_args(args)):
       sys.exit('ERROR: Analyses data not found.')
 
   @staticmethod
   def list_analysis(bp_api, args):
     '''List analyses'''
-    bp_api.print_data(data_type='analyses', is_json=args.json, project=args.project)
+    bp_api.print_data(data_type='analyses', project=args.project, **get_output_args(args))
+
+  @staticmethod
+  def query_analysis(bp_api, args):
+    '''Query analyses in the local catalog'''
+    run_query(
+      bp_api,
+      args,
+      'analyses',
+      genome=args.genome,
+      project_id=args.project,
+      sample_id=args.sample,
+      status=args.status,
+      updated_after=args.updated_after,
+    )
 
   @staticmethod
   def reanalyze_analysis(bp_api, args):
-    '''Restart analysis'''
+    '''Restart analyses'''
     if args.instance:
-      try:
-        instance_choices = bp_api.get_instances()
-      except KeyError:
-        sys.exit('ERROR: Failed to get instance data.')
-      if args.instance not in instance_choices:
-        sys.exit('ERROR: invalid instance_type available instances - {}'.format(' '.join(instance_choices)))
-
-    all_fail = True
-    for each_uid in args.uid:
-      all_fail = not bool(bp_api.restart_analysis(each_uid, args.instance)) and all_fail
-    if all_fail:
+      Analysis._validate_instance(bp_api, args.instance)
+    uids = read_uids(args)
+    if len(uids) == 1:
+      if not bp_api.restart_analysis(uids[0], args.instance):
+        sys.exit('ERROR: while re-analyze the analysis data.')
+      return
+    results = bp_api.bulk_reanalyze(uids, instance_type=args.instance, concurrency=args.parallel)
+    Analysis._print_bulk_results(results.items(), 'analysis')
+    if all(result['status'] == 'error' for result in results.values()):
       sys.exit('ERROR: while re-analyze the analysis data.')
 
   @staticmethod
   def terminate_analysis(bp_api, args):
-    '''Terminate analysis'''
-    for each_uid in args.uid:
-      bp_api.terminate_analysis(each_uid)
+    '''Terminate analyses'''
+    uids = read_uids(args)
+    if len(uids) == 1:
+      bp_api.terminate_analysis(uids[0])
+      return
+    results = bp_api.bulk_terminate(uids, concurrency=args.parallel)
+    Analysis._print_bulk_results(results.items(), 'analysis')
 
   @staticmethod
   def update_analysis(bp_api, args):
@@ -129,6 +181,34 @@ class Analysis:
         data[key] = val
     bp_api.update_analysis(args.uid, data)
 
+  @staticmethod
+  def wait_analysis(bp_api, args):
+    '''Wait for analyses to finish'''
+    def on_change(analysis, previous):
+      if previous:
+        eprint('analysis {}: {} -> {}'.format(analysis['id'], previous, analysis.get('status')))
+      else:
+        eprint('analysis {}: {}'.format(analysis['id'], analysis.get('status')))
+
+    try:
+      statuses = bp_api.watch_analyses(
+        read_uids(args),
+        on_change=on_change,
+        max_interval=args.max_interval,
+        timeout=args.timeout,
+      )
+    except IOError as error:
+      sys.exit('ERROR: {}'.format(error))
+    if not statuses:
+      sys.exit('ERROR: Analyses not found.')
+    running = [uid for uid, status in statuses.items() if status not in FINAL_STATUSES]
+    if running:
+      sys.exit('ERROR: Timed out, {} analyses still running: {}.'.format(len(running), ' '.join(running)))
+    failed = [uid for uid, status in statuses.items() if status != 'complete']
+    if failed:
+      sys.exit('ERROR: {} analyses did not complete: {}.'.format(len(failed), ' '.join(failed)))
+    eprint('All {} analyses are complete.'.format(len(statuses)))
+
   @staticmethod
   def analysis_action_parser(action_parser):
     '''Analysis parser'''
@@ -158,13 +238,25 @@ class Analysis:
       '--instance', help='instance_type for analysis'
     )
     create_analysis_p.add_argument('--params', nargs='+')
+    create_analysis_p.add_argument(
+      '--per-sample',
+      action='store_true',
+      default=False,
+      dest='per_sample',
+      help='Create one analysis per sample, in bulk',
+    )
     create_analysis_p.add_argument('--project', help='Project id', type=valid_uid)
     create_analysis_p.add_argument(
       '--pipeline', help='Pipeline id', type=valid_uid
     )
     create_analysis_p.add_argument(
-      '--sample', nargs='+', help='Sample id', required=True, type=valid_uid
+      '--sample', nargs='+', help='Sample id', type=valid_uid
+    )
+    create_analysis_p.add_argument(
+      '--specs',
+      help='Json, csv or tsv file of the analyses to create in bulk, with pipeline, sample, control, project, instance and params columns',
     )
+    create_analysis_p = Analysis._add_bulk_parallel_parser(create_analysis_p)
 
     # delete analysis parser
     delete_analysis_p = action_parser.add_parser(
@@ -182,6 +274,7 @@ class Analysis:
     download_analysis_p = add_uid_parser(download_analysis_p, 'analysis')
     download_analysis_p = add_tags_parser(download_analysis_p)
     download_analysis_p = add_outdir_parser(download_analysis_p)
+    download_analysis_p = add_parallel_parser(download_analysis_p)
     download_analysis_p = add_common_args(download_analysis_p)
 
     # download analysis log parser
@@ -216,6 +309,16 @@ class Analysis:
     list_analyses_p = add_common_args(list_analyses_p)
     list_analyses_p = add_json_parser(list_analyses_p)
 
+    # query parser
+    query_analysis_p = action_parser.add_parser(
+      'query',
+      help='Find analyses in the local catalog, refreshed with the changes first.'
+    )
+    query_analysis_p.add_argument('--sample', help='(Optional) Sample id.', type=valid_uid)
+    query_analysis_p.add_argument('--status', help='(Optional) Analysis status, e.g. complete.')
+    query_analysis_p = add_query_parser(query_analysis_p, 'analyses')
+    query_analysis_p = add_common_args(query_analysis_p)
+
     # reanalyze parser
     reanalyze_p = action_parser.add_parser(
       'reanalyze',
@@ -226,6 +329,8 @@ class Analysis:
     )
     reanalyze_p = add_common_args(reanalyze_p)
     reanalyze_p = add_uid_parser(reanalyze_p, 'analysis')
+    reanalyze_p = add_uid_file_parser(reanalyze_p, 'analysis')
+    reanalyze_p = Analysis._add_bulk_parallel_parser(reanalyze_p)
 
     # terminate parser
     terminate_p = action_parser.add_parser(
@@ -234,6 +339,8 @@ class Analysis:
     )
     terminate_p = add_common_args(terminate_p)
     terminate_p = add_uid_parser(terminate_p, 'analysis')
+    terminate_p = add_uid_file_parser(terminate_p, 'analysis')
+    terminate_p = Analysis._add_bulk_parallel_parser(terminate_p)
 
     # update an analysis parser
     update_analysis_parser = action_parser.add_parser(
@@ -245,4 +352,58 @@ class Analysis:
     update_analysis_parser = add_common_args(update_analysis_parser)
     update_analysis_parser = add_single_uid_parser(update_analysis_parser, 'analysis')
 
+
+    # wait parser
+    wait_p = action_parser.add_parser(
+      'wait',
+      help='Wait for analyses to finish, exiting with an error if one did not complete.'
+    )
+    wait_p.add_argument(
+      '--max-interval',
+      default=DEFAULT_MAX_INTERVAL,
+      dest='max_interval',
+      help='(Optional) Longest wait between status checks in seconds (default {}).'.format(DEFAULT_MAX_INTERVAL),
+      type=valid_seconds,
+    )
+    wait_p.add_argument(
+      '--timeout',
+      default=None,
+      help='(Optional) Give up after this many seconds.',
+      type=valid_seconds,
+    )
+    wait_p = add_common_args(wait_p)
+    wait_p = add_uid_parser(wait_p, 'analysis')
+    wait_p = add_uid_file_parser(wait_p, 'analysis')
+
     return action_parser
+
+  @staticmethod
+  def _add_bulk_parallel_parser(parser):
+    '''Add the number of calls at once of the bulk operations'''
+    parser.add_argument(
+      '--parallel',
+      default=BULK_CONCURRENCY,
+      help='(Optional) Number of analyses sent at once (default {}).'.format(BULK_CONCURRENCY),
+      metavar='N',
+      type=valid_parallel
+    )
+    return parser
+
+  @staticmethod
+  def _print_bulk_results(results, kind):
+    '''Print the errors and warnings of bulk results'''
+    for key, result in results:
+      if result['status'] in ('error', 'unknown', 'warning'):
+        eprint('{}: {} {}: {}'.format(result['status'].upper(), kind, key, result['error']))
+      elif result.get('id'):
+        eprint('created: analysis {} for {} {}'.format(result['id'], kind, key))
+
+  @staticmethod
+  def _validate_instance(bp_api, instance):
+    '''Exit when the instance type is not available'''
+    try:
+      instance_choices = bp_api.get_instances()
+    except KeyError:
+      sys.exit('ERROR: Failed to get instance data.')
+    if instance not in instance_choices:
+      sys.exit('ERROR: invalid instance_type available instances - {}'.format(' '.join(instance_choices)))
@@ -0,0 +1,128 @@
+'''Batch dataype class'''
+
+# General Import
+from concurrent.futures import ThreadPoolExecutor
+import io
+import json
+import shlex
+import sys
+import threading
+
+# App imports
+from basepair.helpers import eprint
+from bin.common_parser import add_common_args, valid_parallel
+
+class Batch:
+  '''Run many cli commands in one process'''
+
+  @staticmethod
+  def batch_parser(datatype_parser):
+    '''batch parser'''
+    batch_p = datatype_parser.add_parser(
+      'batch',
+      description='Run the commands of a file, one per line such as "sample get -u 1", with one connection. '
+        'The config and cache options of the batch apply to every command. Each command result is written to '
+        'stdout as a json line with its exit code, its output and, when its output is json lines, its data.',
+      help='Run many commands from a file or stdin in a single process.'
+    )
+    batch_p.add_argument(
+      'file',
+      default='-',
+      help='(Optional) File with one command per line, - for stdin (default).',
+      nargs='?',
+    )
+    batch_p.add_argument(
+      '--parallel',
+      default=1,
+      help='(Optional) Number of commands run at once (default 1).',
+      metavar='N',
+      type=valid_parallel
+    )
+    batch_p = add_common_args(batch_p)
+    batch_p.set_defaults(action_type='run')
+    return datatype_parser
+
+  @staticmethod
+  def run_batch(bp_api, args, run_command):
+    '''
+    Run the commands of a batch file and print their results as json lines
+    Parameters
+    ----------
+    args:        {obj}      Batch arguments, with file and parallel         [Required]
+    bp_api:      {obj}      Api shared by the commands                      [Required]
+    run_command: {callable} Runs the arguments of a command line with bp_api [Required]
+    Returns
+    -------
+    Exit code, 1 when a command failed
+    '''
+    handle = sys.stdin if args.file == '-' else open(args.file, 'r', encoding='utf-8')
+    with handle:
+      commands = [
+        (number, line.strip()) for number, line in enumerate(handle, start=1)
+        if line.strip() and not line.strip().startswith('#')
+      ]
+
+    stdout, stderr = sys.stdout, sys.stderr
+    sys.stdout, sys.stderr = _ThreadOutput(stdout), _ThreadOutput(stderr)
+    failed = 0
+    try:
+      with ThreadPoolExecutor(max_workers=args.parallel or 1) as executor:
+        for result in executor.map(lambda command: _run(run_command, *command), commands):
+          failed += result['exit_code'] != 0
+          stdout.write(json.dumps(result) + '\n')
+          stdout.flush()
+    finally:
+      sys.stdout, sys.stderr = stdout, stderr
+
+    if failed:
+      eprint('{} of {} commands failed.'.format(failed, len(commands)))
+    return 1 if failed else 0
+
+class _ThreadOutput():
+  '''Stream writing to the buffer of the command run by the current thread, else to the wrapped stream'''
+  def __init__(self, stream):
+    self.local = threading.local()
+    self.stream = stream
+
+  def __getattr__(self, name):
+    return getattr(self.stream, name)
+
+  def flush(self):
+    '''Flush the wrapped stream, the buffers being read at the end of their command'''
+    if getattr(self.local, 'buffer', None) is None:
+      self.stream.flush()
+
+  def write(self, text):
+    '''Write to the buffer of the current command'''
+    buffer = getattr(self.local, 'buffer', None)
+    return (self.stream if buffer is None else buffer).write(text)
+
+def _run(run_command, number, line):
+  '''Run a command line, returns its result dict'''
+  result = {'command': line, 'exit_code': 0, 'line': number}
+  sys.stdout.local.buffer, sys.stderr.local.buffer = io.StringIO(), io.StringIO()
+  try:
+    argv = shlex.split(line)
+    if argv and argv[0] == 'basepair':
+      argv = argv[1:]
+    if argv and argv[0] == 'batch':
+      sys.exit('ERROR: batch commands cannot be nested.')
+    run_command(argv)
+  except SystemExit as error:
+    if isinstance(error.code, str):
+      sys.stderr.write(error.code + '\n')
+    result['exit_code'] = error.code if isinstance(error.code, int) else int(error.code is not None)
+  except Exception as error: # pylint: disable=broad-except
+    sys.stderr.write('ERROR: {}\n'.format(error))
+    result['exit_code'] = 1
+  finally:
+    result['stdout'] = sys.stdout.local.buffer.getvalue()
+    result['stderr'] = sys.stderr.local.buffer.getvalue()
+    sys.stdout.local.buffer = sys.stderr.local.buffer = None
+
+  lines = result['stdout'].splitlines()
+  try:
+    result['data'] = [json.loads(item) for item in lines if item.strip()] if lines else None
+  except ValueError:
+    result['data'] = None
+  return result
@@ -4,7 +4,8 @@
 import sys
 
 # App imports
-from bin.common_parser import add_uid_parser, add_common_args, add_outdir_parser
+from bin.common_parser import add_uid_parser, add_common_args, add_outdir_parser, add_parallel_parser, add_query_parser, \
+  run_query, valid_uid
 
 class File:
   '''File action methods'''
@@ -12,15 +13,35 @@ class File:
   @staticmethod
   def download_file(bp_api, args):
     '''Download file by uid'''
-    all_fail = True
+    jobs = []
     for uid in args.uid:
       file_i = bp_api.get_file(uid)
-      all_fail = not (bool(file_i.get('id')) \
-        and bool(bp_api.download_file(file_i['path'], uid=uid, dirname=args.outdir, file_type='files'))) \
-        and all_fail
-    if all_fail:
+      if file_i.get('id'):
+        jobs.append({
+          'dirname': args.outdir,
+          'file_type': 'files',
+          'filekey': file_i['path'],
+          'size': file_i.get('filesize') or file_i.get('size') or 0,
+          'uid': uid,
+        })
+    if not jobs or not bp_api.download_files(jobs, parallel=args.parallel)['files']:
       sys.exit('ERROR: File downloading failed.')
 
+  @staticmethod
+  def query_file(bp_api, args):
+    '''Query analysis files in the local catalog'''
+    run_query(
+      bp_api,
+      args,
+      'files',
+      genome=args.genome,
+      project_id=args.project,
+      sample_id=args.sample,
+      status=args.status,
+      tags=args.tags,
+      updated_after=args.updated_after,
+    )
+
   @staticmethod
   def file_action_parser(action_parser):
     '''File datatype action parser'''
@@ -30,6 +51,18 @@ class File:
     )
     download_file_p = add_uid_parser(download_file_p, 'file')
     download_file_p = add_outdir_parser(download_file_p)
+    download_file_p = add_parallel_parser(download_file_p)
     download_file_p = add_common_args(download_file_p)
 
+    # query parser
+    query_file_p = action_parser.add_parser(
+      'query',
+      help='Find analysis files in the local catalog, refreshed with the changes first.'
+    )
+    query_file_p.add_argument('--sample', help='(Optional) Sample id.', type=valid_uid)
+    query_file_p.add_argument('--status', help='(Optional) Analysis status, e.g. complete.')
+    query_file_p.add_argument('--tags', help='(Optional) Tags the files have, among others.', nargs='+')
+    query_file_p = add_query_parser(query_file_p, 'files')
+    query_file_p = add_common_args(query_file_p)
+
     return action_parser
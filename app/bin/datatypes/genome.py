@@ -4,7 +4,7 @@
 import sys
 
 # App imports
-from bin.common_parser import add_common_args, add_uid_parser, add_json_parser
+from bin.common_parser import add_common_args, add_uid_parser, add_json_parser, get_output_args
 
 class Genome:
   '''Genome action methods'''
@@ -12,16 +12,13 @@ class Genome:
   @staticmethod
   def get_genome(bp_api, args):
     '''Get genome'''
-    all_fail = True
-    for uid in args.uid:
-      all_fail = not bool(bp_api.print_data(data_type='genome', uid=uid, is_json=args.json)) and all_fail
-    if all_fail:
+    if not bp_api.print_data(data_type='genome', uid=args.uid, **get_output_args(args)):
       sys.exit('ERROR: Failed to load genome data.')
 
   @staticmethod
   def list_genome(bp_api, args):
     '''List genomes'''
-    bp_api.print_data(data_type='genomes', is_json=args.json)
+    bp_api.print_data(data_type='genomes', **get_output_args(args))
 
   @staticmethod
   def genome_action_parser(action_parser):
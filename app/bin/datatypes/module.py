@@ -4,7 +4,7 @@
 import sys
 
 # App imports
-from bin.common_parser import add_common_args, add_uid_parser, add_json_parser, add_yaml_parser, add_pid_parser, add_force_parser, validate_create_yaml, validate_update_yaml
+from bin.common_parser import add_common_args, add_uid_parser, add_json_parser, get_output_args, add_yaml_parser, add_pid_parser, add_force_parser, validate_create_yaml, validate_update_yaml
 
 class Module:
   '''Module action methods'''
@@ -31,16 +31,13 @@ class Module:
   @staticmethod
   def get_module(bp_api, args):
     '''Get module'''
-    all_fail = True
-    for uid in args.uid:
-      all_fail = not bool(bp_api.print_data(data_type='module', uid=uid, is_json=args.json)) and all_fail
-    if all_fail:
+    if not bp_api.print_data(data_type='module', uid=args.uid, **get_output_args(args)):
       sys.exit('ERROR: Module data not found.')
 
   @staticmethod
   def list_module(bp_api, args):
     '''List Modules'''
-    result = bp_api.print_data(data_type='pipeline_modules', uid=args.pipeline, is_json=args.json)
+    result = bp_api.print_data(data_type='pipeline_modules', uid=args.pipeline, **get_output_args(args))
     if not result:
       sys.exit('ERROR: Module data not found.')
 
@@ -4,7 +4,7 @@ import json
 import sys
 
 # App imports
-from bin.common_parser import add_common_args, add_uid_parser, add_json_parser, add_yaml_parser, add_force_parser, \
+from bin.common_parser import add_common_args, add_uid_parser, add_json_parser, get_output_args, add_yaml_parser, add_force_parser, \
   validate_create_yaml, validate_update_yaml, valid_email, add_single_uid_parser
 
 
@@ -33,16 +33,13 @@ class Pipeline:
   @staticmethod
   def get_pipeline(bp_api, args):
     '''Get pipeline'''
-    all_fail = True
-    for uid in args.uid:
-      all_fail = not bool(bp_api.print_data(data_type='pipeline', uid=uid, is_json=args.json)) and all_fail
-    if all_fail:
+    if not bp_api.print_data(data_type='pipeline', uid=args.uid, **get_output_args(args)):
       sys.exit('ERROR: Pipeline data not found.')
 
   @staticmethod
   def list_pipeline(bp_api, args):
     '''List pipelines'''
-    bp_api.print_data(data_type='pipelines', is_json=args.json)
+    bp_api.print_data(data_type='pipelines', **get_output_args(args))
 
   @staticmethod
   def update_pipeline(bp_api, args):
@@ -5,7 +5,9 @@ import json
 import sys
 
 # App imports
-from bin.common_parser import add_common_args, add_json_parser, add_single_uid_parser, valid_email
+from basepair.helpers import eprint
+from bin.common_parser import add_common_args, add_json_parser, add_parallel_parser, add_single_uid_parser, add_tags_parser, \
+  valid_email
 
 class Project:
   '''Project action methods'''
@@ -21,6 +23,28 @@ class Project:
     '''List pipelines'''
     bp_api.print_data(data_type='projects', is_json=args.json)
 
+  @staticmethod
+  def sync_project(bp_api, args):
+    '''Mirror the analysis files of a project'''
+    if args.tags and not (isinstance(args.tags, list) and isinstance(args.tags[0], list)):
+      sys.exit('ERROR: Invalid tags argument. Provide a list of list of tags.')
+    report = bp_api.sync(
+      args.uid,
+      args.dest,
+      dry_run=args.dry_run,
+      kind=args.tagkind,
+      parallel=args.parallel,
+      prune=args.prune,
+      tags=args.tags,
+    )
+    if args.dry_run:
+      for path in report['transferred']:
+        eprint('transfer {}'.format(path))
+      for path in report['pruned']:
+        eprint('prune {}'.format(path))
+    if report['errors']:
+      sys.exit('ERROR: {} files could not be synced, run it again to retry them.'.format(len(report['errors'])))
+
   @staticmethod
   def update_project(bp_api, args):
     '''Update project'''
@@ -70,6 +94,28 @@ class Project:
     list_project_p = add_common_args(list_project_p)
     list_project_p = add_json_parser(list_project_p)
 
+    # sync project parser
+    sync_project_p = action_parser.add_parser(
+      'sync',
+      help='Mirror the analysis files of a project in a local directory, transferring only new or changed files.'
+    )
+    sync_project_p.add_argument('--dest', help='Mirror directory.', required=True)
+    sync_project_p.add_argument(
+      '--dry-run',
+      action='store_true',
+      dest='dry_run',
+      help='(Optional) Only print what would be transferred and pruned.',
+    )
+    sync_project_p.add_argument(
+      '--prune',
+      action='store_true',
+      help='(Optional) Delete the mirrored files that are not in the project anymore.',
+    )
+    sync_project_p = add_single_uid_parser(sync_project_p, 'project')
+    sync_project_p = add_tags_parser(sync_project_p)
+    sync_project_p = add_parallel_parser(sync_project_p)
+    sync_project_p = add_common_args(sync_project_p)
+
     # update project parser
     update_project_parser = action_parser.add_parser(
       'update',
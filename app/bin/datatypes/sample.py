@@ -6,12 +6,20 @@ import sys
 
 # App imports
 from basepair.helpers import eprint
-from bin.common_parser import add_json_parser, add_common_args, add_single_uid_parser, \
-add_uid_parser, add_outdir_parser, add_tags_parser, valid_uid, valid_sample_extensions , validate_sample_file
+from basepair.helpers.manifest import read_manifest
+from bin.common_parser import add_json_parser, get_output_args, add_common_args, add_single_uid_parser, \
+add_uid_parser, add_outdir_parser, add_parallel_parser, add_query_parser, add_tags_parser, run_query, valid_uid, \
+valid_sample_extensions , validate_sample_file
 
 class Sample:
   '''Sample action methods'''
 
+  @staticmethod
+  def cleanup_uploads_sample(bp_api, args):
+    '''Abort stale unfinished uploads'''
+    uploads = bp_api.cleanup_uploads(older_than=args.older_than, dry_run=args.dry_run)
+    eprint('{} stale upload(s) {}.'.format(len(uploads), 'found' if args.dry_run else 'aborted'))
+
   @staticmethod
   def create_sample(bp_api, args):
     '''Create sample'''
@@ -37,7 +45,7 @@ class Sample:
     if args.key and args.val:
       for key, val in zip(args.key, args.val):
         data['info'][key] = val
-    sample_id = bp_api.create_sample(data, upload=True, source='cli')
+    sample_id = bp_api.create_sample(data, upload=True, source='cli', parallel=args.parallel, resume=not args.no_resume)
     if sample_id:
       eprint('Sample created successfully.')
 
@@ -63,11 +71,11 @@ class Sample:
       # if tags provided, download file by tags
       if args.tags:
         all_fail = not (bool(sample.get('id')) \
-          and bp_api.get_file_by_tags(sample, file_type='samples', tags=args.tags, kind=args.tagkind, dirname=args.outdir, uid=uid)) \
+          and bp_api.get_file_by_tags(sample, file_type='samples', tags=args.tags, kind=args.tagkind, dirname=args.outdir, parallel=args.parallel, uid=uid)) \
           and all_fail
       else:
         all_fail = not (bool(sample.get('id')) \
-          and bool(bp_api.download_raw_files(sample, file_type='samples', uid=uid, outdir=args.outdir))) \
+          and bool(bp_api.download_raw_files(sample, file_type='samples', uid=uid, outdir=args.outdir, parallel=args.parallel))) \
           and all_fail
 
     if all_fail:
@@ -76,12 +84,42 @@ class Sample:
   @staticmethod
   def get_sample(bp_api, args):
     '''Get sample'''
-    all_fail = True
-    for uid in args.uid:
-      all_fail = not bool(bp_api.print_data(data_type='sample', uid=uid, is_json=args.json)) and all_fail
-    if all_fail:
+    if not bp_api.print_data(data_type='sample', uid=args.uid, **get_output_args(args)):
       sys.exit('ERROR: Sample data not found.')
 
+  @staticmethod
+  def ingest_sample(bp_api, args):
+    '''Create the samples of a manifest'''
+    validate_sample_file([
+      filepath
+      for row in read_manifest(args.manifest)
+      for filepath in (row.get('filepaths1') or []) + (row.get('filepaths2') or [])
+    ])
+    report = bp_api.ingest_manifest(
+      args.manifest,
+      parallel=args.parallel,
+      resume=not args.no_resume,
+      upload=not args.no_upload,
+      validate_only=args.validate_only,
+    )
+    if report['errors'] or any(row['status'] == 'error' for row in report['rows']):
+      sys.exit('ERROR: Manifest ingestion failed, run it again to retry the failed rows.')
+    if args.validate_only:
+      eprint('Manifest is valid.')
+
+  @staticmethod
+  def query_sample(bp_api, args):
+    '''Query samples in the local catalog'''
+    run_query(
+      bp_api,
+      args,
+      'samples',
+      genome=args.genome,
+      name=args.name,
+      project_id=args.project,
+      updated_after=args.updated_after,
+    )
+
   @staticmethod
   def update_sample(bp_api, args):
     '''Update sample'''
@@ -108,7 +146,7 @@ class Sample:
   @staticmethod
   def list_sample(bp_api, args):
     '''List sample'''
-    bp_api.print_data(data_type='samples', is_json=args.json, project=args.project)
+    bp_api.print_data(data_type='samples', project=args.project, **get_output_args(args))
 
   @staticmethod
   def sample_action_parser(action_parser):
@@ -135,12 +173,32 @@ class Sample:
     create_sample_p.add_argument('--genome', help='Name of the Genome')
     create_sample_p.add_argument('--key', action='append', help='Specify one(or more) key (can be used multiple times).\nShould be used along with --val flag.\nTags the sample with some additional information.')
     create_sample_p.add_argument('--name', help='Name of the sample')
+    create_sample_p.add_argument('--no-resume', action='store_true', help='(Optional) Create a new sample instead of resuming an unfinished upload of the same files.')
     create_sample_p.add_argument('--platform', help='Name of the sequencing platform')
     create_sample_p.add_argument('--project', help='Project ID', type=valid_uid)
     create_sample_p.add_argument('--val', action='append', help='Specify one(or more)value corresponding to the key (must match number of --key).\nShould be used along with --key flag.' + example_key_usage)
     create_sample_p.add_argument('--pipeline', help='Pipeline ID', type=valid_uid)
+    create_sample_p = add_parallel_parser(create_sample_p)
     create_sample_p = add_common_args(create_sample_p)
 
+    # cleanup uploads parser
+    cleanup_uploads_p = action_parser.add_parser(
+      'cleanup-uploads',
+      help='Abort unfinished sample uploads, re-running sample create resumes them until then.'
+    )
+    cleanup_uploads_p.add_argument(
+      '--dry-run',
+      action='store_true',
+      help='(Optional) Only list the stale uploads.'
+    )
+    cleanup_uploads_p.add_argument(
+      '--older-than',
+      default=7,
+      help='(Optional) Days since the upload started (default 7).',
+      type=int
+    )
+    cleanup_uploads_p = add_common_args(cleanup_uploads_p)
+
     # delete sample parser
     delete_sample_p = action_parser.add_parser(
       'delete',
@@ -157,8 +215,38 @@ class Sample:
     download_sample_p = add_uid_parser(download_sample_p, 'sample')
     download_sample_p = add_tags_parser(download_sample_p)
     download_sample_p = add_outdir_parser(download_sample_p)
+    download_sample_p = add_parallel_parser(download_sample_p)
     download_sample_p = add_common_args(download_sample_p)
 
+    # ingest samples parser
+    ingest_sample_p = action_parser.add_parser(
+      'ingest',
+      help='Create the samples of a csv, tsv or xlsx manifest, running it again skips the rows already created.'
+    )
+    ingest_sample_p.add_argument(
+      '--manifest',
+      help='Manifest with name, genome, datatype, filepaths1, filepaths2, projects, '
+        'default_workflow and platform columns, other columns are added to the sample info.',
+      required=True
+    )
+    ingest_sample_p.add_argument(
+      '--no-resume',
+      action='store_true',
+      help='(Optional) Create every row again instead of skipping or resuming the rows of a previous run.'
+    )
+    ingest_sample_p.add_argument(
+      '--no-upload',
+      action='store_true',
+      help='(Optional) Create the samples without uploading their files.'
+    )
+    ingest_sample_p.add_argument(
+      '--validate-only',
+      action='store_true',
+      help='(Optional) Only validate the manifest rows.'
+    )
+    ingest_sample_p = add_parallel_parser(ingest_sample_p)
+    ingest_sample_p = add_common_args(ingest_sample_p)
+
     # get sample parser
     get_sample_p = action_parser.add_parser(
       'get',
@@ -187,6 +275,15 @@ class Sample:
     update_sample_parser = add_common_args(update_sample_parser)
     update_sample_parser = add_single_uid_parser(update_sample_parser, 'sample')
 
+    # query sample parser
+    query_sample_p = action_parser.add_parser(
+      'query',
+      help='Find samples in the local catalog, refreshed with the changes first.'
+    )
+    query_sample_p.add_argument('--name', help='(Optional) Sample name.')
+    query_sample_p = add_query_parser(query_sample_p, 'samples')
+    query_sample_p = add_common_args(query_sample_p)
+
     # list sample parser
     list_samples_p = action_parser.add_parser(
       'list',
@@ -28,10 +28,12 @@ packages = [
     'basepair.modules.identity.drivers',
     'basepair.modules.logger',
     'basepair.modules.logger.drivers',
+    'basepair.modules.regions',
     'basepair.modules.secrets',
     'basepair.modules.secrets.drivers',
     'basepair.modules.storage',
     'basepair.modules.storage.drivers',
+    'basepair.modules.transfer',
     'basepair.utils',
     'bin',
     'bin.datatypes'
@@ -65,6 +67,11 @@ setup(
         'logbook',
         'tabulate',
     ],
+    extras_require={
+        'async': ['httpx'],
+        'matrix': ['numpy'],
+        'speedups': ['brotli', 'orjson'],
+    },
     scripts=['bin/basepair'],
     classifiers=[
         'Development Status :: 5 - Production/Stable',